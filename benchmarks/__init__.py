@@ -0,0 +1,7 @@
+"""
+Benchmarks de desempenho do AppSalão.
+
+Cada módulo é executável com ``python -m benchmarks.<nome>`` a partir da raiz
+do projeto e roda sobre um banco de testes temporário, sem tocar nos dados
+configurados em ``config/settings.py``.
+"""
@@ -0,0 +1,296 @@
+"""
+Carga HTTP nos fluxos principais, com latência por endpoint.
+
+Usuários virtuais, cada um em uma thread com a própria sessão (cookies),
+entram em salões sorteados e repetem os fluxos do seu perfil até o fim do
+tempo:
+
+    cliente  servicos_lista, meus_agendamentos e agendar_servico (consulta
+             os horários livres e envia o POST com um deles)
+    admin    admin_dashboard e gestao_financeiro do mês
+
+A cada --acoes-por-sessao ações o usuário sai e entra de novo como outro
+usuário do mesmo perfil, o que mede também o login (dominado pelo hash da
+senha, que disputa a CPU com as demais requisições). O resultado, em JSON,
+traz por endpoint as requisições por segundo, a taxa de erros (falha de
+conexão ou status 4xx/5xx), os status recebidos e a latência (p50, p95 e
+p99), para comparar duas execuções.
+
+Sem --url, o benchmark gera salões sintéticos (core.dados_sinteticos) em um
+banco temporário e sobe um servidor local em uma thread:
+
+    python -m benchmarks.carga_http --usuarios 32 --segundos 30 --saloes 5
+
+Com --url, usa um servidor já no ar, com salões gerados por
+gerar_dados_sinteticos (os mesmos --prefixo, --saloes e --clientes, senha
+"senha"). O salão vai no Host (<prefixo>-N.<--dominio>), e a conexão é feita
+com o endereço da URL:
+
+    python manage.py gerar_dados_sinteticos --saloes 20 --prefixo carga
+    python -m benchmarks.carga_http --url http://127.0.0.1:8000 --prefixo carga --saloes 20
+"""
+import argparse
+import http.client
+import json
+import math
+import random
+import re
+import statistics
+import threading
+import time as relogio
+from collections import Counter, defaultdict
+from datetime import date
+from http.cookies import SimpleCookie
+from urllib.parse import urlencode, urlsplit
+
+from benchmarks.utils import banco_temporario, configurar_django, cronometro, imprimir_resultado
+
+# Peso de cada fluxo no sorteio da próxima ação, por perfil
+FLUXOS = {
+    'cliente': (('servicos_lista', 3), ('meus_agendamentos', 3), ('agendar_servico', 1)),
+    'admin': (('admin_dashboard', 1), ('gestao_financeiro', 1)),
+}
+
+SERVICO_URL = re.compile(r'/servicos/agendar/(\d+)/')
+
+
+class UsuarioVirtual:
+    """Sessão HTTP de um usuário em um salão; registra a latência de cada requisição"""
+
+    def __init__(self, endereco, host, registrar):
+        self.conexao = http.client.HTTPConnection(endereco.hostname, endereco.port or 80, timeout=30)
+        self.host = host
+        self.registrar = registrar
+        self.cookies = {}
+        self.servicos = []
+
+    def requisitar(self, nome, metodo, caminho, dados=None):
+        """(status, corpo) da requisição, registrada como `nome`; status None em falha de conexão"""
+        cabecalhos = {'Host': self.host}
+        if self.cookies:
+            cabecalhos['Cookie'] = '; '.join(f'{chave}={valor}' for chave, valor in self.cookies.items())
+        corpo = None
+        if dados is not None:
+            dados = {'csrfmiddlewaretoken': self.cookies.get('csrftoken', ''), **dados}
+            corpo = urlencode(dados)
+            cabecalhos['Content-Type'] = 'application/x-www-form-urlencoded'
+
+        inicio = relogio.perf_counter()
+        try:
+            self.conexao.request(metodo, caminho, body=corpo, headers=cabecalhos)
+            resposta = self.conexao.getresponse()
+            conteudo = resposta.read()
+        except (OSError, http.client.HTTPException):
+            self.conexao.close()
+            self.registrar(nome, None, relogio.perf_counter() - inicio)
+            return None, b''
+        self.registrar(nome, resposta.status, relogio.perf_counter() - inicio)
+        for cabecalho in resposta.headers.get_all('Set-Cookie') or ():
+            for chave, morsel in SimpleCookie(cabecalho).items():
+                self.cookies[chave] = morsel.value
+        return resposta.status, conteudo
+
+    def entrar(self, username, senha):
+        self.cookies.clear()
+        self.requisitar('login_pagina', 'GET', '/login/')
+        status, _ = self.requisitar('login', 'POST', '/login/', {'username': username, 'password': senha})
+        # O login bem-sucedido redireciona para o dashboard
+        return status == 302
+
+    def sair(self):
+        self.requisitar('logout', 'GET', '/logout/')
+
+    def servicos_lista(self, sorteio):
+        status, corpo = self.requisitar('servicos_lista', 'GET', '/servicos/')
+        if status == 200:
+            self.servicos = sorted({int(pk) for pk in SERVICO_URL.findall(corpo.decode())})
+
+    def meus_agendamentos(self, sorteio):
+        self.requisitar('meus_agendamentos', 'GET', '/meus-agendamentos/')
+
+    def agendar_servico(self, sorteio):
+        """Reserva um horário livre dos próximos dias; o POST conta como agendar_servico"""
+        if not self.servicos:
+            self.servicos_lista(sorteio)
+            if not self.servicos:
+                return
+        servico = sorteio.choice(self.servicos)
+        status, corpo = self.requisitar(
+            'horarios_disponiveis', 'GET',
+            f'/servicos/agendar/{servico}/horarios/?' + urlencode({'data': date.today().isoformat(), 'dias': 7}),
+        )
+        if status != 200:
+            return
+        opcoes = [
+            (profissional['id'], dia['data'], hora)
+            for dia in json.loads(corpo)['dias']
+            for profissional in dia['profissionais']
+            for hora in profissional['horarios']
+        ]
+        if opcoes:
+            profissional, data, hora = sorteio.choice(opcoes)
+            self.requisitar('agendar_servico', 'POST', f'/servicos/agendar/{servico}/', {
+                'profissional': profissional, 'data': data, 'hora': hora, 'observacoes': '',
+            })
+
+    def admin_dashboard(self, sorteio):
+        self.requisitar('admin_dashboard', 'GET', '/gestao/dashboard/')
+
+    def gestao_financeiro(self, sorteio):
+        mes = date.today().replace(day=1).isoformat()
+        self.requisitar('gestao_financeiro', 'GET', '/gestao/financeiro/?' + urlencode({'data_inicio': mes}))
+
+
+class Registro:
+    """Latências e status por endpoint, compartilhados entre as threads"""
+
+    def __init__(self):
+        self.trava = threading.Lock()
+        self.latencias = defaultdict(list)
+        self.status = defaultdict(Counter)
+        self.ativo = False
+
+    def __call__(self, nome, status, segundos):
+        # Só conta depois do aquecimento
+        if not self.ativo:
+            return
+        with self.trava:
+            self.latencias[nome].append(segundos)
+            self.status[nome][status or 'falha'] += 1
+
+    def resultado(self, segundos):
+        endpoints = {}
+        for nome in sorted(self.latencias):
+            latencias = sorted(self.latencias[nome])
+            status = self.status[nome]
+            erros = sum(quantidade for codigo, quantidade in status.items() if codigo == 'falha' or codigo >= 400)
+            endpoints[nome] = {
+                'requisicoes': len(latencias),
+                'requisicoes_por_segundo': round(len(latencias) / segundos, 1),
+                'taxa_erros': round(erros / len(latencias), 4),
+                'status': {str(codigo): quantidade for codigo, quantidade in sorted(status.items(), key=str)},
+                'latencia_media_ms': round(statistics.fmean(latencias) * 1000, 2),
+                'latencia_p50_ms': round(percentil(latencias, 50) * 1000, 2),
+                'latencia_p95_ms': round(percentil(latencias, 95) * 1000, 2),
+                'latencia_p99_ms': round(percentil(latencias, 99) * 1000, 2),
+            }
+        total = sum(dados['requisicoes'] for dados in endpoints.values())
+        return {
+            'requisicoes': total,
+            'requisicoes_por_segundo': round(total / segundos, 1),
+            'endpoints': endpoints,
+        }
+
+
+def percentil(ordenados, p):
+    """Percentil pelo posto mais próximo de uma lista ordenada"""
+    return ordenados[max(0, math.ceil(p / 100 * len(ordenados)) - 1)]
+
+
+def usuarios_do_salao(subdominio, perfil, clientes):
+    if perfil == 'admin':
+        return [f'{subdominio}-admin']
+    return [f'{subdominio}-cliente{n}' for n in range(1, clientes + 1)]
+
+
+def simular(args, endereco, subdominios, registro, fim, indice):
+    """Um usuário virtual: entra, sorteia ações do perfil e troca de usuário a cada sessão"""
+    sorteio = random.Random(f'{args.semente}:{indice}')
+    perfil = 'admin' if indice < round(args.usuarios * args.proporcao_admin) else 'cliente'
+    fluxos, pesos = zip(*FLUXOS[perfil])
+    while relogio.monotonic() < fim:
+        subdominio = sorteio.choice(subdominios)
+        usuario = UsuarioVirtual(endereco, f'{subdominio}.{args.dominio}:{endereco.port or 80}', registro)
+        if usuario.entrar(sorteio.choice(usuarios_do_salao(subdominio, perfil, args.clientes)), args.senha):
+            for _ in range(args.acoes_por_sessao):
+                if relogio.monotonic() >= fim:
+                    break
+                getattr(usuario, sorteio.choices(fluxos, pesos)[0])(sorteio)
+            usuario.sair()
+        usuario.conexao.close()
+
+
+def executar(args, endereco, subdominios):
+    registro = Registro()
+    inicio = relogio.monotonic()
+    fim = inicio + args.aquecimento + args.segundos
+    threads = [
+        threading.Thread(target=simular, args=(args, endereco, subdominios, registro, fim, indice))
+        for indice in range(args.usuarios)
+    ]
+    for thread in threads:
+        thread.start()
+    relogio.sleep(args.aquecimento)
+    registro.ativo = True
+    with cronometro() as decorrido:
+        for thread in threads:
+            thread.join()
+    return registro.resultado(decorrido())
+
+
+def servidor_local(args):
+    """Gera os salões no banco temporário e sobe o servidor; devolve (endereço, thread)"""
+    from django.contrib.staticfiles.handlers import StaticFilesHandler
+    from django.test.testcases import LiveServerThread
+    from core.dados_sinteticos import GeradorDadosSinteticos
+
+    with cronometro() as decorrido:
+        GeradorDadosSinteticos(
+            saloes=args.saloes, clientes=args.clientes, anos=args.anos, semente=args.semente,
+            prefixo=args.prefixo, senha=args.senha,
+        ).gerar()
+    servidor = LiveServerThread('127.0.0.1', StaticFilesHandler)
+    servidor.daemon = True
+    servidor.start()
+    servidor.is_ready.wait()
+    if servidor.error:
+        raise servidor.error
+    return urlsplit(f'http://127.0.0.1:{servidor.port}'), servidor, round(decorrido(), 1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', help='servidor já no ar (padrão: servidor local com dados gerados)')
+    parser.add_argument('--dominio', default='localhost', help='TENANT_DOMINIO_BASE do servidor')
+    parser.add_argument('--usuarios', type=int, default=16, help='usuários virtuais simultâneos (threads)')
+    parser.add_argument('--proporcao-admin', type=float, default=0.2, help='fração dos usuários que são admins')
+    parser.add_argument('--segundos', type=float, default=30, help='duração da medição')
+    parser.add_argument('--aquecimento', type=float, default=3, help='segundos iniciais descartados')
+    parser.add_argument('--acoes-por-sessao', type=int, default=50)
+    parser.add_argument('--saloes', type=int, default=5)
+    parser.add_argument('--clientes', type=int, default=50, help='clientes por salão')
+    parser.add_argument('--anos', type=float, default=0.5, help='anos de histórico gerados (servidor local)')
+    parser.add_argument('--prefixo', default='carga')
+    parser.add_argument('--senha', default='senha')
+    parser.add_argument('--semente', type=int, default=0)
+    args = parser.parse_args()
+
+    subdominios = [f'{args.prefixo}-{n}' for n in range(1, args.saloes + 1)]
+    parametros = {
+        'usuarios': args.usuarios, 'proporcao_admin': args.proporcao_admin, 'segundos': args.segundos,
+        'saloes': args.saloes, 'clientes_por_salao': args.clientes,
+    }
+    if args.url:
+        resultado = {'servidor': args.url, **parametros, **executar(args, urlsplit(args.url), subdominios)}
+        imprimir_resultado(resultado)
+        return
+
+    configurar_django()
+
+    from django.test import override_settings
+
+    with banco_temporario() as conexao, \
+            override_settings(DEBUG=False, ALLOWED_HOSTS=[f'.{args.dominio}', args.dominio]):
+        endereco, servidor, segundos_geracao = servidor_local(args)
+        try:
+            resultado = {
+                'servidor': 'local', 'banco': conexao.vendor, 'segundos_geracao': segundos_geracao,
+                **parametros, **executar(args, endereco, subdominios),
+            }
+        finally:
+            servidor.terminate()
+        imprimir_resultado(resultado)
+
+
+if __name__ == '__main__':
+    main()
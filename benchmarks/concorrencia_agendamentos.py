@@ -0,0 +1,122 @@
+"""
+Agendamentos concorrentes para um único profissional.
+
+Várias threads tentam reservar horários (com sobreposição proposital) na
+agenda do mesmo profissional. Ao final o benchmark verifica que nenhum par de
+agendamentos ativos se sobrepõe e informa a vazão obtida.
+
+    python -m benchmarks.concorrencia_agendamentos --threads 16 --tentativas 50
+"""
+import argparse
+import random
+import threading
+from collections import Counter
+from datetime import date, time, timedelta
+
+from benchmarks.utils import banco_temporario, configurar_django, cronometro, imprimir_resultado
+
+
+def criar_cenario(dias):
+    from core.models import Salao, Usuario
+    from servicos.models import Modulo, Profissional, Servico
+
+    salao = Salao.objects.create(nome='Salão Benchmark', subdominio='benchmark')
+    modulo = Modulo.objects.create(nome='cabelo')
+    usuario = Usuario.objects.create(username='profissional', salao=salao, tipo='profissional')
+    profissional = Profissional.objects.create(
+        salao=salao, usuario=usuario, horario_inicio=time(9), horario_fim=time(18),
+        trabalha_sabado=True, trabalha_domingo=True,
+    )
+    profissional.modulos.add(modulo)
+    servicos = [
+        Servico.objects.create(salao=salao, nome=f'Serviço {duracao}min', modulo=modulo, preco=50, duracao_minutos=duracao)
+        for duracao in (30, 60, 90)
+    ]
+    clientes = Usuario.objects.bulk_create([
+        Usuario(username=f'cliente{n}', salao=salao) for n in range(20)
+    ])
+    inicio = date.today() + timedelta(days=1)
+    return salao, profissional, servicos, clientes, [inicio + timedelta(days=n) for n in range(dias)]
+
+
+def verificar_sobreposicoes(profissional):
+    from servicos.models import Agendamento
+
+    sobreposicoes = 0
+    ultimo = {}
+    for data, hora, hora_fim in Agendamento.objects.filter(
+        profissional=profissional
+    ).exclude(status='cancelado').order_by('data', 'hora').values_list('data', 'hora', 'hora_fim'):
+        if data in ultimo and hora < ultimo[data]:
+            sobreposicoes += 1
+        ultimo[data] = max(ultimo.get(data, hora_fim), hora_fim)
+    return sobreposicoes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--tentativas', type=int, default=50, help='tentativas de agendamento por thread')
+    parser.add_argument('--dias', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    configurar_django()
+
+    from django.core.exceptions import ValidationError
+    from django.db import DatabaseError, connection
+    from servicos.models import Agendamento
+
+    with banco_temporario() as conexao:
+        salao, profissional, servicos, clientes, dias = criar_cenario(args.dias)
+        horarios = [time(9 + minuto // 60, minuto % 60) for minuto in range(0, 8 * 60 + 1, 30)]
+        contagem = Counter()
+        trava = threading.Lock()
+
+        def trabalhador(indice):
+            sorteio = random.Random(args.seed + indice)
+            local = Counter()
+            try:
+                for _ in range(args.tentativas):
+                    try:
+                        Agendamento(
+                            salao=salao,
+                            cliente=sorteio.choice(clientes),
+                            profissional=profissional,
+                            servico=sorteio.choice(servicos),
+                            data=sorteio.choice(dias),
+                            hora=sorteio.choice(horarios),
+                        ).save()
+                        local['sucesso'] += 1
+                    except ValidationError:
+                        local['conflito'] += 1
+                    except DatabaseError:
+                        local['erro_banco'] += 1
+            finally:
+                connection.close()
+                with trava:
+                    contagem.update(local)
+
+        threads = [threading.Thread(target=trabalhador, args=(n,)) for n in range(args.threads)]
+        with cronometro() as decorrido:
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        total = args.threads * args.tentativas
+        imprimir_resultado({
+            'banco': conexao.vendor,
+            'threads': args.threads,
+            'tentativas': total,
+            'sucesso': contagem['sucesso'],
+            'conflito': contagem['conflito'],
+            'erro_banco': contagem['erro_banco'],
+            'segundos': round(decorrido(), 3),
+            'tentativas_por_segundo': round(total / decorrido(), 1),
+            'sobreposicoes': verificar_sobreposicoes(profissional),
+        })
+
+
+if __name__ == '__main__':
+    main()
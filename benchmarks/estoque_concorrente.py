@@ -0,0 +1,142 @@
+"""
+Movimentações de estoque concorrentes.
+
+Várias threads registram entradas, saídas e ajustes nos mesmos materiais e
+concluem os mesmos agendamentos (disparando a baixa da ficha técnica) ao
+mesmo tempo. Ao final o benchmark verifica que não houve atualização perdida
+(estoque = estoque inicial + soma das movimentações) e que cada agendamento
+teve a ficha técnica baixada uma única vez.
+
+    python -m benchmarks.estoque_concorrente --threads 16 --operacoes 100
+"""
+import argparse
+import random
+import threading
+from collections import Counter
+from datetime import date, time, timedelta
+from decimal import Decimal
+
+from benchmarks.utils import banco_temporario, configurar_django, cronometro, imprimir_resultado
+
+ESTOQUE_INICIAL = Decimal('1000')
+
+
+def criar_cenario(materiais, agendamentos):
+    from core.models import Salao, Usuario
+    from gestao.models import ConsumoMaterial, Material
+    from servicos.models import Agendamento, Modulo, Profissional, Servico
+
+    salao = Salao.objects.create(nome='Salão Benchmark', subdominio='benchmark')
+    modulo = Modulo.objects.create(nome='cabelo')
+    usuario = Usuario.objects.create(username='profissional', salao=salao, tipo='profissional')
+    cliente = Usuario.objects.create(username='cliente', salao=salao)
+    profissional = Profissional.objects.create(
+        salao=salao, usuario=usuario, horario_inicio=time(0), horario_fim=time(23, 59),
+        trabalha_sabado=True, trabalha_domingo=True,
+    )
+    profissional.modulos.add(modulo)
+    servico = Servico.objects.create(salao=salao, nome='Coloração', modulo=modulo, preco=150, duracao_minutos=30)
+    lista_materiais = [
+        Material.objects.create(salao=salao, nome=f'Material {n}', modulo='cabelo', quantidade=ESTOQUE_INICIAL)
+        for n in range(materiais)
+    ]
+    for material in lista_materiais:
+        ConsumoMaterial.objects.create(salao=salao, servico=servico, material=material, quantidade=Decimal('0.5'))
+
+    inicio = date.today() + timedelta(days=1)
+    lista_agendamentos = [
+        Agendamento.objects.create(
+            salao=salao, cliente=cliente, profissional=profissional, servico=servico,
+            data=inicio + timedelta(days=n // 40), hora=time((n % 40) // 2, 30 * (n % 2)),
+        )
+        for n in range(agendamentos)
+    ]
+    return lista_materiais, lista_agendamentos
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--operacoes', type=int, default=100, help='operações por thread')
+    parser.add_argument('--materiais', type=int, default=3)
+    parser.add_argument('--agendamentos', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    configurar_django()
+
+    from django.core.exceptions import ValidationError
+    from django.db import DatabaseError, connection
+    from gestao.estoque import registrar_movimentacao, saldo_por_movimentacoes
+    from gestao.models import Material, MovimentacaoEstoque
+    from servicos.models import Agendamento
+
+    with banco_temporario() as conexao:
+        materiais, agendamentos = criar_cenario(args.materiais, args.agendamentos)
+        contagem = Counter()
+        trava = threading.Lock()
+
+        def trabalhador(indice):
+            sorteio = random.Random(args.seed + indice)
+            local = Counter()
+            try:
+                for _ in range(args.operacoes):
+                    operacao = sorteio.choices(('entrada', 'saida', 'ajuste', 'conclusao'), weights=(40, 40, 5, 15))[0]
+                    try:
+                        if operacao == 'conclusao':
+                            agendamento = Agendamento._base_manager.get(pk=sorteio.choice(agendamentos).pk)
+                            agendamento.status = 'concluido'
+                            agendamento.save()
+                        else:
+                            # Instância possivelmente desatualizada, como a de um formulário aberto há tempo
+                            material = sorteio.choice(materiais)
+                            quantidade = Decimal(sorteio.randint(1, 2000)) / 100
+                            if operacao == 'ajuste':
+                                quantidade += ESTOQUE_INICIAL
+                            registrar_movimentacao(material, operacao, quantidade)
+                        local[operacao] += 1
+                    except ValidationError:
+                        local['recusada'] += 1
+                    except DatabaseError:
+                        local['erro_banco'] += 1
+            finally:
+                connection.close()
+                with trava:
+                    contagem.update(local)
+
+        threads = [threading.Thread(target=trabalhador, args=(n,)) for n in range(args.threads)]
+        with cronometro() as decorrido:
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        atualizacoes_perdidas = sum(
+            Material._base_manager.get(pk=material.pk).quantidade != ESTOQUE_INICIAL + saldo_por_movimentacoes(material)
+            for material in materiais
+        )
+        concluidos = Agendamento._base_manager.filter(status='concluido').count()
+        baixas = MovimentacaoEstoque._base_manager.exclude(agendamento=None).count()
+
+        total = args.threads * args.operacoes
+        imprimir_resultado({
+            'banco': conexao.vendor,
+            'threads': args.threads,
+            'operacoes': total,
+            'entradas': contagem['entrada'],
+            'saidas': contagem['saida'],
+            'ajustes': contagem['ajuste'],
+            'conclusoes': contagem['conclusao'],
+            'recusadas': contagem['recusada'],
+            'erro_banco': contagem['erro_banco'],
+            'segundos': round(decorrido(), 3),
+            'operacoes_por_segundo': round(total / decorrido(), 1),
+            'materiais_com_atualizacao_perdida': atualizacoes_perdidas,
+            'agendamentos_concluidos': concluidos,
+            'baixas_esperadas': concluidos * args.materiais,
+            'baixas_registradas': baixas,
+        })
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,123 @@
+"""
+Exportação em streaming de um livro-caixa grande.
+
+Popula um salão com N transações (1 milhão por padrão), gera a exportação
+CSV ou XLSX consumindo o gerador da resposta pedaço a pedaço e informa a
+vazão e o pico de memória residente (RSS) durante a exportação, que deve
+ficar estável independentemente do número de linhas.
+
+    python -m benchmarks.exportacao --linhas 1000000 --formato csv
+"""
+import argparse
+import os
+import random
+import resource
+import threading
+from datetime import date, timedelta
+from decimal import Decimal
+
+from benchmarks.utils import banco_temporario, configurar_django, cronometro, imprimir_resultado
+
+
+def rss_atual():
+    """Memória residente atual do processo em bytes (Linux) ou o pico, se indisponível"""
+    try:
+        with open('/proc/self/statm') as arquivo:
+            return int(arquivo.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class MonitorRSS(threading.Thread):
+    """Amostra o RSS periodicamente e guarda o maior valor observado"""
+
+    def __init__(self, intervalo=0.05):
+        super().__init__(daemon=True)
+        self.intervalo = intervalo
+        self.pico = rss_atual()
+        self.parar = threading.Event()
+
+    def run(self):
+        while not self.parar.wait(self.intervalo):
+            self.pico = max(self.pico, rss_atual())
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.parar.set()
+        self.join()
+        self.pico = max(self.pico, rss_atual())
+
+
+def popular(salao, linhas, lote, seed):
+    from gestao.models import Transacao
+
+    sorteio = random.Random(seed)
+    categorias = [codigo for codigo, _ in Transacao.CATEGORIA_CHOICES]
+    inicio = date.today() - timedelta(days=365)
+    criadas = 0
+    while criadas < linhas:
+        quantidade = min(lote, linhas - criadas)
+        Transacao._base_manager.bulk_create([
+            Transacao(
+                salao=salao,
+                tipo=sorteio.choice(('receita', 'despesa')),
+                categoria=sorteio.choice(categorias),
+                descricao=f'Lançamento {criadas + n}',
+                valor=Decimal(sorteio.randint(100, 100000)) / 100,
+                data=inicio + timedelta(days=sorteio.randrange(365)),
+                pago=sorteio.random() < 0.8,
+            )
+            for n in range(quantidade)
+        ])
+        criadas += quantidade
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--linhas', type=int, default=1_000_000)
+    parser.add_argument('--formato', choices=('csv', 'xlsx'), default='csv')
+    parser.add_argument('--lote', type=int, default=10_000, help='tamanho dos lotes de inserção')
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    configurar_django()
+
+    from core.models import Salao
+    from gestao.exportacao import FORMATOS, TAMANHO_LOTE, cabecalho, linhas_exportacao
+
+    with banco_temporario() as conexao:
+        salao = Salao.objects.create(nome='Salão Benchmark', subdominio='benchmark')
+        with cronometro() as tempo_carga:
+            popular(salao, args.linhas, args.lote, args.seed)
+
+        gerar, _ = FORMATOS[args.formato]
+        rss_inicial = rss_atual()
+        total_bytes = 0
+        pedacos = 0
+        with MonitorRSS() as monitor, cronometro() as decorrido:
+            for pedaco in gerar(cabecalho('transacoes'), linhas_exportacao('transacoes', salao)):
+                total_bytes += len(pedaco)
+                pedacos += 1
+
+        mb = 1024 * 1024
+        imprimir_resultado({
+            'banco': conexao.vendor,
+            'formato': args.formato,
+            'linhas': args.linhas,
+            'tamanho_lote_leitura': TAMANHO_LOTE,
+            'segundos_carga': round(tempo_carga(), 3),
+            'segundos_exportacao': round(decorrido(), 3),
+            'linhas_por_segundo': round(args.linhas / decorrido(), 1),
+            'mb_gerados': round(total_bytes / mb, 2),
+            'pedacos': pedacos,
+            'rss_inicial_mb': round(rss_inicial / mb, 1),
+            'rss_pico_mb': round(monitor.pico / mb, 1),
+            'rss_acrescimo_mb': round((monitor.pico - rss_inicial) / mb, 1),
+        })
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+"""
+Vazão da fila de tarefas (fila.tarefas) com um ou mais workers.
+
+Grava --tarefas tarefas vazias, de vários salões, e mede quanto tempo
+--workers processos (cada um com um Trabalhador e o seu pool de
+--concorrencia threads ou processos) levam para esvaziar a fila. A soma das
+tentativas confere que nenhuma tarefa foi reservada por dois workers.
+Também mede a vazão do enfileiramento pelo on_commit, uma tarefa por vez.
+
+    python -m benchmarks.fila_tarefas --tarefas 20000 --workers 2 --lote 500
+"""
+import argparse
+import multiprocessing
+import sys
+
+from benchmarks.utils import banco_temporario, configurar_django, cronometro, imprimir_resultado
+
+
+def trabalhar(args):
+    from fila.trabalhador import Trabalhador
+
+    Trabalhador(pool=args.pool, concorrencia=args.concorrencia, lote=args.lote).executar(ate_esvaziar=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--tarefas', type=int, default=20000)
+    parser.add_argument('--enfileiradas', type=int, default=2000, help='tarefas do teste de enfileiramento')
+    parser.add_argument('--saloes', type=int, default=20)
+    parser.add_argument('--workers', type=int, default=1, help='processos worker simultâneos')
+    parser.add_argument('--pool', choices=('threads', 'processos'), default='threads')
+    parser.add_argument('--concorrencia', type=int, default=4)
+    parser.add_argument('--lote', type=int, default=500)
+    args = parser.parse_args()
+
+    configurar_django()
+
+    from django.db import connections, transaction
+    from django.db.models import Sum
+    from core.models import Salao
+    from core.utils import usar_salao
+    from fila.models import Tarefa
+    from fila.tarefas import tarefa
+
+    @tarefa(nome='benchmark.vazia')
+    def vazia(numero):
+        pass
+
+    with banco_temporario() as conexao:
+        saloes = Salao.objects.bulk_create(
+            Salao(nome=f'Salão {n}', subdominio=f'salao{n}') for n in range(args.saloes)
+        )
+
+        with cronometro() as decorrido:
+            for numero in range(args.enfileiradas):
+                with usar_salao(saloes[numero % len(saloes)]), transaction.atomic():
+                    vazia.enfileirar(numero=numero)
+        enfileiramento = round(args.enfileiradas / decorrido())
+
+        Tarefa.objects.bulk_create(
+            (
+                Tarefa(nome='benchmark.vazia', argumentos={'numero': numero}, salao_id=saloes[numero % len(saloes)].id)
+                for numero in range(args.tarefas)
+            ),
+            batch_size=5000,
+        )
+        total = Tarefa.objects.count()
+
+        # Os workers (fork) abrem as próprias conexões
+        connections.close_all()
+        workers = [multiprocessing.Process(target=trabalhar, args=(args,)) for _ in range(args.workers)]
+        with cronometro() as decorrido:
+            for worker in workers:
+                worker.start()
+            for worker in workers:
+                worker.join()
+        segundos = decorrido()
+
+        if any(worker.exitcode for worker in workers):
+            sys.exit('Um dos workers terminou com erro.')
+        concluidas = Tarefa.objects.filter(status='concluida').count()
+        tentativas = Tarefa.objects.aggregate(soma=Sum('tentativas'))['soma']
+        imprimir_resultado({
+            'banco': conexao.vendor,
+            'workers': args.workers,
+            'pool': args.pool,
+            'concorrencia': args.concorrencia,
+            'lote': args.lote,
+            'enfileiradas_por_segundo': enfileiramento,
+            'tarefas': total,
+            'concluidas': concluidas,
+            'reservas_repetidas': tentativas - total,
+            'segundos': round(segundos, 2),
+            'tarefas_por_segundo': round(concluidas / segundos),
+        })
+
+
+if __name__ == '__main__':
+    main()
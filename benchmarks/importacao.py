@@ -0,0 +1,92 @@
+"""
+Importação em massa de transações via CSV.
+
+Gera um CSV com N transações (100 mil por padrão), importa com
+gestao.importacao.importar_csv e compara com o caminho antigo (um
+TransacaoForm + save() por linha) medido em uma amostra e extrapolado.
+
+    python -m benchmarks.importacao --linhas 100000 --amostra 2000
+"""
+import argparse
+import io
+import random
+from datetime import date, timedelta
+
+from benchmarks.utils import banco_temporario, configurar_django, cronometro, imprimir_resultado
+
+
+def gerar_csv(linhas, seed):
+    sorteio = random.Random(seed)
+    inicio = date.today() - timedelta(days=365)
+    categorias = ('servico', 'fornecedor', 'salario', 'aluguel', 'conta', 'outro')
+    saida = io.StringIO()
+    saida.write('tipo,categoria,descricao,valor,data,pago\n')
+    for n in range(linhas):
+        saida.write(
+            f'{sorteio.choice(("receita", "despesa"))},{sorteio.choice(categorias)},Lançamento {n},'
+            f'{sorteio.randint(100, 100000) / 100:.2f},{inicio + timedelta(days=sorteio.randrange(365))},'
+            f'{sorteio.choice(("sim", "não"))}\n'
+        )
+    return saida.getvalue().encode()
+
+
+def linha_a_linha(conteudo, salao):
+    """Caminho anterior: um formulário e um save() (com signals) por linha"""
+    import csv
+
+    from gestao.forms import TransacaoForm
+
+    for linha in csv.DictReader(io.StringIO(conteudo.decode())):
+        linha['pago'] = linha['pago'] == 'sim'
+        form = TransacaoForm(linha)
+        if form.is_valid():
+            transacao = form.save(commit=False)
+            transacao.salao = salao
+            transacao.save()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--linhas', type=int, default=100_000)
+    parser.add_argument('--amostra', type=int, default=2000, help='linhas importadas uma a uma para comparação')
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    configurar_django()
+
+    from core.models import Salao
+    from gestao.financeiro import verificar_resumo
+    from gestao.importacao import TAMANHO_LOTE, importar_csv
+
+    with banco_temporario() as conexao:
+        salao = Salao.objects.create(nome='Salão Benchmark', subdominio='benchmark')
+        conteudo = gerar_csv(args.linhas, args.seed)
+
+        with cronometro() as simulacao:
+            importar_csv(io.BytesIO(conteudo), 'transacoes', salao, simular=True)
+        with cronometro() as importacao:
+            resultado = importar_csv(io.BytesIO(conteudo), 'transacoes', salao)
+
+        outro = Salao.objects.create(nome='Salão Comparação', subdominio='comparacao')
+        with cronometro() as antigo:
+            linha_a_linha(gerar_csv(args.amostra, args.seed), outro)
+        estimativa_antiga = antigo() / args.amostra * args.linhas
+
+        imprimir_resultado({
+            'banco': conexao.vendor,
+            'linhas': args.linhas,
+            'tamanho_lote': TAMANHO_LOTE,
+            'importadas': resultado.importadas,
+            'erros': resultado.total_erros,
+            'segundos_simulacao': round(simulacao(), 3),
+            'segundos_importacao': round(importacao(), 3),
+            'linhas_por_segundo': round(args.linhas / importacao(), 1),
+            'linha_a_linha_amostra': args.amostra,
+            'linha_a_linha_segundos_estimados': round(estimativa_antiga, 1),
+            'aceleracao': round(estimativa_antiga / importacao(), 1),
+            'resumo_confere': not verificar_resumo(salao),
+        })
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,235 @@
+"""
+Latência do dashboard administrativo e do financeiro com e sem particionamento por data.
+
+Gera no próprio PostgreSQL, com generate_series, --linhas agendamentos e
+--linhas transações (10 milhões de cada por padrão), distribuídos entre
+--saloes salões ao longo de --anos anos até três meses à frente. O mesmo
+banco é medido antes e depois da conversão das tabelas (core.particionamento):
+
+    sem_particionamento  tabelas comuns, com os índices dos modelos
+    particionado         uma partição por mês ou por ano (--granularidade)
+
+Em cada modo são feitas requisições ao dashboard administrativo e ao
+financeiro filtrado pelo mês atual, de salões sorteados, com o cache do
+dashboard descartado antes de cada uma. As consultas (TenantManager) são as
+mesmas nos dois modos. O resultado inclui também o tempo da conversão e as
+partições lidas pela contagem de agendamentos do mês.
+
+Requer o perfil PostgreSQL (DB_ENGINE=postgresql, ver .env.exemplo) e
+espaço em disco para duas cópias das tabelas, já que a conversão as copia.
+Por exemplo:
+
+    docker run --rm -e POSTGRES_PASSWORD=senha -p 5432:5432 postgres:16
+    DB_ENGINE=postgresql DB_USER=postgres DB_PASSWORD=senha \\
+        python -m benchmarks.particionamento --linhas 10000000 --granularidade mensal
+"""
+import argparse
+import math
+import random
+import re
+import statistics
+import sys
+import time as relogio
+from datetime import date, time, timedelta
+
+from benchmarks.utils import banco_temporario, configurar_django, cronometro, imprimir_resultado
+
+# Horários de 30 minutos entre 8h e 20h
+HORARIOS_POR_DIA = 24
+
+AGENDAMENTOS_SQL = """
+INSERT INTO servicos_agendamento (
+    salao_id, cliente_id, profissional_id, servico_id, data, hora, hora_fim,
+    status, observacoes, criado_em, atualizado_em
+)
+SELECT
+    saloes[s + 1],
+    clientes[s * %(clientes)s + k %% %(clientes)s + 1],
+    profissionais[s * %(profissionais)s + (k %% %(por_dia)s) / 24 + 1],
+    servicos[s + 1],
+    %(inicio)s::date + (k / %(por_dia)s)::int,
+    time '08:00' + ((k %% %(por_dia)s) %% 24) * interval '30 minutes',
+    time '08:30' + ((k %% %(por_dia)s) %% 24) * interval '30 minutes',
+    CASE k %% 10 WHEN 0 THEN 'cancelado' WHEN 1 THEN 'pendente' ELSE 'concluido' END,
+    '', now(), now()
+FROM
+    generate_series(0, %(linhas)s - 1) AS n,
+    LATERAL (SELECT n %% %(saloes)s AS s, n / %(saloes)s AS k) AS posicao,
+    (SELECT %(saloes_ids)s::int[] AS saloes, %(clientes_ids)s::int[] AS clientes,
+            %(profissionais_ids)s::int[] AS profissionais, %(servicos_ids)s::int[] AS servicos) AS ids
+"""
+
+TRANSACOES_SQL = """
+INSERT INTO gestao_transacao (
+    salao_id, tipo, categoria, descricao, valor, data, pago, observacoes, criado_em, atualizado_em
+)
+SELECT
+    saloes[s + 1],
+    CASE WHEN k %% 4 = 0 THEN 'despesa' ELSE 'receita' END,
+    CASE WHEN k %% 4 = 0 THEN 'fornecedor' ELSE 'servico' END,
+    'Transação ' || n, 10 + k %% 90, %(inicio)s::date + (k::bigint * %(dias)s / %(por_salao)s)::int,
+    k %% 3 <> 0, '', now(), now()
+FROM
+    generate_series(0, %(linhas)s - 1) AS n,
+    LATERAL (SELECT n %% %(saloes)s AS s, n / %(saloes)s AS k) AS posicao,
+    (SELECT %(saloes_ids)s::int[] AS saloes) AS ids
+"""
+
+
+def criar_cenario(args):
+    """Salões com admin, serviço, profissionais e clientes; linhas geradas no banco"""
+    from django.db import connection
+    from core.models import Salao, Usuario
+    from gestao.financeiro import recalcular_resumo
+    from servicos.models import Modulo, Profissional, Servico
+
+    dias = args.anos * 365
+    # Agendamentos por salão e por dia, sem sobreposição na agenda de cada profissional
+    por_dia = math.ceil(args.linhas / (args.saloes * dias))
+    quantidade_profissionais = math.ceil(por_dia / HORARIOS_POR_DIA)
+    modulo = Modulo.objects.create(nome='cabelo')
+
+    saloes, admins, servicos, profissionais, clientes = [], [], [], [], []
+    for n in range(args.saloes):
+        salao = Salao.objects.create(nome=f'Salão {n}', subdominio=f'salao{n}')
+        saloes.append(salao)
+        admins.append(Usuario.objects.create(username=f'admin{n}', salao=salao, tipo='admin', is_staff=True))
+        servicos.append(Servico.objects.create(salao=salao, nome='Corte', modulo=modulo, preco=50, duracao_minutos=30))
+        for p in range(quantidade_profissionais):
+            usuario = Usuario.objects.create(username=f'profissional{n}-{p}', salao=salao, tipo='profissional')
+            profissionais.append(Profissional.objects.create(
+                salao=salao, usuario=usuario, horario_inicio=time(8), horario_fim=time(20),
+                trabalha_sabado=True, trabalha_domingo=True,
+            ))
+        clientes.extend(Usuario.objects.bulk_create(
+            Usuario(username=f'cliente{n}-{c}', salao=salao) for c in range(args.clientes)
+        ))
+
+    inicio = date.today() + timedelta(days=90) - timedelta(days=dias)
+    parametros = {
+        'linhas': args.linhas, 'saloes': args.saloes, 'clientes': args.clientes,
+        'profissionais': quantidade_profissionais, 'por_dia': por_dia, 'inicio': inicio, 'dias': dias,
+        'por_salao': math.ceil(args.linhas / args.saloes),
+        'saloes_ids': [salao.pk for salao in saloes], 'clientes_ids': [cliente.pk for cliente in clientes],
+        'profissionais_ids': [profissional.pk for profissional in profissionais],
+        'servicos_ids': [servico.pk for servico in servicos],
+    }
+    with cronometro() as decorrido, connection.cursor() as cursor:
+        cursor.execute(AGENDAMENTOS_SQL, parametros)
+        cursor.execute(TRANSACOES_SQL, parametros)
+    for salao in saloes:
+        recalcular_resumo(salao)
+    return admins, round(decorrido(), 1)
+
+
+def analisar():
+    from django.db import connection
+
+    with connection.cursor() as cursor:
+        cursor.execute('ANALYZE servicos_agendamento')
+        cursor.execute('ANALYZE gestao_transacao')
+
+
+def particoes_lidas(salao_id):
+    """Partições de agendamentos no plano da contagem do mês de um salão"""
+    from django.db import connection
+    from core.utils import usar_salao
+    from core.models import Salao
+    from servicos.models import Agendamento
+
+    with usar_salao(Salao.objects.get(pk=salao_id)):
+        sql, params = Agendamento.objects.filter(data__gte=date.today().replace(day=1)).query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN SELECT count(*) FROM ({sql}) AS mes', params)
+        plano = '\n'.join(linha for linha, in cursor.fetchall())
+    return sorted(set(re.findall(r'\bon (servicos_agendamento\w*)', plano)))
+
+
+def medir(clientes, requisicoes):
+    """Latência de cada página, com o cache do dashboard vazio a cada requisição"""
+    from django.urls import reverse
+    from gestao.dashboard import invalidar_dashboard
+
+    sorteio = random.Random(0)
+    mes = date.today().replace(day=1).isoformat()
+    paginas = {
+        'admin_dashboard': reverse('admin_dashboard'),
+        'gestao_financeiro': f"{reverse('gestao_financeiro')}?data_inicio={mes}",
+    }
+    resultado = {}
+    for nome, caminho in paginas.items():
+        latencias = []
+        for _ in range(requisicoes):
+            salao_id, client = sorteio.choice(clientes)
+            invalidar_dashboard(salao_id)
+            inicio = relogio.perf_counter()
+            resposta = client.get(caminho)
+            latencias.append(relogio.perf_counter() - inicio)
+            if resposta.status_code != 200:
+                sys.exit(f'{caminho}: status {resposta.status_code}')
+        latencias.sort()
+        resultado[nome] = {
+            'latencia_media_ms': round(statistics.fmean(latencias) * 1000, 2),
+            'latencia_p50_ms': round(latencias[len(latencias) // 2] * 1000, 2),
+            'latencia_p95_ms': round(latencias[int(len(latencias) * 0.95)] * 1000, 2),
+        }
+    return resultado
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--linhas', type=int, default=10_000_000, help='agendamentos e também transações')
+    parser.add_argument('--saloes', type=int, default=100)
+    parser.add_argument('--clientes', type=int, default=20, help='clientes por salão')
+    parser.add_argument('--anos', type=int, default=5)
+    parser.add_argument('--granularidade', choices=('mensal', 'anual'), default='mensal')
+    parser.add_argument('--requisicoes', type=int, default=200, help='requisições por página em cada modo')
+    args = parser.parse_args()
+
+    configurar_django()
+
+    from django.db import connection
+    from django.test import Client, override_settings
+    from core import particionamento
+
+    if connection.vendor != 'postgresql':
+        sys.exit('Este benchmark requer o perfil PostgreSQL (DB_ENGINE=postgresql).')
+
+    # O banco é migrado sem particionamento; a conversão é medida abaixo
+    with override_settings(PARTICIONAMENTO=''), banco_temporario() as conexao, \
+            override_settings(DEBUG=False, ALLOWED_HOSTS=['localhost']):
+        admins, segundos_geracao = criar_cenario(args)
+        clientes = []
+        for admin in admins:
+            client = Client(HTTP_HOST='localhost')
+            client.force_login(admin)
+            clientes.append((admin.salao_id, client))
+
+        resultado = {
+            'banco': conexao.vendor,
+            'linhas_por_tabela': args.linhas,
+            'saloes': args.saloes,
+            'segundos_geracao': segundos_geracao,
+        }
+        analisar()
+        medir(clientes, min(20, args.requisicoes))
+        resultado['sem_particionamento'] = medir(clientes, args.requisicoes)
+
+        with override_settings(PARTICIONAMENTO=args.granularidade):
+            ate = particionamento.horizonte(date.today(), args.granularidade)
+            with cronometro() as decorrido:
+                for modelo in particionamento.modelos_particionados():
+                    particionamento.converter(conexao, modelo._meta.db_table, args.granularidade, ate)
+            analisar()
+            medir(clientes, min(20, args.requisicoes))
+            resultado['particionado'] = {
+                'granularidade': args.granularidade,
+                'segundos_conversao': round(decorrido(), 1),
+                'particoes_lidas_agendamentos_do_mes': particoes_lidas(admins[0].salao_id),
+                **medir(clientes, args.requisicoes),
+            }
+        imprimir_resultado(resultado)
+
+
+if __name__ == '__main__':
+    main()
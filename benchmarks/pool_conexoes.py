@@ -0,0 +1,202 @@
+"""
+Requisições por segundo nos dashboards com e sem reaproveitamento de conexões.
+
+Várias threads fazem requisições ao dashboard do cliente (core) e ao
+dashboard administrativo (gestao) pelo WSGIHandler do Django, como um
+servidor WSGI com threads: cada requisição passa pelos signals
+request_started/request_finished, que fecham, mantêm ou devolvem ao pool a
+conexão conforme a configuração. O mesmo cenário é medido em cada modo:
+
+    sem_persistencia  CONN_MAX_AGE = 0: uma conexão nova por requisição
+    persistente       CONN_MAX_AGE + CONN_HEALTH_CHECKS: uma conexão por thread
+    pool              pool de conexões do psycopg 3 (OPTIONS['pool'])
+
+Requer o perfil PostgreSQL (DB_ENGINE=postgresql, ver .env.exemplo). Um
+PostgreSQL local faz o papel do servidor de produção, por exemplo:
+
+    docker run --rm -e POSTGRES_PASSWORD=senha -p 5432:5432 postgres:16
+    DB_ENGINE=postgresql DB_USER=postgres DB_PASSWORD=senha \\
+        python -m benchmarks.pool_conexoes --threads 8 --segundos 10
+"""
+import argparse
+import statistics
+import sys
+import threading
+import time as relogio
+from datetime import date, time, timedelta
+from wsgiref.util import setup_testing_defaults
+
+from benchmarks.utils import banco_temporario, configurar_django, cronometro, imprimir_resultado
+
+MODOS = ('sem_persistencia', 'persistente', 'pool')
+
+
+def criar_cenario(clientes, agendamentos):
+    from core.models import Salao, Usuario
+    from gestao.financeiro import recalcular_resumo
+    from gestao.models import Transacao
+    from servicos.models import Agendamento, Modulo, Profissional, Servico
+
+    salao = Salao.objects.create(nome='Salão Benchmark', subdominio='benchmark')
+    modulo = Modulo.objects.create(nome='cabelo')
+    admin = Usuario.objects.create(username='admin', salao=salao, tipo='admin', is_staff=True)
+    usuario = Usuario.objects.create(username='profissional', first_name='Ana', salao=salao, tipo='profissional')
+    profissional = Profissional.objects.create(salao=salao, usuario=usuario, horario_inicio=time(8), horario_fim=time(20))
+    profissional.modulos.add(modulo)
+    servico = Servico.objects.create(salao=salao, nome='Corte', modulo=modulo, preco=50, duracao_minutos=30)
+    lista_clientes = Usuario.objects.bulk_create(
+        Usuario(username=f'cliente{n}', salao=salao) for n in range(clientes)
+    )
+
+    inicio = date.today() - timedelta(days=agendamentos // 48)
+    lista_agendamentos = []
+    for n in range(agendamentos):
+        hora = time(8 + (n % 24) // 2, 30 * (n % 2))
+        lista_agendamentos.append(Agendamento(
+            salao=salao, cliente=lista_clientes[n % clientes], profissional=profissional, servico=servico,
+            data=inicio + timedelta(days=n // 24), hora=hora,
+            hora_fim=Agendamento.calcular_hora_fim(hora, servico.duracao_minutos),
+        ))
+    Agendamento._base_manager.bulk_create(lista_agendamentos, batch_size=1000)
+    Transacao._base_manager.bulk_create(
+        (
+            Transacao(
+                salao=salao, tipo='receita', categoria='servico', descricao=f'Receita {n}',
+                valor=50, data=inicio + timedelta(days=n // 24), pago=n % 3 != 0,
+            )
+            for n in range(agendamentos)
+        ),
+        batch_size=1000,
+    )
+    recalcular_resumo(salao)
+    return admin, lista_clientes
+
+
+def configurar_modo(modo, threads):
+    """Aplica o modo às configurações da conexão usada pelas novas threads"""
+    from django.db import connections
+
+    conexao = connections['default']
+    conexao.close()
+    conexao.close_pool()
+    # As conexões de cada thread são criadas a partir deste mesmo dicionário
+    configuracao = conexao.settings_dict
+    configuracao['OPTIONS'].pop('pool', None)
+    configuracao['CONN_MAX_AGE'] = 600 if modo == 'persistente' else 0
+    configuracao['CONN_HEALTH_CHECKS'] = modo == 'persistente'
+    if modo == 'pool':
+        configuracao['OPTIONS']['pool'] = {'min_size': threads, 'max_size': threads, 'timeout': 30}
+
+
+def requisitar(handler, caminho, cookie):
+    """Uma requisição GET pelo WSGIHandler; retorna o status HTTP"""
+    environ = {'PATH_INFO': caminho, 'HTTP_HOST': 'localhost', 'HTTP_COOKIE': cookie}
+    setup_testing_defaults(environ)
+    status = []
+    resposta = handler(environ, lambda linha, cabecalhos, exc_info=None: status.append(linha))
+    try:
+        for _ in resposta:
+            pass
+    finally:
+        # Dispara request_finished, que fecha ou devolve a conexão
+        resposta.close()
+    return int(status[0].split()[0])
+
+
+def medir(handler, roteiros, threads, segundos):
+    """Executa os roteiros (caminho, cookie) em paralelo por `segundos`"""
+    from django.db import connection
+
+    latencias = []
+    erros = []
+    trava = threading.Lock()
+    limite = relogio.perf_counter() + segundos
+
+    def trabalhador(indice):
+        locais, falhas = [], 0
+        try:
+            n = indice
+            while relogio.perf_counter() < limite:
+                caminho, cookie = roteiros[n % len(roteiros)]
+                inicio = relogio.perf_counter()
+                if requisitar(handler, caminho, cookie) != 200:
+                    falhas += 1
+                locais.append(relogio.perf_counter() - inicio)
+                n += 1
+        finally:
+            connection.close()
+            with trava:
+                latencias.extend(locais)
+                erros.append(falhas)
+
+    lista = [threading.Thread(target=trabalhador, args=(n,)) for n in range(threads)]
+    with cronometro() as decorrido:
+        for thread in lista:
+            thread.start()
+        for thread in lista:
+            thread.join()
+
+    latencias.sort()
+    return {
+        'requisicoes': len(latencias),
+        'erros': sum(erros),
+        'requisicoes_por_segundo': round(len(latencias) / decorrido(), 1),
+        'latencia_media_ms': round(statistics.fmean(latencias) * 1000, 2) if latencias else None,
+        'latencia_p95_ms': round(latencias[int(len(latencias) * 0.95)] * 1000, 2) if latencias else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--segundos', type=float, default=10, help='duração de cada modo')
+    parser.add_argument('--clientes', type=int, default=50)
+    parser.add_argument('--agendamentos', type=int, default=5000)
+    parser.add_argument('--modos', nargs='+', choices=MODOS, default=list(MODOS))
+    args = parser.parse_args()
+
+    configurar_django()
+
+    from django.conf import settings
+    from django.core.handlers.wsgi import WSGIHandler
+    from django.db import connection
+    from django.test import Client, override_settings
+    from django.urls import reverse
+
+    if connection.vendor != 'postgresql':
+        sys.exit('Este benchmark requer o perfil PostgreSQL (DB_ENGINE=postgresql).')
+    from django.db.backends.postgresql.psycopg_any import is_psycopg3
+
+    with banco_temporario() as conexao, override_settings(DEBUG=False, ALLOWED_HOSTS=['localhost']):
+        admin, clientes = criar_cenario(args.clientes, args.agendamentos)
+
+        # Sessões criadas uma vez; as requisições só enviam o cookie
+        roteiros = []
+        for usuario, caminho in [(admin, reverse('admin_dashboard'))] + [
+            (cliente, reverse('dashboard')) for cliente in clientes
+        ]:
+            client = Client()
+            client.force_login(usuario)
+            roteiros.append((caminho, f'{settings.SESSION_COOKIE_NAME}={client.cookies[settings.SESSION_COOKIE_NAME].value}'))
+
+        handler = WSGIHandler()
+        resultado = {
+            'banco': conexao.vendor,
+            'threads': args.threads,
+            'segundos_por_modo': args.segundos,
+        }
+        for modo in args.modos:
+            if modo == 'pool' and not is_psycopg3:
+                resultado[modo] = 'indisponível: o pool requer psycopg 3'
+                continue
+            configurar_modo(modo, args.threads)
+            # Aquecimento: caches do processo e, no modo pool, abertura das conexões
+            medir(handler, roteiros, args.threads, min(1, args.segundos))
+            resultado[modo] = medir(handler, roteiros, args.threads, args.segundos)
+
+        configurar_modo('sem_persistencia', args.threads)
+        imprimir_resultado(resultado)
+
+
+if __name__ == '__main__':
+    main()
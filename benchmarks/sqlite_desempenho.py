@@ -0,0 +1,133 @@
+"""
+Gravações concorrentes de agendamentos no SQLite, com e sem o perfil de desempenho.
+
+Cada thread reserva horários livres na agenda do seu próprio profissional,
+de modo que não há conflito de horário: o benchmark mede só a disputa pelo
+lock de escrita do arquivo. O mesmo cenário roda em um banco novo para cada
+modo:
+
+    padrao       configuração padrão do Django (journal DELETE, BEGIN DEFERRED)
+    desempenho   SQLITE_OPCOES_DESEMPENHO (WAL, synchronous=NORMAL,
+                 busy_timeout, BEGIN IMMEDIATE; ver config/settings.py)
+
+Erros "database is locked" aparecem em erro_banco.
+
+    python -m benchmarks.sqlite_desempenho --threads 16 --agendamentos 100
+"""
+import argparse
+import sys
+import threading
+from collections import Counter
+from datetime import date, time, timedelta
+
+from benchmarks.utils import banco_temporario, configurar_django, cronometro, imprimir_resultado
+
+MODOS = ('padrao', 'desempenho')
+
+# Horários de 30 minutos entre 9h e 18h
+HORARIOS = [time(9 + minuto // 60, minuto % 60) for minuto in range(0, 9 * 60, 30)]
+
+
+def criar_cenario(profissionais):
+    from core.models import Salao, Usuario
+    from servicos.models import Modulo, Profissional, Servico
+
+    salao = Salao.objects.create(nome='Salão Benchmark', subdominio='benchmark')
+    modulo = Modulo.objects.create(nome='cabelo')
+    servico = Servico.objects.create(salao=salao, nome='Corte', modulo=modulo, preco=50, duracao_minutos=30)
+    cliente = Usuario.objects.create(username='cliente', salao=salao)
+    lista = []
+    for n in range(profissionais):
+        usuario = Usuario.objects.create(username=f'profissional{n}', salao=salao, tipo='profissional')
+        profissional = Profissional.objects.create(
+            salao=salao, usuario=usuario, horario_inicio=time(9), horario_fim=time(18),
+            trabalha_sabado=True, trabalha_domingo=True,
+        )
+        profissional.modulos.add(modulo)
+        lista.append(profissional)
+    return salao, servico, cliente, lista
+
+
+def medir(modo, args):
+    from django.conf import settings
+    from django.core.exceptions import ValidationError
+    from django.db import DatabaseError, connection
+    from servicos.models import Agendamento
+
+    # As conexões de cada thread são criadas a partir deste mesmo dicionário
+    connection.close()
+    connection.settings_dict['OPTIONS'] = dict(settings.SQLITE_OPCOES_DESEMPENHO) if modo == 'desempenho' else {}
+
+    with banco_temporario():
+        salao, servico, cliente, profissionais = criar_cenario(args.threads)
+        with connection.cursor() as cursor:
+            pragmas = {
+                nome: cursor.execute(f'PRAGMA {nome}').fetchone()[0]
+                for nome in ('journal_mode', 'synchronous', 'busy_timeout')
+            }
+        contagem = Counter()
+        trava = threading.Lock()
+        inicio = date.today() + timedelta(days=1)
+
+        def trabalhador(indice):
+            local = Counter()
+            try:
+                for n in range(args.agendamentos):
+                    try:
+                        Agendamento(
+                            salao=salao, cliente=cliente, profissional=profissionais[indice], servico=servico,
+                            data=inicio + timedelta(days=n // len(HORARIOS)), hora=HORARIOS[n % len(HORARIOS)],
+                        ).save()
+                        local['sucesso'] += 1
+                    except ValidationError:
+                        local['conflito'] += 1
+                    except DatabaseError:
+                        local['erro_banco'] += 1
+            finally:
+                connection.close()
+                with trava:
+                    contagem.update(local)
+
+        threads = [threading.Thread(target=trabalhador, args=(n,)) for n in range(args.threads)]
+        with cronometro() as decorrido:
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        return {
+            **pragmas,
+            'sucesso': contagem['sucesso'],
+            'conflito': contagem['conflito'],
+            'erro_banco': contagem['erro_banco'],
+            'segundos': round(decorrido(), 3),
+            'agendamentos_por_segundo': round(contagem['sucesso'] / decorrido(), 1),
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--agendamentos', type=int, default=100, help='agendamentos por thread')
+    parser.add_argument('--modos', nargs='+', choices=MODOS, default=list(MODOS))
+    args = parser.parse_args()
+
+    configurar_django()
+
+    from django.db import connection
+
+    if connection.vendor != 'sqlite':
+        sys.exit('Este benchmark compara perfis do SQLite (sem DB_ENGINE=postgresql).')
+
+    resultado = {'threads': args.threads, 'agendamentos': args.threads * args.agendamentos}
+    opcoes_originais = connection.settings_dict['OPTIONS']
+    try:
+        for modo in args.modos:
+            resultado[modo] = medir(modo, args)
+    finally:
+        connection.settings_dict['OPTIONS'] = opcoes_originais
+    imprimir_resultado(resultado)
+
+
+if __name__ == '__main__':
+    main()
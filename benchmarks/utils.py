@@ -0,0 +1,65 @@
+import json
+import os
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+RAIZ = Path(__file__).resolve().parent.parent
+
+
+def configurar_django():
+    """Inicializa o Django usando as configurações do projeto"""
+    if str(RAIZ) not in sys.path:
+        sys.path.insert(0, str(RAIZ))
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+
+    import django
+    django.setup()
+
+
+@contextmanager
+def banco_temporario(alias='default'):
+    """
+    Cria (e remove ao final) um banco de testes migrado.
+
+    No SQLite o banco de testes é gravado em arquivo, e não em memória, para
+    que várias threads compartilhem os mesmos dados com o lock de arquivo real.
+    """
+    from django.db import connections
+
+    conexao = connections[alias]
+    diretorio = None
+    if conexao.vendor == 'sqlite':
+        diretorio = tempfile.TemporaryDirectory()
+        conexao.settings_dict.setdefault('TEST', {})['NAME'] = os.path.join(diretorio.name, 'benchmark.sqlite3')
+
+    nome_original = conexao.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+    try:
+        yield conexao
+    finally:
+        connections.close_all()
+        conexao.creation.destroy_test_db(nome_original, verbosity=0)
+        if diretorio:
+            diretorio.cleanup()
+
+
+@contextmanager
+def cronometro():
+    """Mede o tempo decorrido em segundos: ``with cronometro() as t: ...; t()``"""
+    inicio = time.perf_counter()
+    fim = None
+
+    def decorrido():
+        return (fim or time.perf_counter()) - inicio
+
+    try:
+        yield decorrido
+    finally:
+        fim = time.perf_counter()
+
+
+def imprimir_resultado(resultado):
+    """Imprime o resultado como JSON para facilitar a comparação entre execuções"""
+    print(json.dumps(resultado, indent=2, ensure_ascii=False, default=str))
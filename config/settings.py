@@ -12,6 +12,8 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 
 from pathlib import Path
 
+from decouple import Choices, Csv, config
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -20,12 +22,12 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 # See https://docs.djangoproject.com/en/5.2/howto/deployment/checklist/
 
 # SECURITY WARNING: keep the secret key used in production secret!
-SECRET_KEY = 'django-insecure-ld$!abf+p$j)a4x$^(=^wrpm#vig0foh1%!q$!3o=-!@uri2*^'
+SECRET_KEY = config('SECRET_KEY', default='django-insecure-ld$!abf+p$j)a4x$^(=^wrpm#vig0foh1%!q$!3o=-!@uri2*^')
 
 # SECURITY WARNING: don't run with debug turned on in production!
-DEBUG = True
+DEBUG = config('DEBUG', default=True, cast=bool)
 
-ALLOWED_HOSTS = []
+ALLOWED_HOSTS = config('ALLOWED_HOSTS', default='', cast=Csv())
 
 
 # Application definition
@@ -42,16 +44,19 @@ INSTALLED_APPS = [
     'core',
     'servicos',
     'gestao',
+    'fila',
 ]
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'core.middleware.InstrumentacaoMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'core.replicas.ReplicaMiddleware',
     'core.middleware.TenantMiddleware',
 ]
 
@@ -78,12 +83,119 @@ WSGI_APPLICATION = 'config.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+# Variáveis de ambiente (ou .env, ver .env.exemplo). DB_ENGINE=postgresql
+# ativa o perfil de produção; sem ele, o projeto usa o SQLite local.
+DB_ENGINE = config('DB_ENGINE', default='sqlite')
+
+if DB_ENGINE == 'postgresql':
+    DB_POOL = config('DB_POOL', default=False, cast=bool)
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': config('DB_NAME', default='salao_db'),
+            'USER': config('DB_USER', default='salao_user'),
+            'PASSWORD': config('DB_PASSWORD', default=''),
+            'HOST': config('DB_HOST', default='localhost'),
+            'PORT': config('DB_PORT', default='5432'),
+            # Sem pool, a conexão de cada thread é reaproveitada entre
+            # requisições por até DB_CONN_MAX_AGE segundos e testada antes do
+            # reuso. Com pool, cada requisição devolve a conexão ao pool do
+            # processo, o que exige CONN_MAX_AGE = 0.
+            'CONN_MAX_AGE': 0 if DB_POOL else config('DB_CONN_MAX_AGE', default=60, cast=int),
+            'CONN_HEALTH_CHECKS': config('DB_CONN_HEALTH_CHECKS', default=True, cast=bool),
+            'OPTIONS': {
+                'connect_timeout': config('DB_CONNECT_TIMEOUT', default=5, cast=int),
+            },
+        }
+    }
+    if DB_POOL:
+        # psycopg_pool.ConnectionPool (requer psycopg 3)
+        DATABASES['default']['OPTIONS']['pool'] = {
+            'min_size': config('DB_POOL_MIN', default=2, cast=int),
+            'max_size': config('DB_POOL_MAX', default=10, cast=int),
+            # Espera máxima por uma conexão livre antes de erro
+            'timeout': config('DB_POOL_TIMEOUT', default=10, cast=float),
+            'max_idle': config('DB_POOL_MAX_IDLE', default=300, cast=float),
+            'max_lifetime': config('DB_POOL_MAX_LIFETIME', default=3600, cast=float),
+        }
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': BASE_DIR / 'db.sqlite3',
+        }
     }
+
+# Perfil de desempenho do SQLite para salões pequenos em um único servidor
+# (DB_SQLITE_DESEMPENHO=True). Os PRAGMAs rodam a cada nova conexão: WAL
+# (leitores não bloqueiam o escritor), synchronous=NORMAL (fsync só nos
+# checkpoints do WAL), cache de páginas e mmap maiores, e busy_timeout para
+# esperar o lock em vez de falhar com "database is locked". Transações de
+# gravação começam com BEGIN IMMEDIATE, obtendo o lock de escrita no início
+# em vez de falhar ao promover um lock de leitura.
+SQLITE_OPCOES_DESEMPENHO = {
+    'transaction_mode': 'IMMEDIATE',
+    'init_command': ';'.join([
+        'PRAGMA journal_mode = WAL',
+        'PRAGMA synchronous = NORMAL',
+        f"PRAGMA cache_size = -{config('DB_SQLITE_CACHE_KIB', default=64 * 1024, cast=int)}",
+        f"PRAGMA mmap_size = {config('DB_SQLITE_MMAP_BYTES', default=256 * 1024 * 1024, cast=int)}",
+        f"PRAGMA busy_timeout = {config('DB_SQLITE_BUSY_TIMEOUT_MS', default=20000, cast=int)}",
+    ]),
 }
+if DB_ENGINE != 'postgresql' and config('DB_SQLITE_DESEMPENHO', default=False, cast=bool):
+    DATABASES['default']['OPTIONS'] = dict(SQLITE_OPCOES_DESEMPENHO)
+
+# Réplica de leitura dos dashboards e relatórios (core.replicas), com as
+# mesmas credenciais do principal: outro host no PostgreSQL, outro arquivo no
+# SQLite. Nos testes ela espelha o banco principal.
+if DB_ENGINE == 'postgresql' and config('DB_REPLICA_HOST', default=''):
+    DATABASES['replica'] = {
+        **DATABASES['default'],
+        'HOST': config('DB_REPLICA_HOST'),
+        'PORT': config('DB_REPLICA_PORT', default=DATABASES['default']['PORT']),
+        'OPTIONS': dict(DATABASES['default']['OPTIONS']),
+        'TEST': {'MIRROR': 'default'},
+    }
+elif DB_ENGINE != 'postgresql' and config('DB_REPLICA_NAME', default=''):
+    DATABASES['replica'] = {
+        **DATABASES['default'],
+        'NAME': config('DB_REPLICA_NAME'),
+        'TEST': {'MIRROR': 'default'},
+    }
+
+# Particionamento por intervalo de data de Agendamento e Transacao no
+# PostgreSQL (core.particionamento): DB_PARTICIONAMENTO=mensal ou anual. As
+# tabelas são convertidas por criar_particoes --converter (não pelas
+# migrações), e as partições dos próximos DB_PARTICOES_FUTURAS períodos são
+# criadas pelo mesmo comando.
+PARTICIONAMENTO = config('DB_PARTICIONAMENTO', default='', cast=Choices(['', 'mensal', 'anual']))
+PARTICOES_FUTURAS = config('DB_PARTICOES_FUTURAS', default=3, cast=int)
+
+# Shards (core.shards): bancos adicionais, cada um com os dados de parte dos
+# salões. O diretório de shards fica no banco principal. No PostgreSQL, cada
+# shard usa as credenciais do principal, em DB_SHARD_<ALIAS>_HOST,
+# DB_SHARD_<ALIAS>_PORT e DB_SHARD_<ALIAS>_NAME (padrão: <DB_NAME>_<alias>);
+# no SQLite, o arquivo <alias>.sqlite3. Salões novos vão para
+# DB_SHARD_NOVOS_SALOES; o comando mover_salao troca um salão de shard.
+SHARDS = config('DB_SHARDS', default='', cast=Csv())
+for _shard in SHARDS:
+    if DB_ENGINE == 'postgresql':
+        _prefixo = f'DB_SHARD_{_shard.upper()}'
+        DATABASES[_shard] = {
+            **DATABASES['default'],
+            'NAME': config(f'{_prefixo}_NAME', default=f"{DATABASES['default']['NAME']}_{_shard}"),
+            'HOST': config(f'{_prefixo}_HOST', default=DATABASES['default']['HOST']),
+            'PORT': config(f'{_prefixo}_PORT', default=DATABASES['default']['PORT']),
+            'OPTIONS': dict(DATABASES['default']['OPTIONS']),
+        }
+    else:
+        DATABASES[_shard] = {**DATABASES['default'], 'NAME': BASE_DIR / f'{_shard}.sqlite3'}
+SHARD_NOVOS_SALOES = config('DB_SHARD_NOVOS_SALOES', default='default')
+
+DATABASE_ROUTERS = ['core.shards.RoteadorShard', 'core.replicas.RoteadorReplica']
+# Após uma gravação, as leituras do mesmo navegador ficam no principal por este tempo
+REPLICA_FIXACAO_SEGUNDOS = config('REPLICA_FIXACAO_SEGUNDOS', default=15, cast=int)
 
 
 # Password validation
@@ -130,6 +242,13 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 # Custom User Model
 AUTH_USER_MODEL = 'core.Usuario'
 
+# Autenticação: usuário e salão carregados juntos, com cache curto por usuário
+AUTHENTICATION_BACKENDS = ['core.backends.UsuarioSalaoBackend']
+USUARIO_CACHE_TIMEOUT = 30
+
+# Sessões lidas do cache, gravadas também no banco
+SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
+
 # Crispy Forms
 CRISPY_ALLOWED_TEMPLATE_PACKS = "bootstrap5"
 CRISPY_TEMPLATE_PACK = "bootstrap5"
@@ -140,7 +259,42 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Cache: sem CACHE_REDIS_URL, o LocMemCache de cada processo. Com mais de um
+# processo (gunicorn, mover_salao, processar_fila), use um cache compartilhado:
+# as invalidações de salões, catálogos e shards só chegam aos outros
+# processos por ele.
+CACHE_REDIS_URL = config('CACHE_REDIS_URL', default='')
+if CACHE_REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': CACHE_REDIS_URL,
+        },
+    }
+
 # Login
 LOGIN_URL = 'login'
 LOGIN_REDIRECT_URL = 'dashboard'
 LOGOUT_REDIRECT_URL = 'home'
+
+# Multi-tenancy
+# O salão é identificado pelo subdomínio: <subdominio>.<TENANT_DOMINIO_BASE>
+TENANT_DOMINIO_BASE = 'localhost'
+TENANT_SUBDOMINIOS_RESERVADOS = ['www']
+
+# Instrumentação de consultas por requisição (core.instrumentacao)
+# Fração das requisições medidas: 0 desliga, 1 mede todas
+INSTRUMENTACAO_AMOSTRAGEM = config('INSTRUMENTACAO_AMOSTRAGEM', default=0, cast=float)
+INSTRUMENTACAO_HISTORICO = 200
+INSTRUMENTACAO_LIMITE_REPETICOES = 3
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'core.instrumentacao': {'handlers': ['console'], 'level': 'INFO', 'propagate': False},
+    },
+}
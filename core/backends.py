@@ -0,0 +1,78 @@
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+
+from . import shards
+
+UserModel = get_user_model()
+
+
+def chave_usuario(user_id, banco=DEFAULT_DB_ALIAS):
+    # Com shards, o mesmo id pode existir em mais de um banco
+    return f'usuario:{banco}:{user_id}'
+
+
+def _timeout_cache():
+    """Tempo de vida do par usuário + salão em cache (0 desativa)"""
+    return getattr(settings, 'USUARIO_CACHE_TIMEOUT', 0)
+
+
+def invalidar_usuarios(*user_ids, banco=DEFAULT_DB_ALIAS):
+    """Descarta do cache os usuários informados"""
+    if user_ids:
+        cache.delete_many([chave_usuario(user_id, banco) for user_id in user_ids])
+
+
+class UsuarioSalaoBackend(ModelBackend):
+    """
+    Backend de autenticação que carrega o usuário junto com o salão.
+
+    O usuário da sessão vem com select_related('salao') em uma única consulta,
+    e o par pode ficar em cache por USUARIO_CACHE_TIMEOUT segundos. O cache é
+    invalidado quando o Usuario ou o Salao é salvo ou excluído.
+
+    Com shards, o usuário é procurado no banco do contexto (o TenantMiddleware
+    fixa o da sessão). O login fora de um salão, no domínio principal,
+    procura o usuário em cada shard.
+    """
+
+    def authenticate(self, request, username=None, password=None, **kwargs):
+        if not (shards.sharding_ativo() and shards.fora_de_contexto()):
+            return super().authenticate(request, username, password, **kwargs)
+        for banco in shards.shards():
+            with shards.usar_banco(banco):
+                user = super().authenticate(request, username, password, **kwargs)
+            if user is not None:
+                return user
+        return None
+
+    def _consulta(self):
+        return UserModel._default_manager.select_related('salao')
+
+    def get_user(self, user_id):
+        timeout = _timeout_cache()
+        chave = chave_usuario(user_id, shards.banco_de(UserModel))
+        user = cache.get(chave) if timeout else None
+        if user is None:
+            try:
+                user = self._consulta().get(pk=user_id)
+            except UserModel.DoesNotExist:
+                return None
+            if timeout:
+                cache.set(chave, user, timeout)
+        return user if self.user_can_authenticate(user) else None
+
+    async def aget_user(self, user_id):
+        timeout = _timeout_cache()
+        chave = chave_usuario(user_id, shards.banco_de(UserModel))
+        user = await cache.aget(chave) if timeout else None
+        if user is None:
+            try:
+                user = await self._consulta().aget(pk=user_id)
+            except UserModel.DoesNotExist:
+                return None
+            if timeout:
+                await cache.aset(chave, user, timeout)
+        return user if self.user_can_authenticate(user) else None
@@ -0,0 +1,479 @@
+"""
+Dados sintéticos de vários salões para testes de carga e de escala.
+
+Cada salão recebe um administrador, profissionais, clientes, serviços,
+materiais com ficha técnica e o histórico de agendamentos, transações e
+movimentações de estoque de alguns anos, até alguns dias à frente. O sorteio
+de cada salão usa uma semente derivada da semente geral e do número do
+salão: os mesmos parâmetros e a mesma data de referência geram os mesmos
+dados.
+
+Os agendamentos respeitam Agendamento.clean sem passar por ele: cada
+profissional só recebe agendamentos nos dias e no horário de trabalho, e a
+agenda é preenchida em sequência, sem sobreposição (nem entre os
+cancelados). Os status seguem a data: concluídos e cancelados no passado,
+pendentes e confirmados no futuro.
+
+As linhas são gravadas em lotes, sem signals: o cadastro com bulk_create e
+o histórico (agendamentos, transações e movimentações) com o mesmo INSERT de
+várias linhas, a partir de tuplas (ver GeradorDadosSinteticos.inserir). Por
+isso o gerador também calcula o que os signals e os serviços manteriam: hora_fim
+dos agendamentos, uma receita por atendimento concluído, a baixa da ficha
+técnica, as compras mensais de material (com a despesa do fornecedor), o
+estoque final e o resumo financeiro diário. As datas de criação
+(auto_now_add) acompanham a data de cada registro.
+"""
+import math
+import random
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+
+from django.contrib.auth.hashers import make_password
+from django.db import connections, transaction
+from django.utils import timezone
+
+from gestao.dashboard import invalidar_dashboard
+from gestao.financeiro import recalcular_resumo
+from gestao.models import ConsumoMaterial, Material, MovimentacaoEstoque, Transacao
+from servicos.catalogo import invalidar_catalogo
+from servicos.models import Agendamento, Modulo, Profissional, Servico
+from .models import Salao, Usuario
+from .shards import banco_de
+from .utils import usar_salao
+
+# Agenda em intervalos de 30 minutos, como a oferecida ao cliente
+INTERVALO_MINUTOS = 30
+
+# (nome, duração em minutos, preço) por módulo
+SERVICOS = {
+    'cabelo': [
+        ('Corte feminino', 60, 80), ('Corte masculino', 30, 45), ('Escova', 45, 60),
+        ('Coloração', 120, 180), ('Hidratação', 60, 90), ('Mechas', 180, 320),
+    ],
+    'pele': [
+        ('Limpeza de pele', 60, 120), ('Maquiagem', 60, 150), ('Design de sobrancelhas', 30, 40),
+        ('Depilação de pernas', 45, 70),
+    ],
+    'unhas': [
+        ('Manicure', 45, 35), ('Pedicure', 60, 45), ('Unhas em gel', 90, 120), ('Spa dos pés', 60, 80),
+    ],
+}
+
+# (nome, unidade, custo unitário, consumo por atendimento) por módulo
+MATERIAIS = {
+    'cabelo': [
+        ('Shampoo', 'ml', '0.08', 30), ('Condicionador', 'ml', '0.09', 30), ('Tinta', 'g', '0.45', 60),
+        ('Máscara capilar', 'g', '0.12', 40), ('Oxidante', 'ml', '0.05', 60),
+    ],
+    'pele': [
+        ('Sabonete facial', 'ml', '0.15', 10), ('Base', 'ml', '1.20', 3), ('Cera depilatória', 'g', '0.10', 80),
+        ('Algodão', 'g', '0.04', 10),
+    ],
+    'unhas': [
+        ('Esmalte', 'ml', '1.50', 2), ('Acetona', 'ml', '0.03', 15), ('Lixa', 'un', '0.80', 1),
+        ('Gel', 'g', '2.00', 3),
+    ],
+}
+
+# Status dos agendamentos passados, de hoje e futuros, com os pesos
+STATUS_PASSADO = (('concluido', 82), ('cancelado', 13), ('confirmado', 3), ('pendente', 2))
+STATUS_HOJE = (('concluido', 30), ('em_andamento', 10), ('confirmado', 45), ('pendente', 10), ('cancelado', 5))
+STATUS_FUTURO = (('pendente', 55), ('confirmado', 40), ('cancelado', 5))
+
+# Colunas gravadas por GeradorDadosSinteticos.inserir nas tabelas do histórico
+CAMPOS_AGENDAMENTO = (
+    'salao', 'cliente', 'profissional', 'servico', 'data', 'hora', 'hora_fim', 'status', 'observacoes',
+    'criado_em', 'atualizado_em',
+)
+CAMPOS_TRANSACAO = (
+    'salao', 'tipo', 'categoria', 'descricao', 'valor', 'data', 'pago', 'agendamento', 'profissional',
+    'observacoes', 'criado_em', 'atualizado_em',
+)
+CAMPOS_MOVIMENTACAO = (
+    'salao', 'material', 'tipo', 'quantidade', 'motivo', 'usuario', 'agendamento', 'criado_em',
+)
+# Tipos de campo adaptados ao banco antes do INSERT; os demais vão como estão
+CAMPOS_ADAPTADOS = {'DateField', 'DateTimeField', 'TimeField', 'DecimalField'}
+
+# Despesas fixas mensais (categoria, descrição, valor mínimo, valor máximo)
+DESPESAS_MENSAIS = (('aluguel', 'Aluguel', 2500, 6000), ('conta', 'Água, luz e internet', 400, 1200))
+
+
+@contextmanager
+def datas_historicas(*modelos):
+    """
+    Desliga auto_now e auto_now_add dos campos de data dos modelos dentro do
+    bloco, para que o bulk_create grave as datas informadas. Só para
+    comandos: a alteração vale para o processo inteiro.
+    """
+    campos = [
+        (campo, campo.auto_now, campo.auto_now_add)
+        for modelo in modelos for campo in modelo._meta.concrete_fields
+        if getattr(campo, 'auto_now', False) or getattr(campo, 'auto_now_add', False)
+    ]
+    for campo, _, _ in campos:
+        campo.auto_now = campo.auto_now_add = False
+    try:
+        yield
+    finally:
+        for campo, auto_now, auto_now_add in campos:
+            campo.auto_now, campo.auto_now_add = auto_now, auto_now_add
+
+
+def _sortear(sorteio, pesos):
+    return sorteio.choices([opcao for opcao, _ in pesos], [peso for _, peso in pesos])[0]
+
+
+def _inicio_do_mes(dia):
+    return dia.replace(day=1)
+
+
+class GeradorDadosSinteticos:
+    """
+    Gera os salões `prefixo-1` a `prefixo-N`.
+
+    `anos` de histórico terminam `dias_futuros` dias depois de `hoje`.
+    `ocupacao` é a chance de cada intervalo livre da agenda de um
+    profissional receber um agendamento. `tamanho_lote` é o número de
+    agendamentos gravados (com as transações e movimentações deles) em cada
+    transação do banco, e também o batch_size do bulk_create. Todos os
+    usuários têm a senha `senha`.
+    """
+
+    def __init__(self, saloes=10, profissionais=8, clientes=300, servicos=12, materiais=12, anos=2,
+                 dias_futuros=30, ocupacao=0.6, semente=0, prefixo='sintetico', senha='senha',
+                 tamanho_lote=5000, hoje=None):
+        self.saloes = saloes
+        self.profissionais = profissionais
+        self.clientes = clientes
+        self.servicos = servicos
+        self.materiais = materiais
+        self.ocupacao = ocupacao
+        self.semente = semente
+        self.prefixo = prefixo
+        self.tamanho_lote = tamanho_lote
+        self.hoje = hoje or timezone.localdate()
+        self.inicio = self.hoje - timedelta(days=round(anos * 365))
+        self.fim = self.hoje + timedelta(days=dias_futuros)
+        self.senha = make_password(senha)
+        self.totais = defaultdict(int)
+        self.adaptados = defaultdict(dict)
+        self.horas_fim = {}
+        self.instantes = {}
+
+    def subdominios(self):
+        return [f'{self.prefixo}-{n}' for n in range(1, self.saloes + 1)]
+
+    def instante(self, dia, hora=time(8)):
+        chave = dia, hora
+        if chave not in self.instantes:
+            self.instantes[chave] = timezone.make_aware(datetime.combine(dia, hora))
+        return self.instantes[chave]
+
+    def gerar(self, progresso=None):
+        """Gera todos os salões; progresso(subdominio, linhas) é chamado ao fim de cada um"""
+        modulos = {
+            modulo.nome: modulo
+            for modulo in (Modulo.objects.get_or_create(nome=nome)[0] for nome in SERVICOS)
+        }
+        with datas_historicas(Material, Agendamento, Transacao, MovimentacaoEstoque):
+            for numero, subdominio in enumerate(self.subdominios(), start=1):
+                antes = sum(self.totais.values())
+                self.gerar_salao(numero, subdominio, modulos)
+                if progresso:
+                    progresso(subdominio, sum(self.totais.values()) - antes)
+        return dict(self.totais)
+
+    def bulk_create(self, modelo, objetos):
+        criados = modelo._base_manager.bulk_create(objetos, batch_size=self.tamanho_lote)
+        self.totais[modelo._meta.label] += len(criados)
+        return criados
+
+    def gerar_salao(self, numero, subdominio, modulos):
+        sorteio = random.Random(f'{self.semente}:{numero}')
+        salao = Salao.objects.create(nome=f'Salão Sintético {numero}', subdominio=subdominio)
+        self.totais['core.Salao'] += 1
+        # Dentro do salão, as gravações vão para o shard dele
+        with usar_salao(salao), transaction.atomic(using=banco_de(Agendamento)):
+            cadastro = self.gerar_cadastro(salao, sorteio, modulos)
+        with usar_salao(salao):
+            self.gerar_historico(salao, sorteio, *cadastro)
+            recalcular_resumo(salao)
+        invalidar_catalogo(salao.id)
+        invalidar_dashboard(salao.id)
+
+    def gerar_cadastro(self, salao, sorteio, modulos):
+        """Usuários, serviços, profissionais e materiais do salão"""
+        prefixo = salao.subdominio
+        entrada = self.instante(self.inicio)
+        usuarios = [
+            Usuario(
+                username=f'{prefixo}-admin', first_name='Administrador', salao=salao, tipo='admin',
+                password=self.senha, date_joined=entrada,
+            )
+        ]
+        usuarios += [
+            Usuario(
+                username=f'{prefixo}-profissional{n}', first_name=f'Profissional {n}', salao=salao,
+                tipo='profissional', password=self.senha, date_joined=entrada,
+            )
+            for n in range(1, self.profissionais + 1)
+        ]
+        usuarios += [
+            Usuario(
+                username=f'{prefixo}-cliente{n}', first_name=f'Cliente {n}', salao=salao, tipo='cliente',
+                password=self.senha, date_joined=entrada,
+            )
+            for n in range(1, self.clientes + 1)
+        ]
+        usuarios = self.bulk_create(Usuario, usuarios)
+        usuarios_profissionais = usuarios[1:self.profissionais + 1]
+        clientes = usuarios[self.profissionais + 1:]
+
+        catalogo = [(nome_modulo, *item) for nome_modulo, itens in SERVICOS.items() for item in itens]
+        servicos = []
+        for n in range(self.servicos):
+            nome_modulo, nome, duracao, preco = catalogo[n % len(catalogo)]
+            if n >= len(catalogo):
+                nome, preco = f'{nome} premium {n // len(catalogo)}', preco * 1.5
+            servicos.append(Servico(
+                salao=salao, modulo=modulos[nome_modulo], nome=nome, duracao_minutos=duracao,
+                preco=Decimal(preco * sorteio.uniform(0.8, 1.3)).quantize(Decimal('1')),
+            ))
+        servicos = self.bulk_create(Servico, servicos)
+        modulos_com_servico = sorted({servico.modulo.nome for servico in servicos})
+
+        profissionais = []
+        for usuario in usuarios_profissionais:
+            inicio = sorteio.choice((8, 9, 10))
+            profissionais.append(Profissional(
+                salao=salao, usuario=usuario,
+                horario_inicio=time(inicio), horario_fim=time(inicio + sorteio.choice((8, 9, 10))),
+                trabalha_segunda=sorteio.random() < 0.7, trabalha_sabado=sorteio.random() < 0.6,
+                trabalha_domingo=sorteio.random() < 0.1,
+            ))
+        profissionais = self.bulk_create(Profissional, profissionais)
+        atende = {}
+        ligacoes = []
+        for profissional in profissionais:
+            nomes = sorteio.sample(modulos_com_servico, min(len(modulos_com_servico), sorteio.choice((1, 1, 2))))
+            atende[profissional.pk] = [servico for servico in servicos if servico.modulo.nome in nomes]
+            ligacoes += [
+                Profissional.modulos.through(profissional_id=profissional.pk, modulo_id=modulos[nome].pk)
+                for nome in nomes
+            ]
+        self.bulk_create(Profissional.modulos.through, ligacoes)
+
+        materiais = []
+        catalogo = [(nome_modulo, *item) for nome_modulo, itens in MATERIAIS.items() for item in itens]
+        consumo_por_material = {}
+        for n in range(self.materiais):
+            nome_modulo, nome, unidade, custo, consumo = catalogo[n % len(catalogo)]
+            if n >= len(catalogo):
+                nome = f'{nome} {n // len(catalogo) + 1}'
+            materiais.append(Material(
+                salao=salao, nome=nome, modulo=nome_modulo, unidade=unidade, custo_unitario=Decimal(custo),
+                estoque_minimo=consumo * 10, criado_em=entrada, atualizado_em=entrada,
+            ))
+            consumo_por_material[nome] = consumo
+        materiais = self.bulk_create(Material, materiais)
+
+        # Ficha técnica: um ou dois materiais do módulo de cada serviço
+        fichas = defaultdict(list)
+        consumos = []
+        for servico in servicos:
+            candidatos = [material for material in materiais if material.modulo == servico.modulo.nome]
+            for material in sorteio.sample(candidatos, min(len(candidatos), sorteio.choice((1, 2)))):
+                quantidade = Decimal(consumo_por_material[material.nome])
+                fichas[servico.pk].append((material.pk, quantidade))
+                consumos.append(ConsumoMaterial(salao=salao, servico=servico, material=material, quantidade=quantidade))
+        self.bulk_create(ConsumoMaterial, consumos)
+        return usuarios[0], clientes, profissionais, atende, materiais, fichas
+
+    def agenda(self, sorteio, profissional, servicos):
+        """(data, hora, serviço) dos agendamentos do profissional, sem sobreposição, em ordem"""
+        dias_trabalho = set(profissional.dias_trabalho())
+        inicio = profissional.horario_inicio.hour * 60
+        fim = profissional.horario_fim.hour * 60
+        dia = self.inicio
+        while dia <= self.fim:
+            if dia.weekday() in dias_trabalho:
+                minuto = inicio
+                while minuto < fim:
+                    if sorteio.random() < self.ocupacao:
+                        # Só os serviços que terminam dentro do expediente
+                        cabem = [servico for servico in servicos if minuto + servico.duracao_minutos <= fim]
+                        if not cabem:
+                            break
+                        servico = sorteio.choice(cabem)
+                        yield dia, time(minuto // 60, minuto % 60), servico
+                        minuto += math.ceil(servico.duracao_minutos / INTERVALO_MINUTOS) * INTERVALO_MINUTOS
+                    else:
+                        minuto += INTERVALO_MINUTOS
+            dia += timedelta(days=1)
+
+    def status(self, sorteio, dia):
+        if dia < self.hoje:
+            return _sortear(sorteio, STATUS_PASSADO)
+        if dia == self.hoje:
+            return _sortear(sorteio, STATUS_HOJE)
+        return _sortear(sorteio, STATUS_FUTURO)
+
+    def inserir(self, modelo, campos, linhas, retornar_ids=False):
+        """
+        Grava `linhas` (tuplas com os valores de `campos`) com o mesmo INSERT
+        de várias linhas do bulk_create, mas sem instâncias do modelo: nas
+        tabelas do histórico, montar e preparar cada instância custa mais que
+        o próprio INSERT. Datas, horas e decimais são adaptados ao banco uma
+        vez por valor distinto. Com retornar_ids, devolve os ids na ordem das
+        linhas (RETURNING, como o bulk_create).
+        """
+        banco = banco_de(modelo)
+        conexao = connections[banco]
+        quote_name = conexao.ops.quote_name
+        campos = [modelo._meta.get_field(nome) for nome in campos]
+        adaptadores = [
+            self.adaptador(banco, campo) if campo.get_internal_type() in CAMPOS_ADAPTADOS else None
+            for campo in campos
+        ]
+        sql = 'INSERT INTO {} ({}) VALUES '.format(
+            quote_name(modelo._meta.db_table), ', '.join(quote_name(campo.column) for campo in campos),
+        )
+        retorno = f' RETURNING {quote_name(modelo._meta.pk.column)}' if retornar_ids else ''
+        por_comando = max(1, min(self.tamanho_lote, conexao.ops.bulk_batch_size(campos, linhas)))
+        linha_sql = '({})'.format(', '.join(['%s'] * len(campos)))
+
+        ids = []
+        with conexao.cursor() as cursor:
+            for inicio in range(0, len(linhas), por_comando):
+                parte = linhas[inicio:inicio + por_comando]
+                parametros = [
+                    adaptar(valor) if adaptar else valor
+                    for linha in parte for adaptar, valor in zip(adaptadores, linha)
+                ]
+                cursor.execute(sql + ', '.join([linha_sql] * len(parte)) + retorno, parametros)
+                if retornar_ids:
+                    ids += [linha[0] for linha in cursor.fetchall()]
+        self.totais[modelo._meta.label] += len(linhas)
+        return ids
+
+    def adaptador(self, banco, campo):
+        """Valor do campo pronto para o banco, guardado por valor"""
+        adaptados = self.adaptados[banco, campo]
+        conexao = connections[banco]
+
+        def adaptar(valor):
+            try:
+                return adaptados[valor]
+            except KeyError:
+                adaptado = adaptados[valor] = campo.get_db_prep_save(valor, conexao)
+                return adaptado
+        return adaptar
+
+    def gerar_historico(self, salao, sorteio, admin, clientes, profissionais, atende, materiais, fichas):
+        """Agendamentos com as receitas e as baixas de estoque, compras mensais e despesas fixas"""
+        consumo_mensal = defaultdict(Decimal)
+        servicos_por_id = {servico.pk: servico for servicos in atende.values() for servico in servicos}
+        clientes_ids = [cliente.pk for cliente in clientes]
+        lote = []
+
+        for profissional in profissionais:
+            servicos = atende[profissional.pk]
+            if not servicos:
+                continue
+            for dia, hora, servico in self.agenda(sorteio, profissional, servicos):
+                criado_em = self.instante(dia - timedelta(days=sorteio.randrange(0, 15)), time(sorteio.randrange(8, 20)))
+                lote.append((
+                    salao.pk, sorteio.choice(clientes_ids), profissional.pk, servico.pk, dia, hora,
+                    self.hora_fim(hora, servico.duracao_minutos), self.status(sorteio, dia), '', criado_em, criado_em,
+                ))
+                if len(lote) >= self.tamanho_lote:
+                    self.gravar_agendamentos(salao, sorteio, admin, lote, servicos_por_id, fichas, consumo_mensal)
+                    lote = []
+        if lote:
+            self.gravar_agendamentos(salao, sorteio, admin, lote, servicos_por_id, fichas, consumo_mensal)
+
+        self.gravar_compras_e_despesas(salao, sorteio, admin, materiais, consumo_mensal, len(profissionais))
+
+    def hora_fim(self, hora, duracao_minutos):
+        chave = hora, duracao_minutos
+        if chave not in self.horas_fim:
+            self.horas_fim[chave] = Agendamento.calcular_hora_fim(hora, duracao_minutos)
+        return self.horas_fim[chave]
+
+    def gravar_agendamentos(self, salao, sorteio, admin, agendamentos, servicos, fichas, consumo_mensal):
+        with transaction.atomic(using=banco_de(Agendamento)):
+            ids = self.inserir(Agendamento, CAMPOS_AGENDAMENTO, agendamentos, retornar_ids=True)
+            transacoes = []
+            movimentacoes = []
+            for agendamento_id, linha in zip(ids, agendamentos):
+                _, _, profissional_id, servico_id, data, _, hora_fim, status, *_ = linha
+                if status != 'concluido':
+                    continue
+                servico = servicos[servico_id]
+                concluido_em = self.instante(data, hora_fim)
+                transacoes.append((
+                    salao.pk, 'receita', 'servico', f'Serviço: {servico.nome}', servico.preco, data,
+                    data < self.hoje or sorteio.random() < 0.5, agendamento_id, profissional_id, '',
+                    concluido_em, concluido_em,
+                ))
+                for material_id, quantidade in fichas[servico_id]:
+                    movimentacoes.append((
+                        salao.pk, material_id, 'saida', quantidade, f'Consumo do agendamento #{agendamento_id}',
+                        admin.pk, agendamento_id, concluido_em,
+                    ))
+                    consumo_mensal[material_id, _inicio_do_mes(data)] += quantidade
+            self.inserir(Transacao, CAMPOS_TRANSACAO, transacoes)
+            self.inserir(MovimentacaoEstoque, CAMPOS_MOVIMENTACAO, movimentacoes)
+
+    def gravar_compras_e_despesas(self, salao, sorteio, admin, materiais, consumo_mensal, quantidade_profissionais):
+        """
+        Uma compra de cada material no primeiro dia de cada mês, com o
+        consumo do mês e uma folga (o estoque nunca fica negativo), a despesa
+        do fornecedor e as despesas fixas. Atualiza o estoque dos materiais.
+        """
+        meses = []
+        mes = _inicio_do_mes(self.inicio)
+        while mes <= self.hoje:
+            meses.append(mes)
+            mes = (mes + timedelta(days=32)).replace(day=1)
+
+        movimentacoes, transacoes = [], []
+        for mes in meses:
+            # A primeira compra é feita no cadastro dos materiais
+            mes_ou_inicio = max(mes, self.inicio)
+            comprado_em = self.instante(mes_ou_inicio, time(7))
+            custo_do_mes = Decimal('0')
+            for material in materiais:
+                consumo = consumo_mensal.get((material.pk, mes), Decimal('0'))
+                quantidade = (consumo * Decimal('1.2') + material.estoque_minimo).quantize(Decimal('1'))
+                material.quantidade += quantidade - consumo
+                custo_do_mes += quantidade * material.custo_unitario
+                movimentacoes.append(MovimentacaoEstoque(
+                    salao=salao, material=material, tipo='entrada', quantidade=quantidade,
+                    motivo='Compra mensal', usuario=admin, criado_em=comprado_em,
+                ))
+            transacoes.append(Transacao(
+                salao=salao, tipo='despesa', categoria='fornecedor', descricao='Compra mensal de materiais',
+                valor=custo_do_mes.quantize(Decimal('0.01')), data=mes_ou_inicio, pago=True,
+                criado_em=comprado_em, atualizado_em=comprado_em,
+            ))
+            vencimento = min(mes_ou_inicio + timedelta(days=9), self.hoje)
+            for categoria, descricao, minimo, maximo in DESPESAS_MENSAIS:
+                transacoes.append(Transacao(
+                    salao=salao, tipo='despesa', categoria=categoria, descricao=descricao,
+                    valor=Decimal(sorteio.uniform(minimo, maximo)).quantize(Decimal('0.01')),
+                    data=vencimento, pago=vencimento < self.hoje, criado_em=comprado_em, atualizado_em=comprado_em,
+                ))
+            transacoes.append(Transacao(
+                salao=salao, tipo='despesa', categoria='salario', descricao='Salários',
+                valor=Decimal(quantidade_profissionais * sorteio.uniform(1800, 3500)).quantize(Decimal('0.01')),
+                data=vencimento, pago=vencimento < self.hoje, criado_em=comprado_em, atualizado_em=comprado_em,
+            ))
+
+        with transaction.atomic(using=banco_de(Material)):
+            self.bulk_create(MovimentacaoEstoque, movimentacoes)
+            self.bulk_create(Transacao, transacoes)
+            Material._base_manager.bulk_update(materiais, ['quantidade'], batch_size=self.tamanho_lote)
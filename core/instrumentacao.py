@@ -0,0 +1,159 @@
+"""
+Instrumentação de consultas SQL por requisição.
+
+Um execute_wrapper instalado em cada conexão (ver core.signals) conta as
+consultas, soma o tempo gasto no banco e agrupa o SQL por impressão digital
+(literais e listas de parâmetros normalizados). Uma mesma impressão digital
+repetida várias vezes na requisição costuma indicar um N+1.
+
+A medição só acontece dentro de `medir_consultas`, usado pelo
+InstrumentacaoMiddleware em uma fração das requisições
+(INSTRUMENTACAO_AMOSTRAGEM). O registro fica em uma ContextVar, então vale
+também para as consultas das views assíncronas, executadas em outra thread
+via sync_to_async. Cada resultado vira uma linha de log em JSON e entra no
+histórico em memória consultado pela equipe em /instrumentacao/.
+"""
+import json
+import logging
+import re
+import threading
+import time
+from collections import Counter, deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+# Impressões digitais repetidas ao menos este número de vezes são reportadas
+LIMITE_REPETICOES = getattr(settings, 'INSTRUMENTACAO_LIMITE_REPETICOES', 3)
+MAX_REPETIDAS = 5
+
+_historico = deque(maxlen=getattr(settings, 'INSTRUMENTACAO_HISTORICO', 200))
+_historico_lock = threading.Lock()
+
+_registro_atual = ContextVar('registro_consultas', default=None)
+
+_LITERAL_TEXTO = re.compile(r"'(?:[^']|'')*'")
+_LITERAL_NUMERO = re.compile(r'\b\d+(?:\.\d+)?\b')
+_LISTA_PARAMETROS = re.compile(r'\((?:\s*(?:%s|\?)\s*,)+\s*(?:%s|\?)\s*\)')
+_ESPACOS = re.compile(r'\s+')
+
+
+def impressao_digital(sql):
+    """SQL normalizado: consultas que só diferem nos valores ficam iguais"""
+    sql = _LITERAL_TEXTO.sub('?', sql)
+    sql = _LITERAL_NUMERO.sub('?', sql)
+    sql = sql.replace('%s', '?')
+    sql = _LISTA_PARAMETROS.sub('(...)', sql)
+    return _ESPACOS.sub(' ', sql).strip()
+
+
+class RegistroConsultas:
+    """Consultas executadas durante uma medição"""
+
+    def __init__(self):
+        self.consultas = 0
+        self.tempo_banco = 0.0
+        self.repeticoes = Counter()
+        self.tempo_por_impressao = Counter()
+
+    def registrar(self, sql, duracao):
+        impressao = impressao_digital(sql)
+        self.consultas += 1
+        self.tempo_banco += duracao
+        self.repeticoes[impressao] += 1
+        self.tempo_por_impressao[impressao] += duracao
+
+    def repetidas(self, limite=LIMITE_REPETICOES):
+        """Impressões digitais executadas ao menos `limite` vezes, da mais repetida para a menos"""
+        return [
+            {'sql': impressao, 'vezes': vezes, 'tempo_ms': round(self.tempo_por_impressao[impressao] * 1000, 3)}
+            for impressao, vezes in self.repeticoes.most_common(MAX_REPETIDAS)
+            if vezes >= limite
+        ]
+
+
+def registrar_consulta(execute, sql, params, many, context):
+    """execute_wrapper das conexões: mede a consulta se houver uma medição ativa"""
+    registro = _registro_atual.get()
+    if registro is None:
+        return execute(sql, params, many, context)
+    inicio = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        registro.registrar(sql, time.perf_counter() - inicio)
+
+
+def instalar(conexao):
+    """Instala o execute_wrapper em uma conexão (uma única vez)"""
+    if registrar_consulta not in conexao.execute_wrappers:
+        conexao.execute_wrappers.append(registrar_consulta)
+
+
+@contextmanager
+def medir_consultas():
+    """Mede as consultas do bloco (e das threads de sync_to_async chamadas nele)"""
+    registro = RegistroConsultas()
+    token = _registro_atual.set(registro)
+    try:
+        yield registro
+    finally:
+        _registro_atual.reset(token)
+
+
+def publicar(dados):
+    """Grava a linha de log estruturada e guarda o resultado no histórico"""
+    with _historico_lock:
+        _historico.append(dados)
+    nivel = logging.WARNING if dados.get('repetidas') else logging.INFO
+    logger.log(nivel, json.dumps(dados, ensure_ascii=False, default=str))
+
+
+def historico():
+    """Resultados publicados, do mais recente para o mais antigo"""
+    with _historico_lock:
+        return list(reversed(_historico))
+
+
+def limpar_historico():
+    with _historico_lock:
+        _historico.clear()
+
+
+def resumo_por_view(registros):
+    """Média e máximo de consultas e tempo de banco por view nos registros"""
+    por_view = {}
+    for registro in registros:
+        por_view.setdefault(registro['view'] or registro['caminho'], []).append(registro)
+    return {
+        view: {
+            'requisicoes': len(itens),
+            'consultas_media': round(sum(item['consultas'] for item in itens) / len(itens), 1),
+            'consultas_max': max(item['consultas'] for item in itens),
+            'tempo_banco_ms_medio': round(sum(item['tempo_banco_ms'] for item in itens) / len(itens), 3),
+            'com_repeticoes': sum(1 for item in itens if item['repetidas']),
+        }
+        for view, itens in sorted(por_view.items())
+    }
+
+
+def resultado_requisicao(request, response, registro, duracao):
+    """Dados publicados de uma requisição medida"""
+    resolver_match = getattr(request, 'resolver_match', None)
+    salao = getattr(request, 'salao', None)
+    return {
+        'momento': timezone.now().isoformat(),
+        'view': resolver_match.view_name if resolver_match else None,
+        'metodo': request.method,
+        'caminho': request.path,
+        'status': response.status_code,
+        'salao': getattr(salao, 'id', None),
+        'consultas': registro.consultas,
+        'tempo_banco_ms': round(registro.tempo_banco * 1000, 3),
+        'tempo_total_ms': round(duracao * 1000, 3),
+        'repetidas': registro.repetidas(),
+    }
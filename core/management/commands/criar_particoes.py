@@ -0,0 +1,55 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.migrations.recorder import MigrationRecorder
+from django.utils import timezone
+
+from core.particionamento import (
+    MIGRACOES, ativo, converter, criar_particoes, horizonte, modelos_particionados, particionada,
+)
+
+
+class Command(BaseCommand):
+    help = 'Cria as partições por data dos próximos períodos (PostgreSQL com DB_PARTICIONAMENTO)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--periodos', type=int,
+            help='Períodos (meses ou anos) à frente do atual (padrão: DB_PARTICOES_FUTURAS)',
+        )
+        parser.add_argument(
+            '--converter', action='store_true',
+            help='Converte as tabelas ainda não particionadas (particionamento ligado depois das migrações)',
+        )
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS)
+
+    def handle(self, *args, **options):
+        conexao = connections[options['database']]
+        if not ativo(conexao):
+            raise CommandError('O particionamento requer PostgreSQL e DB_PARTICIONAMENTO=mensal ou anual.')
+        if options['periodos'] is not None and options['periodos'] < 0:
+            raise CommandError('--periodos não pode ser negativo.')
+
+        aplicadas = MigrationRecorder(conexao).applied_migrations()
+        if options['converter'] and any(migracao not in aplicadas for migracao in MIGRACOES):
+            raise CommandError('Aplique as migrações (manage.py migrate) antes de converter as tabelas.')
+
+        granularidade = settings.PARTICIONAMENTO
+        hoje = timezone.localdate()
+        ate = horizonte(hoje, granularidade, options['periodos'])
+        for modelo in modelos_particionados():
+            tabela = modelo._meta.db_table
+            if not particionada(conexao, tabela):
+                if not options['converter']:
+                    raise CommandError(f'A tabela {tabela} não é particionada; use --converter para convertê-la.')
+                removidas = converter(conexao, tabela, granularidade, ate)
+                self.stdout.write(f'{tabela} convertida em tabela particionada.')
+                for restricao in removidas:
+                    self.stderr.write(self.style.WARNING(
+                        f'Chave estrangeira {restricao} removida: o banco não a aceita para uma tabela '
+                        f'particionada; a integridade passa a ser só do Django.'
+                    ))
+            criadas = criar_particoes(conexao, tabela, granularidade, ate, hoje)
+            self.stdout.write(self.style.SUCCESS(
+                f'{tabela}: {len(criadas)} partição(ões) criada(s)' + (f': {", ".join(criadas)}.' if criadas else '.')
+            ))
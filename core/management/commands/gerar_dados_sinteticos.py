@@ -0,0 +1,66 @@
+import time
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.dados_sinteticos import GeradorDadosSinteticos
+from core.models import Salao
+
+
+class Command(BaseCommand):
+    help = 'Gera salões sintéticos com anos de histórico para testes de carga e de escala'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--saloes', type=int, default=10)
+        parser.add_argument('--profissionais', type=int, default=8, help='Profissionais por salão')
+        parser.add_argument('--clientes', type=int, default=300, help='Clientes por salão')
+        parser.add_argument('--servicos', type=int, default=12, help='Serviços por salão')
+        parser.add_argument('--materiais', type=int, default=12, help='Materiais por salão')
+        parser.add_argument('--anos', type=float, default=2, help='Anos de histórico até hoje')
+        parser.add_argument('--dias-futuros', type=int, default=30, help='Dias de agenda depois de hoje')
+        parser.add_argument(
+            '--ocupacao', type=float, default=0.6,
+            help='Chance de cada intervalo livre da agenda receber um agendamento (0 a 1)',
+        )
+        parser.add_argument('--semente', type=int, default=0)
+        parser.add_argument('--prefixo', default='sintetico', help='Subdomínios <prefixo>-1 a <prefixo>-N')
+        parser.add_argument('--senha', default='senha', help='Senha de todos os usuários gerados')
+        parser.add_argument('--lote', type=int, default=5000, help='Agendamentos por transação e por bulk_create')
+        parser.add_argument('--hoje', type=date.fromisoformat, help='Data de referência (AAAA-MM-DD; padrão: hoje)')
+
+    def handle(self, *args, **options):
+        for opcao in ('saloes', 'profissionais', 'clientes', 'servicos', 'materiais', 'lote'):
+            if options[opcao] < 1:
+                raise CommandError(f'--{opcao} deve ser positivo.')
+        if not 0 <= options['ocupacao'] <= 1:
+            raise CommandError('--ocupacao deve estar entre 0 e 1.')
+        if options['anos'] < 0 or options['dias_futuros'] < 0:
+            raise CommandError('--anos e --dias-futuros não podem ser negativos.')
+
+        gerador = GeradorDadosSinteticos(
+            saloes=options['saloes'], profissionais=options['profissionais'], clientes=options['clientes'],
+            servicos=options['servicos'], materiais=options['materiais'], anos=options['anos'],
+            dias_futuros=options['dias_futuros'], ocupacao=options['ocupacao'], semente=options['semente'],
+            prefixo=options['prefixo'], senha=options['senha'], tamanho_lote=options['lote'], hoje=options['hoje'],
+        )
+        existentes = list(
+            Salao.objects.filter(subdominio__in=gerador.subdominios()).values_list('subdominio', flat=True)[:5]
+        )
+        if existentes:
+            raise CommandError(
+                f'Já existem salões com o prefixo {options["prefixo"]} ({", ".join(existentes)}); use outro --prefixo.'
+            )
+
+        inicio = time.perf_counter()
+
+        def progresso(subdominio, linhas):
+            self.stdout.write(f'{subdominio}: {linhas} linha(s).')
+
+        totais = gerador.gerar(progresso)
+        segundos = time.perf_counter() - inicio
+        for modelo, quantidade in sorted(totais.items()):
+            self.stdout.write(f'  {modelo}: {quantidade}')
+        linhas = sum(totais.values())
+        self.stdout.write(self.style.SUCCESS(
+            f'{linhas} linha(s) em {segundos:.1f}s ({linhas / max(segundos, 1e-9) * 60:,.0f} por minuto).'
+        ))
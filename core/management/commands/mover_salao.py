@@ -0,0 +1,50 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from core.models import Salao
+from core.shards import MovimentacaoSalao, sharding_ativo
+
+
+class Command(BaseCommand):
+    help = 'Move os dados de um salão para outro shard sem tirá-lo do ar (ver core.shards)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('subdominio')
+        parser.add_argument('destino', help='Alias do banco de destino (default ou um de DB_SHARDS)')
+        parser.add_argument('--lote', type=int, default=1000, help='Linhas por lote de cópia')
+        parser.add_argument(
+            '--espera', type=float, default=5,
+            help='Segundos entre o bloqueio das gravações e a sincronização final',
+        )
+        parser.add_argument('--manter-origem', action='store_true', help='Não apaga as linhas do banco de origem')
+
+    def handle(self, *args, **options):
+        if not sharding_ativo():
+            raise CommandError('Nenhum shard configurado (DB_SHARDS).')
+        if options['lote'] < 1:
+            raise CommandError('--lote deve ser positivo.')
+        try:
+            salao = Salao.objects.get(subdominio=options['subdominio'])
+        except Salao.DoesNotExist:
+            raise CommandError(f'Salão {options["subdominio"]} não encontrado.')
+
+        try:
+            movimentacao = MovimentacaoSalao(salao, options['destino'], options['lote'])
+            origem = movimentacao.origem
+            movimentacao.preparar()
+            movimentacao.copiar()
+            copiadas = sum(len(mapa) for mapa in movimentacao.mapa.values())
+            self.stdout.write(f'{copiadas} linha(s) copiada(s) de {origem} para {movimentacao.destino}.')
+
+            self.stdout.write(f'Bloqueando as gravações; sincronização final em {options["espera"]:g}s.')
+            movimentacao.bloquear_e_sincronizar(options['espera'])
+            movimentacao.concluir()
+            if not options['manter_origem']:
+                apagadas = movimentacao.apagar_origem()
+                self.stdout.write(f'{apagadas} linha(s) apagada(s) de {origem}.')
+        except ValueError as erro:
+            raise CommandError(str(erro))
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Salão {salao.subdominio} movido para {movimentacao.destino}. '
+            'Os usuários do salão precisam entrar novamente.'
+        ))
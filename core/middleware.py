@@ -1,21 +1,150 @@
-from .utils import set_current_salao
-from .models import Salao
+import random
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.contrib import auth
+from django.http import Http404, HttpResponse
+
+from .instrumentacao import medir_consultas, publicar, resultado_requisicao
+from .replicas import METODOS_LEITURA
+from .shards import SEM_SHARD, SESSAO_BANCO, SESSAO_SALAO, localizar_salao, sharding_ativo, usar_banco
+from .utils import buscar_salao_por_subdominio, extrair_subdominio, usar_salao
+
+# Segundos sugeridos ao cliente enquanto o salão troca de shard
+RETRY_AFTER_BLOQUEIO = 30
 
 class TenantMiddleware:
-    """Middleware para identificar e definir o salão atual"""
-    
+    """
+    Middleware para identificar e definir o salão atual.
+
+    O salão vem do subdomínio do host (com cache, sem consulta ao banco em
+    regime) ou, fora de um subdomínio de salão, do usuário logado.
+
+    Suporta os modos síncrono (WSGI) e assíncrono (ASGI). O salão fica
+    fixado no contexto da requisição e é restaurado ao final, de modo que
+    tarefas concorrentes no mesmo event loop não compartilham o tenant.
+
+    Com shards (core.shards), o usuário é carregado do banco guardado na
+    sessão e a requisição roda no banco do salão. Gravações em um salão
+    bloqueado para troca de shard recebem 503.
+    """
+    sync_capable = True
+    async_capable = True
+
     def __init__(self, get_response):
         self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
 
     def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        if sharding_ativo():
+            with usar_banco(self.banco_da_sessao(request)):
+                request.user = auth.get_user(request)
+        request.salao = self.resolver_salao(request)
+        localizacao = self.localizar(request.salao)
+        if localizacao.bloqueado and request.method not in METODOS_LEITURA:
+            return self.salao_bloqueado()
+        with usar_banco(localizacao.banco), usar_salao(request.salao):
+            return self.get_response(request)
+
+    async def __acall__(self, request):
+        # Resolve o usuário de forma assíncrona para que as views async possam
+        # usar request.user sem disparar consultas síncronas
+        banco = await sync_to_async(self.banco_da_sessao)(request) if sharding_ativo() else None
+        with usar_banco(banco):
+            request.user = await request.auser()
+        request.salao = await sync_to_async(self.resolver_salao)(request)
+        localizacao = await sync_to_async(self.localizar)(request.salao)
+        if localizacao.bloqueado and request.method not in METODOS_LEITURA:
+            return self.salao_bloqueado()
+        with usar_banco(localizacao.banco), usar_salao(request.salao):
+            return await self.get_response(request)
+
+    def banco_da_sessao(self, request):
+        """
+        Banco do usuário logado. A sessão aberta antes de o salão trocar de
+        shard é encerrada, pois os ids do salão mudaram.
+        """
+        salao_id = request.session.get(SESSAO_SALAO)
+        if salao_id is None:
+            return None
+        banco = localizar_salao(salao_id).banco
+        if request.session.get(SESSAO_BANCO) != banco:
+            request.session.flush()
+            return None
+        return banco
+
+    def localizar(self, salao):
+        if salao is None or not sharding_ativo():
+            return SEM_SHARD
+        return localizar_salao(salao.id)
+
+    def salao_bloqueado(self):
+        return HttpResponse(
+            'Salão em manutenção. Tente novamente em instantes.',
+            status=503, headers={'Retry-After': str(RETRY_AFTER_BLOQUEIO)},
+        )
+
+    def resolver_salao(self, request):
+        subdominio = extrair_subdominio(request.get_host())
+        if subdominio:
+            salao = buscar_salao_por_subdominio(subdominio)
+            if salao is None:
+                raise Http404('Salão não encontrado.')
+            # Usuários de outro salão não acessam este subdomínio
+            user = request.user
+            if user.is_authenticated and not user.is_superuser and user.salao_id != salao.id:
+                raise Http404('Salão não encontrado.')
+            return salao
+
         # Tenta identificar o salão pelo usuário logado
         if request.user.is_authenticated and hasattr(request.user, 'salao') and request.user.salao:
-            request.salao = request.user.salao
-            set_current_salao(request.user.salao)
-        else:
-            # TODO: Implementar lógica por subdomínio se necessário no futuro
-            request.salao = None
-            set_current_salao(None)
-            
-        response = self.get_response(request)
+            return request.user.salao
+        return None
+
+
+class InstrumentacaoMiddleware:
+    """
+    Mede consultas SQL e tempo de banco de uma amostra das requisições.
+
+    A fração medida vem de INSTRUMENTACAO_AMOSTRAGEM (0 desliga, 1 mede
+    todas). O resultado é publicado em log estruturado e no histórico em
+    memória (ver core.instrumentacao). Deve ficar no início de MIDDLEWARE
+    para incluir as consultas de sessão, autenticação e salão.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def amostrar(self):
+        amostragem = getattr(settings, 'INSTRUMENTACAO_AMOSTRAGEM', 0)
+        return amostragem >= 1 or (amostragem > 0 and random.random() < amostragem)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        if not self.amostrar():
+            return self.get_response(request)
+        inicio = time.perf_counter()
+        with medir_consultas() as registro:
+            response = self.get_response(request)
+        publicar(resultado_requisicao(request, response, registro, time.perf_counter() - inicio))
+        return response
+
+    async def __acall__(self, request):
+        if not self.amostrar():
+            return await self.get_response(request)
+        inicio = time.perf_counter()
+        with medir_consultas() as registro:
+            response = await self.get_response(request)
+        publicar(resultado_requisicao(request, response, registro, time.perf_counter() - inicio))
         return response
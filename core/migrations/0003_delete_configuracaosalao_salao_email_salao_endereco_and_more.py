@@ -0,0 +1,51 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0002_salao_usuario_salao'),
+    ]
+
+    operations = [
+        migrations.DeleteModel(
+            name='ConfiguracaoSalao',
+        ),
+        migrations.AddField(
+            model_name='salao',
+            name='email',
+            field=models.EmailField(blank=True, max_length=254, verbose_name='Email'),
+        ),
+        migrations.AddField(
+            model_name='salao',
+            name='endereco',
+            field=models.TextField(blank=True, verbose_name='Endereço'),
+        ),
+        migrations.AddField(
+            model_name='salao',
+            name='logo',
+            field=models.ImageField(blank=True, null=True, upload_to='logos_salao/', verbose_name='Logo'),
+        ),
+        migrations.AddField(
+            model_name='salao',
+            name='modulo_cabelo',
+            field=models.BooleanField(default=True, verbose_name='Módulo Cabelo'),
+        ),
+        migrations.AddField(
+            model_name='salao',
+            name='modulo_pele',
+            field=models.BooleanField(default=True, verbose_name='Módulo Pele'),
+        ),
+        migrations.AddField(
+            model_name='salao',
+            name='modulo_unhas',
+            field=models.BooleanField(default=True, verbose_name='Módulo Unhas'),
+        ),
+        migrations.AddField(
+            model_name='salao',
+            name='telefone',
+            field=models.CharField(blank=True, max_length=15, verbose_name='Telefone'),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:34
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_delete_configuracaosalao_salao_email_salao_endereco_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ShardSalao',
+            fields=[
+                ('salao', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='shard', serialize=False, to='core.salao', verbose_name='Salão')),
+                ('banco', models.CharField(help_text='Alias em DATABASES', max_length=100, verbose_name='Banco')),
+                ('bloqueado', models.BooleanField(default=False, help_text='Troca de shard em andamento', verbose_name='Gravações bloqueadas')),
+                ('atualizado_em', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Shard do salão',
+                'verbose_name_plural': 'Shards dos salões',
+            },
+        ),
+    ]
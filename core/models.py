@@ -49,3 +49,18 @@ class Usuario(AbstractUser):
     
     def __str__(self):
         return f"{self.get_full_name() or self.username} ({self.get_tipo_display()})"
+
+
+class ShardSalao(models.Model):
+    """Diretório de shards: banco que guarda os dados do salão (ver core.shards)"""
+    salao = models.OneToOneField(Salao, on_delete=models.CASCADE, primary_key=True, related_name='shard', verbose_name='Salão')
+    banco = models.CharField('Banco', max_length=100, help_text='Alias em DATABASES')
+    bloqueado = models.BooleanField('Gravações bloqueadas', default=False, help_text='Troca de shard em andamento')
+    atualizado_em = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = 'Shard do salão'
+        verbose_name_plural = 'Shards dos salões'
+
+    def __str__(self):
+        return f'{self.salao_id} → {self.banco}'
@@ -0,0 +1,266 @@
+"""
+Particionamento por intervalo de data das tabelas grandes no PostgreSQL.
+
+Com PARTICIONAMENTO = 'mensal' ou 'anual' (DB_PARTICIONAMENTO), as tabelas de
+Agendamento e Transacao passam a ser particionadas por RANGE (data): uma
+partição por mês ou por ano, mais a partição padrão (<tabela>_padrao), que
+recebe as datas fora das partições existentes. Os modelos e o TenantManager
+não mudam. As consultas do dashboard e dos relatórios filtram por data, e o
+PostgreSQL só lê as partições do período (partition pruning).
+
+O PostgreSQL exige que as restrições únicas de uma tabela particionada
+contenham a chave de partição. Por isso:
+
+- a chave primária passa a ser (id, data). O id continua único, gerado por
+  uma sequência comum a todas as partições;
+- as chaves estrangeiras que apontam para a tabela particionada, como
+  Transacao.agendamento e MovimentacaoEstoque.agendamento, são removidas do
+  banco na conversão (e listadas pelo comando). O on_delete continua
+  valendo, pois é aplicado pelo ORM, mas o banco deixa de recusar um
+  agendamento_id inexistente;
+- restrições de exclusão sem igualdade na data, como
+  agendamento_sem_sobreposicao, são criadas em cada partição. Um agendamento
+  começa e termina no mesmo dia, então agendamentos sobrepostos estão
+  sempre na mesma partição.
+
+As migrações nunca convertem as tabelas: o esquema que criam não depende de
+DB_PARTICIONAMENTO. Quem converte é o comando `criar_particoes --converter`,
+depois das migrações servicos.0005 e gestao.0008, que marcam o ponto a partir
+do qual as tabelas podem estar particionadas; revertê-las com as tabelas já
+convertidas levanta IrreversibleError. O mesmo comando, agendado (por
+exemplo, diariamente), cria as partições dos próximos PARTICOES_FUTURAS
+períodos.
+"""
+from django.apps import apps
+from django.conf import settings
+from django.db import transaction
+from django.db.migrations.exceptions import IrreversibleError
+from django.utils import timezone
+
+GRANULARIDADES = ('mensal', 'anual')
+MODELOS_PARTICIONADOS = ('servicos.Agendamento', 'gestao.Transacao')
+CHAVE_PARTICAO = 'data'
+# Migrações a partir das quais as tabelas podem ser convertidas
+MIGRACOES = (('servicos', '0005_particionamento'), ('gestao', '0008_particionamento'))
+
+
+def ativo(conexao):
+    """Se o particionamento está ligado para o banco da conexão"""
+    return conexao.vendor == 'postgresql' and getattr(settings, 'PARTICIONAMENTO', '') in GRANULARIDADES
+
+
+def modelos_particionados():
+    return [apps.get_model(label) for label in MODELOS_PARTICIONADOS]
+
+
+def inicio_periodo(dia, granularidade):
+    """Primeiro dia do mês ou do ano de `dia`"""
+    if granularidade == 'anual':
+        return dia.replace(month=1, day=1)
+    return dia.replace(day=1)
+
+
+def proximo_periodo(inicio, granularidade):
+    """Primeiro dia do período seguinte ao que começa em `inicio`"""
+    if granularidade == 'anual':
+        return inicio.replace(year=inicio.year + 1)
+    if inicio.month == 12:
+        return inicio.replace(year=inicio.year + 1, month=1)
+    return inicio.replace(month=inicio.month + 1)
+
+
+def periodos(de, ate, granularidade):
+    """(início, fim exclusivo) de cada período que cobre os dias de `de` até `ate`"""
+    inicio = inicio_periodo(de, granularidade)
+    while inicio <= ate:
+        fim = proximo_periodo(inicio, granularidade)
+        yield inicio, fim
+        inicio = fim
+
+
+def horizonte(hoje, granularidade, futuros=None):
+    """Início do último período a ter partição: o atual mais `futuros` períodos"""
+    if futuros is None:
+        futuros = getattr(settings, 'PARTICOES_FUTURAS', 3)
+    inicio = inicio_periodo(hoje, granularidade)
+    for _ in range(futuros):
+        inicio = proximo_periodo(inicio, granularidade)
+    return inicio
+
+
+def nome_particao(tabela, inicio, granularidade):
+    if granularidade == 'anual':
+        return f'{tabela}_p{inicio:%Y}'
+    return f'{tabela}_p{inicio:%Y_%m}'
+
+
+def nome_padrao(tabela):
+    return f'{tabela}_padrao'
+
+
+def particionada(conexao, tabela):
+    """Se a tabela já é particionada"""
+    with conexao.cursor() as cursor:
+        cursor.execute('SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(%s)', [tabela])
+        return cursor.fetchone() is not None
+
+
+def _existe(cursor, nome):
+    cursor.execute('SELECT to_regclass(%s) IS NOT NULL', [nome])
+    return cursor.fetchone()[0]
+
+
+def _restricoes_de_exclusao(cursor, tabela):
+    """[(nome, definição)] das restrições de exclusão da tabela"""
+    cursor.execute(
+        "SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint "
+        "WHERE conrelid = %s::regclass AND contype = 'x' ORDER BY conname",
+        [tabela],
+    )
+    return cursor.fetchall()
+
+
+def _estrangeiras_de_entrada(cursor, tabela):
+    """[(tabela de origem, nome)] das chaves estrangeiras de outras tabelas que apontam para esta"""
+    cursor.execute(
+        "SELECT conrelid::regclass::text, conname FROM pg_constraint "
+        "WHERE confrelid = %s::regclass AND conrelid <> confrelid AND contype = 'f' ORDER BY 1, 2",
+        [tabela],
+    )
+    return cursor.fetchall()
+
+
+def _criar_restricoes(cursor, quote_name, particao, restricoes):
+    """Cria na partição as restrições de exclusão, com o nome prefixado pelo da partição"""
+    for nome, definicao in restricoes:
+        cursor.execute(f'ALTER TABLE {quote_name(particao)} ADD CONSTRAINT {quote_name(f"{particao}_{nome}")} {definicao}')
+
+
+def _intervalo(inicio, fim):
+    return f"FOR VALUES FROM ('{inicio.isoformat()}') TO ('{fim.isoformat()}')"
+
+
+def converter(conexao, tabela, granularidade, ate):
+    """
+    Converte uma tabela comum em particionada por data, com as partições dos
+    dados existentes até o período que começa em `ate`.
+
+    Copia as linhas e recria índices, chaves estrangeiras de saída e
+    restrições de exclusão (em cada partição). As chaves estrangeiras de
+    entrada não podem ser recriadas (referenciam só o id) e são removidas.
+    Retorna as removidas, como "tabela.restrição", ou None se a tabela já
+    era particionada.
+    """
+    if particionada(conexao, tabela):
+        return None
+    q = conexao.ops.quote_name
+    chave = q(CHAVE_PARTICAO)
+    nova = f'{tabela}_particionada'
+
+    with transaction.atomic(using=conexao.alias), conexao.cursor() as cursor:
+        # Gravações pendentes de verificação impedem o ALTER TABLE
+        cursor.execute('SET CONSTRAINTS ALL IMMEDIATE')
+
+        # O que o CREATE TABLE ... LIKE não copia: índices (fora os das
+        # restrições), chaves estrangeiras e restrições de exclusão
+        cursor.execute(
+            'SELECT pg_get_indexdef(indice.indexrelid) FROM pg_index indice '
+            'WHERE indice.indrelid = %s::regclass AND NOT EXISTS ('
+            '    SELECT 1 FROM pg_constraint WHERE conrelid = indice.indrelid AND conindid = indice.indexrelid'
+            ')',
+            [tabela],
+        )
+        indices = [definicao for definicao, in cursor.fetchall()]
+        cursor.execute(
+            "SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint "
+            "WHERE conrelid = %s::regclass AND contype = 'f'",
+            [tabela],
+        )
+        estrangeiras = cursor.fetchall()
+        exclusoes = _restricoes_de_exclusao(cursor, tabela)
+        entrada = _estrangeiras_de_entrada(cursor, tabela)
+        cursor.execute(f'SELECT min({chave}), max({chave}) FROM {q(tabela)}')
+        minima, maxima = cursor.fetchone()
+
+        cursor.execute(
+            f'CREATE TABLE {q(nova)} (LIKE {q(tabela)} INCLUDING DEFAULTS INCLUDING CONSTRAINTS) '
+            f'PARTITION BY RANGE ({chave})'
+        )
+        # A sequência do id é recriada abaixo, depois que a antiga some com a tabela
+        cursor.execute(f'ALTER TABLE {q(nova)} ALTER COLUMN id DROP DEFAULT')
+        hoje = timezone.localdate()
+        particoes = [nome_padrao(tabela)]
+        cursor.execute(f'CREATE TABLE {q(particoes[0])} PARTITION OF {q(nova)} DEFAULT')
+        for inicio, fim in periodos(min(minima or hoje, hoje), max(ate, maxima or ate), granularidade):
+            particoes.append(nome_particao(tabela, inicio, granularidade))
+            cursor.execute(f'CREATE TABLE {q(particoes[-1])} PARTITION OF {q(nova)} {_intervalo(inicio, fim)}')
+        cursor.execute(f'INSERT INTO {q(nova)} SELECT * FROM {q(tabela)}')
+
+        # Sem CASCADE: qualquer outro objeto que dependa da tabela interrompe a conversão
+        for origem, nome in entrada:
+            cursor.execute(f'ALTER TABLE {origem} DROP CONSTRAINT {q(nome)}')
+        cursor.execute(f'DROP TABLE {q(tabela)}')
+        cursor.execute(f'ALTER TABLE {q(nova)} RENAME TO {q(tabela)}')
+        cursor.execute(f'ALTER TABLE {q(tabela)} ADD CONSTRAINT {q(f"{tabela}_pkey")} PRIMARY KEY (id, {chave})')
+        sequencia = f'{tabela}_id_seq'
+        cursor.execute(f'CREATE SEQUENCE {q(sequencia)} OWNED BY {q(tabela)}.id')
+        cursor.execute(f"ALTER TABLE {q(tabela)} ALTER COLUMN id SET DEFAULT nextval('{sequencia}')")
+        cursor.execute(f'SELECT setval(%s, coalesce(max(id), 0) + 1, false) FROM {q(tabela)}', [sequencia])
+
+        for definicao in indices:
+            cursor.execute(definicao)
+        for nome, definicao in estrangeiras:
+            cursor.execute(f'ALTER TABLE {q(tabela)} ADD CONSTRAINT {q(nome)} {definicao}')
+        for particao in particoes:
+            _criar_restricoes(cursor, q, particao, exclusoes)
+    return [f'{origem}.{nome}' for origem, nome in entrada]
+
+
+def criar_particoes(conexao, tabela, granularidade, ate, hoje=None):
+    """
+    Cria as partições que faltam, do período atual até o que começa em `ate`.
+
+    Linhas desses períodos que estavam na partição padrão passam para a nova
+    partição. Retorna os nomes das partições criadas.
+    """
+    q = conexao.ops.quote_name
+    padrao = nome_padrao(tabela)
+    criadas = []
+    with transaction.atomic(using=conexao.alias), conexao.cursor() as cursor:
+        cursor.execute('SET CONSTRAINTS ALL IMMEDIATE')
+        # Execuções simultâneas do comando esperam umas pelas outras
+        cursor.execute('SELECT pg_advisory_xact_lock(hashtext(%s))', [tabela])
+        restricoes = [
+            (nome.removeprefix(f'{padrao}_'), definicao)
+            for nome, definicao in _restricoes_de_exclusao(cursor, padrao)
+        ]
+        for inicio, fim in periodos(hoje or timezone.localdate(), ate, granularidade):
+            particao = nome_particao(tabela, inicio, granularidade)
+            if _existe(cursor, particao):
+                continue
+            cursor.execute(f'CREATE TABLE {q(particao)} (LIKE {q(tabela)} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)')
+            cursor.execute(
+                f'WITH movidas AS ('
+                f'    DELETE FROM {q(padrao)} WHERE {q(CHAVE_PARTICAO)} >= %s AND {q(CHAVE_PARTICAO)} < %s RETURNING *'
+                f') INSERT INTO {q(particao)} SELECT * FROM movidas',
+                [inicio, fim],
+            )
+            _criar_restricoes(cursor, q, particao, restricoes)
+            # Os índices da tabela particionada são criados na partição ao anexá-la
+            cursor.execute(f'ALTER TABLE {q(tabela)} ATTACH PARTITION {q(particao)} {_intervalo(inicio, fim)}')
+            criadas.append(particao)
+    return criadas
+
+
+def impedir_reversao(modelo, conexao):
+    """
+    Reversão das migrações de particionamento: levanta IrreversibleError se
+    a tabela do modelo já foi convertida, pois as migrações anteriores
+    pressupõem uma tabela comum.
+    """
+    tabela = modelo._meta.db_table
+    if conexao.vendor == 'postgresql' and particionada(conexao, tabela):
+        raise IrreversibleError(
+            f'A tabela {tabela} é particionada (criar_particoes --converter) e não volta a ser uma '
+            f'tabela comum pelas migrações.'
+        )
@@ -0,0 +1,216 @@
+"""
+Leituras em réplica para dashboards e relatórios.
+
+O RoteadorReplica só manda leituras para a réplica (REPLICA_ALIAS) dentro de
+usar_replica, usado pelas views de relatório através de
+replica_para_leitura. Fora dele, e sem a réplica configurada em DATABASES,
+tudo vai para o banco principal.
+
+A réplica pode estar atrasada em relação ao principal. Por isso qualquer
+gravação fixa o restante da requisição (ou do bloco usar_replica) no
+principal, e o ReplicaMiddleware estende a fixação às requisições seguintes
+do mesmo navegador por REPLICA_FIXACAO_SEGUNDOS, com um cookie. Assim quem
+acabou de gravar, por exemplo no POST antes do redirect, sempre vê a
+própria gravação.
+"""
+import time
+from contextvars import ContextVar
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+REPLICA_ALIAS = getattr(settings, 'REPLICA_ALIAS', 'replica')
+REPLICA_FIXACAO_SEGUNDOS = getattr(settings, 'REPLICA_FIXACAO_SEGUNDOS', 15)
+COOKIE_FIXACAO = 'primario_ate'
+
+METODOS_LEITURA = ('GET', 'HEAD', 'OPTIONS')
+
+_usar_replica = ContextVar('usar_replica', default=False)
+_estado_atual = ContextVar('estado_replica', default=None)
+
+
+class EstadoReplica:
+    """
+    Fixação no banco principal de uma requisição ou bloco.
+
+    É um objeto mutável guardado na ContextVar, para que gravações feitas em
+    threads de sync_to_async também fixem a requisição que as chamou.
+    """
+
+    def __init__(self, fixado=False):
+        self.fixado = fixado
+        self.gravou = False
+
+    def registrar_gravacao(self):
+        self.fixado = True
+        self.gravou = True
+
+
+def replica_configurada():
+    return REPLICA_ALIAS in connections.settings
+
+
+def lendo_da_replica():
+    """Se as leituras do contexto atual vão para a réplica"""
+    estado = _estado_atual.get()
+    return (
+        _usar_replica.get() and replica_configurada()
+        and not (estado is not None and estado.fixado)
+    )
+
+
+class usar_replica:
+    """
+    Envia as leituras de um bloco ou de uma função para a réplica.
+
+    Funciona como gerenciador de contexto (síncrono ou assíncrono) e como
+    decorador de funções e corrotinas, como core.utils.usar_salao. Uma
+    gravação dentro do bloco fixa o restante dele no banco principal.
+    """
+
+    def __init__(self):
+        self._tokens = []
+
+    def __enter__(self):
+        tokens = [_usar_replica.set(True)]
+        if _estado_atual.get() is None:
+            tokens.append(_estado_atual.set(EstadoReplica()))
+        self._tokens.append(tokens)
+        return self
+
+    def __exit__(self, *exc_info):
+        for token in reversed(self._tokens.pop()):
+            token.var.reset(token)
+
+    async def __aenter__(self):
+        return self.__enter__()
+
+    async def __aexit__(self, *exc_info):
+        self.__exit__(*exc_info)
+
+    def __call__(self, func):
+        if iscoroutinefunction(func):
+            @wraps(func)
+            async def inner(*args, **kwargs):
+                with usar_replica():
+                    return await func(*args, **kwargs)
+        else:
+            @wraps(func)
+            def inner(*args, **kwargs):
+                with usar_replica():
+                    return func(*args, **kwargs)
+        return inner
+
+
+def replica_para_leitura(view):
+    """Decorador de views: requisições de leitura (GET, HEAD, OPTIONS) leem da réplica"""
+    if iscoroutinefunction(view):
+        @wraps(view)
+        async def inner(request, *args, **kwargs):
+            if request.method not in METODOS_LEITURA:
+                return await view(request, *args, **kwargs)
+            with usar_replica():
+                return await view(request, *args, **kwargs)
+    else:
+        @wraps(view)
+        def inner(request, *args, **kwargs):
+            if request.method not in METODOS_LEITURA:
+                return view(request, *args, **kwargs)
+            with usar_replica():
+                return view(request, *args, **kwargs)
+    return inner
+
+
+def iterar_na_replica(iteravel):
+    """
+    Itera na réplica, como usar_replica, um iterável consumido depois que a
+    view retorna (por exemplo, o conteúdo de uma StreamingHttpResponse). A
+    réplica fica ativa só durante cada next(), sem vazar para quem consome.
+    """
+    iterador = iter(iteravel)
+    while True:
+        with usar_replica():
+            try:
+                item = next(iterador)
+            except StopIteration:
+                return
+        yield item
+
+
+class RoteadorReplica:
+    """Roteador de banco: leituras na réplica dentro de usar_replica, o resto no principal"""
+
+    def db_for_read(self, model, **hints):
+        if lendo_da_replica():
+            return REPLICA_ALIAS
+        return None
+
+    def db_for_write(self, model, **hints):
+        estado = _estado_atual.get()
+        if estado is not None:
+            estado.registrar_gravacao()
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Réplica e principal têm os mesmos dados: objetos lidos de um podem
+        # ser relacionados a objetos gravados no outro
+        bancos = {DEFAULT_DB_ALIAS, REPLICA_ALIAS}
+        if obj1._state.db in bancos and obj2._state.db in bancos:
+            return True
+        return None
+
+
+class ReplicaMiddleware:
+    """
+    Mantém no banco principal, por REPLICA_FIXACAO_SEGUNDOS, as requisições
+    de quem acabou de gravar.
+
+    A requisição que grava recebe o cookie COOKIE_FIXACAO com o instante até
+    o qual as leituras do navegador ignoram a réplica. Suporta os modos
+    síncrono e assíncrono.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def estado_inicial(self, request):
+        try:
+            fixado = float(request.COOKIES.get(COOKIE_FIXACAO, 0)) > time.time()
+        except ValueError:
+            fixado = False
+        return EstadoReplica(fixado=fixado)
+
+    def registrar_fixacao(self, estado, response):
+        if estado.gravou:
+            response.set_cookie(
+                COOKIE_FIXACAO, f'{time.time() + REPLICA_FIXACAO_SEGUNDOS:.3f}',
+                max_age=REPLICA_FIXACAO_SEGUNDOS, httponly=True, samesite='Lax',
+            )
+        return response
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        estado = self.estado_inicial(request)
+        token = _estado_atual.set(estado)
+        try:
+            response = self.get_response(request)
+        finally:
+            _estado_atual.reset(token)
+        return self.registrar_fixacao(estado, response)
+
+    async def __acall__(self, request):
+        estado = self.estado_inicial(request)
+        token = _estado_atual.set(estado)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _estado_atual.reset(token)
+        return self.registrar_fixacao(estado, response)
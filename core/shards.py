@@ -0,0 +1,529 @@
+"""
+Salões distribuídos entre vários bancos (shards).
+
+Os dados de cada salão ficam em um único banco, o shard do salão. São os
+usuários, profissionais, serviços, agendamentos, estoque e financeiro:
+todos os modelos com o campo `salao` e as suas tabelas de ligação. O
+diretório é a tabela ShardSalao do banco principal. Um salão sem linha no
+diretório fica no principal. O diretório é lido pelo CacheSalao `diretorio`,
+e a troca de shard vale na requisição seguinte de todos os processos. Isso
+depende de um cache compartilhado entre eles (CACHE_REDIS_URL): com o
+LocMemCache, o bloqueio gravado pelo comando mover_salao não chegaria aos
+workers, que continuariam gravando na origem durante a sincronização e
+depois dela. Por isso MovimentacaoSalao recusa rodar sem ele.
+
+O RoteadorShard manda as consultas desses modelos ao shard. O shard é o do
+banco fixado por usar_banco (o TenantMiddleware fixa o da requisição); sem
+ele, o do salão da instância consultada ou gravada; sem ela, o do salão
+atual. Salao e Modulo são gravados no principal, e os signals mantêm cópias
+nos shards para as chaves estrangeiras e as junções. Por isso as leituras
+dentro de um salão usam a cópia do shard. Fora de um salão (comandos,
+admin), as consultas vão ao principal. Tarefas que percorrem todos os
+salões devem tratar cada salão em usar_salao, ou cada shard em usar_banco.
+
+Os ids são sequenciais em cada banco: ao trocar de shard
+(MovimentacaoSalao, comando mover_salao), as linhas do salão recebem ids
+novos. O login fica na sessão junto com o salão e o banco, e as sessões
+abertas antes da troca são encerradas.
+
+Grupos e permissões (auth.Group e auth.Permission) só existem no
+principal, e as ligações do Usuario com eles não vão para os shards: os
+usuários de um salão em um shard não têm grupos nem permissões (os papéis
+do salão ficam em Usuario.tipo). O Django recusa ligá-los a um usuário de
+shard (ValueError, objetos em bancos diferentes), e um salão cujos usuários
+os tenham não é movido para um shard.
+
+Sem SHARDS nas configurações (DB_SHARDS), tudo fica no principal, e nada
+disso é consultado.
+"""
+import functools
+import time
+from collections import namedtuple
+from contextvars import ContextVar
+from functools import wraps
+from inspect import iscoroutinefunction
+
+from django.apps import apps
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+
+from .utils import CacheSalao, cache_compartilhado, get_current_salao
+
+# Modelos comuns a todos os salões, com cópias em cada shard
+REFERENCIAS = ('core.Salao', 'servicos.Modulo')
+DIRETORIO = 'core.ShardSalao'
+
+# Chaves da sessão gravadas no login
+SESSAO_SALAO = 'salao_id'
+SESSAO_BANCO = 'salao_banco'
+
+Localizacao = namedtuple('Localizacao', 'banco bloqueado')
+# Sem shards: nenhum banco fixado
+SEM_SHARD = Localizacao(None, False)
+
+diretorio = CacheSalao(
+    'shard',
+    timeout=getattr(settings, 'SHARD_CACHE_TIMEOUT', 60 * 60),
+    ttl_local=getattr(settings, 'SHARD_CACHE_LOCAL_TTL', 60 * 5),
+)
+
+_banco_atual = ContextVar('banco_atual', default=None)
+
+
+def sharding_ativo():
+    return bool(getattr(settings, 'SHARDS', None))
+
+
+def shards():
+    """Aliases dos bancos que guardam salões, começando pelo principal"""
+    return [DEFAULT_DB_ALIAS, *getattr(settings, 'SHARDS', [])]
+
+
+def localizar_salao(salao_id):
+    """Banco do salão e se as gravações nele estão bloqueadas (troca de shard em andamento)"""
+    def carregar():
+        linha = (
+            apps.get_model(DIRETORIO).objects.using(DEFAULT_DB_ALIAS)
+            .filter(salao_id=salao_id).values_list('banco', 'bloqueado').first()
+        )
+        return tuple(linha) if linha else (DEFAULT_DB_ALIAS, False)
+    return Localizacao(*diretorio.obter(salao_id, 'localizacao', carregar))
+
+
+def invalidar_localizacao(salao_id):
+    diretorio.invalidar(salao_id)
+
+
+class usar_banco:
+    """
+    Fixa o banco dos modelos de salão dentro de um bloco ou de uma função.
+
+    Funciona como gerenciador de contexto (síncrono ou assíncrono) e como
+    decorador de funções e corrotinas, como core.utils.usar_salao. None não
+    fixa nenhum banco.
+    """
+
+    def __init__(self, banco):
+        self.banco = banco
+        self._tokens = []
+
+    def __enter__(self):
+        self._tokens.append(_banco_atual.set(self.banco))
+        return self.banco
+
+    def __exit__(self, *exc_info):
+        _banco_atual.reset(self._tokens.pop())
+
+    async def __aenter__(self):
+        return self.__enter__()
+
+    async def __aexit__(self, *exc_info):
+        self.__exit__(*exc_info)
+
+    def __call__(self, func):
+        banco = self.banco
+
+        if iscoroutinefunction(func):
+            @wraps(func)
+            async def inner(*args, **kwargs):
+                with usar_banco(banco):
+                    return await func(*args, **kwargs)
+        else:
+            @wraps(func)
+            def inner(*args, **kwargs):
+                with usar_banco(banco):
+                    return func(*args, **kwargs)
+        return inner
+
+
+def usar_banco_do_sinal(receptor):
+    """
+    Decorador de receptores de signals de modelo: as consultas do receptor
+    vão para o banco da gravação (argumento `using`), mesmo fora de um salão.
+    """
+    @wraps(receptor)
+    def inner(sender, **kwargs):
+        with usar_banco(kwargs.get('using')):
+            return receptor(sender, **kwargs)
+    return inner
+
+
+def banco_fixado():
+    """Banco fixado por usar_banco no contexto atual (ou None)"""
+    return _banco_atual.get()
+
+
+def fora_de_contexto():
+    """Se não há banco fixado nem salão atual (por exemplo, no login pelo domínio principal)"""
+    return _banco_atual.get() is None and get_current_salao() is None
+
+
+def _ligacoes_por_salao():
+    """
+    Modelos com salão e {tabela de ligação criada pelo Django: (campo
+    muitos-para-muitos, campo do salão para filtros)} das ligações deles
+    """
+    salao = apps.get_model('core', 'Salao')
+    diretorio_shards = apps.get_model(DIRETORIO)
+    modelos, ligacoes = [], {}
+    for modelo in apps.get_models():
+        if modelo is diretorio_shards or modelo._meta.proxy:
+            continue
+        if any(campo.name == 'salao' and campo.related_model is salao for campo in modelo._meta.concrete_fields):
+            modelos.append(modelo)
+            for campo in modelo._meta.local_many_to_many:
+                ligacao = campo.remote_field.through
+                if ligacao._meta.auto_created:
+                    ligacoes[ligacao] = (campo, f'{campo.m2m_field_name()}__salao_id')
+    return modelos, ligacoes
+
+
+@functools.cache
+def ligacoes_fora_do_shard():
+    """
+    {tabela de ligação: campo do salão} das ligações de modelos do salão com
+    modelos que só existem no principal: os grupos e as permissões do
+    Usuario. Não vão para os shards, onde não haveria para onde apontar.
+    """
+    modelos, ligacoes = _ligacoes_por_salao()
+    return {
+        ligacao: filtro for ligacao, (campo, filtro) in ligacoes.items()
+        if campo.related_model not in modelos and campo.related_model not in modelos_de_referencia()
+    }
+
+
+@functools.cache
+def modelos_por_salao():
+    """
+    {modelo: campo do salão para filtros} dos modelos guardados no shard do
+    salão, em ordem de dependência (as chaves estrangeiras apontam para
+    modelos anteriores).
+    """
+    modelos, ligacoes = _ligacoes_por_salao()
+    campos = {modelo: 'salao_id' for modelo in modelos}
+    for ligacao, (_, filtro) in ligacoes.items():
+        if ligacao not in ligacoes_fora_do_shard():
+            campos[ligacao] = filtro
+
+    ordem = []
+
+    def visitar(modelo):
+        if modelo in ordem:
+            return
+        for campo in modelo._meta.concrete_fields:
+            if campo.is_relation and campo.related_model in campos and campo.related_model is not modelo:
+                visitar(campo.related_model)
+        ordem.append(modelo)
+
+    for modelo in campos:
+        visitar(modelo)
+    return {modelo: campos[modelo] for modelo in ordem}
+
+
+@functools.cache
+def modelos_de_referencia():
+    return tuple(apps.get_model(label) for label in REFERENCIAS)
+
+
+def _salao_da_instancia(instancia):
+    if instancia is None:
+        return None
+    if isinstance(instancia, apps.get_model('core', 'Salao')):
+        return instancia.pk
+    return getattr(instancia, 'salao_id', None)
+
+
+def banco_de(modelo, instancia=None):
+    """Banco dos dados do modelo no contexto atual (o principal fora de um salão)"""
+    banco = _banco_atual.get()
+    if banco is not None or not sharding_ativo():
+        return banco or DEFAULT_DB_ALIAS
+    salao_id = _salao_da_instancia(instancia)
+    if salao_id is None:
+        salao = get_current_salao()
+        salao_id = salao.id if salao else None
+    return localizar_salao(salao_id).banco if salao_id else DEFAULT_DB_ALIAS
+
+
+class RoteadorShard:
+    """
+    Roteador de banco: modelos de salão no shard do salão e leituras de Salao
+    e Modulo na cópia do shard. Para o banco principal, devolve None e deixa a
+    decisão para os roteadores seguintes (réplica de leitura).
+    """
+
+    def db_for_read(self, model, **hints):
+        if not sharding_ativo():
+            return None
+        if model in modelos_por_salao() or model in modelos_de_referencia():
+            banco = banco_de(model, hints.get('instance'))
+            return None if banco == DEFAULT_DB_ALIAS else banco
+        return None
+
+    def db_for_write(self, model, **hints):
+        if not sharding_ativo() or model not in modelos_por_salao():
+            return None
+        banco = banco_de(model, hints.get('instance'))
+        return None if banco == DEFAULT_DB_ALIAS else banco
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Salao e Modulo existem em todos os bancos com os mesmos ids
+        referencias = modelos_de_referencia()
+        if sharding_ativo() and (isinstance(obj1, referencias) or isinstance(obj2, referencias)):
+            return True
+        return None
+
+
+def copiar_objetos(modelo, objetos, banco):
+    """
+    Grava em `banco` cópias exatas dos objetos, com a mesma chave primária,
+    sem signals e sem os valores automáticos (auto_now) dos campos.
+    """
+    gerenciador = modelo._base_manager.using(banco)
+    existentes = set(gerenciador.filter(pk__in=[objeto.pk for objeto in objetos]).values_list('pk', flat=True))
+    campos = [campo for campo in modelo._meta.concrete_fields if not campo.primary_key]
+    for objeto in objetos:
+        if objeto.pk in existentes:
+            gerenciador.filter(pk=objeto.pk).update(**{campo.attname: getattr(objeto, campo.attname) for campo in campos})
+    novos = [objeto for objeto in objetos if objeto.pk not in existentes]
+    if novos:
+        gerenciador._insert(novos, fields=modelo._meta.concrete_fields, raw=True, using=banco)
+
+
+def replicar_referencias(salao, banco):
+    """Copia o salão e os módulos para o shard"""
+    if banco == DEFAULT_DB_ALIAS:
+        return
+    salao_modelo, modulo_modelo = modelos_de_referencia()
+    with transaction.atomic(using=banco):
+        copiar_objetos(salao_modelo, [salao], banco)
+        copiar_objetos(modulo_modelo, list(modulo_modelo._base_manager.using(DEFAULT_DB_ALIAS)), banco)
+
+
+def _lotes_de_pks(queryset, tamanho):
+    """Chaves primárias do queryset em lotes, por ordem crescente"""
+    ultimo = None
+    while True:
+        pagina = queryset.order_by('pk')
+        if ultimo is not None:
+            pagina = pagina.filter(pk__gt=ultimo)
+        pks = list(pagina.values_list('pk', flat=True)[:tamanho])
+        if not pks:
+            return
+        yield pks
+        ultimo = pks[-1]
+
+
+class MovimentacaoSalao:
+    """
+    Move os dados de um salão para outro shard sem tirar o salão do ar.
+
+    1. copiar(): copia as linhas em lotes, com o salão funcionando
+       normalmente no shard de origem. Guarda, para cada linha, o id novo e
+       uma impressão digital dos valores.
+    2. bloquear(): bloqueia as gravações do salão. O TenantMiddleware
+       responde 503 a requisições que não são de leitura.
+    3. sincronizar(): repassa ao destino as linhas criadas, alteradas e
+       excluídas na origem desde a cópia.
+    4. concluir(): aponta o diretório para o destino e desbloqueia.
+    5. apagar_origem(): apaga da origem, em lotes, as linhas copiadas.
+
+    As chaves estrangeiras entre as linhas do salão são traduzidas para os
+    ids novos. Salao e Modulo mantêm os ids. Erros de uso, inclusive a falta
+    de um cache compartilhado com os workers e usuários com grupos ou
+    permissões indo para um shard, levantam ValueError.
+    """
+
+    def __init__(self, salao, destino, tamanho_lote=1000):
+        if destino not in shards():
+            raise ValueError(f'O banco {destino} não está em SHARDS.')
+        if not cache_compartilhado():
+            raise ValueError(
+                'A troca de shard requer um cache compartilhado entre os processos (CACHE_REDIS_URL): '
+                'com o cache local, os workers não veriam o bloqueio das gravações.'
+            )
+        self.salao = salao
+        self.origem = localizar_salao(salao.id).banco
+        self.destino = destino
+        if self.origem == destino:
+            raise ValueError(f'O salão já está no banco {destino}.')
+        if destino != DEFAULT_DB_ALIAS:
+            ligacoes = sum(
+                ligacao._base_manager.using(self.origem).filter(**{campo: salao.id}).count()
+                for ligacao, campo in ligacoes_fora_do_shard().items()
+            )
+            if ligacoes:
+                raise ValueError(
+                    f'Os usuários do salão têm {ligacoes} grupo(s) ou permissão(ões), que não existem nos shards. '
+                    'Remova-os antes de mover o salão.'
+                )
+        self.tamanho_lote = tamanho_lote
+        # {modelo: {id na origem: (id no destino, impressão digital)}}
+        self.mapa = {modelo: {} for modelo in modelos_por_salao()}
+
+    def linhas(self, modelo, banco):
+        """QuerySet das linhas do salão no banco"""
+        return modelo._base_manager.using(banco).filter(**{modelos_por_salao()[modelo]: self.salao.id})
+
+    def _campos(self, modelo):
+        return [campo for campo in modelo._meta.concrete_fields if not campo.primary_key]
+
+    def _ler(self, modelo, pks):
+        """[(pk, valores)] das linhas da origem"""
+        atributos = [campo.attname for campo in self._campos(modelo)]
+        return [
+            (linha[0], linha[1:])
+            for linha in modelo._base_manager.using(self.origem).filter(pk__in=pks).order_by('pk')
+            .values_list('pk', *atributos)
+        ]
+
+    def _traduzir(self, modelo, valores):
+        """Objeto (sem id) com as chaves estrangeiras apontando para os ids do destino"""
+        dados = {}
+        for campo, valor in zip(self._campos(modelo), valores):
+            if valor is not None and campo.is_relation and campo.related_model in self.mapa:
+                try:
+                    valor = self.mapa[campo.related_model][valor][0]
+                except KeyError:
+                    raise ValueError(
+                        f'{modelo._meta.label}.{campo.name} aponta para {campo.related_model._meta.label} '
+                        f'{valor}, que não é do salão.'
+                    )
+            dados[campo.attname] = valor
+        return modelo(**dados)
+
+    def _referencias_copiadas(self, modelo, valores):
+        """Se as linhas do salão para as quais a linha aponta já estão no destino"""
+        return all(
+            valor is None or not (campo.is_relation and campo.related_model in self.mapa)
+            or valor in self.mapa[campo.related_model]
+            for campo, valor in zip(self._campos(modelo), valores)
+        )
+
+    def _inserir(self, modelo, linhas):
+        """Insere as linhas [(pk na origem, valores)] no destino e registra os ids novos"""
+        campos = self._campos(modelo)
+        objetos = [self._traduzir(modelo, valores) for _, valores in linhas]
+        conexao = connections[self.destino]
+        tamanho = 1
+        if conexao.features.can_return_rows_from_bulk_insert:
+            tamanho = conexao.ops.bulk_batch_size(campos, objetos) or len(objetos)
+        novos = []
+        for inicio in range(0, len(objetos), tamanho):
+            novos += modelo._base_manager.using(self.destino)._insert(
+                objetos[inicio:inicio + tamanho], fields=campos,
+                returning_fields=[modelo._meta.pk], raw=True, using=self.destino,
+            )
+        for (pk, valores), (novo,) in zip(linhas, novos):
+            self.mapa[modelo][pk] = (novo, hash(valores))
+
+    def preparar(self):
+        """Copia o salão e os módulos e apaga do destino restos de uma movimentação interrompida"""
+        replicar_referencias(self.salao, self.destino)
+        self._apagar(self.destino)
+
+    def copiar(self):
+        """Primeira cópia, em lotes, com o salão no ar"""
+        for modelo in self.mapa:
+            for pks in _lotes_de_pks(self.linhas(modelo, self.origem), self.tamanho_lote):
+                # Linhas que apontam para outras criadas durante a cópia ficam para sincronizar()
+                linhas = [linha for linha in self._ler(modelo, pks) if self._referencias_copiadas(modelo, linha[1])]
+                if linhas:
+                    with transaction.atomic(using=self.destino):
+                        self._inserir(modelo, linhas)
+
+    def _registrar_diretorio(self, banco, bloqueado):
+        apps.get_model(DIRETORIO).objects.using(DEFAULT_DB_ALIAS).update_or_create(
+            salao_id=self.salao.id, defaults={'banco': banco, 'bloqueado': bloqueado},
+        )
+
+    def bloquear(self):
+        self._registrar_diretorio(self.origem, True)
+
+    def desbloquear(self):
+        self._registrar_diretorio(self.origem, False)
+
+    def sincronizar(self):
+        """Repassa ao destino o que mudou na origem desde copiar(); com as gravações bloqueadas"""
+        with transaction.atomic(using=self.destino):
+            # Primeiro as exclusões, na ordem inversa (as linhas que apontam
+            # para outras antes), para que um valor único liberado na origem
+            # possa ser reaproveitado por uma linha nova
+            for modelo in reversed(list(self.mapa)):
+                vistos = set(self.linhas(modelo, self.origem).values_list('pk', flat=True).iterator())
+                removidos = [self.mapa[modelo].pop(pk)[0] for pk in set(self.mapa[modelo]) - vistos]
+                for inicio in range(0, len(removidos), self.tamanho_lote):
+                    modelo._base_manager.using(self.destino).filter(
+                        pk__in=removidos[inicio:inicio + self.tamanho_lote]
+                    )._raw_delete(self.destino)
+
+            for modelo, mapa in self.mapa.items():
+                alterados = []
+                for pks in _lotes_de_pks(self.linhas(modelo, self.origem), self.tamanho_lote):
+                    novas = []
+                    for pk, valores in self._ler(modelo, pks):
+                        if pk not in mapa:
+                            novas.append((pk, valores))
+                        elif mapa[pk][1] != hash(valores):
+                            objeto = self._traduzir(modelo, valores)
+                            objeto.pk = mapa[pk][0]
+                            alterados.append(objeto)
+                            mapa[pk] = (mapa[pk][0], hash(valores))
+                    if novas:
+                        self._inserir(modelo, novas)
+                if alterados:
+                    modelo._base_manager.using(self.destino).bulk_update(
+                        alterados, [campo.name for campo in self._campos(modelo)], batch_size=self.tamanho_lote,
+                    )
+
+    def concluir(self):
+        """Aponta o diretório para o destino e libera as gravações"""
+        from gestao.dashboard import invalidar_dashboard
+        from servicos.catalogo import invalidar_catalogo
+
+        self._registrar_diretorio(self.destino, False)
+        invalidar_catalogo(self.salao.id)
+        invalidar_dashboard(self.salao.id)
+
+    def _apagar(self, banco):
+        """Apaga as linhas do salão no banco, em lotes, na ordem inversa das dependências"""
+        total = 0
+        # Ligações com grupos e permissões criadas durante a movimentação
+        for ligacao, campo in ligacoes_fora_do_shard().items():
+            ligacao._base_manager.using(banco).filter(**{campo: self.salao.id})._raw_delete(banco)
+        for modelo in reversed(list(self.mapa)):
+            linhas = self.linhas(modelo, banco)
+            while pks := list(linhas.values_list('pk', flat=True)[:self.tamanho_lote]):
+                with transaction.atomic(using=banco):
+                    total += modelo._base_manager.using(banco).filter(pk__in=pks)._raw_delete(banco)
+        return total
+
+    def apagar_origem(self):
+        """Apaga da origem as linhas do salão (e a cópia do salão, se a origem é um shard)"""
+        total = self._apagar(self.origem)
+        if self.origem != DEFAULT_DB_ALIAS:
+            modelos_de_referencia()[0]._base_manager.using(self.origem).filter(pk=self.salao.id)._raw_delete(self.origem)
+        return total
+
+    def bloquear_e_sincronizar(self, espera=5):
+        """
+        bloquear() e sincronizar(). `espera` é o tempo, em segundos, para as
+        requisições que já estavam em andamento terminarem depois do
+        bloqueio. Em caso de erro, desbloqueia o salão na origem.
+        """
+        self.bloquear()
+        try:
+            time.sleep(espera)
+            self.sincronizar()
+        except BaseException:
+            self.desbloquear()
+            raise
+
+    def executar(self, espera=5, manter_origem=False):
+        """Todas as etapas"""
+        self.preparar()
+        self.copiar()
+        self.bloquear_e_sincronizar(espera)
+        self.concluir()
+        if not manter_origem:
+            self.apagar_origem()
@@ -0,0 +1,104 @@
+from django.conf import settings
+from django.contrib.auth.signals import user_logged_in
+from django.db import DEFAULT_DB_ALIAS
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from servicos.models import Modulo
+from . import instrumentacao, shards
+from .backends import invalidar_usuarios
+from .models import Salao, ShardSalao, Usuario
+from .utils import invalidar_salao_subdominio
+
+
+@receiver(pre_save, sender=Salao)
+def guardar_subdominio_anterior(sender, instance, **kwargs):
+    """Guarda o subdomínio original para invalidar o cache se ele mudar"""
+    instance._subdominio_anterior = None
+    if instance.pk and not instance._state.adding:
+        instance._subdominio_anterior = sender._base_manager.filter(pk=instance.pk).values_list(
+            'subdominio', flat=True
+        ).first()
+
+
+@receiver(post_save, sender=Salao)
+@receiver(post_delete, sender=Salao)
+def invalidar_cache_salao(sender, instance, **kwargs):
+    invalidar_salao_subdominio(instance.subdominio)
+    anterior = getattr(instance, '_subdominio_anterior', None)
+    if anterior and anterior != instance.subdominio:
+        invalidar_salao_subdominio(anterior)
+
+
+@receiver(post_save, sender=Salao)
+def invalidar_usuarios_do_salao(sender, instance, created, **kwargs):
+    """Os usuários em cache carregam uma cópia do salão"""
+    if not created and getattr(settings, 'USUARIO_CACHE_TIMEOUT', 0):
+        usuarios = instance.usuarios.values_list('pk', flat=True)
+        invalidar_usuarios(*usuarios, banco=usuarios.db)
+
+
+@receiver(post_save, sender=Usuario)
+@receiver(post_delete, sender=Usuario)
+def invalidar_cache_usuario(sender, instance, using, **kwargs):
+    invalidar_usuarios(instance.pk, banco=using)
+
+
+@receiver(user_logged_in)
+def guardar_salao_na_sessao(sender, request, user, **kwargs):
+    """O salão e o banco da sessão dizem de onde carregar o usuário (ver TenantMiddleware)"""
+    request.session[shards.SESSAO_SALAO] = user.salao_id
+    request.session[shards.SESSAO_BANCO] = shards.banco_de(sender, user)
+
+
+@receiver(post_save, sender=Salao)
+def replicar_salao(sender, instance, created, using, **kwargs):
+    """Salões novos vão para SHARD_NOVOS_SALOES; o shard guarda uma cópia do salão"""
+    if not shards.sharding_ativo() or using != DEFAULT_DB_ALIAS:
+        return
+    novos = getattr(settings, 'SHARD_NOVOS_SALOES', DEFAULT_DB_ALIAS)
+    if created and novos != DEFAULT_DB_ALIAS:
+        ShardSalao.objects.create(salao=instance, banco=novos)
+    shards.replicar_referencias(instance, shards.localizar_salao(instance.pk).banco)
+
+
+@receiver(pre_delete, sender=Salao)
+def guardar_shard_anterior(sender, instance, using, **kwargs):
+    instance._shard_anterior = None
+    if shards.sharding_ativo() and using == DEFAULT_DB_ALIAS:
+        instance._shard_anterior = shards.localizar_salao(instance.pk).banco
+
+
+@receiver(post_delete, sender=Salao)
+def excluir_salao_do_shard(sender, instance, **kwargs):
+    """Os dados do salão no shard saem junto com a cópia do salão"""
+    banco = getattr(instance, '_shard_anterior', None)
+    if banco and banco != DEFAULT_DB_ALIAS:
+        sender._base_manager.using(banco).filter(pk=instance.pk).delete()
+
+
+@receiver(post_save, sender=ShardSalao)
+@receiver(post_delete, sender=ShardSalao)
+def invalidar_diretorio(sender, instance, **kwargs):
+    shards.invalidar_localizacao(instance.salao_id)
+
+
+@receiver(post_save, sender=Modulo)
+def replicar_modulo(sender, instance, using, **kwargs):
+    if shards.sharding_ativo() and using == DEFAULT_DB_ALIAS:
+        for banco in shards.shards()[1:]:
+            shards.copiar_objetos(sender, [instance], banco)
+
+
+@receiver(post_delete, sender=Modulo)
+def excluir_modulo_dos_shards(sender, instance, using, **kwargs):
+    if shards.sharding_ativo() and using == DEFAULT_DB_ALIAS:
+        for banco in shards.shards()[1:]:
+            sender._base_manager.using(banco).filter(pk=instance.pk).delete()
+
+
+@receiver(connection_created)
+def instalar_instrumentacao(sender, connection, **kwargs):
+    """Toda conexão passa pelo execute_wrapper da instrumentação (inativo fora de uma medição)"""
+    instrumentacao.instalar(connection)
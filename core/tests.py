@@ -1,3 +1,1032 @@
-from django.test import TestCase
+import asyncio
+import importlib.util
+import io
+import os
+import tempfile
+import time as relogio
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, time, timedelta
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from django.contrib.auth.models import Group, Permission
+from django.core.cache import cache
+from django.db import connection, connections
+from django.db.migrations.exceptions import IrreversibleError
+from django.http import Http404
+from django.core.management import CommandError, call_command
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from gestao.estoque import saldo_por_movimentacoes
+from gestao.financeiro import verificar_resumo
+from gestao.models import Material, Transacao
+from servicos.models import Agendamento, Modulo, Profissional, Servico
+from .backends import UsuarioSalaoBackend
+from . import instrumentacao, particionamento
+from .dados_sinteticos import GeradorDadosSinteticos
+from .instrumentacao import historico, impressao_digital, limpar_historico, medir_consultas
+from .middleware import TenantMiddleware
+from .models import Salao, ShardSalao, Usuario
+from .replicas import COOKIE_FIXACAO, REPLICA_ALIAS, iterar_na_replica, usar_replica
+from .shards import SESSAO_BANCO, MovimentacaoSalao, diretorio, localizar_salao, modelos_por_salao, usar_banco
+from .testutils import CargaTestMixin, PlanoConsultaMixin
+from .utils import (
+    CacheLRU, CacheSalao, _saloes_por_subdominio, buscar_salao_por_subdominio, extrair_subdominio,
+    get_current_salao, set_current_salao, reset_current_salao, usar_salao,
+)
+
+
+class ContextoSalaoTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.salao_a = Salao.objects.create(nome='Salão A', subdominio='salao-a')
+        cls.salao_b = Salao.objects.create(nome='Salão B', subdominio='salao-b')
+        modulo = Modulo.objects.create(nome='cabelo')
+        Servico.objects.create(salao=cls.salao_a, nome='Corte A', modulo=modulo, preco=10)
+        Servico.objects.create(salao=cls.salao_b, nome='Corte B', modulo=modulo, preco=10)
+
+    def test_set_e_reset(self):
+        token = set_current_salao(self.salao_a)
+        self.assertEqual(get_current_salao(), self.salao_a)
+        reset_current_salao(token)
+        self.assertIsNone(get_current_salao())
+
+    def test_gerenciador_de_contexto_aninhado(self):
+        with usar_salao(self.salao_a):
+            with usar_salao(self.salao_b):
+                self.assertEqual(get_current_salao(), self.salao_b)
+            self.assertEqual(get_current_salao(), self.salao_a)
+            self.assertEqual(list(Servico.objects.values_list('nome', flat=True)), ['Corte A'])
+        self.assertIsNone(get_current_salao())
+
+    def test_decorador(self):
+        @usar_salao(self.salao_b)
+        def nomes():
+            return list(Servico.objects.values_list('nome', flat=True))
+
+        self.assertEqual(nomes(), ['Corte B'])
+        self.assertIsNone(get_current_salao())
+
+    def test_tarefas_asyncio_nao_compartilham_salao(self):
+        async def tarefa(salao, resultados):
+            with usar_salao(salao):
+                await asyncio.sleep(0.01)
+                resultados.append((salao, get_current_salao()))
+
+        async def principal():
+            resultados = []
+            await asyncio.gather(*(
+                tarefa(salao, resultados) for salao in [self.salao_a, self.salao_b] * 5
+            ))
+            return resultados
+
+        for esperado, obtido in asyncio.run(principal()):
+            self.assertEqual(esperado, obtido)
+
+    def test_decorador_de_corrotina(self):
+        @usar_salao(self.salao_a)
+        async def atual():
+            await asyncio.sleep(0)
+            return get_current_salao()
+
+        self.assertEqual(asyncio.run(atual()), self.salao_a)
+        self.assertIsNone(get_current_salao())
+
+    def test_threads_do_pool_nao_herdam_salao(self):
+        with usar_salao(self.salao_a), ThreadPoolExecutor(max_workers=1) as pool:
+            self.assertIsNone(pool.submit(get_current_salao).result())
+
+
+class ViewsAssincronasTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.salao_a = Salao.objects.create(nome='Salão A', subdominio='salao-a')
+        cls.salao_b = Salao.objects.create(nome='Salão B', subdominio='salao-b')
+        modulo = Modulo.objects.create(nome='cabelo')
+        cls.cliente = Usuario.objects.create_user(username='cliente', password='senha', salao=cls.salao_a)
+        usuario_prof = Usuario.objects.create_user(username='prof', password='senha', salao=cls.salao_a)
+        profissional = Profissional.objects.create(
+            salao=cls.salao_a, usuario=usuario_prof, horario_inicio=time(9), horario_fim=time(18)
+        )
+        profissional.modulos.add(modulo)
+        servico = Servico.objects.create(salao=cls.salao_a, nome='Corte A', modulo=modulo, preco=10)
+        Servico.objects.create(salao=cls.salao_b, nome='Corte B', modulo=modulo, preco=10)
+        segunda = date.today() + timedelta(days=7 - date.today().weekday())
+        Agendamento.objects.create(
+            salao=cls.salao_a, cliente=cls.cliente, profissional=profissional,
+            servico=servico, data=segunda, hora=time(10),
+        )
+
+    def setUp(self):
+        self.client.force_login(self.cliente)
+
+    def test_servicos_lista_mostra_apenas_o_salao_do_usuario(self):
+        resposta = self.client.get(reverse('servicos_lista'))
+        self.assertContains(resposta, 'Corte A')
+        self.assertNotContains(resposta, 'Corte B')
+
+    def test_dashboard(self):
+        resposta = self.client.get(reverse('dashboard'))
+        self.assertEqual(resposta.status_code, 200)
+        self.assertContains(resposta, 'Corte A')
+
+    def test_meus_agendamentos(self):
+        resposta = self.client.get(reverse('meus_agendamentos'))
+        self.assertContains(resposta, 'Corte A')
+
+    async def test_views_com_cliente_assincrono(self):
+        await self.async_client.aforce_login(self.cliente)
+        for nome in ('servicos_lista', 'dashboard', 'meus_agendamentos'):
+            resposta = await self.async_client.get(reverse(nome))
+            self.assertEqual(resposta.status_code, 200, nome)
+        self.assertIsNone(get_current_salao())
+
+
+class PlanoConsultasTests(PlanoConsultaMixin, TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.salao = Salao.objects.create(nome='Salão A', subdominio='salao-a')
+        cls.cliente = Usuario.objects.create_user(username='cliente', password='senha', salao=cls.salao)
+
+    def setUp(self):
+        self.client.force_login(self.cliente)
+
+    def test_agendamentos_do_cliente(self):
+        with usar_salao(self.salao):
+            recentes = Agendamento.objects.filter(cliente=self.cliente).order_by('-data', '-hora')[:10]
+            self.assertUsaIndice(recentes, 'agendamento_cliente_data_hora')
+            self.assertUsaIndice(Agendamento.objects.filter(cliente=self.cliente, status='pendente'))
+
+    def test_views_do_cliente(self):
+        for nome in ('dashboard', 'meus_agendamentos'):
+            with self.subTest(nome), self.assertConsultasUsamIndices():
+                self.client.get(reverse(nome))
+
+
+class DesempenhoTests(CargaTestMixin, TestCase):
+    """Orçamento de consultas das views de core/urls.py"""
+
+    def test_views(self):
+        orcamentos = [
+            # (nome, consultas, usuário)
+            ('home', 1, None),
+            ('cadastro', 1, None),
+            ('login', 1, None),
+            ('dashboard', 3, None),
+            ('perfil', 1, None),
+            ('meus_agendamentos', 2, None),
+            ('instrumentacao', 1, self.admin),
+            ('logout', 3, None),
+        ]
+        for nome, consultas, usuario in orcamentos:
+            with self.subTest(nome):
+                self.orcamento_view(reverse(nome), consultas, usuario=usuario)
+
+    def test_isolamento_sob_carga(self):
+        from gestao.models import Material, MovimentacaoEstoque, Transacao
+
+        modelos = (Agendamento, Transacao, Material, MovimentacaoEstoque, Profissional, Servico)
+        pares = ((self.salao, self.outro_salao, self.carga), (self.outro_salao, self.salao, self.carga_outro))
+        for salao, outro, carga in pares:
+            clientes_do_outro = set(Usuario._base_manager.filter(salao=outro).values_list('pk', flat=True))
+            for modelo in modelos:
+                with self.subTest(salao=salao.subdominio, modelo=modelo.__name__):
+                    with usar_salao(salao):
+                        visiveis = set(modelo.objects.values_list('pk', flat=True))
+                    do_salao = set(modelo._base_manager.filter(salao=salao).values_list('pk', flat=True))
+                    do_outro = set(modelo._base_manager.filter(salao=outro).values_list('pk', flat=True))
+                    self.assertTrue(do_outro)
+                    self.assertEqual(visiveis, do_salao)
+                    self.assertFalse(visiveis & do_outro)
+            with usar_salao(salao):
+                self.assertEqual(Agendamento.objects.count(), carga['agendamentos'])
+                self.assertEqual(Transacao.objects.count(), carga['transacoes'])
+                self.assertEqual(MovimentacaoEstoque.objects.count(), carga['agendamentos'] // 3)
+                clientes = set(Agendamento.objects.values_list('cliente_id', flat=True))
+            self.assertFalse(clientes & clientes_do_outro)
+
+
+@override_settings(ALLOWED_HOSTS=['.localhost'], TENANT_DOMINIO_BASE='localhost')
+class SubdominioTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.salao = Salao.objects.create(nome='Salão A', subdominio='salao-a')
+        cls.inativo = Salao.objects.create(nome='Salão Fechado', subdominio='fechado', ativo=False)
+        cls.outro = Salao.objects.create(nome='Salão B', subdominio='salao-b')
+
+    def setUp(self):
+        cache.clear()
+        _saloes_por_subdominio.local.clear()
+        self.factory = RequestFactory()
+
+    def resolver(self, host, user=None):
+        from django.contrib.auth.models import AnonymousUser
+        request = self.factory.get('/', HTTP_HOST=host)
+        request.user = user or AnonymousUser()
+        return TenantMiddleware(lambda r: None).resolver_salao(request)
+
+    def test_extrair_subdominio(self):
+        self.assertEqual(extrair_subdominio('salao-a.localhost:8000'), 'salao-a')
+        self.assertIsNone(extrair_subdominio('localhost:8000'))
+        self.assertIsNone(extrair_subdominio('www.localhost'))
+        self.assertIsNone(extrair_subdominio('salao-a.exemplo.com'))
+
+    def test_resolve_salao_pelo_host(self):
+        self.assertEqual(self.resolver('salao-a.localhost'), self.salao)
+
+    def test_regime_permanente_nao_consulta_o_banco(self):
+        buscar_salao_por_subdominio('salao-a')
+        with self.assertNumQueries(0):
+            self.assertEqual(self.resolver('salao-a.localhost'), self.salao)
+        # Sem o LRU local, o cache compartilhado ainda evita o banco
+        _saloes_por_subdominio.local.clear()
+        with self.assertNumQueries(0):
+            self.assertEqual(buscar_salao_por_subdominio('salao-a'), self.salao)
+
+    def test_invalidacao_feita_por_outro_processo(self):
+        self.assertEqual(self.resolver('salao-a.localhost'), self.salao)
+        # Outro processo desativa o salão: só o contador de geração no cache compartilhado muda
+        Salao.objects.filter(pk=self.salao.pk).update(ativo=False)
+        cache.incr(_saloes_por_subdominio.chave_geracao('salao-a'))
+        with self.assertRaises(Http404):
+            self.resolver('salao-a.localhost')
+
+    def test_cada_requisicao_recebe_uma_copia(self):
+        salao = buscar_salao_por_subdominio('salao-a')
+        salao.nome = 'Alterado'
+        self.assertEqual(buscar_salao_por_subdominio('salao-a').nome, 'Salão A')
+
+    def test_inexistente_e_inativo_recebem_404_com_cache_negativo(self):
+        for host in ('nao-existe.localhost', 'fechado.localhost'):
+            with self.assertNumQueries(1), self.assertRaises(Http404):
+                self.resolver(host)
+            with self.assertNumQueries(0), self.assertRaises(Http404):
+                self.resolver(host)
+
+    def test_invalidado_ao_salvar(self):
+        self.assertEqual(self.resolver('salao-a.localhost'), self.salao)
+        self.salao.ativo = False
+        self.salao.save()
+        with self.assertRaises(Http404):
+            self.resolver('salao-a.localhost')
+
+    def test_invalidado_ao_criar_e_renomear(self):
+        with self.assertRaises(Http404):
+            self.resolver('novo.localhost')
+        self.outro.subdominio = 'novo'
+        self.outro.save()
+        self.assertEqual(self.resolver('novo.localhost'), self.outro)
+        with self.assertRaises(Http404):
+            self.resolver('salao-b.localhost')
+
+    def test_invalidado_ao_excluir(self):
+        self.assertEqual(self.resolver('salao-b.localhost'), self.outro)
+        self.outro.delete()
+        with self.assertRaises(Http404):
+            self.resolver('salao-b.localhost')
+
+    def test_usuario_de_outro_salao(self):
+        usuario = Usuario.objects.create_user(username='cliente-b', password='senha', salao=self.outro)
+        with self.assertRaises(Http404):
+            self.resolver('salao-a.localhost', usuario)
+
+    def test_requisicao_anonima_recebe_salao(self):
+        resposta = self.client.get(reverse('home'), HTTP_HOST='salao-a.localhost')
+        self.assertEqual(resposta.status_code, 200)
+        self.assertEqual(resposta.wsgi_request.salao, self.salao)
+        self.assertEqual(self.client.get(reverse('home'), HTTP_HOST='fechado.localhost').status_code, 404)
+
+
+class CacheSalaoTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.catalogo = CacheSalao('teste')
+        self.cargas = []
+
+    def carregador(self, valor):
+        def carregar():
+            self.cargas.append(valor)
+            return valor
+        return carregar
+
+    def test_carrega_uma_vez_por_geracao(self):
+        self.assertEqual(self.catalogo.obter(1, 'itens', self.carregador(['a'])), ['a'])
+        self.assertEqual(self.catalogo.obter(1, 'itens', self.carregador(['b'])), ['a'])
+        self.assertEqual(self.cargas, [['a']])
+
+        self.catalogo.invalidar(1)
+        self.assertEqual(self.catalogo.obter(1, 'itens', self.carregador(['b'])), ['b'])
+
+    def test_namespace_por_salao_e_geracao_global(self):
+        self.catalogo.obter(1, 'itens', self.carregador('salão 1'))
+        self.catalogo.obter(2, 'itens', self.carregador('salão 2'))
+        self.catalogo.invalidar(1)
+        self.assertEqual(self.catalogo.obter(1, 'itens', self.carregador('novo 1')), 'novo 1')
+        self.assertEqual(self.catalogo.obter(2, 'itens', self.carregador('novo 2')), 'salão 2')
+
+        self.catalogo.invalidar(None)
+        self.assertEqual(self.catalogo.obter(2, 'itens', self.carregador('novo 2')), 'novo 2')
+        self.assertEqual(self.catalogo.obter(None, 'itens', self.carregador('global')), 'global')
+
+    def test_camada_local_e_invalidacao_de_outro_processo(self):
+        valor = self.catalogo.obter(1, 'itens', self.carregador(['a']))
+        # O mesmo objeto volta da camada local, sem desserializar o cache compartilhado
+        self.assertIs(self.catalogo.obter(1, 'itens', self.carregador(['b'])), valor)
+        self.catalogo.local.clear()
+        self.assertEqual(self.catalogo.obter(1, 'itens', self.carregador(['b'])), ['a'])
+        self.assertEqual(len(self.cargas), 1)
+
+        # Outro processo incrementa o contador no cache compartilhado
+        cache.incr(self.catalogo.chave_geracao(1))
+        self.assertEqual(self.catalogo.obter(1, 'itens', self.carregador(['c'])), ['c'])
+
+    def test_contador_perdido_nao_reaproveita_valores(self):
+        self.catalogo.obter(1, 'itens', self.carregador('antigo'))
+        cache.delete(self.catalogo.chave_geracao(1))
+        self.assertEqual(self.catalogo.obter(1, 'itens', self.carregador('novo')), 'novo')
+
+    def test_aobter(self):
+        async def carregar_async():
+            return 'async'
+        self.assertEqual(async_to_sync(self.catalogo.aobter)(1, 'a', carregar_async), 'async')
+        self.assertEqual(async_to_sync(self.catalogo.aobter)(1, 's', self.carregador('sync')), 'sync')
+        self.assertEqual(self.catalogo.obter(1, 's', self.carregador('outro')), 'sync')
+
+
+class PerfilBancoTests(TestCase):
+    """Perfil de banco escolhido pelas variáveis de ambiente (config/settings.py)"""
+
+    def carregar_settings(self, **ambiente):
+        caminho = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'config', 'settings.py')
+        especificacao = importlib.util.spec_from_file_location('settings_perfil', caminho)
+        modulo = importlib.util.module_from_spec(especificacao)
+        with mock.patch.dict(os.environ, ambiente):
+            especificacao.loader.exec_module(modulo)
+        return modulo.DATABASES['default']
+
+    def test_sqlite_por_padrao(self):
+        with mock.patch.dict(os.environ):
+            os.environ.pop('DB_ENGINE', None)
+            banco = self.carregar_settings()
+        self.assertEqual(banco['ENGINE'], 'django.db.backends.sqlite3')
+
+    def test_postgresql_com_conexoes_persistentes(self):
+        banco = self.carregar_settings(DB_ENGINE='postgresql', DB_POOL='False', DB_CONN_MAX_AGE='120', DB_HOST='db')
+        self.assertEqual(banco['ENGINE'], 'django.db.backends.postgresql')
+        self.assertEqual(banco['HOST'], 'db')
+        self.assertEqual(banco['CONN_MAX_AGE'], 120)
+        self.assertTrue(banco['CONN_HEALTH_CHECKS'])
+        self.assertNotIn('pool', banco['OPTIONS'])
+
+    def test_sqlite_perfil_de_desempenho(self):
+        self.assertNotIn('OPTIONS', self.carregar_settings(DB_ENGINE='sqlite', DB_SQLITE_DESEMPENHO='False'))
+        banco = self.carregar_settings(DB_ENGINE='sqlite', DB_SQLITE_DESEMPENHO='True', DB_SQLITE_BUSY_TIMEOUT_MS='1000')
+        self.assertEqual(banco['OPTIONS']['transaction_mode'], 'IMMEDIATE')
+        self.assertIn('PRAGMA busy_timeout = 1000', banco['OPTIONS']['init_command'])
+
+        # Os PRAGMAs valem para cada nova conexão
+        from django.conf import settings
+        from django.db.backends.sqlite3.base import DatabaseWrapper
+        with tempfile.TemporaryDirectory() as diretorio:
+            conexao = DatabaseWrapper({
+                **connection.settings_dict,
+                'NAME': os.path.join(diretorio, 'perfil.sqlite3'),
+                'OPTIONS': settings.SQLITE_OPCOES_DESEMPENHO,
+            }, alias='perfil')
+            try:
+                with conexao.cursor() as cursor:
+                    pragmas = [
+                        cursor.execute(f'PRAGMA {nome}').fetchone()[0]
+                        for nome in ('journal_mode', 'synchronous', 'busy_timeout')
+                    ]
+                self.assertEqual(pragmas, ['wal', 1, 20000])
+                self.assertEqual(conexao.transaction_mode, 'IMMEDIATE')
+            finally:
+                conexao.close()
+
+    def test_postgresql_com_pool(self):
+        banco = self.carregar_settings(DB_ENGINE='postgresql', DB_POOL='True', DB_POOL_MAX='20', DB_POOL_TIMEOUT='2.5')
+        # O pool do Django não aceita conexões persistentes
+        self.assertEqual(banco['CONN_MAX_AGE'], 0)
+        self.assertEqual(banco['OPTIONS']['pool']['max_size'], 20)
+        self.assertEqual(banco['OPTIONS']['pool']['timeout'], 2.5)
+
+
+class ParticionamentoTests(TestCase):
+    """Particionamento por data de Agendamento e Transacao (core.particionamento)"""
+
+    def test_periodos_mensais(self):
+        self.assertEqual(list(particionamento.periodos(date(2026, 11, 15), date(2027, 1, 1), 'mensal')), [
+            (date(2026, 11, 1), date(2026, 12, 1)),
+            (date(2026, 12, 1), date(2027, 1, 1)),
+            (date(2027, 1, 1), date(2027, 2, 1)),
+        ])
+        self.assertEqual(particionamento.horizonte(date(2026, 11, 15), 'mensal', 3), date(2027, 2, 1))
+        self.assertEqual(
+            particionamento.nome_particao('servicos_agendamento', date(2027, 2, 1), 'mensal'),
+            'servicos_agendamento_p2027_02',
+        )
+
+    def test_periodos_anuais(self):
+        self.assertEqual(list(particionamento.periodos(date(2026, 6, 30), date(2027, 1, 1), 'anual')), [
+            (date(2026, 1, 1), date(2027, 1, 1)),
+            (date(2027, 1, 1), date(2028, 1, 1)),
+        ])
+        self.assertEqual(particionamento.horizonte(date(2026, 6, 30), 'anual', 1), date(2027, 1, 1))
+        self.assertEqual(
+            particionamento.nome_particao('gestao_transacao', date(2027, 1, 1), 'anual'), 'gestao_transacao_p2027'
+        )
+
+    def test_desligado_sem_postgresql(self):
+        with override_settings(PARTICIONAMENTO=''):
+            self.assertFalse(particionamento.ativo(connection))
+        if connection.vendor != 'postgresql':
+            with override_settings(PARTICIONAMENTO='mensal'):
+                self.assertFalse(particionamento.ativo(connection))
+                # Tabela comum: as migrações de particionamento podem ser revertidas
+                particionamento.impedir_reversao(Agendamento, connection)
+                with self.assertRaisesMessage(CommandError, 'requer PostgreSQL'):
+                    call_command('criar_particoes', stdout=io.StringIO())
+
+    @skipUnless(connection.vendor == 'postgresql', 'particionamento só no PostgreSQL')
+    @override_settings(PARTICIONAMENTO='mensal', PARTICOES_FUTURAS=2)
+    def test_particionamento_postgresql(self):
+        hoje = date.today()
+        salao = Salao.objects.create(nome='Salão Particionado', subdominio='particionado')
+        modulo = Modulo.objects.get_or_create(nome='cabelo')[0]
+        servico = Servico.objects.create(salao=salao, nome='Corte', modulo=modulo, preco=50, duracao_minutos=30)
+        cliente = Usuario.objects.create(username='cliente-particionado', salao=salao)
+        profissional = Profissional.objects.create(
+            salao=salao, usuario=Usuario.objects.create(username='profissional-particionado', salao=salao),
+            horario_inicio=time(8), horario_fim=time(20), trabalha_sabado=True, trabalha_domingo=True,
+        )
+
+        def agendar(data):
+            return Agendamento._base_manager.create(
+                salao=salao, cliente=cliente, profissional=profissional, servico=servico, data=data, hora=time(10),
+            )
+
+        tabela = Agendamento._meta.db_table
+
+        def particao(agendamento):
+            with connection.cursor() as cursor:
+                cursor.execute(f'SELECT tableoid::regclass::text FROM {tabela} WHERE id = %s', [agendamento.pk])
+                return cursor.fetchone()[0]
+
+        antigo = agendar(hoje - timedelta(days=400))
+        avisos = io.StringIO()
+        call_command('criar_particoes', '--converter', stdout=io.StringIO(), stderr=avisos)
+        for modelo in particionamento.modelos_particionados():
+            self.assertTrue(particionamento.particionada(connection, modelo._meta.db_table))
+            with self.assertRaises(IrreversibleError):
+                particionamento.impedir_reversao(modelo, connection)
+        # As chaves estrangeiras para agendamentos são removidas e listadas
+        self.assertIn('gestao_transacao.', avisos.getvalue())
+        self.assertIn('gestao_movimentacaoestoque.', avisos.getvalue())
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT count(*) FROM pg_constraint WHERE confrelid = %s::regclass AND contype = 'f'", [tabela]
+            )
+            self.assertEqual(cursor.fetchone()[0], 0)
+        self.assertEqual(particao(antigo), particionamento.nome_particao(tabela, antigo.data, 'mensal'))
+
+        # O id continua a sequência da tabela original
+        self.assertGreater(agendar(hoje).pk, antigo.pk)
+
+        # Datas além das partições ficam na padrão até a partição do mês ser criada
+        futuro = agendar(hoje + timedelta(days=365))
+        self.assertEqual(particao(futuro), particionamento.nome_padrao(tabela))
+        call_command('criar_particoes', '--periodos', '13', stdout=io.StringIO())
+        self.assertEqual(particao(futuro), particionamento.nome_particao(tabela, futuro.data, 'mensal'))
+
+        # A consulta do TenantManager só lê as partições do período
+        with usar_salao(salao):
+            sql, params = Agendamento.objects.filter(data__gte=hoje.replace(day=1)).query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN {sql}', params)
+            plano = '\n'.join(linha for linha, in cursor.fetchall())
+        self.assertNotIn(particionamento.nome_particao(tabela, antigo.data, 'mensal'), plano)
+        self.assertIn(particionamento.nome_particao(tabela, hoje, 'mensal'), plano)
+
+
+class ReplicaTests(TransactionTestCase):
+    """
+    Principal e réplica em dois arquivos SQLite, sem replicação entre eles:
+    um registro gravado no principal só é visto quando a leitura vai para o
+    principal.
+    """
+    # A réplica só é criada em setUpClass: '__all__' inclui o alias a partir daí
+    databases = '__all__'
+
+    @classmethod
+    def setUpClass(cls):
+        cls.diretorio = tempfile.TemporaryDirectory()
+        connections.settings[REPLICA_ALIAS] = {
+            **connections.settings['default'],
+            'NAME': os.path.join(cls.diretorio.name, 'replica.sqlite3'),
+        }
+        call_command('migrate', database=REPLICA_ALIAS, verbosity=0)
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        connections[REPLICA_ALIAS].close()
+        del connections[REPLICA_ALIAS]
+        del connections.settings[REPLICA_ALIAS]
+        cls.diretorio.cleanup()
+
+    def setUp(self):
+        cache.clear()
+        self.salao = Salao.objects.create(nome='Salão', subdominio='salao')
+        # O administrador existe nos dois bancos, como aconteceria com a replicação
+        for banco in ('default', REPLICA_ALIAS):
+            Salao.objects.using(banco).get_or_create(pk=self.salao.pk, defaults={'nome': 'Salão', 'subdominio': 'salao'})
+            admin = Usuario.objects.using(banco).create(
+                username='admin', salao_id=self.salao.pk, tipo='admin', is_staff=True
+            )
+        self.client.force_login(Usuario.objects.get(pk=admin.pk))
+
+    def test_leituras_na_replica_somente_em_usar_replica(self):
+        Modulo.objects.create(nome='cabelo')
+        self.assertTrue(Modulo.objects.exists())
+        with usar_replica():
+            self.assertFalse(Modulo.objects.exists())
+        self.assertTrue(Modulo.objects.exists())
+
+    def test_gravacao_fixa_o_bloco_no_principal(self):
+        with usar_replica():
+            Modulo.objects.create(nome='cabelo')
+            self.assertTrue(Modulo.objects.exists())
+        with usar_replica():
+            self.assertFalse(Modulo.objects.exists())
+
+    def test_iterar_na_replica_nao_vaza_entre_itens(self):
+        Modulo.objects.create(nome='cabelo')
+
+        def linhas():
+            yield Modulo.objects.exists()
+            yield Modulo.objects.exists()
+
+        for existe in iterar_na_replica(linhas()):
+            self.assertFalse(existe)
+            self.assertTrue(Modulo.objects.exists())
+
+    def test_views_de_relatorio_leem_da_replica(self):
+        from gestao.models import Material
+        Material.objects.create(salao=self.salao, nome='Shampoo Só no Principal', modulo='cabelo')
+        for url in (reverse('gestao_estoque'), reverse('admin_dashboard'), reverse('gestao_financeiro')):
+            with self.subTest(url), CaptureQueriesContext(connections[REPLICA_ALIAS]) as replica:
+                resposta = self.client.get(url)
+            self.assertEqual(resposta.status_code, 200)
+            self.assertTrue(replica.captured_queries)
+        self.assertNotContains(self.client.get(reverse('gestao_estoque')), 'Shampoo Só no Principal')
+
+    def test_quem_grava_le_do_principal_ate_o_fim_da_fixacao(self):
+        resposta = self.client.post(reverse('gestao_estoque'), {
+            'nome': 'Condicionador Novo', 'modulo': 'cabelo', 'quantidade': '0',
+            'unidade': 'un', 'custo_unitario': '10', 'estoque_minimo': '1',
+        })
+        self.assertEqual(resposta.status_code, 302)
+        self.assertIn(COOKIE_FIXACAO, resposta.cookies)
+
+        with CaptureQueriesContext(connections[REPLICA_ALIAS]) as replica:
+            resposta = self.client.get(reverse('gestao_estoque'))
+        self.assertContains(resposta, 'Condicionador Novo')
+        self.assertEqual(replica.captured_queries, [])
+
+        # Fixação expirada: volta a ler da réplica
+        self.client.cookies[COOKIE_FIXACAO] = str(relogio.time() - 1)
+        self.assertNotContains(self.client.get(reverse('gestao_estoque')), 'Condicionador Novo')
+
+
+@override_settings(SHARDS=['shard1', 'shard2'], SHARD_NOVOS_SALOES='shard1')
+class ShardTests(TransactionTestCase):
+    """Principal e dois shards em arquivos SQLite separados"""
+    databases = '__all__'
+    SHARDS = ('shard1', 'shard2')
+
+    @classmethod
+    def setUpClass(cls):
+        cls.diretorio = tempfile.TemporaryDirectory()
+        for banco in cls.SHARDS:
+            connections.settings[banco] = {
+                **connections.settings['default'],
+                'NAME': os.path.join(cls.diretorio.name, f'{banco}.sqlite3'),
+            }
+            call_command('migrate', database=banco, verbosity=0)
+        super().setUpClass()
+        # A troca de shard requer um cache compartilhado entre processos
+        cls.enterClassContext(override_settings(CACHES=cls.cache_em_arquivos()))
+
+    @classmethod
+    def cache_em_arquivos(cls):
+        return {'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.path.join(cls.diretorio.name, 'cache'),
+        }}
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        for banco in cls.SHARDS:
+            connections[banco].close()
+            del connections[banco]
+            del connections.settings[banco]
+        cls.diretorio.cleanup()
+
+    def setUp(self):
+        cache.clear()
+        self.modulo = Modulo.objects.create(nome='cabelo')
+
+    def popular(self, salao, prefixo):
+        """Usuários, profissional, serviço, agendamento, transação e estoque do salão; retorna o admin"""
+        from gestao.models import Material, MovimentacaoEstoque, Transacao
+
+        with usar_salao(salao):
+            admin = Usuario.objects.create(username=f'admin-{prefixo}', salao=salao, tipo='admin', is_staff=True)
+            cliente = Usuario.objects.create(username=f'cliente-{prefixo}', salao=salao)
+            profissional = Profissional.objects.create(
+                salao=salao, usuario=Usuario.objects.create(username=f'prof-{prefixo}', salao=salao),
+                horario_inicio=time(8), horario_fim=time(20), trabalha_sabado=True, trabalha_domingo=True,
+            )
+            profissional.modulos.add(self.modulo)
+            servico = Servico.objects.create(salao=salao, nome=f'Corte {prefixo}', modulo=self.modulo, preco=50)
+            agendamento = Agendamento.objects.create(
+                salao=salao, cliente=cliente, profissional=profissional, servico=servico,
+                data=date.today() + timedelta(days=1), hora=time(10),
+            )
+            Transacao.objects.create(
+                salao=salao, tipo='receita', categoria='servico', descricao=f'Corte {prefixo}', valor=50,
+                data=date.today(), agendamento=agendamento, profissional=profissional,
+            )
+            material = Material.objects.create(salao=salao, nome=f'Shampoo {prefixo}', modulo='cabelo')
+            MovimentacaoEstoque.objects.create(salao=salao, material=material, tipo='entrada', quantidade=5, usuario=admin)
+        return admin
+
+    def contar(self, salao, banco):
+        """Linhas do salão em cada modelo do banco"""
+        return {
+            modelo._meta.label: modelo._base_manager.using(banco).filter(**{campo: salao.pk}).count()
+            for modelo, campo in modelos_por_salao().items()
+        }
+
+    def test_salao_novo_vai_para_o_shard(self):
+        salao = Salao.objects.create(nome='Salão', subdominio='salao')
+        self.assertEqual(ShardSalao.objects.get(salao=salao).banco, 'shard1')
+        self.assertEqual(localizar_salao(salao.pk).banco, 'shard1')
+        # Salão e módulos copiados para os shards, com os mesmos ids
+        self.assertTrue(Salao.objects.using('shard1').filter(pk=salao.pk, subdominio='salao').exists())
+        for banco in self.SHARDS:
+            self.assertTrue(Modulo.objects.using(banco).filter(pk=self.modulo.pk).exists())
+
+        self.popular(salao, 'a')
+        self.assertFalse(Usuario.objects.filter(salao=salao).exists())
+        self.assertEqual(Usuario.objects.using('shard1').filter(salao=salao).count(), 3)
+        with usar_salao(salao):
+            self.assertEqual(Servico.objects.get().nome, 'Corte a')
+            self.assertEqual(Agendamento.objects.select_related('cliente').get().cliente.username, 'cliente-a')
+
+        salao.nome = 'Salão Renomeado'
+        salao.save()
+        self.assertEqual(Salao.objects.using('shard1').get(pk=salao.pk).nome, 'Salão Renomeado')
+
+    def test_excluir_salao_exclui_os_dados_do_shard(self):
+        salao = Salao.objects.create(nome='Salão', subdominio='salao')
+        Usuario.objects.create(username='cliente', salao=salao)
+        salao.delete()
+        self.assertFalse(Salao.objects.using('shard1').exists())
+        self.assertFalse(Usuario.objects.using('shard1').exists())
+        self.assertFalse(ShardSalao.objects.exists())
+
+    def test_requisicao_no_shard_do_salao(self):
+        salao = Salao.objects.create(nome='Salão', subdominio='salao')
+        self.client.force_login(self.popular(salao, 'a'))
+        self.assertEqual(self.client.session[SESSAO_BANCO], 'shard1')
+        with CaptureQueriesContext(connections['shard1']) as shard:
+            resposta = self.client.get(reverse('servicos_lista'))
+        self.assertContains(resposta, 'Corte a')
+        self.assertTrue(shard.captured_queries)
+        self.assertEqual(self.client.get(reverse('admin_dashboard')).status_code, 200)
+
+    def test_login_no_dominio_principal_procura_nos_shards(self):
+        salao = Salao.objects.create(nome='Salão', subdominio='salao')
+        Usuario.objects.create_user(username='cliente', password='senha', salao=salao)
+        resposta = self.client.post(reverse('login'), {'username': 'cliente', 'password': 'senha'})
+        self.assertRedirects(resposta, reverse('dashboard'), fetch_redirect_response=False)
+        self.assertEqual(self.client.session[SESSAO_BANCO], 'shard1')
+        self.assertEqual(self.client.get(reverse('meus_agendamentos')).status_code, 200)
+
+    def test_mover_salao(self):
+        with self.settings(SHARD_NOVOS_SALOES='default'):
+            salao = Salao.objects.create(nome='Salão A', subdominio='salao-a')
+        self.popular(salao, 'a')
+        # Outro salão no destino ocupa os mesmos ids: as linhas movidas recebem ids novos
+        self.popular(Salao.objects.create(nome='Salão B', subdominio='salao-b'), 'b')
+        antes = self.contar(salao, 'default')
+
+        saida = io.StringIO()
+        call_command('mover_salao', 'salao-a', 'shard1', espera=0, lote=2, stdout=saida)
+        self.assertIn('movido para shard1', saida.getvalue())
+
+        self.assertEqual(localizar_salao(salao.pk), ('shard1', False))
+        self.assertEqual(self.contar(salao, 'shard1'), antes)
+        self.assertFalse(any(self.contar(salao, 'default').values()))
+        with usar_salao(salao):
+            from gestao.models import MovimentacaoEstoque, Transacao
+            agendamento = Agendamento.objects.select_related('cliente', 'profissional__usuario').get()
+            self.assertEqual(agendamento.cliente.username, 'cliente-a')
+            self.assertEqual(agendamento.profissional.usuario.username, 'prof-a')
+            self.assertEqual(list(agendamento.profissional.modulos.all()), [self.modulo])
+            self.assertEqual(Transacao.objects.get().agendamento, agendamento)
+            self.assertEqual(MovimentacaoEstoque.objects.get().usuario.username, 'admin-a')
+
+        with self.assertRaisesMessage(CommandError, 'já está no banco shard1'):
+            call_command('mover_salao', 'salao-a', 'shard1', espera=0, stdout=io.StringIO())
+
+    def test_sincronizacao_das_alteracoes_feitas_durante_a_copia(self):
+        from gestao.models import Material
+
+        salao = Salao.objects.create(nome='Salão', subdominio='salao')
+        self.popular(salao, 'a')
+        movimentacao = MovimentacaoSalao(salao, 'shard2', tamanho_lote=2)
+        movimentacao.preparar()
+        movimentacao.copiar()
+
+        # Alterações na origem, com o salão ainda no ar
+        with usar_salao(salao):
+            Usuario.objects.create(username='cliente-novo', salao=salao)
+            Servico.objects.update(preco=80)
+            Material.objects.all().delete()
+
+        movimentacao.bloquear_e_sincronizar(espera=0)
+        movimentacao.concluir()
+        movimentacao.apagar_origem()
+
+        self.assertEqual(localizar_salao(salao.pk).banco, 'shard2')
+        self.assertFalse(any(self.contar(salao, 'shard1').values()))
+        self.assertFalse(Salao.objects.using('shard1').filter(pk=salao.pk).exists())
+        with usar_salao(salao):
+            self.assertTrue(Usuario.objects.filter(username='cliente-novo').exists())
+            self.assertEqual(Servico.objects.get().preco, 80)
+            self.assertFalse(Material.objects.exists())
+
+    def test_sessao_encerrada_quando_o_salao_troca_de_shard(self):
+        salao = Salao.objects.create(nome='Salão', subdominio='salao')
+        self.client.force_login(self.popular(salao, 'a'))
+        call_command('mover_salao', 'salao', 'shard2', espera=0, stdout=io.StringIO())
+        resposta = self.client.get(reverse('admin_dashboard'))
+        self.assertEqual(resposta.status_code, 302)
+        self.assertIn(reverse('login'), resposta.url)
+
+    def test_gravacoes_bloqueadas_durante_a_troca_de_shard(self):
+        salao = Salao.objects.create(nome='Salão', subdominio='salao')
+        self.client.force_login(self.popular(salao, 'a'))
+        MovimentacaoSalao(salao, 'shard2').bloquear()
+
+        self.assertEqual(self.client.get(reverse('gestao_estoque')).status_code, 200)
+        resposta = self.client.post(reverse('gestao_estoque'), {'nome': 'Novo', 'modulo': 'cabelo'})
+        self.assertEqual(resposta.status_code, 503)
+        self.assertIn('Retry-After', resposta.headers)
+
+    def test_usuario_com_grupo_nao_vai_para_o_shard(self):
+        with self.settings(SHARD_NOVOS_SALOES='default'):
+            salao = Salao.objects.create(nome='Salão A', subdominio='salao-a')
+        admin = self.popular(salao, 'a')
+        grupo = Group.objects.create(name='Recepção')
+        admin.groups.add(grupo)
+        antes = self.contar(salao, 'default')
+
+        with self.assertRaisesMessage(CommandError, 'grupo(s) ou permissão(ões)'):
+            call_command('mover_salao', 'salao-a', 'shard1', espera=0, stdout=io.StringIO())
+        self.assertEqual(localizar_salao(salao.pk), ('default', False))
+        self.assertFalse(any(self.contar(salao, 'shard1').values()))
+
+        admin.groups.clear()
+        call_command('mover_salao', 'salao-a', 'shard1', espera=0, stdout=io.StringIO())
+        self.assertEqual(self.contar(salao, 'shard1'), antes)
+
+        movido = Usuario.objects.using('shard1').get(username='admin-a')
+        # Os grupos estão no principal, e o Django recusa a ligação entre bancos
+        with self.assertRaisesMessage(ValueError, 'instance is on database "shard1"'):
+            movido.groups.add(grupo)
+        # As ligações de um usuário do principal com o mesmo id não valem para o do shard
+        homonimo = Usuario.objects.create(pk=movido.pk, username='principal')
+        homonimo.user_permissions.add(Permission.objects.get(codename='view_salao'))
+        homonimo.groups.add(grupo)
+        self.assertEqual(UsuarioSalaoBackend().get_all_permissions(homonimo), {'core.view_salao'})
+        self.assertEqual(UsuarioSalaoBackend().get_all_permissions(movido), set())
+
+    def test_bloqueio_gravado_por_outro_processo(self):
+        salao = Salao.objects.create(nome='Salão', subdominio='salao')
+        self.client.force_login(self.popular(salao, 'a'))
+        self.assertEqual(self.client.get(reverse('gestao_estoque')).status_code, 200)
+        self.assertEqual(localizar_salao(salao.pk), ('shard1', False))
+
+        # O comando em outro processo: outra instância do cache (os mesmos
+        # arquivos) e outro cache local do diretório
+        with self.settings(CACHES=self.cache_em_arquivos()), mock.patch.object(diretorio, 'local', CacheLRU()):
+            MovimentacaoSalao(salao, 'shard2').bloquear()
+
+        resposta = self.client.post(reverse('gestao_estoque'), {'nome': 'Novo', 'modulo': 'cabelo'})
+        self.assertEqual(resposta.status_code, 503)
+
+    def test_troca_de_shard_exige_cache_compartilhado(self):
+        Salao.objects.create(nome='Salão', subdominio='salao')
+        locmem = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+        with self.settings(CACHES=locmem), self.assertRaisesMessage(CommandError, 'cache compartilhado'):
+            call_command('mover_salao', 'salao', 'shard2', espera=0, stdout=io.StringIO())
+        self.assertEqual(localizar_salao(Salao.objects.get().pk), ('shard1', False))
+
+    def test_usar_banco(self):
+        salao = Salao.objects.create(nome='Salão', subdominio='salao')
+        self.popular(salao, 'a')
+        with usar_banco('shard1'):
+            self.assertEqual(Usuario.objects.count(), 3)
+        with usar_banco('shard2'):
+            self.assertFalse(Usuario.objects.exists())
+        self.assertFalse(Usuario.objects.exists())
+
+
+class AutenticacaoTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.salao = Salao.objects.create(nome='Salão A', subdominio='salao-a')
+        cls.usuario = Usuario.objects.create_user(username='cliente', password='senha', salao=cls.salao)
+
+    def setUp(self):
+        cache.clear()
+        self.backend = UsuarioSalaoBackend()
+
+    @override_settings(USUARIO_CACHE_TIMEOUT=0)
+    def test_usuario_e_salao_em_uma_consulta(self):
+        with self.assertNumQueries(1):
+            usuario = self.backend.get_user(self.usuario.pk)
+            self.assertEqual(usuario.salao.nome, 'Salão A')
+        with self.assertNumQueries(1):
+            self.backend.get_user(self.usuario.pk)
+
+    def test_cache_do_usuario(self):
+        self.backend.get_user(self.usuario.pk)
+        with self.assertNumQueries(0):
+            usuario = self.backend.get_user(self.usuario.pk)
+            self.assertEqual(usuario.salao, self.salao)
+
+    def test_cache_invalidado_ao_salvar_usuario(self):
+        self.backend.get_user(self.usuario.pk)
+        self.usuario.first_name = 'Maria'
+        self.usuario.save()
+        self.assertEqual(self.backend.get_user(self.usuario.pk).first_name, 'Maria')
+
+    def test_cache_invalidado_ao_salvar_salao(self):
+        self.backend.get_user(self.usuario.pk)
+        self.salao.nome = 'Salão Renomeado'
+        self.salao.save()
+        self.assertEqual(self.backend.get_user(self.usuario.pk).salao.nome, 'Salão Renomeado')
+
+    def test_usuario_inativo(self):
+        self.usuario.is_active = False
+        self.usuario.save()
+        self.assertIsNone(self.backend.get_user(self.usuario.pk))
+
+    def test_requisicao_autenticada_sem_consultas_em_regime(self):
+        self.client.login(username='cliente', password='senha')
+        self.client.get(reverse('perfil'))
+        with self.assertNumQueries(0):
+            resposta = self.client.get(reverse('perfil'))
+        self.assertEqual(resposta.status_code, 200)
+        self.assertEqual(resposta.wsgi_request.salao, self.salao)
+
+
+
+@override_settings(INSTRUMENTACAO_AMOSTRAGEM=1)
+class InstrumentacaoTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.salao = Salao.objects.create(nome='Salão A', subdominio='salao-a')
+        modulo = Modulo.objects.create(nome='cabelo')
+        cls.cliente = Usuario.objects.create_user(username='cliente', password='senha', salao=cls.salao)
+        cls.equipe = Usuario.objects.create_user(
+            username='equipe', password='senha', salao=cls.salao, is_staff=True
+        )
+        usuario_prof = Usuario.objects.create_user(username='prof', password='senha', salao=cls.salao)
+        profissional = Profissional.objects.create(
+            salao=cls.salao, usuario=usuario_prof, horario_inicio=time(8), horario_fim=time(18)
+        )
+        profissional.modulos.add(modulo)
+        segunda = date.today() + timedelta(days=7 - date.today().weekday())
+        for hora in range(9, 14):
+            servico = Servico.objects.create(salao=cls.salao, nome=f'Serviço {hora}', modulo=modulo, preco=10)
+            Agendamento.objects.create(
+                salao=cls.salao, cliente=cls.cliente, profissional=profissional,
+                servico=servico, data=segunda, hora=time(hora),
+            )
+
+    def setUp(self):
+        limpar_historico()
+        # Sem saída no console durante os testes (assertLogs instala o próprio handler)
+        self.enterContext(mock.patch.object(instrumentacao.logger, 'handlers', []))
+
+    def test_impressao_digital(self):
+        self.assertEqual(
+            impressao_digital("SELECT * FROM t WHERE id = 42 AND nome = 'O''Brien'"),
+            'SELECT * FROM t WHERE id = ? AND nome = ?',
+        )
+        self.assertEqual(
+            impressao_digital('SELECT * FROM t1 WHERE id IN (%s, %s,\n %s)'),
+            impressao_digital('SELECT * FROM t1 WHERE id IN (%s, %s)'),
+        )
+
+    def test_detecta_n_mais_1(self):
+        with medir_consultas() as registro:
+            for agendamento in Agendamento.objects.filter(cliente=self.cliente):
+                agendamento.servico.nome
+        self.assertEqual(registro.consultas, 6)
+        [repetida] = registro.repetidas()
+        self.assertEqual(repetida['vezes'], 5)
+        self.assertIn('"servicos_servico"', repetida['sql'])
+
+    def test_middleware_publica_log_e_historico(self):
+        self.client.force_login(self.cliente)
+        with self.assertLogs('core.instrumentacao', 'INFO') as logs:
+            self.client.get(reverse('meus_agendamentos'))
+        [registro] = historico()
+        self.assertEqual(registro['view'], 'meus_agendamentos')
+        self.assertEqual(registro['salao'], self.salao.id)
+        self.assertGreater(registro['consultas'], 0)
+        # As relações usadas pelo template vêm no select_related
+        self.assertEqual(registro['repetidas'], [])
+        self.assertIn('"view": "meus_agendamentos"', logs.output[0])
+
+    async def test_middleware_assincrono(self):
+        await self.async_client.aforce_login(self.cliente)
+        await self.async_client.get(reverse('meus_agendamentos'))
+        [registro] = historico()
+        self.assertEqual(registro['view'], 'meus_agendamentos')
+        self.assertGreater(registro['consultas'], 0)
+
+    @override_settings(INSTRUMENTACAO_AMOSTRAGEM=0)
+    def test_amostragem_desligada(self):
+        self.client.force_login(self.cliente)
+        self.client.get(reverse('meus_agendamentos'))
+        self.assertEqual(historico(), [])
+
+    def test_view_restrita_a_equipe(self):
+        self.client.force_login(self.cliente)
+        self.assertEqual(self.client.get(reverse('instrumentacao')).status_code, 302)
+        self.client.force_login(self.equipe)
+        self.client.get(reverse('meus_agendamentos'))
+        dados = self.client.get(reverse('instrumentacao')).json()
+        self.assertEqual(dados['resumo']['meus_agendamentos']['requisicoes'], 1)
+
+
+class DadosSinteticosTests(TestCase):
+    parametros = dict(
+        saloes=2, profissionais=2, clientes=5, servicos=4, materiais=4, anos=0.2, dias_futuros=7,
+        hoje=date(2026, 3, 10), tamanho_lote=50,
+    )
+
+    def test_gerador(self):
+        totais = GeradorDadosSinteticos(prefixo='sint', **self.parametros).gerar()
+        self.assertEqual(totais['core.Salao'], 2)
+        self.assertGreater(totais['servicos.Agendamento'], 50)
+
+        salao = Salao.objects.get(subdominio='sint-1')
+        with usar_salao(salao):
+            agendamentos = list(Agendamento.objects.select_related('profissional', 'servico'))
+            for agendamento in agendamentos[::5]:
+                agendamento.full_clean()
+            self.assertEqual(
+                {a.status for a in agendamentos if a.data > date(2026, 3, 10)} - {'pendente', 'confirmado', 'cancelado'},
+                set(),
+            )
+            concluidos = sum(agendamento.status == 'concluido' for agendamento in agendamentos)
+            self.assertEqual(Transacao.objects.filter(categoria='servico').count(), concluidos)
+            for material in Material.objects.all():
+                self.assertGreaterEqual(material.quantidade, 0)
+                self.assertEqual(material.quantidade, saldo_por_movimentacoes(material))
+        self.assertEqual(verificar_resumo(salao), [])
+        self.assertTrue(Usuario.objects.get(username='sint-1-cliente1').check_password('senha'))
+
+    def test_mesma_semente_gera_os_mesmos_dados(self):
+        def gerar(prefixo):
+            GeradorDadosSinteticos(prefixo=prefixo, **{**self.parametros, 'saloes': 1}).gerar()
+            with usar_salao(Salao.objects.get(subdominio=f'{prefixo}-1')):
+                return list(Agendamento.objects.order_by('id').values_list(
+                    'profissional__usuario__first_name', 'data', 'hora', 'servico__nome', 'status',
+                ))
+        self.assertEqual(gerar('a'), gerar('b'))
+
+    def test_comando_recusa_prefixo_existente(self):
+        Salao.objects.create(nome='Existente', subdominio='sint-1')
+        with self.assertRaises(CommandError):
+            call_command('gerar_dados_sinteticos', '--prefixo', 'sint', '--saloes', '1', stdout=io.StringIO())
@@ -0,0 +1,215 @@
+"""
+Mixins compartilhados pelos testes das apps: verificação do plano das
+consultas (EXPLAIN) e salão com volume realista para orçamentos de consultas.
+"""
+import random
+import re
+from contextlib import contextmanager
+from datetime import date, time, timedelta
+from decimal import Decimal
+
+from django.apps import apps
+from django.contrib.auth.hashers import make_password
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from servicos.models import Agendamento, Modulo, Profissional, Servico
+from .models import Salao, Usuario
+
+
+class PlanoConsultaMixin:
+    """
+    Verifica com EXPLAIN o plano das consultas às tabelas com salão.
+
+    Uma consulta falha se varrer a tabela inteira: "SCAN <tabela>" sem índice
+    no SQLite ou "Seq Scan" no PostgreSQL. No PostgreSQL o seq scan é
+    desligado antes do EXPLAIN, para que o planejador só o escolha na falta
+    de um índice utilizável mesmo com as tabelas pequenas dos testes.
+    """
+
+    @staticmethod
+    def tabelas_com_salao():
+        return {
+            modelo._meta.db_table for modelo in apps.get_models()
+            if any(campo.name == 'salao' for campo in modelo._meta.fields)
+        }
+
+    def plano(self, sql, params=()):
+        with connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                cursor.execute('SET LOCAL enable_seqscan = off')
+                cursor.execute(f'EXPLAIN {sql}', params)
+                return '\n'.join(linha for linha, in cursor.fetchall())
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+            return '\n'.join(linha[-1] for linha in cursor.fetchall())
+
+    def varreduras_completas(self, plano):
+        if connection.vendor == 'postgresql':
+            tabelas = re.findall(r'Seq Scan on (\w+)', plano)
+        else:
+            tabelas = re.findall(r'\bSCAN (\w+)\b(?! USING)', plano)
+        return set(tabelas) & self.tabelas_com_salao()
+
+    def assertUsaIndice(self, queryset, indice=None):
+        """A consulta não varre tabelas com salão (e usa `indice`, se informado)"""
+        sql, params = queryset.query.sql_with_params()
+        plano = self.plano(sql, params)
+        tabelas = self.varreduras_completas(plano)
+        self.assertFalse(tabelas, f'Varredura completa de {", ".join(sorted(tabelas))}:\n{sql}\n{plano}')
+        if indice:
+            self.assertIn(indice, plano, f'{indice} não usado:\n{sql}\n{plano}')
+
+    @contextmanager
+    def assertConsultasUsamIndices(self):
+        """Nenhum SELECT executado dentro do bloco varre tabelas com salão"""
+        with CaptureQueriesContext(connection) as contexto:
+            yield contexto
+        consultas = [
+            consulta['sql'] for consulta in contexto.captured_queries
+            if consulta['sql'].lstrip().upper().startswith('SELECT')
+        ]
+        self.assertTrue(consultas, 'Nenhuma consulta executada.')
+        for sql in consultas:
+            plano = self.plano(sql)
+            tabelas = self.varreduras_completas(plano)
+            self.assertFalse(tabelas, f'Varredura completa de {", ".join(sorted(tabelas))}:\n{sql}\n{plano}')
+
+
+class CargaTestMixin:
+    """
+    Salão com volume realista para os testes de orçamento de consultas.
+
+    O salão principal tem dezenas de profissionais e milhares de agendamentos
+    e transações; um segundo salão, com todos os nomes marcados com
+    OUTRO_SALAO, serve para verificar que nada dele aparece nas páginas do
+    primeiro. Os dados são criados com bulk_create, com uma única senha
+    calculada para todos os usuários.
+
+    orcamento_view faz uma requisição com o cache vazio e falha se ela passar
+    do número de consultas permitido. O orçamento é em consultas, e não em
+    segundos, para não depender da velocidade da máquina que roda os testes.
+    """
+    OUTRO_SALAO = 'OUTRO-SALAO'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.modulos = [Modulo.objects.get_or_create(nome=nome)[0] for nome in ('cabelo', 'pele', 'unhas')]
+        cls.senha = make_password('senha')
+        cls.salao = Salao.objects.create(nome='Salão Carga', subdominio='carga')
+        cls.outro_salao = Salao.objects.create(nome=f'Salão {cls.OUTRO_SALAO}', subdominio='outro')
+        cls.carga = cls.popular(cls.salao, 'Carga', profissionais=30, clientes=300, agendamentos=3000)
+        cls.carga_outro = cls.popular(
+            cls.outro_salao, cls.OUTRO_SALAO, profissionais=5, clientes=30, agendamentos=300
+        )
+        cls.admin = Usuario.objects.create_user(
+            username='admin', password='senha', salao=cls.salao, tipo='admin', is_staff=True
+        )
+        cls.cliente = cls.carga['clientes'][0]
+        cls.servico = cls.carga['servicos'][0]
+
+    @classmethod
+    def popular(cls, salao, nome, profissionais, clientes, agendamentos):
+        from gestao.financeiro import recalcular_resumo
+        from gestao.models import Material, MovimentacaoEstoque, Transacao
+
+        sorteio = random.Random(salao.subdominio)
+        hoje = date.today()
+
+        def usuarios(prefixo, quantidade, **campos):
+            return Usuario.objects.bulk_create([
+                Usuario(
+                    username=f'{salao.subdominio}-{prefixo}-{n}', password=cls.senha, salao=salao,
+                    first_name=f'{nome} {prefixo} {n}', email=f'{prefixo}{n}@{salao.subdominio}.com', **campos
+                )
+                for n in range(quantidade)
+            ])
+
+        lista_profissionais = Profissional.objects.bulk_create([
+            Profissional(
+                salao=salao, usuario=usuario, horario_inicio=time(8), horario_fim=time(20),
+                trabalha_sabado=True, trabalha_domingo=True,
+            )
+            for usuario in usuarios('profissional', profissionais, tipo='profissional')
+        ])
+        Profissional.modulos.through.objects.bulk_create([
+            Profissional.modulos.through(profissional=profissional, modulo=modulo)
+            for profissional in lista_profissionais for modulo in cls.modulos
+        ])
+        lista_clientes = usuarios('cliente', clientes)
+        servicos = Servico.objects.bulk_create([
+            Servico(
+                salao=salao, nome=f'Serviço {nome} {n}', modulo=cls.modulos[n % 3],
+                preco=Decimal(50 + n), duracao_minutos=30,
+            )
+            for n in range(30)
+        ])
+
+        # Horários distintos: (dia de -60 a +29, meia hora das 8h às 19h30, profissional)
+        status = [codigo for codigo, _ in Agendamento.STATUS_CHOICES]
+        lista_agendamentos = []
+        for n, horario in enumerate(sorteio.sample(range(90 * 24 * profissionais), agendamentos)):
+            dia, resto = divmod(horario, 24 * profissionais)
+            meia_hora, indice = divmod(resto, profissionais)
+            hora = time(8 + meia_hora // 2, 30 * (meia_hora % 2))
+            lista_agendamentos.append(Agendamento(
+                salao=salao,
+                cliente=lista_clientes[n % clientes],
+                profissional=lista_profissionais[indice],
+                servico=servicos[n % len(servicos)],
+                data=hoje + timedelta(days=dia - 60),
+                hora=hora,
+                hora_fim=Agendamento.calcular_hora_fim(hora, 30),
+                status=status[n % len(status)],
+            ))
+        Agendamento.objects.bulk_create(lista_agendamentos, batch_size=1000)
+
+        categorias = [codigo for codigo, _ in Transacao.CATEGORIA_CHOICES]
+        Transacao.objects.bulk_create([
+            Transacao(
+                salao=salao, tipo=sorteio.choice(('receita', 'despesa')), categoria=sorteio.choice(categorias),
+                descricao=f'Lançamento {nome} {n}', valor=Decimal(sorteio.randint(100, 50000)) / 100,
+                data=hoje - timedelta(days=sorteio.randrange(365)), pago=sorteio.random() < 0.8,
+            )
+            for n in range(agendamentos)
+        ], batch_size=1000)
+        recalcular_resumo(salao)
+
+        materiais = Material.objects.bulk_create([
+            Material(
+                salao=salao, nome=f'Material {nome} {n}', modulo=('cabelo', 'pele', 'unhas', 'geral')[n % 4],
+                quantidade=Decimal(sorteio.randint(0, 100)), custo_unitario=Decimal('2.50'),
+            )
+            for n in range(100)
+        ])
+        MovimentacaoEstoque.objects.bulk_create([
+            MovimentacaoEstoque(
+                salao=salao, material=materiais[n % len(materiais)], tipo='entrada', quantidade=Decimal(1),
+                motivo=f'Compra {nome}',
+            )
+            for n in range(agendamentos // 3)
+        ])
+        return {
+            'profissionais': lista_profissionais,
+            'clientes': lista_clientes,
+            'servicos': servicos,
+            'agendamentos': agendamentos,
+            'transacoes': agendamentos,
+            'materiais': len(materiais),
+        }
+
+    def orcamento_view(self, url, consultas, metodo='get', dados=None, usuario=None):
+        """Faz a requisição com o cache vazio e verifica consultas e isolamento"""
+        cache.clear()
+        self.client.force_login(usuario or self.cliente)
+        with CaptureQueriesContext(connection) as contexto:
+            resposta = getattr(self.client, metodo)(url, dados)
+            conteudo = b''.join(resposta.streaming_content) if resposta.streaming else resposta.content
+        self.assertLess(resposta.status_code, 400, url)
+        self.assertLessEqual(
+            len(contexto), consultas,
+            f'{url}: {len(contexto)} consultas (orçamento {consultas}):\n'
+            + '\n'.join(consulta['sql'] for consulta in contexto.captured_queries),
+        )
+        self.assertNotIn(self.OUTRO_SALAO, conteudo.decode(errors='replace'), url)
+        return resposta
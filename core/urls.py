@@ -9,4 +9,5 @@ urlpatterns = [
     path('dashboard/', views.dashboard, name='dashboard'),
     path('perfil/', views.perfil, name='perfil'),
     path('meus-agendamentos/', views.meus_agendamentos, name='meus_agendamentos'),
+    path('instrumentacao/', views.instrumentacao, name='instrumentacao'),
 ]
@@ -1,24 +1,278 @@
+import copy
+import threading
+import time
+from collections import OrderedDict
+from contextvars import ContextVar
+from functools import wraps
+from inspect import iscoroutinefunction
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
 from django.db import models
-from threading import local
 
-_thread_locals = local()
+# O salão atual acompanha o contexto de execução (thread, tarefa asyncio ou
+# chamada sync_to_async/async_to_sync), e não apenas a thread.
+_salao_atual = ContextVar('salao_atual', default=None)
 
 def get_current_salao():
-    """Retorna o salão atual do thread local storage"""
-    return getattr(_thread_locals, 'salao', None)
+    """Retorna o salão do contexto de execução atual"""
+    return _salao_atual.get()
 
 def set_current_salao(salao):
-    """Define o salão atual no thread local storage"""
-    _thread_locals.salao = salao
+    """Define o salão do contexto atual. Retorna um token para reset_current_salao"""
+    return _salao_atual.set(salao)
+
+def reset_current_salao(token):
+    """Restaura o salão que estava ativo antes de set_current_salao"""
+    _salao_atual.reset(token)
+
+
+class usar_salao:
+    """
+    Fixa o salão atual dentro de um bloco ou de uma função.
+
+    Útil para tarefas em segundo plano, comandos e threads, onde não há
+    TenantMiddleware. Funciona como gerenciador de contexto (síncrono ou
+    assíncrono) e como decorador de funções e corrotinas:
+
+        with usar_salao(salao):
+            Servico.objects.all()
+
+        @usar_salao(salao)
+        async def tarefa():
+            ...
+    """
+
+    def __init__(self, salao):
+        self.salao = salao
+        self._tokens = []
+
+    def __enter__(self):
+        self._tokens.append(set_current_salao(self.salao))
+        return self.salao
+
+    def __exit__(self, *exc_info):
+        reset_current_salao(self._tokens.pop())
+
+    async def __aenter__(self):
+        return self.__enter__()
+
+    async def __aexit__(self, *exc_info):
+        self.__exit__(*exc_info)
+
+    def __call__(self, func):
+        salao = self.salao
+
+        if iscoroutinefunction(func):
+            @wraps(func)
+            async def inner(*args, **kwargs):
+                with usar_salao(salao):
+                    return await func(*args, **kwargs)
+        else:
+            @wraps(func)
+            def inner(*args, **kwargs):
+                with usar_salao(salao):
+                    return func(*args, **kwargs)
+        return inner
+
 
 class TenantManager(models.Manager):
     """Manager que filtra automaticamente pelo salão atual"""
-    
+
     def get_queryset(self):
         queryset = super().get_queryset()
         salao = get_current_salao()
-        
+
         if salao:
             return queryset.filter(salao=salao)
-        
+
         return queryset
+
+
+class CacheLRU:
+    """
+    Cache em memória do processo, limitado em tamanho (LRU) e com TTL.
+
+    Fica à frente do cache compartilhado do Django para que leituras muito
+    frequentes não custem nem uma ida ao backend de cache. Seguro para uso
+    entre threads.
+    """
+    AUSENTE = object()
+
+    def __init__(self, tamanho_maximo=1024, ttl=60):
+        self.tamanho_maximo = tamanho_maximo
+        self.ttl = ttl
+        self._dados = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, chave, padrao=AUSENTE):
+        with self._lock:
+            item = self._dados.get(chave)
+            if item is None:
+                return padrao
+            expira_em, valor = item
+            if expira_em < time.monotonic():
+                del self._dados[chave]
+                return padrao
+            self._dados.move_to_end(chave)
+            return valor
+
+    def set(self, chave, valor):
+        with self._lock:
+            self._dados[chave] = (time.monotonic() + self.ttl, valor)
+            self._dados.move_to_end(chave)
+            while len(self._dados) > self.tamanho_maximo:
+                self._dados.popitem(last=False)
+
+    def delete(self, chave):
+        with self._lock:
+            self._dados.pop(chave, None)
+
+    def clear(self):
+        with self._lock:
+            self._dados.clear()
+
+
+
+class CacheSalao:
+    """
+    Cache de dados pequenos e muito lidos de cada salão (catálogos).
+
+    Os valores ficam no namespace do salão, em chaves que incluem o contador
+    de geração do salão e o contador global do namespace (dados comuns a
+    todos os salões). invalidar(salao_id) incrementa o contador do salão e
+    invalidar(None) o global: os valores antigos deixam de ser lidos sem
+    precisar ser apagados e expiram pelo timeout.
+
+    Os contadores são lidos do cache do Django a cada acesso, em uma única
+    ida ao backend, de modo que a invalidação feita por outro processo vale
+    já na leitura seguinte. Os valores passam antes por um CacheLRU do
+    processo: cada geração é desserializada uma vez por processo e o mesmo
+    objeto é devolvido a todas as requisições, então deve ser tratado como
+    somente leitura. carregar() não deve retornar None.
+    """
+
+    def __init__(self, namespace, timeout=60 * 60, tamanho_local=256, ttl_local=60 * 5):
+        self.namespace = namespace
+        self.timeout = timeout
+        self.local = CacheLRU(tamanho_maximo=tamanho_local, ttl=ttl_local)
+
+    def _prefixo(self, salao_id):
+        return f'salao:{"global" if salao_id is None else salao_id}:{self.namespace}'
+
+    def chave_geracao(self, salao_id=None):
+        return f'{self._prefixo(salao_id)}:geracao'
+
+    def _chaves_geracao(self, salao_id):
+        if salao_id is None:
+            return [self.chave_geracao()]
+        return [self.chave_geracao(salao_id), self.chave_geracao()]
+
+    def _chave(self, salao_id, nome, geracoes):
+        return f'{self._prefixo(salao_id)}:{nome}:{".".join(map(str, geracoes))}'
+
+    @staticmethod
+    def _nova_geracao():
+        # Um contador perdido (expirado ou removido do cache) recomeça em um valor
+        # que não coincide com gerações já usadas em chaves ainda guardadas
+        return time.time_ns()
+
+    def geracoes(self, salao_id):
+        chaves = self._chaves_geracao(salao_id)
+        encontradas = cache.get_many(chaves)
+        for chave in chaves:
+            if chave not in encontradas:
+                cache.add(chave, self._nova_geracao(), None)
+                encontradas[chave] = cache.get(chave)
+        return [encontradas[chave] for chave in chaves]
+
+    async def ageracoes(self, salao_id):
+        chaves = self._chaves_geracao(salao_id)
+        encontradas = await cache.aget_many(chaves)
+        for chave in chaves:
+            if chave not in encontradas:
+                await cache.aadd(chave, self._nova_geracao(), None)
+                encontradas[chave] = await cache.aget(chave)
+        return [encontradas[chave] for chave in chaves]
+
+    def obter(self, salao_id, nome, carregar):
+        """Valor `nome` do salão (None: global), carregado com carregar() na falta"""
+        chave = self._chave(salao_id, nome, self.geracoes(salao_id))
+        valor = self.local.get(chave, None)
+        if valor is None:
+            valor = cache.get(chave)
+            if valor is None:
+                valor = carregar()
+                cache.set(chave, valor, self.timeout)
+            self.local.set(chave, valor)
+        return valor
+
+    async def aobter(self, salao_id, nome, carregar):
+        """obter() assíncrono; carregar pode ser síncrona (roda em sync_to_async) ou coroutine"""
+        chave = self._chave(salao_id, nome, await self.ageracoes(salao_id))
+        valor = self.local.get(chave, None)
+        if valor is None:
+            valor = await cache.aget(chave)
+            if valor is None:
+                valor = await carregar() if iscoroutinefunction(carregar) else await sync_to_async(carregar)()
+                await cache.aset(chave, valor, self.timeout)
+            self.local.set(chave, valor)
+        return valor
+
+    def invalidar(self, salao_id=None):
+        """Nova geração para o salão (None: para todos os salões)"""
+        chave = self.chave_geracao(salao_id)
+        try:
+            cache.incr(chave)
+        except ValueError:
+            cache.set(chave, self._nova_geracao(), None)
+
+
+# Resolução de salão por subdomínio: CacheSalao com o subdomínio no lugar do id.
+# Salões inexistentes ou inativos também são guardados, para que subdomínios
+# inválidos recebam 404 sem nova consulta ao banco. A invalidação vale para
+# os outros processos pelo contador de geração, o que requer um cache
+# compartilhado entre eles (ver CACHES em config/settings.py).
+SALAO_CACHE_TIMEOUT = getattr(settings, 'SALAO_CACHE_TIMEOUT', 60 * 10)
+_SALAO_INDISPONIVEL = 'indisponivel'
+_saloes_por_subdominio = CacheSalao(
+    'subdominio',
+    timeout=SALAO_CACHE_TIMEOUT,
+    tamanho_local=getattr(settings, 'SALAO_CACHE_LOCAL_TAMANHO', 1024),
+    ttl_local=getattr(settings, 'SALAO_CACHE_LOCAL_TTL', 30),
+)
+
+def cache_compartilhado(alias='default'):
+    """Se o cache é o mesmo para todos os processos (não é o LocMemCache nem o DummyCache)"""
+    return not isinstance(caches[alias], (LocMemCache, DummyCache))
+
+def extrair_subdominio(host):
+    """Extrai o subdomínio do salão do host da requisição (ou None)"""
+    dominio_base = getattr(settings, 'TENANT_DOMINIO_BASE', '')
+    host = host.split(':', 1)[0].lower().rstrip('.')
+    if not dominio_base or not host.endswith('.' + dominio_base):
+        return None
+    subdominio = host[:-len(dominio_base) - 1]
+    if not subdominio or subdominio in getattr(settings, 'TENANT_SUBDOMINIOS_RESERVADOS', ()):
+        return None
+    return subdominio
+
+def buscar_salao_por_subdominio(subdominio):
+    """
+    Retorna o salão ativo do subdomínio, ou None se não existe/está inativo.
+    Cada chamada recebe uma cópia, que pode ser alterada sem afetar as
+    outras requisições.
+    """
+    def carregar():
+        from .models import Salao
+        return Salao.objects.filter(subdominio=subdominio, ativo=True).first() or _SALAO_INDISPONIVEL
+
+    salao = _saloes_por_subdominio.obter(subdominio, 'salao', carregar)
+    return None if salao == _SALAO_INDISPONIVEL else copy.copy(salao)
+
+def invalidar_salao_subdominio(subdominio):
+    """Descarta o salão em cache de um subdomínio, em todos os processos"""
+    _saloes_por_subdominio.invalidar(subdominio)
@@ -1,11 +1,14 @@
 from django.shortcuts import render, redirect
 from django.contrib.auth import login, authenticate, logout
 from django.contrib.auth.decorators import login_required
+from django.contrib.admin.views.decorators import staff_member_required
+from django.http import JsonResponse
 from django.contrib import messages
 from django.contrib.auth.forms import AuthenticationForm
 from .forms import CadastroUsuarioForm, PerfilUsuarioForm
 from servicos.models import Servico, Profissional, Agendamento
 from core.models import Salao
+from core.instrumentacao import historico, resumo_por_view
 from django.utils.text import slugify
 
 
@@ -84,7 +87,7 @@ def logout_view(request):
 
 
 @login_required
-def dashboard(request):
+async def dashboard(request):
     """Dashboard do usuário (cliente ou profissional)"""
     user = request.user
     
@@ -92,10 +95,14 @@ def dashboard(request):
         return redirect('admin_dashboard')
     
     # Agendamentos do cliente
-    agendamentos = Agendamento.objects.filter(cliente=user).order_by('-data', '-hora')[:10]
+    agendamentos = [
+        agendamento async for agendamento in Agendamento.objects.filter(cliente=user).select_related(
+            'servico', 'cliente', 'profissional__usuario'
+        ).order_by('-data', '-hora')[:10]
+    ]
     
     # Contagem de agendamentos pendentes
-    agendamentos_pendentes = Agendamento.objects.filter(cliente=user, status='pendente').count()
+    agendamentos_pendentes = await Agendamento.objects.filter(cliente=user, status='pendente').acount()
     
     from datetime import date
     context = {
@@ -122,8 +129,24 @@ def perfil(request):
 
 
 @login_required
-def meus_agendamentos(request):
+async def meus_agendamentos(request):
     """Lista de agendamentos do usuário"""
-    agendamentos = Agendamento.objects.filter(cliente=request.user).order_by('-data', '-hora')
+    agendamentos = [
+        agendamento async for agendamento in Agendamento.objects.filter(cliente=request.user).select_related(
+            'servico__modulo', 'profissional__usuario'
+        ).order_by('-data', '-hora')
+    ]
     
     return render(request, 'core/meus_agendamentos.html', {'agendamentos': agendamentos})
+
+
+@staff_member_required
+def instrumentacao(request):
+    """Últimas requisições medidas pela instrumentação de consultas (JSON, apenas equipe)"""
+    registros = historico()
+    if request.GET.get('repetidas'):
+        registros = [registro for registro in registros if registro['repetidas']]
+    return JsonResponse({
+        'resumo': resumo_por_view(registros),
+        'registros': registros,
+    }, json_dumps_params={'ensure_ascii': False})
@@ -0,0 +1,21 @@
+from django.contrib import admin
+from django.utils import timezone
+
+from .models import Tarefa
+
+
+@admin.register(Tarefa)
+class TarefaAdmin(admin.ModelAdmin):
+    list_display = ['nome', 'status', 'salao_id', 'tentativas', 'executar_em', 'criado_em', 'concluida_em']
+    list_filter = ['status', 'nome']
+    search_fields = ['nome', 'erro']
+    date_hierarchy = 'criado_em'
+    readonly_fields = ['reserva', 'reservada_em', 'erro', 'criado_em', 'concluida_em']
+    actions = ['reenfileirar']
+
+    @admin.action(description='Executar novamente as tarefas selecionadas')
+    def reenfileirar(self, request, queryset):
+        atualizadas = queryset.exclude(status='executando').update(
+            status='pendente', tentativas=0, executar_em=timezone.now(), reserva='', erro='',
+        )
+        self.message_user(request, f'{atualizadas} tarefa(s) enfileirada(s) novamente.')
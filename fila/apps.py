@@ -0,0 +1,11 @@
+from django.apps import AppConfig
+from django.utils.module_loading import autodiscover_modules
+
+
+class FilaConfig(AppConfig):
+    default_auto_field = 'django.db.models.BigAutoField'
+    name = 'fila'
+
+    def ready(self):
+        # As tarefas ficam nos módulos `tarefas` de cada app
+        autodiscover_modules('tarefas')
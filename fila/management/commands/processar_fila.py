@@ -0,0 +1,47 @@
+import signal
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from fila.tarefas import TEMPO_LIMITE
+from fila.trabalhador import POOLS, Trabalhador
+
+
+class Command(BaseCommand):
+    help = 'Executa as tarefas em segundo plano da fila (ver fila.tarefas)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--pool', choices=POOLS, default='threads', help='Threads (E/S) ou processos (CPU)')
+        parser.add_argument('--concorrencia', type=int, default=4, help='Threads ou processos do pool')
+        parser.add_argument('--lote', type=int, default=100, help='Tarefas reservadas por vez')
+        parser.add_argument(
+            '--intervalo', type=float, default=1.0, help='Segundos de espera quando não há tarefas vencidas',
+        )
+        parser.add_argument(
+            '--tempo-limite', type=float, default=TEMPO_LIMITE,
+            help='Segundos até uma tarefa reservada por um worker parado voltar para a fila',
+        )
+        parser.add_argument('--ate-esvaziar', action='store_true', help='Termina quando não houver tarefas vencidas')
+
+    def handle(self, *args, **options):
+        for opcao in ('concorrencia', 'lote'):
+            if options[opcao] < 1:
+                raise CommandError(f'--{opcao} deve ser positivo.')
+
+        trabalhador = Trabalhador(
+            pool=options['pool'], concorrencia=options['concorrencia'], lote=options['lote'],
+            intervalo=options['intervalo'], tempo_limite=options['tempo_limite'],
+        )
+        # SIGTERM (parada do serviço) termina o lote em andamento antes de sair
+        signal.signal(signal.SIGTERM, lambda *args: trabalhador.parar.set())
+        self.stdout.write(f'Processando a fila com {options["concorrencia"]} {options["pool"]}.')
+        inicio = time.perf_counter()
+        try:
+            trabalhador.executar(ate_esvaziar=options['ate_esvaziar'])
+        except KeyboardInterrupt:
+            trabalhador.parar.set()
+        segundos = time.perf_counter() - inicio
+        self.stdout.write(self.style.SUCCESS(
+            f'{trabalhador.processadas} tarefa(s) processada(s), {trabalhador.falhas} com erro, '
+            f'em {segundos:.1f}s.'
+        ))
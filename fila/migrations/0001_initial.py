@@ -0,0 +1,41 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:00
+
+import django.core.serializers.json
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Tarefa',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('nome', models.CharField(max_length=200, verbose_name='Tarefa')),
+                ('argumentos', models.JSONField(blank=True, default=dict, encoder=django.core.serializers.json.DjangoJSONEncoder, verbose_name='Argumentos')),
+                ('salao_id', models.BigIntegerField(blank=True, null=True, verbose_name='Salão')),
+                ('banco', models.CharField(blank=True, max_length=100, verbose_name='Banco fixado')),
+                ('status', models.CharField(choices=[('pendente', 'Pendente'), ('executando', 'Executando'), ('concluida', 'Concluída'), ('falhou', 'Falhou')], default='pendente', max_length=20, verbose_name='Status')),
+                ('tentativas', models.PositiveIntegerField(default=0, verbose_name='Tentativas')),
+                ('max_tentativas', models.PositiveIntegerField(default=5, verbose_name='Máximo de tentativas')),
+                ('executar_em', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Executar em')),
+                ('reserva', models.CharField(blank=True, db_index=True, max_length=32, verbose_name='Reserva')),
+                ('reservada_em', models.DateTimeField(blank=True, null=True, verbose_name='Reservada em')),
+                ('erro', models.TextField(blank=True, verbose_name='Último erro')),
+                ('criado_em', models.DateTimeField(auto_now_add=True, verbose_name='Criada em')),
+                ('concluida_em', models.DateTimeField(blank=True, null=True, verbose_name='Concluída em')),
+            ],
+            options={
+                'verbose_name': 'Tarefa',
+                'verbose_name_plural': 'Tarefas',
+                'ordering': ['-criado_em'],
+                'indexes': [models.Index(fields=['status', 'executar_em'], name='tarefa_status_executar_em'), models.Index(fields=['status', 'reservada_em'], name='tarefa_status_reservada_em')],
+            },
+        ),
+    ]
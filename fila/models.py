@@ -0,0 +1,45 @@
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import models
+from django.utils import timezone
+
+
+class Tarefa(models.Model):
+    """Tarefa em segundo plano, executada pelo comando processar_fila (ver fila.tarefas)"""
+    STATUS_CHOICES = (
+        ('pendente', 'Pendente'),
+        ('executando', 'Executando'),
+        ('concluida', 'Concluída'),
+        ('falhou', 'Falhou'),
+    )
+
+    nome = models.CharField('Tarefa', max_length=200)
+    argumentos = models.JSONField('Argumentos', default=dict, blank=True, encoder=DjangoJSONEncoder)
+
+    # Contexto do salão. Sem chave estrangeira, a tabela fica no banco
+    # principal mesmo com shards, e um worker atende todos os salões.
+    salao_id = models.BigIntegerField('Salão', null=True, blank=True)
+    banco = models.CharField('Banco fixado', max_length=100, blank=True)
+
+    status = models.CharField('Status', max_length=20, choices=STATUS_CHOICES, default='pendente')
+    tentativas = models.PositiveIntegerField('Tentativas', default=0)
+    max_tentativas = models.PositiveIntegerField('Máximo de tentativas', default=5)
+    executar_em = models.DateTimeField('Executar em', default=timezone.now)
+    reserva = models.CharField('Reserva', max_length=32, blank=True, db_index=True)
+    reservada_em = models.DateTimeField('Reservada em', null=True, blank=True)
+    erro = models.TextField('Último erro', blank=True)
+
+    criado_em = models.DateTimeField('Criada em', auto_now_add=True)
+    concluida_em = models.DateTimeField('Concluída em', null=True, blank=True)
+
+    class Meta:
+        verbose_name = 'Tarefa'
+        verbose_name_plural = 'Tarefas'
+        ordering = ['-criado_em']
+        indexes = [
+            # Reserva das tarefas vencidas e recuperação das abandonadas
+            models.Index(fields=['status', 'executar_em'], name='tarefa_status_executar_em'),
+            models.Index(fields=['status', 'reservada_em'], name='tarefa_status_reservada_em'),
+        ]
+
+    def __str__(self):
+        return f'{self.nome} #{self.pk} ({self.get_status_display()})'
@@ -0,0 +1,213 @@
+"""
+Fila de tarefas em segundo plano, gravada no banco, sem broker externo.
+
+As funções registradas com @tarefa (nos módulos `tarefas` de cada app) são
+enfileiradas depois do commit da transação em andamento, com o salão atual,
+e executadas pelo comando processar_fila:
+
+    # servicos/tarefas.py
+    @tarefa(tentativas=3)
+    def confirmar_agendamento(agendamento_id):
+        agendamento = Agendamento.objects.get(pk=agendamento_id)
+        ...
+
+    # na view, dentro do salão da requisição
+    confirmar_agendamento.enfileirar(agendamento_id=agendamento.pk)
+
+Os argumentos são gravados em JSON: passe ids, e não instâncias. Se a
+transação for desfeita, nada é enfileirado. A tarefa roda com o mesmo salão
+(e com o banco fixado por usar_banco, fora de um salão), em outra thread ou
+processo, e pode rodar mais de uma vez: uma tarefa que falha volta para a
+fila com espera exponencial, e uma reservada por um worker que parou volta
+depois de FILA_TEMPO_LIMITE. As tarefas devem, portanto, poder ser
+repetidas sem efeito duplicado.
+
+Cada worker reserva as tarefas vencidas em lotes. No PostgreSQL, com
+SELECT ... FOR UPDATE SKIP LOCKED, os workers não disputam as mesmas
+linhas. No SQLite, que não tem locks de linha, o UPDATE da reserva obtém o
+lock de escrita do banco e só leva as linhas ainda pendentes.
+"""
+import functools
+import logging
+import random
+import traceback
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, close_old_connections, connections, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from core.shards import banco_de, banco_fixado, usar_banco
+from core.utils import get_current_salao, usar_salao
+from .models import Tarefa
+
+logger = logging.getLogger(__name__)
+
+TENTATIVAS_PADRAO = 5
+# Espera antes da nova tentativa: base * 2^(tentativas - 1), até o máximo, com até 10% a mais
+ESPERA_BASE = getattr(settings, 'FILA_ESPERA_BASE', 5)
+ESPERA_MAXIMA = getattr(settings, 'FILA_ESPERA_MAXIMA', 60 * 60)
+# Segundos até uma tarefa reservada por um worker que parou voltar para a fila
+TEMPO_LIMITE = getattr(settings, 'FILA_TEMPO_LIMITE', 5 * 60)
+
+_tarefas = {}
+
+
+def tarefa(funcao=None, *, nome=None, tentativas=TENTATIVAS_PADRAO):
+    """
+    Registra a função como tarefa, pelo caminho dela (ou `nome`). Funciona
+    como @tarefa e como @tarefa(tentativas=3). A função continua podendo ser
+    chamada diretamente e ganha .enfileirar(**argumentos).
+    """
+    if funcao is None:
+        return functools.partial(tarefa, nome=nome, tentativas=tentativas)
+
+    funcao.nome_tarefa = nome or f'{funcao.__module__}.{funcao.__qualname__}'
+    funcao.tentativas = tentativas
+    funcao.enfileirar = functools.partial(enfileirar, funcao)
+    _tarefas[funcao.nome_tarefa] = funcao
+    return funcao
+
+
+def tarefa_registrada(nome):
+    try:
+        return _tarefas[nome]
+    except KeyError:
+        raise ValueError(f'Tarefa não registrada: {nome}.') from None
+
+
+def enfileirar(funcao, *, atraso=None, using=None, **argumentos):
+    """
+    Enfileira a tarefa (a função registrada ou o nome dela) no commit da
+    transação do banco `using`, que por padrão é o dos dados do salão atual.
+    Fora de uma transação, enfileira na hora. `atraso` (timedelta ou
+    segundos) adia a execução.
+    """
+    funcao = tarefa_registrada(funcao if isinstance(funcao, str) else funcao.nome_tarefa)
+    if isinstance(atraso, (int, float)):
+        atraso = timedelta(seconds=atraso)
+    salao = get_current_salao()
+    # Com salão, o banco é o dele na hora da execução (o salão pode trocar de shard)
+    dados = {
+        'nome': funcao.nome_tarefa,
+        'argumentos': argumentos,
+        'salao_id': salao.id if salao else None,
+        'banco': '' if salao else banco_fixado() or '',
+        'max_tentativas': funcao.tentativas,
+    }
+
+    def gravar():
+        Tarefa.objects.using(DEFAULT_DB_ALIAS).create(
+            executar_em=timezone.now() + (atraso or timedelta()), **dados,
+        )
+
+    # banco_de sem instância: o banco dos dados do salão atual
+    transaction.on_commit(gravar, using=using or banco_de(Tarefa))
+
+
+def reservar(quantidade):
+    """Reserva para este worker até `quantidade` tarefas vencidas, as mais antigas primeiro"""
+    conexao = connections[DEFAULT_DB_ALIAS]
+    tarefas = Tarefa.objects.using(DEFAULT_DB_ALIAS)
+    reserva = uuid.uuid4().hex
+    agora = timezone.now()
+    vencidas = tarefas.filter(status='pendente', executar_em__lte=agora).order_by('executar_em', 'pk')
+    with transaction.atomic(using=DEFAULT_DB_ALIAS):
+        if conexao.features.has_select_for_update_skip_locked:
+            ids = list(vencidas.select_for_update(skip_locked=True).values_list('pk', flat=True)[:quantidade])
+        else:
+            ids = vencidas.values('pk')[:quantidade]
+        reservadas = tarefas.filter(pk__in=ids, status='pendente').update(
+            status='executando', reserva=reserva, reservada_em=agora, tentativas=F('tentativas') + 1,
+        )
+    if not reservadas:
+        return []
+    return list(tarefas.filter(reserva=reserva, status='executando'))
+
+
+def executar(tarefa, salao=None):
+    """
+    Executa a tarefa no salão dela (ou no banco fixado). Devolve None ou o
+    traceback do erro. Fica no nível do módulo para rodar também em um
+    pool de processos.
+
+    Como o Django faz a cada requisição, as conexões da thread (ou do
+    processo) vencidas por CONN_MAX_AGE ou quebradas são fechadas antes e
+    depois da tarefa, para que uma tarefa não herde a conexão que a
+    anterior deixou inutilizável.
+    """
+    close_old_connections()
+    try:
+        funcao = tarefa_registrada(tarefa.nome)
+        if tarefa.salao_id and salao is None:
+            raise ValueError(f'Salão {tarefa.salao_id} não encontrado.')
+        with usar_banco(tarefa.banco or None), usar_salao(salao):
+            funcao(**tarefa.argumentos)
+    except Exception:
+        return traceback.format_exc()
+    finally:
+        close_old_connections()
+    return None
+
+
+def espera(tentativas):
+    """Espera antes da próxima tentativa, em segundos"""
+    segundos = min(ESPERA_MAXIMA, ESPERA_BASE * 2 ** max(0, tentativas - 1))
+    return segundos * (1 + random.random() / 10)
+
+
+def finalizar(tarefas, erros):
+    """
+    Grava o resultado das tarefas executadas. `erros` é {pk: traceback} das
+    que falharam: voltam para a fila com espera ou, sem tentativas
+    restantes, ficam como falhou.
+    """
+    agora = timezone.now()
+    tarefas_banco = Tarefa.objects.using(DEFAULT_DB_ALIAS)
+    concluidas = [tarefa.pk for tarefa in tarefas if tarefa.pk not in erros]
+    falhas = []
+    for tarefa in tarefas:
+        if tarefa.pk not in erros:
+            continue
+        tarefa.erro = erros[tarefa.pk]
+        if tarefa.tentativas >= tarefa.max_tentativas:
+            tarefa.status = 'falhou'
+            logger.error('Tarefa %s #%s falhou após %s tentativa(s):\n%s', tarefa.nome, tarefa.pk,
+                         tarefa.tentativas, tarefa.erro)
+        else:
+            tarefa.status = 'pendente'
+            tarefa.executar_em = agora + timedelta(seconds=espera(tarefa.tentativas))
+            logger.warning('Tarefa %s #%s falhou (tentativa %s de %s).', tarefa.nome, tarefa.pk,
+                           tarefa.tentativas, tarefa.max_tentativas)
+        falhas.append(tarefa)
+
+    # Só as que continuam reservadas por este worker (não foram dadas como
+    # abandonadas e reservadas por outro)
+    with transaction.atomic(using=DEFAULT_DB_ALIAS):
+        if concluidas:
+            tarefas_banco.filter(
+                pk__in=concluidas, status='executando', reserva__in={tarefa.reserva for tarefa in tarefas},
+            ).update(status='concluida', concluida_em=agora)
+        for tarefa in falhas:
+            tarefas_banco.filter(pk=tarefa.pk, status='executando', reserva=tarefa.reserva).update(
+                status=tarefa.status, executar_em=tarefa.executar_em, erro=tarefa.erro,
+            )
+
+
+def recuperar_abandonadas(tempo_limite=TEMPO_LIMITE):
+    """Devolve à fila as tarefas reservadas há mais de `tempo_limite` segundos (worker parado)"""
+    limite = timezone.now() - timedelta(seconds=tempo_limite)
+    abandonadas = Tarefa.objects.using(DEFAULT_DB_ALIAS).filter(status='executando', reservada_em__lt=limite)
+    erro = 'Tempo limite de execução esgotado.'
+    with transaction.atomic(using=DEFAULT_DB_ALIAS):
+        falharam = abandonadas.filter(tentativas__gte=F('max_tentativas')).update(status='falhou', erro=erro)
+        voltaram = abandonadas.update(status='pendente', executar_em=timezone.now(), erro=erro)
+    return voltaram + falharam
+
+
+def apagar_concluidas(antes):
+    """Apaga as tarefas concluídas antes do instante `antes`"""
+    apagadas, _ = Tarefa.objects.using(DEFAULT_DB_ALIAS).filter(status='concluida', concluida_em__lt=antes).delete()
+    return apagadas
@@ -0,0 +1,139 @@
+import io
+from datetime import timedelta
+from unittest import mock
+
+from django.core.management import call_command
+from django.db import transaction
+from django.test import TestCase
+from django.utils import timezone
+
+from core.models import Salao
+from core.utils import get_current_salao, usar_salao
+from .models import Tarefa
+from .tarefas import enfileirar, espera, executar, finalizar, recuperar_abandonadas, reservar, tarefa
+from .trabalhador import Trabalhador
+
+executadas = []
+
+
+@tarefa
+def registrar_execucao(valor):
+    salao = get_current_salao()
+    executadas.append((valor, salao.subdominio if salao else None))
+
+
+@tarefa(tentativas=2)
+def falhar():
+    raise RuntimeError('falha proposital')
+
+
+class FilaTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.salao = Salao.objects.create(nome='Salão A', subdominio='salao-a')
+
+    def setUp(self):
+        executadas.clear()
+
+    def test_enfileira_no_commit_com_o_salao(self):
+        with usar_salao(self.salao), self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                registrar_execucao.enfileirar(valor=1)
+                self.assertFalse(Tarefa.objects.exists())
+        tarefa_gravada = Tarefa.objects.get()
+        self.assertEqual(tarefa_gravada.nome, 'fila.tests.registrar_execucao')
+        self.assertEqual(tarefa_gravada.salao_id, self.salao.id)
+        self.assertEqual(tarefa_gravada.argumentos, {'valor': 1})
+
+    def test_nada_enfileirado_se_a_transacao_e_desfeita(self):
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            with transaction.atomic():
+                registrar_execucao.enfileirar(valor=1)
+                transaction.set_rollback(True)
+        self.assertEqual(callbacks, [])
+        self.assertFalse(Tarefa.objects.exists())
+
+    def test_tarefa_nao_registrada(self):
+        with self.assertRaises(ValueError):
+            enfileirar('fila.tests.inexistente')
+
+    def test_worker_executa_no_contexto_do_salao(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            with usar_salao(self.salao):
+                registrar_execucao.enfileirar(valor=1)
+            registrar_execucao.enfileirar(valor=2)
+            registrar_execucao.enfileirar(valor=3, atraso=60)
+
+        saida = io.StringIO()
+        call_command('processar_fila', '--ate-esvaziar', '--concorrencia', '2', stdout=saida)
+        self.assertEqual(sorted(executadas), [(1, 'salao-a'), (2, None)])
+        self.assertIn('2 tarefa(s) processada(s), 0 com erro', saida.getvalue())
+        self.assertEqual(Tarefa.objects.filter(status='concluida').count(), 2)
+        # A adiada continua na fila
+        self.assertEqual(Tarefa.objects.get(status='pendente').argumentos, {'valor': 3})
+
+    def test_reserva_nao_repete_tarefas(self):
+        Tarefa.objects.bulk_create(Tarefa(nome='fila.tests.registrar_execucao') for _ in range(5))
+        primeiras = reservar(3)
+        segundas = reservar(3)
+        self.assertEqual(len(primeiras), 3)
+        self.assertEqual(len(segundas), 2)
+        self.assertFalse({t.pk for t in primeiras} & {t.pk for t in segundas})
+        self.assertEqual(reservar(3), [])
+        self.assertTrue(all(t.status == 'executando' and t.tentativas == 1 for t in primeiras + segundas))
+
+    def test_nova_tentativa_com_espera_e_falha_definitiva(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            falhar.enfileirar()
+        trabalhador = Trabalhador(concorrencia=1)
+        with trabalhador.criar_executor() as executor, self.assertLogs('fila.tarefas', 'WARNING'):
+            self.assertEqual(trabalhador.processar_lote(executor), 1)
+            tarefa_gravada = Tarefa.objects.get()
+            self.assertEqual(tarefa_gravada.status, 'pendente')
+            self.assertEqual(tarefa_gravada.tentativas, 1)
+            self.assertGreater(tarefa_gravada.executar_em, timezone.now())
+            self.assertIn('falha proposital', tarefa_gravada.erro)
+            # Ainda não venceu
+            self.assertEqual(trabalhador.processar_lote(executor), 0)
+
+            Tarefa.objects.update(executar_em=timezone.now())
+            self.assertEqual(trabalhador.processar_lote(executor), 1)
+        self.assertEqual(Tarefa.objects.get().status, 'falhou')
+        self.assertEqual(trabalhador.falhas, 2)
+
+    def test_falha_de_tarefa_reservada_por_outro_worker_e_ignorada(self):
+        Tarefa.objects.create(nome='fila.tests.falhar')
+        [tarefa_reservada] = reservar(1)
+        # O worker demorou: a tarefa foi dada como abandonada e outro worker a reservou
+        Tarefa.objects.update(reservada_em=timezone.now() - timedelta(hours=1))
+        recuperar_abandonadas(tempo_limite=60)
+        [outra] = reservar(1)
+
+        finalizar([tarefa_reservada], {tarefa_reservada.pk: 'erro antigo'})
+        tarefa_gravada = Tarefa.objects.get()
+        self.assertEqual((tarefa_gravada.status, tarefa_gravada.reserva), ('executando', outra.reserva))
+        self.assertNotEqual(tarefa_gravada.erro, 'erro antigo')
+
+    def test_conexoes_velhas_fechadas_em_volta_da_tarefa(self):
+        tarefa_gravada = Tarefa.objects.create(nome='fila.tests.registrar_execucao', argumentos={'valor': 1})
+        with mock.patch('fila.tarefas.close_old_connections') as fechar:
+            self.assertIsNone(executar(tarefa_gravada))
+        self.assertEqual(fechar.call_count, 2)
+
+    def test_espera_exponencial(self):
+        self.assertLess(espera(1), espera(3))
+        self.assertGreaterEqual(espera(3), 4 * espera(1) / 1.1)
+        self.assertLessEqual(espera(100), 60 * 60 * 1.1)
+
+    def test_recupera_tarefas_abandonadas(self):
+        antiga = timezone.now() - timedelta(hours=1)
+        Tarefa.objects.bulk_create([
+            Tarefa(nome='fila.tests.registrar_execucao', status='executando', tentativas=1, reservada_em=antiga),
+            Tarefa(nome='fila.tests.registrar_execucao', status='executando', tentativas=5, reservada_em=antiga),
+            Tarefa(nome='fila.tests.registrar_execucao', status='executando', tentativas=1, reservada_em=timezone.now()),
+        ])
+        self.assertEqual(recuperar_abandonadas(tempo_limite=60), 2)
+        self.assertEqual(
+            sorted(Tarefa.objects.values_list('status', flat=True)), ['executando', 'falhou', 'pendente'],
+        )
@@ -0,0 +1,89 @@
+"""
+Worker da fila: reserva lotes de tarefas e as executa em um pool de threads
+ou de processos (ver fila.tarefas).
+
+Threads servem às tarefas que esperam por rede ou banco (e-mail, WhatsApp),
+e processos às que usam CPU. Cada lote é reservado, executado e finalizado
+com poucas consultas, independentemente do número de tarefas (mais uma por
+tarefa que falhou).
+"""
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import timedelta
+
+import django
+from django.conf import settings
+from django.db import connections
+from django.utils import timezone
+
+from core.models import Salao
+from .tarefas import TEMPO_LIMITE, apagar_concluidas, executar, finalizar, recuperar_abandonadas, reservar
+
+POOLS = ('threads', 'processos')
+# Horas que as tarefas concluídas ficam na tabela antes de serem apagadas pelo worker
+RETENCAO_CONCLUIDAS = getattr(settings, 'FILA_RETENCAO_CONCLUIDAS', 24)
+# Segundos entre as manutenções (abandonadas e concluídas antigas)
+INTERVALO_MANUTENCAO = 60
+
+
+def _iniciar_processo():
+    # Com fork o Django já vem configurado; as conexões herdadas foram fechadas antes
+    django.setup()
+
+
+class Trabalhador:
+    """
+    Processa a fila até `parar` (threading.Event) ser sinalizado ou, com
+    ate_esvaziar, até não haver tarefas vencidas.
+    """
+
+    def __init__(self, pool='threads', concorrencia=4, lote=100, intervalo=1.0, tempo_limite=TEMPO_LIMITE):
+        if pool not in POOLS:
+            raise ValueError(f'Pool inválido: {pool}.')
+        self.pool = pool
+        self.concorrencia = concorrencia
+        self.lote = lote
+        self.intervalo = intervalo
+        self.tempo_limite = tempo_limite
+        self.parar = threading.Event()
+        self.processadas = 0
+        self.falhas = 0
+
+    def criar_executor(self):
+        if self.pool == 'processos':
+            # Os processos filhos abrem as próprias conexões
+            connections.close_all()
+            return ProcessPoolExecutor(self.concorrencia, initializer=_iniciar_processo)
+        return ThreadPoolExecutor(self.concorrencia, thread_name_prefix='fila')
+
+    def processar_lote(self, executor):
+        """Reserva, executa e finaliza um lote; devolve o número de tarefas"""
+        tarefas = reservar(self.lote)
+        if not tarefas:
+            return 0
+        saloes = Salao.objects.in_bulk({tarefa.salao_id for tarefa in tarefas if tarefa.salao_id})
+        resultados = executor.map(executar, tarefas, [saloes.get(tarefa.salao_id) for tarefa in tarefas])
+        erros = {tarefa.pk: erro for tarefa, erro in zip(tarefas, resultados) if erro is not None}
+        finalizar(tarefas, erros)
+        self.processadas += len(tarefas)
+        self.falhas += len(erros)
+        return len(tarefas)
+
+    def manutencao(self):
+        recuperar_abandonadas(self.tempo_limite)
+        apagar_concluidas(timezone.now() - timedelta(hours=RETENCAO_CONCLUIDAS))
+
+    def executar(self, ate_esvaziar=False):
+        proxima_manutencao = 0
+        with self.criar_executor() as executor:
+            while not self.parar.is_set():
+                if time.monotonic() >= proxima_manutencao:
+                    self.manutencao()
+                    proxima_manutencao = time.monotonic() + INTERVALO_MANUTENCAO
+                if self.processar_lote(executor):
+                    continue
+                if ate_esvaziar:
+                    break
+                self.parar.wait(self.intervalo)
+        return self.processadas
@@ -1,5 +1,7 @@
 from django.contrib import admin
-from .models import Material, MovimentacaoEstoque, Transacao
+from .estoque import registrar_movimentacao
+from .forms import MovimentacaoEstoqueForm
+from .models import ConsumoMaterial, Material, MovimentacaoEstoque, SnapshotEstoque, Transacao, TransacaoDiaria
 
 @admin.register(Material)
 class MaterialAdmin(admin.ModelAdmin):
@@ -10,6 +12,12 @@ class MaterialAdmin(admin.ModelAdmin):
     def estoque_baixo_display(self, obj):
         return '⚠️ Baixo' if obj.estoque_baixo else '✓ OK'
     estoque_baixo_display.short_description = 'Situação Estoque'
+    
+    def get_readonly_fields(self, request, obj=None):
+        # Depois de criado, o estoque só muda por movimentações
+        if obj is not None:
+            return ['quantidade']
+        return []
 
 @admin.register(MovimentacaoEstoque)
 class MovimentacaoEstoqueAdmin(admin.ModelAdmin):
@@ -17,6 +25,24 @@ class MovimentacaoEstoqueAdmin(admin.ModelAdmin):
     list_filter = ['tipo', 'criado_em']
     search_fields = ['material__nome', 'motivo']
     date_hierarchy = 'criado_em'
+    form = MovimentacaoEstoqueForm
+    
+    def has_change_permission(self, request, obj=None):
+        # Movimentações já aplicadas ao estoque não são editadas; registre um ajuste
+        return obj is None and super().has_change_permission(request, obj)
+    
+    def save_model(self, request, obj, form, change):
+        movimentacao = registrar_movimentacao(
+            obj.material, obj.tipo, obj.quantidade, usuario=request.user, motivo=obj.motivo
+        )
+        obj.pk = movimentacao.pk
+        obj.quantidade = movimentacao.quantidade
+
+@admin.register(ConsumoMaterial)
+class ConsumoMaterialAdmin(admin.ModelAdmin):
+    list_display = ['servico', 'material', 'quantidade']
+    list_filter = ['servico__modulo']
+    search_fields = ['servico__nome', 'material__nome']
 
 @admin.register(Transacao)
 class TransacaoAdmin(admin.ModelAdmin):
@@ -26,3 +52,28 @@ class TransacaoAdmin(admin.ModelAdmin):
     date_hierarchy = 'data'
     list_editable = ['pago']
     readonly_fields = ['criado_em', 'atualizado_em']
+
+@admin.register(TransacaoDiaria)
+class TransacaoDiariaAdmin(admin.ModelAdmin):
+    list_display = ['data', 'salao', 'tipo', 'categoria', 'pago', 'total', 'quantidade']
+    list_filter = ['tipo', 'categoria', 'pago', 'salao']
+    date_hierarchy = 'data'
+    
+    def has_add_permission(self, request):
+        return False
+    
+    def has_change_permission(self, request, obj=None):
+        return False
+
+@admin.register(SnapshotEstoque)
+class SnapshotEstoqueAdmin(admin.ModelAdmin):
+    list_display = ['data', 'material', 'quantidade', 'custo_unitario', 'valor_total']
+    list_filter = ['data', 'salao']
+    search_fields = ['material__nome']
+    date_hierarchy = 'data'
+    
+    def has_add_permission(self, request):
+        return False
+    
+    def has_change_permission(self, request, obj=None):
+        return False
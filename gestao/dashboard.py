@@ -0,0 +1,88 @@
+"""
+Estatísticas do dashboard administrativo.
+
+Todos os indicadores são calculados em uma única consulta (subconsultas
+escalares com agregação condicional) e guardados em cache por salão por
+DASHBOARD_CACHE_TIMEOUT segundos. Gravações em Agendamento, Transacao e
+Material invalidam o cache (ver gestao.signals).
+
+Só entra no cache o que foi calculado no banco principal. A réplica pode
+estar atrasada: um valor lido dela e guardado logo depois de uma gravação
+(que acabou de invalidar o cache) continuaria desatualizado por todo o
+CACHE_TIMEOUT, bem depois de a fixação no principal de quem gravou expirar.
+"""
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, DecimalField, F, IntegerField, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+from core.models import Salao
+from core.replicas import lendo_da_replica
+from servicos.models import Agendamento
+from .models import Material, TransacaoDiaria
+
+CACHE_TIMEOUT = getattr(settings, 'DASHBOARD_CACHE_TIMEOUT', 60)
+
+CAMPOS = ('total_agendamentos_mes', 'agendamentos_hoje', 'receitas_mes', 'despesas_mes', 'materiais_baixo')
+
+
+def chave_cache(salao_id):
+    return f'dashboard:{salao_id}'
+
+
+def invalidar_dashboard(salao_id):
+    """Descarta as estatísticas em cache do salão"""
+    cache.delete(chave_cache(salao_id))
+
+
+def _agregado(queryset, agregado, output_field):
+    """Subconsulta escalar com o agregado das linhas do salão da consulta externa"""
+    return Coalesce(
+        Subquery(
+            queryset.filter(salao=OuterRef('pk'))
+            .order_by()
+            .values('salao')
+            .annotate(valor=agregado)
+            .values('valor')
+        ),
+        Value(0, output_field=output_field),
+        output_field=output_field,
+    )
+
+
+def calcular_estatisticas(salao_id, hoje):
+    """Calcula as estatísticas do dashboard em uma consulta"""
+    mes_atual = hoje.replace(day=1)
+    inteiro = IntegerField()
+    moeda = DecimalField(max_digits=14, decimal_places=2)
+
+    agendamentos = Agendamento._base_manager.filter(data__gte=mes_atual)
+    financeiro = TransacaoDiaria._base_manager.filter(data__gte=mes_atual, pago=True)
+
+    estatisticas = Salao.objects.filter(pk=salao_id).annotate(
+        total_agendamentos_mes=_agregado(agendamentos, Count('id'), inteiro),
+        agendamentos_hoje=_agregado(agendamentos, Count('id', filter=Q(data=hoje)), inteiro),
+        receitas_mes=_agregado(financeiro, Sum('total', filter=Q(tipo='receita')), moeda),
+        despesas_mes=_agregado(financeiro, Sum('total', filter=Q(tipo='despesa')), moeda),
+        materiais_baixo=_agregado(
+            Material._base_manager.filter(quantidade__lte=F('estoque_minimo')), Count('id'), inteiro
+        ),
+    ).values(*CAMPOS).first() or dict.fromkeys(CAMPOS, 0)
+
+    estatisticas['receitas_mes'] = Decimal(estatisticas['receitas_mes'])
+    estatisticas['despesas_mes'] = Decimal(estatisticas['despesas_mes'])
+    estatisticas['data'] = hoje
+    return estatisticas
+
+
+def estatisticas_dashboard(salao_id, hoje):
+    """Estatísticas do dashboard, lidas do cache quando possível"""
+    chave = chave_cache(salao_id)
+    estatisticas = cache.get(chave)
+    if estatisticas is None or estatisticas['data'] != hoje:
+        estatisticas = calcular_estatisticas(salao_id, hoje)
+        if not lendo_da_replica():
+            cache.set(chave, estatisticas, CACHE_TIMEOUT)
+    return estatisticas
@@ -0,0 +1,276 @@
+"""
+Movimentação de estoque.
+
+Toda alteração de Material.quantidade passa por aqui: a movimentação é
+registrada e aplicada na mesma transação com um UPDATE atômico (F()), de modo
+que gravações concorrentes não se sobrescrevem. Entradas e saídas são
+diferenças e não precisam de lock; ajustes (contagem de inventário) travam a
+linha do material para calcular a diferença em relação ao valor contado.
+
+A movimentação guarda em `quantidade` o valor positivo de entradas e saídas
+e a diferença com sinal dos ajustes (ver MovimentacaoEstoque.variacao), então
+o estoque atual é sempre o estoque anterior às movimentações mais a soma das
+variações registradas.
+
+O estoque em uma data passada é calculado a partir do SnapshotEstoque mais
+recente até a data, somando só as movimentações entre o snapshot e a data,
+de modo que o custo não cresce com o histórico de movimentações.
+"""
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, transaction
+from django.db.models import Case, DecimalField, ExpressionWrapper, F, OuterRef, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from core.shards import banco_de
+from .dashboard import invalidar_dashboard
+from .models import ConsumoMaterial, Material, MovimentacaoEstoque, SnapshotEstoque
+
+QUANTIDADE = DecimalField(max_digits=12, decimal_places=2)
+MOEDA = DecimalField(max_digits=14, decimal_places=2)
+
+# Efeito de uma movimentação no estoque (ver MovimentacaoEstoque.variacao)
+VARIACAO = Case(When(tipo='saida', then=-F('quantidade')), default=F('quantidade'), output_field=QUANTIDADE)
+
+
+def _travar_material(materiais):
+    """
+    Bloqueia as linhas dos materiais até o fim da transação. Usa SELECT ...
+    FOR UPDATE quando o banco suporta; caso contrário (SQLite) um UPDATE sem
+    efeito obtém o lock de escrita antes da leitura.
+    """
+    if transaction.get_connection(materiais.db).features.has_select_for_update:
+        list(materiais.select_for_update().values_list('pk'))
+    else:
+        materiais.update(quantidade=F('quantidade'))
+
+
+def registrar_movimentacao(material, tipo, quantidade, usuario=None, motivo='', permitir_negativo=False):
+    """
+    Registra uma movimentação e a aplica ao estoque do material.
+
+    Para 'entrada' e 'saida', quantidade é o valor movimentado (positivo);
+    para 'ajuste', é a quantidade contada, e a movimentação guarda a diferença.
+    Saídas maiores que o estoque levantam ValidationError, a menos que
+    permitir_negativo=True. Atualiza material.quantidade e retorna a
+    movimentação criada.
+    """
+    quantidade = Decimal(quantidade)
+    if tipo not in dict(MovimentacaoEstoque.TIPO_CHOICES):
+        raise ValidationError('Tipo de movimentação inválido.')
+    if quantidade < 0 or (quantidade == 0 and tipo != 'ajuste'):
+        raise ValidationError('Informe uma quantidade positiva.')
+
+    materiais = Material._base_manager.filter(pk=material.pk)
+    banco = banco_de(Material, material)
+    with transaction.atomic(using=banco):
+        if tipo == 'ajuste':
+            _travar_material(materiais)
+            atual = materiais.values_list('quantidade', flat=True).get()
+            variacao = quantidade - atual
+            materiais.update(quantidade=quantidade)
+        else:
+            variacao = quantidade if tipo == 'entrada' else -quantidade
+            if tipo == 'saida' and not permitir_negativo:
+                materiais = materiais.filter(quantidade__gte=quantidade)
+            if not materiais.update(quantidade=F('quantidade') + variacao):
+                raise ValidationError(f'Estoque insuficiente de {material.nome}.')
+
+        movimentacao = MovimentacaoEstoque.objects.create(
+            salao_id=material.salao_id,
+            material=material,
+            tipo=tipo,
+            quantidade=variacao if tipo == 'ajuste' else quantidade,
+            motivo=motivo,
+            usuario=usuario,
+        )
+        transaction.on_commit(lambda: invalidar_dashboard(material.salao_id), using=banco)
+
+    material.refresh_from_db(fields=['quantidade'])
+    return movimentacao
+
+
+def registrar_estoque_inicial(iniciais, usuario=None):
+    """
+    Registra como entradas o estoque inicial de materiais recém-criados em
+    massa (gravados com quantidade zero), como a view de cadastro faz com
+    um material. `iniciais` é uma lista de (material, quantidade).
+
+    As movimentações são criadas com bulk_create e aplicadas em um único
+    UPDATE, com a soma das variações de cada material. Retorna as
+    movimentações criadas.
+    """
+    iniciais = [(material, Decimal(quantidade)) for material, quantidade in iniciais if quantidade]
+    if not iniciais:
+        return []
+    banco = banco_de(Material, iniciais[0][0])
+    with transaction.atomic(using=banco):
+        movimentacoes = MovimentacaoEstoque._base_manager.bulk_create([
+            MovimentacaoEstoque(
+                salao_id=material.salao_id, material=material, tipo='entrada', quantidade=quantidade,
+                motivo='Estoque inicial', usuario=usuario,
+            )
+            for material, quantidade in iniciais
+        ])
+        Material._base_manager.filter(pk__in=[material.pk for material, _ in iniciais]).update(
+            quantidade=F('quantidade') + _soma_variacoes()
+        )
+    for material, quantidade in iniciais:
+        material.quantidade += quantidade
+    return movimentacoes
+
+
+def consumir_materiais(agendamento, usuario=None):
+    """
+    Dá baixa nos materiais da ficha técnica do serviço do agendamento.
+
+    As movimentações são criadas com bulk_create e o estoque de todos os
+    materiais é atualizado em um único UPDATE. É idempotente: a restrição
+    movimentacao_consumo_unico impede uma segunda baixa para o mesmo
+    agendamento, inclusive entre requisições concorrentes. Retorna as
+    movimentações criadas (lista vazia se já houve baixa ou não há ficha).
+    """
+    consumos = list(
+        ConsumoMaterial._base_manager.filter(servico_id=agendamento.servico_id)
+        .order_by().values_list('material_id', 'quantidade')
+    )
+    if not consumos or MovimentacaoEstoque._base_manager.filter(agendamento=agendamento).exists():
+        return []
+
+    motivo = f'Consumo do agendamento #{agendamento.pk}'
+    movimentacoes = [
+        MovimentacaoEstoque(
+            salao_id=agendamento.salao_id,
+            material_id=material_id,
+            tipo='saida',
+            quantidade=quantidade,
+            motivo=motivo,
+            usuario=usuario,
+            agendamento=agendamento,
+        )
+        for material_id, quantidade in consumos
+    ]
+    banco = banco_de(MovimentacaoEstoque, agendamento)
+    try:
+        with transaction.atomic(using=banco):
+            MovimentacaoEstoque.objects.bulk_create(movimentacoes)
+            Material._base_manager.filter(pk__in=[material_id for material_id, _ in consumos]).update(
+                quantidade=F('quantidade') - Case(
+                    *(When(pk=material_id, then=Value(quantidade)) for material_id, quantidade in consumos),
+                    output_field=DecimalField(max_digits=10, decimal_places=2),
+                )
+            )
+    except IntegrityError:
+        # Baixa registrada por uma gravação concorrente do mesmo agendamento
+        return []
+    transaction.on_commit(lambda: invalidar_dashboard(agendamento.salao_id), using=banco)
+    return movimentacoes
+
+
+def saldo_por_movimentacoes(material):
+    """Soma das variações registradas do material (para conferência com o estoque)"""
+    return MovimentacaoEstoque._base_manager.filter(material=material).aggregate(
+        saldo=Sum(VARIACAO)
+    )['saldo'] or Decimal('0')
+
+
+def inicio_do_dia(data):
+    """Instante em que a data começa, no fuso horário do projeto"""
+    return timezone.make_aware(datetime.combine(data, time.min))
+
+
+def fim_do_dia(data):
+    """Instante em que a data termina, no fuso horário do projeto"""
+    return inicio_do_dia(data + timedelta(days=1))
+
+
+def _soma_variacoes(**filtros):
+    """Subconsulta com a soma das variações do material da consulta externa"""
+    return Coalesce(
+        Subquery(
+            MovimentacaoEstoque._base_manager.filter(material=OuterRef('pk'), **filtros)
+            .order_by().values('material').annotate(soma=Sum(VARIACAO)).values('soma')
+        ),
+        Value(Decimal('0')),
+        output_field=QUANTIDADE,
+    )
+
+
+def estoque_em(data, materiais=None):
+    """
+    Materiais anotados com o estoque ao fim de `data`, em uma consulta.
+
+    Anota quantidade_em, custo_em e valor_em. Com um snapshot até a data, a
+    quantidade é a do snapshot mais as movimentações entre ele e o fim do
+    dia; sem snapshot, é a quantidade atual menos as movimentações
+    posteriores. Materiais cadastrados depois da data são excluídos.
+    """
+    limite = fim_do_dia(data)
+    if materiais is None:
+        materiais = Material.objects.all()
+    snapshot = SnapshotEstoque._base_manager.filter(material=OuterRef('pk'), data__lte=data).order_by('-data')
+
+    return materiais.filter(criado_em__lt=limite).annotate(
+        snapshot_referencia=Subquery(snapshot.values('referencia')[:1]),
+        snapshot_quantidade=Subquery(snapshot.values('quantidade')[:1]),
+        snapshot_custo=Subquery(snapshot.values('custo_unitario')[:1]),
+    ).annotate(
+        quantidade_em=Case(
+            When(
+                snapshot_referencia__isnull=True,
+                then=F('quantidade') - _soma_variacoes(criado_em__gte=limite),
+            ),
+            default=F('snapshot_quantidade') + _soma_variacoes(
+                criado_em__gte=OuterRef('snapshot_referencia'), criado_em__lt=limite
+            ),
+            output_field=QUANTIDADE,
+        ),
+        custo_em=Coalesce('snapshot_custo', 'custo_unitario', output_field=QUANTIDADE),
+    ).annotate(
+        valor_em=ExpressionWrapper(F('quantidade_em') * F('custo_em'), output_field=MOEDA),
+    )
+
+
+def valor_estoque_em(data, materiais=None):
+    """Valor total do estoque ao fim de `data`"""
+    return estoque_em(data, materiais).aggregate(total=Sum('valor_em'))['total'] or Decimal('0')
+
+
+def gerar_snapshots(data, salao=None, tamanho_lote=1000):
+    """
+    Grava (ou regrava) o snapshot de cada material ao fim de `data`.
+
+    Parte do snapshot anterior, então o custo é proporcional às movimentações
+    desde ele. Retorna o número de snapshots gravados.
+    """
+    materiais = Material._base_manager.all()
+    if salao is not None:
+        materiais = materiais.filter(salao=salao)
+    referencia = fim_do_dia(data)
+    centavo = Decimal('0.01')
+
+    snapshots = [
+        SnapshotEstoque(
+            salao_id=salao_id,
+            material_id=material_id,
+            data=data,
+            referencia=referencia,
+            quantidade=quantidade,
+            custo_unitario=custo,
+            valor_total=(quantidade * custo).quantize(centavo),
+        )
+        for material_id, salao_id, quantidade, custo in estoque_em(data, materiais).values_list(
+            'pk', 'salao_id', 'quantidade_em', 'custo_em'
+        ).iterator(chunk_size=tamanho_lote)
+    ]
+    SnapshotEstoque._base_manager.bulk_create(
+        snapshots,
+        batch_size=tamanho_lote,
+        update_conflicts=True,
+        unique_fields=['material', 'data'],
+        update_fields=['referencia', 'quantidade', 'custo_unitario', 'valor_total'],
+    )
+    return len(snapshots)
@@ -0,0 +1,256 @@
+"""
+Exportação em streaming (CSV e XLSX) de transações, agendamentos e
+movimentações de estoque.
+
+As linhas são lidas com values_list().iterator(chunk_size=...) (cursor do
+lado do servidor no PostgreSQL) e convertidas em bytes à medida que a
+resposta é enviada, de modo que a memória usada não cresce com o número de
+linhas. Como o corpo da resposta é gerado depois que a view retorna (fora do
+contexto do TenantMiddleware), as consultas filtram o salão explicitamente.
+"""
+import csv
+import zipfile
+from datetime import date, datetime, time
+from decimal import Decimal
+from xml.sax.saxutils import escape
+
+from django.conf import settings
+from django.db.models import DateTimeField
+
+from servicos.models import Agendamento
+from .estoque import fim_do_dia, inicio_do_dia
+from .models import MovimentacaoEstoque, Transacao
+
+TAMANHO_LOTE = getattr(settings, 'EXPORTACAO_TAMANHO_LOTE', 2000)
+
+# Bytes acumulados antes de enviar um pedaço da resposta
+TAMANHO_PEDACO = 64 * 1024
+
+# Início de texto que o Excel/LibreOffice interpretam como fórmula
+PREFIXOS_FORMULA = ('=', '+', '-', '@', '\t', '\r')
+
+EXPORTACOES = {
+    'transacoes': {
+        'modelo': Transacao,
+        'campo_data': 'data',
+        'ordem': ('data', 'criado_em', 'id'),
+        'colunas': (
+            ('ID', 'id'),
+            ('Data', 'data'),
+            ('Tipo', 'tipo'),
+            ('Categoria', 'categoria'),
+            ('Descrição', 'descricao'),
+            ('Valor', 'valor'),
+            ('Pago', 'pago'),
+            ('Agendamento', 'agendamento_id'),
+            ('Profissional', 'profissional__usuario__username'),
+        ),
+    },
+    'agendamentos': {
+        'modelo': Agendamento,
+        'campo_data': 'data',
+        'ordem': ('data', 'hora', 'id'),
+        'colunas': (
+            ('ID', 'id'),
+            ('Data', 'data'),
+            ('Hora', 'hora'),
+            ('Término', 'hora_fim'),
+            ('Status', 'status'),
+            ('Cliente', 'cliente__username'),
+            ('Profissional', 'profissional__usuario__username'),
+            ('Serviço', 'servico__nome'),
+            ('Preço', 'servico__preco'),
+        ),
+    },
+    'movimentacoes': {
+        'modelo': MovimentacaoEstoque,
+        'campo_data': 'criado_em',
+        'ordem': ('criado_em', 'id'),
+        'colunas': (
+            ('ID', 'id'),
+            ('Data', 'criado_em'),
+            ('Material', 'material__nome'),
+            ('Tipo', 'tipo'),
+            ('Quantidade', 'quantidade'),
+            ('Motivo', 'motivo'),
+            ('Usuário', 'usuario__username'),
+        ),
+    },
+}
+
+
+def cabecalho(nome):
+    """Títulos das colunas da exportação"""
+    return [titulo for titulo, _ in EXPORTACOES[nome]['colunas']]
+
+
+def consulta_exportacao(nome, salao, data_inicio=None, data_fim=None):
+    """Consulta (values_list) das linhas da exportação do salão no período"""
+    exportacao = EXPORTACOES[nome]
+    modelo = exportacao['modelo']
+    campo_data = exportacao['campo_data']
+    queryset = modelo._base_manager.filter(salao=salao)
+    if isinstance(modelo._meta.get_field(campo_data), DateTimeField):
+        # Intervalo de instantes, e não __date: o cast do campo para data
+        # impediria o uso do índice (salao, campo) no intervalo
+        if data_inicio:
+            queryset = queryset.filter(**{f'{campo_data}__gte': inicio_do_dia(data_inicio)})
+        if data_fim:
+            queryset = queryset.filter(**{f'{campo_data}__lt': fim_do_dia(data_fim)})
+    else:
+        if data_inicio:
+            queryset = queryset.filter(**{f'{campo_data}__gte': data_inicio})
+        if data_fim:
+            queryset = queryset.filter(**{f'{campo_data}__lte': data_fim})
+    return queryset.order_by(*exportacao['ordem']).values_list(*(campo for _, campo in exportacao['colunas']))
+
+
+def linhas_exportacao(nome, salao, data_inicio=None, data_fim=None, tamanho_lote=TAMANHO_LOTE):
+    """Itera as linhas (tuplas) da exportação do salão, sem carregá-las todas"""
+    return consulta_exportacao(nome, salao, data_inicio, data_fim).iterator(chunk_size=tamanho_lote)
+
+
+def neutralizar_formula(valor):
+    """
+    Prefixa com apóstrofo o texto que a planilha executaria como fórmula
+    (injeção de fórmula em CSV). Números, datas e booleanos não mudam.
+    """
+    if isinstance(valor, str) and valor.startswith(PREFIXOS_FORMULA):
+        return "'" + valor
+    return valor
+
+
+class _Eco:
+    """Arquivo falso cujo write() devolve o texto, para o csv.writer em streaming"""
+
+    def write(self, valor):
+        return valor
+
+
+def gerar_csv(titulos, linhas):
+    """Gera o CSV em pedaços de bytes UTF-8 (com BOM para o Excel)"""
+    escritor = csv.writer(_Eco())
+    pedaco = ['\ufeff', escritor.writerow(titulos)]
+    tamanho = 0
+    for linha in linhas:
+        texto = escritor.writerow([neutralizar_formula(valor) for valor in linha])
+        pedaco.append(texto)
+        tamanho += len(texto)
+        if tamanho >= TAMANHO_PEDACO:
+            yield ''.join(pedaco).encode()
+            pedaco.clear()
+            tamanho = 0
+    yield ''.join(pedaco).encode()
+
+
+class _Buffer:
+    """Destino não posicionável do zipfile; os bytes escritos são esvaziados a cada pedaço"""
+
+    def __init__(self):
+        self.partes = []
+        self.tamanho = 0
+
+    def write(self, dados):
+        self.partes.append(bytes(dados))
+        self.tamanho += len(dados)
+        return len(dados)
+
+    def flush(self):
+        pass
+
+    def esvaziar(self):
+        dados = b''.join(self.partes)
+        self.partes.clear()
+        self.tamanho = 0
+        return dados
+
+
+_CONTENT_TYPES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Override PartName="/xl/workbook.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+    '<Override PartName="/xl/worksheets/sheet1.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+    '</Types>'
+)
+
+_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+    'Target="xl/workbook.xml"/>'
+    '</Relationships>'
+)
+
+_WORKBOOK = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+    'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+    '<sheets><sheet name="{nome}" sheetId="1" r:id="rId1"/></sheets>'
+    '</workbook>'
+)
+
+_WORKBOOK_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+    'Target="worksheets/sheet1.xml"/>'
+    '</Relationships>'
+)
+
+
+def _celula(valor):
+    """Célula da planilha: números como valores, o resto como texto"""
+    if valor is None:
+        return '<c/>'
+    if isinstance(valor, bool):
+        return f'<c t="b"><v>{int(valor)}</v></c>'
+    if isinstance(valor, (int, float, Decimal)):
+        return f'<c><v>{valor}</v></c>'
+    if isinstance(valor, (date, datetime, time)):
+        valor = valor.isoformat()
+    return f'<c t="inlineStr"><is><t>{escape(neutralizar_formula(str(valor)))}</t></is></c>'
+
+
+def _linha_xml(linha):
+    return '<row>' + ''.join(_celula(valor) for valor in linha) + '</row>'
+
+
+def gerar_xlsx(titulos, linhas, nome_planilha='Dados'):
+    """
+    Gera uma planilha XLSX mínima (uma aba, strings inline) em streaming.
+
+    O zip é escrito em um destino não posicionável, então o zipfile usa
+    descritores de dados e a planilha pode ter qualquer tamanho.
+    """
+    buffer = _Buffer()
+    with zipfile.ZipFile(buffer, 'w', compression=zipfile.ZIP_DEFLATED) as arquivo:
+        arquivo.writestr('[Content_Types].xml', _CONTENT_TYPES)
+        arquivo.writestr('_rels/.rels', _RELS)
+        arquivo.writestr('xl/workbook.xml', _WORKBOOK.format(nome=escape(nome_planilha)))
+        arquivo.writestr('xl/_rels/workbook.xml.rels', _WORKBOOK_RELS)
+        yield buffer.esvaziar()
+
+        with arquivo.open('xl/worksheets/sheet1.xml', 'w', force_zip64=True) as planilha:
+            planilha.write(
+                b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                b'<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>'
+            )
+            planilha.write(_linha_xml(titulos).encode())
+            for linha in linhas:
+                planilha.write(_linha_xml(linha).encode())
+                if buffer.tamanho >= TAMANHO_PEDACO:
+                    yield buffer.esvaziar()
+            planilha.write(b'</sheetData></worksheet>')
+    yield buffer.esvaziar()
+
+
+FORMATOS = {
+    'csv': (gerar_csv, 'text/csv; charset=utf-8'),
+    'xlsx': (gerar_xlsx, 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'),
+}
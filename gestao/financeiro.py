@@ -0,0 +1,290 @@
+"""
+Resumo financeiro diário (TransacaoDiaria).
+
+Cada linha do resumo acumula o total e a quantidade de transações de um
+salão em uma combinação (data, tipo, categoria, pago). Os signals de
+Transacao aplicam as diferenças a cada criação, alteração ou exclusão, de
+modo que os totais das telas leem poucas linhas do resumo em vez de somar
+todo o histórico.
+
+Operações em massa que não disparam signals (QuerySet.update, bulk_create)
+devem chamar registrar_transacoes() ou recalcular_resumo().
+
+A listagem de transações é paginada por chave (data, criado_em, id) e o saldo
+acumulado de cada página é calculado no banco com uma window function sobre
+as linhas da página, partindo do saldo anterior a ela (resumo diário para os
+dias anteriores + transações do próprio dia). O custo de uma página não
+depende de quantas páginas vêm antes dela.
+"""
+import base64
+import binascii
+import json
+from collections import defaultdict
+from datetime import date, datetime
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import Case, Count, DecimalField, F, Q, Subquery, Sum, Value, When, Window
+from django.db.models.functions import Coalesce
+
+from core.shards import banco_de
+from .models import Transacao, TransacaoDiaria
+
+CAMPOS_CHAVE = ('salao_id', 'data', 'tipo', 'categoria', 'pago')
+
+ITENS_POR_PAGINA = getattr(settings, 'FINANCEIRO_ITENS_POR_PAGINA', 50)
+
+ORDEM_PAGINACAO = ('data', 'criado_em', 'id')
+
+
+def chave_resumo(transacao):
+    """Chave do resumo diário à qual a transação pertence"""
+    return tuple(getattr(transacao, campo) for campo in CAMPOS_CHAVE)
+
+
+def aplicar_no_resumo(chave, valor, quantidade, criar=True):
+    """
+    Soma valor e quantidade (positivos ou negativos) à linha do resumo.
+
+    Com criar=False só altera a linha se ela existir: na exclusão de um
+    salão, o resumo dele pode já ter sido apagado pela cascata, e recriá-lo
+    apontaria para um salão que não existe mais.
+    """
+    filtro = dict(zip(CAMPOS_CHAVE, chave))
+    with transaction.atomic(using=banco_de(TransacaoDiaria)):
+        if criar:
+            TransacaoDiaria._base_manager.get_or_create(**filtro)
+        TransacaoDiaria._base_manager.filter(**filtro).update(
+            total=F('total') + valor,
+            quantidade=F('quantidade') + quantidade,
+        )
+
+
+def acumular_deltas(transacoes, deltas=None, sinal=1):
+    """Soma as transações em um dicionário chave -> [valor, quantidade]"""
+    if deltas is None:
+        deltas = defaultdict(lambda: [Decimal('0'), 0])
+    for transacao in transacoes:
+        delta = deltas[chave_resumo(transacao)]
+        delta[0] += Decimal(transacao.valor) * sinal
+        delta[1] += sinal
+    return deltas
+
+
+def aplicar_deltas(deltas, tamanho_lote=1000):
+    """
+    Aplica as diferenças acumuladas ao resumo com uma consulta por lote.
+
+    Cada lote é um INSERT ... ON CONFLICT DO UPDATE que cria as linhas que
+    faltam e soma as diferenças às existentes no próprio banco, sem lê-las,
+    preservando as atualizações concorrentes feitas pelos signals.
+    """
+    if not deltas:
+        return
+    conexao = connections[banco_de(TransacaoDiaria)]
+    opcoes = TransacaoDiaria._meta
+    campos = [opcoes.get_field(campo) for campo in (*CAMPOS_CHAVE, 'total', 'quantidade')]
+    qn = conexao.ops.quote_name
+    tabela = qn(opcoes.db_table)
+    colunas = [qn(campo.column) for campo in campos]
+    total, quantidade = colunas[-2:]
+    somas = f'{total} = {tabela}.{total} + EXCLUDED.{total}, ' \
+            f'{quantidade} = {tabela}.{quantidade} + EXCLUDED.{quantidade}'
+
+    linhas = [(*chave, valor, n) for chave, (valor, n) in deltas.items()]
+    tamanho_lote = min(tamanho_lote, conexao.ops.bulk_batch_size(campos, linhas))
+    with transaction.atomic(using=conexao.alias), conexao.cursor() as cursor:
+        for inicio in range(0, len(linhas), tamanho_lote):
+            lote = linhas[inicio:inicio + tamanho_lote]
+            marcadores = ', '.join(['(' + ', '.join(['%s'] * len(campos)) + ')'] * len(lote))
+            cursor.execute(
+                f'INSERT INTO {tabela} ({", ".join(colunas)}) VALUES {marcadores} '
+                f'ON CONFLICT ({", ".join(colunas[:len(CAMPOS_CHAVE)])}) DO UPDATE SET {somas}',
+                [
+                    campo.get_db_prep_value(valor, conexao)
+                    for linha in lote for campo, valor in zip(campos, linha)
+                ],
+            )
+
+
+def registrar_transacoes(transacoes, sinal=1):
+    """
+    Aplica um lote de transações ao resumo, agrupando por chave.
+
+    Usado após bulk_create (sinal=1) ou exclusões em massa (sinal=-1). Para
+    vários lotes, prefira acumular_deltas() em cada um e aplicar_deltas() uma
+    única vez ao final.
+    """
+    aplicar_deltas(acumular_deltas(transacoes, sinal=sinal))
+
+
+def _totais_brutos(salao=None):
+    transacoes = Transacao._base_manager.exclude(salao=None)
+    if salao is not None:
+        transacoes = transacoes.filter(salao=salao)
+    return (
+        transacoes.values(*CAMPOS_CHAVE)
+        .annotate(total=Sum('valor'), quantidade=Count('id'))
+        .order_by()
+    )
+
+
+def recalcular_resumo(salao=None, tamanho_lote=1000):
+    """Reconstrói o resumo a partir das transações (de um salão ou de todos)"""
+    resumo = TransacaoDiaria._base_manager.all()
+    if salao is not None:
+        resumo = resumo.filter(salao=salao)
+    with transaction.atomic(using=banco_de(TransacaoDiaria)):
+        resumo.delete()
+        linhas = TransacaoDiaria._base_manager.bulk_create(
+            (TransacaoDiaria(**linha) for linha in _totais_brutos(salao).iterator()),
+            batch_size=tamanho_lote,
+        )
+    return len(linhas)
+
+
+def verificar_resumo(salao=None):
+    """
+    Compara o resumo com as transações brutas.
+
+    Retorna a lista de divergências como (chave, esperado, encontrado), onde
+    esperado e encontrado são pares (total, quantidade).
+    """
+    esperado = {
+        tuple(linha[campo] for campo in CAMPOS_CHAVE): (linha['total'], linha['quantidade'])
+        for linha in _totais_brutos(salao).iterator()
+    }
+    resumo = TransacaoDiaria._base_manager.all()
+    if salao is not None:
+        resumo = resumo.filter(salao=salao)
+    encontrado = {
+        tuple(linha[:5]): (linha[5], linha[6])
+        for linha in resumo.values_list(*CAMPOS_CHAVE, 'total', 'quantidade').iterator()
+        if linha[6] or linha[5]
+    }
+
+    divergencias = []
+    for chave in sorted(set(esperado) | set(encontrado), key=str):
+        valores_esperados = esperado.get(chave, (Decimal('0'), 0))
+        valores_encontrados = encontrado.get(chave, (Decimal('0'), 0))
+        if valores_esperados != valores_encontrados:
+            divergencias.append((chave, valores_esperados, valores_encontrados))
+    return divergencias
+
+
+def totais_por_tipo(data_inicio=None, data_fim=None, **filtros):
+    """
+    Soma receitas e despesas do salão atual a partir do resumo, em uma consulta.
+
+    Aceita filtros adicionais do resumo (ex.: pago=True, categoria='servico').
+    """
+    resumo = TransacaoDiaria.objects.filter(**filtros)
+    if data_inicio:
+        resumo = resumo.filter(data__gte=data_inicio)
+    if data_fim:
+        resumo = resumo.filter(data__lte=data_fim)
+    totais = resumo.aggregate(
+        receitas=Sum('total', filter=Q(tipo='receita')),
+        despesas=Sum('total', filter=Q(tipo='despesa')),
+    )
+    return totais['receitas'] or 0, totais['despesas'] or 0
+
+
+def _valor_com_sinal(campo):
+    """Receitas somam e despesas subtraem"""
+    return Case(
+        When(tipo='despesa', then=-F(campo)),
+        default=F(campo),
+        output_field=DecimalField(max_digits=14, decimal_places=2),
+    )
+
+
+def codificar_cursor(data, criado_em, pk):
+    """Cursor opaco e seguro para URL com a chave da última linha da página"""
+    valor = json.dumps([data.isoformat(), criado_em.isoformat(), pk])
+    return base64.urlsafe_b64encode(valor.encode()).decode().rstrip('=')
+
+
+def decodificar_cursor(cursor):
+    """Retorna (data, criado_em, id) ou levanta ValueError se o cursor for inválido"""
+    try:
+        texto = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        data, criado_em, pk = json.loads(texto)
+        return date.fromisoformat(data), datetime.fromisoformat(criado_em), int(pk)
+    except (binascii.Error, UnicodeDecodeError, TypeError, ValueError) as erro:
+        raise ValueError('Cursor inválido.') from erro
+
+
+def _antes_de(data, criado_em, pk):
+    """Linhas anteriores à chave (data, criado_em, id)"""
+    return (
+        Q(data__lt=data)
+        | Q(data=data, criado_em__lt=criado_em)
+        | Q(data=data, criado_em=criado_em, id__lt=pk)
+    )
+
+
+def _saldo_anterior(data, criado_em, pk, data_inicio=None, **filtros):
+    """
+    Expressão com o saldo de todas as transações filtradas anteriores à chave.
+
+    Os dias anteriores vêm do resumo diário e o próprio dia das transações,
+    ambos pelos índices (salao, data, ...), independentemente da profundidade.
+    """
+    moeda = DecimalField(max_digits=14, decimal_places=2)
+    resumo = TransacaoDiaria.objects.filter(data__lt=data, **filtros)
+    if data_inicio:
+        resumo = resumo.filter(data__gte=data_inicio)
+    mesmo_dia = Transacao.objects.filter(
+        _antes_de(data, criado_em, pk), data=data, **filtros
+    )
+
+    def soma(queryset, campo):
+        return Coalesce(
+            Subquery(
+                queryset.order_by().annotate(grupo=Value(1)).values('grupo')
+                .annotate(soma=Sum(_valor_com_sinal(campo))).values('soma')
+            ),
+            Value(Decimal('0'), output_field=moeda),
+            output_field=moeda,
+        )
+
+    return soma(resumo, 'total') + soma(mesmo_dia, 'valor')
+
+
+def pagina_transacoes(cursor=None, tamanho=ITENS_POR_PAGINA, data_inicio=None, data_fim=None, **filtros):
+    """
+    Uma página de transações do salão atual, da mais recente para a mais antiga.
+
+    Cada transação vem anotada com `saldo`, o saldo acumulado das transações
+    filtradas até ela (inclusive). Retorna (transacoes, proximo_cursor), com
+    proximo_cursor None na última página. Usa duas consultas de custo
+    constante: as chaves da página e as linhas com o saldo.
+    """
+    transacoes = Transacao.objects.filter(**filtros)
+    if data_inicio:
+        transacoes = transacoes.filter(data__gte=data_inicio)
+    if data_fim:
+        transacoes = transacoes.filter(data__lte=data_fim)
+
+    pagina = transacoes
+    if cursor:
+        pagina = pagina.filter(_antes_de(*cursor))
+    decrescente = [F(campo).desc() for campo in ORDEM_PAGINACAO]
+    chaves = list(pagina.order_by(*decrescente).values_list(*ORDEM_PAGINACAO)[:tamanho + 1])
+
+    proximo_cursor = None
+    if len(chaves) > tamanho:
+        chaves = chaves[:tamanho]
+        proximo_cursor = codificar_cursor(*chaves[-1])
+    if not chaves:
+        return [], None
+
+    linhas = Transacao.objects.filter(pk__in=[pk for _, _, pk in chaves]).annotate(
+        saldo=_saldo_anterior(*chaves[-1], data_inicio=data_inicio, **filtros) + Window(
+            Sum(_valor_com_sinal('valor')),
+            order_by=[F(campo).asc() for campo in ORDEM_PAGINACAO],
+        ),
+    ).order_by(*decrescente)
+    return list(linhas), proximo_cursor
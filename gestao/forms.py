@@ -1,8 +1,8 @@
 from django import forms
 from crispy_forms.helper import FormHelper
 from crispy_forms.layout import Submit
-from servicos.models import Profissional, Servico
-from .models import Material, Transacao
+from servicos.models import Agendamento, Profissional, Servico
+from .models import Material, MovimentacaoEstoque, Transacao
 
 class ProfissionalForm(forms.ModelForm):
     """Formulário de profissional com criação de usuário"""
@@ -66,8 +66,40 @@ class MaterialForm(forms.ModelForm):
         self.helper.add_input(Submit('submit', 'Salvar', css_class='btn btn-primary'))
 
 
+class MovimentacaoEstoqueForm(forms.ModelForm):
+    """Formulário de movimentação de estoque (aplicada por gestao.estoque)"""
+    class Meta:
+        model = MovimentacaoEstoque
+        fields = ['material', 'tipo', 'quantidade', 'motivo']
+        help_texts = {
+            'quantidade': 'Em ajustes, informe a quantidade contada no estoque.',
+        }
+    
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Avaliado por requisição, para respeitar o salão atual
+        self.fields['material'].queryset = Material.objects.all()
+        self.helper = FormHelper()
+        self.helper.form_method = 'post'
+        self.helper.add_input(Submit('movimentar', 'Registrar Movimentação', css_class='btn btn-primary'))
+    
+    def clean(self):
+        cleaned_data = super().clean()
+        material = cleaned_data.get('material')
+        tipo = cleaned_data.get('tipo')
+        quantidade = cleaned_data.get('quantidade')
+        if quantidade is not None:
+            if quantidade < 0 or (quantidade == 0 and tipo != 'ajuste'):
+                self.add_error('quantidade', 'Informe uma quantidade positiva.')
+            elif tipo == 'saida' and material and quantidade > material.quantidade:
+                self.add_error('quantidade', f'Estoque insuficiente: há {material.quantidade} {material.unidade}.')
+        return cleaned_data
+
+
 class TransacaoForm(forms.ModelForm):
     """Formulário de transação"""
+    AGENDAMENTOS_RECENTES = 100
+    
     class Meta:
         model = Transacao
         fields = '__all__'
@@ -79,6 +111,79 @@ class TransacaoForm(forms.ModelForm):
     
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
+        # Avaliado por requisição, para respeitar o salão atual
+        agendamentos = Agendamento.objects.select_related('cliente', 'servico')
+        if not self.is_bound:
+            # O select mostra só os agendamentos mais recentes; na validação vale qualquer um do salão
+            agendamentos = agendamentos.exclude(status='cancelado').order_by('-data', '-hora')[:self.AGENDAMENTOS_RECENTES]
+        self.fields['agendamento'].queryset = agendamentos
+        self.fields['profissional'].queryset = Profissional.objects.select_related('usuario')
         self.helper = FormHelper()
         self.helper.form_method = 'post'
         self.helper.add_input(Submit('submit', 'Salvar', css_class='btn btn-primary'))
+
+
+class PeriodoForm(forms.Form):
+    """Filtro por período (via GET)"""
+    data_inicio = forms.DateField(label='De', required=False, widget=forms.DateInput(attrs={'type': 'date'}))
+    data_fim = forms.DateField(label='Até', required=False, widget=forms.DateInput(attrs={'type': 'date'}))
+    
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.helper = FormHelper()
+        self.helper.form_method = 'get'
+        self.helper.form_tag = False
+    
+    def clean(self):
+        cleaned_data = super().clean()
+        data_inicio = cleaned_data.get('data_inicio')
+        data_fim = cleaned_data.get('data_fim')
+        if data_inicio and data_fim and data_inicio > data_fim:
+            raise forms.ValidationError('A data inicial deve ser anterior à data final.')
+        return cleaned_data
+    
+    def filtros(self):
+        """Filtros preenchidos"""
+        if not self.is_valid():
+            return {}
+        return {campo: valor for campo, valor in self.cleaned_data.items() if valor not in (None, '')}
+
+
+class InventarioForm(forms.Form):
+    """Data do inventário (via GET)"""
+    em = forms.DateField(label='Inventário em', widget=forms.DateInput(attrs={'type': 'date'}))
+
+
+class FiltroTransacaoForm(PeriodoForm):
+    """Filtros da listagem de transações; aplicáveis a Transacao e ao resumo diário"""
+    tipo = forms.ChoiceField(label='Tipo', required=False, choices=(('', 'Todos'),) + Transacao.TIPO_CHOICES)
+    categoria = forms.ChoiceField(
+        label='Categoria', required=False, choices=(('', 'Todas'),) + Transacao.CATEGORIA_CHOICES
+    )
+    pago = forms.NullBooleanField(
+        label='Situação',
+        required=False,
+        widget=forms.Select(choices=(('', 'Todas'), ('true', 'Pago'), ('false', 'Pendente'))),
+    )
+
+
+class ImportacaoForm(forms.Form):
+    """Upload de CSV para importação em massa"""
+    TIPO_CHOICES = (
+        ('materiais', 'Materiais'),
+        ('servicos', 'Serviços'),
+        ('transacoes', 'Transações'),
+    )
+    
+    tipo = forms.ChoiceField(label='Importar', choices=TIPO_CHOICES)
+    arquivo = forms.FileField(label='Arquivo CSV', help_text='UTF-8, com cabeçalho com os nomes dos campos.')
+    simular = forms.BooleanField(
+        label='Apenas validar (não grava nada)', required=False, initial=True
+    )
+    
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.helper = FormHelper()
+        self.helper.form_method = 'post'
+        self.helper.attrs = {'enctype': 'multipart/form-data'}
+        self.helper.add_input(Submit('submit', 'Importar', css_class='btn btn-primary'))
@@ -0,0 +1,258 @@
+"""
+Importação em massa (CSV) de materiais, serviços e transações.
+
+O arquivo é lido em streaming e processado em lotes. Cada linha passa pela
+limpeza dos campos do formulário correspondente (MaterialForm, ServicoForm,
+TransacaoForm), mas com uma única instância do formulário por importação e
+com as chaves estrangeiras de cada lote buscadas em uma consulta, em vez de
+uma por linha. As linhas válidas são gravadas com bulk_create dentro de uma
+transação; se houver qualquer erro (ou em modo de simulação) nada é gravado.
+
+Como bulk_create não dispara signals, o resumo financeiro e os caches do
+dashboard e do catálogo de serviços são atualizados aqui. Os materiais são
+gravados com estoque zero e a quantidade do arquivo entra como movimentação
+de entrada (ver estoque.registrar_estoque_inicial).
+"""
+import codecs
+import csv
+import io
+from itertools import islice
+
+from django import forms
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import transaction
+
+from core.shards import banco_de
+from servicos.catalogo import invalidar_catalogo
+from servicos.models import Servico
+from .dashboard import invalidar_dashboard
+from .estoque import registrar_estoque_inicial
+from .financeiro import acumular_deltas, aplicar_deltas
+from .forms import MaterialForm, ServicoForm, TransacaoForm
+from .models import Material, Transacao
+
+TAMANHO_LOTE = getattr(settings, 'IMPORTACAO_TAMANHO_LOTE', 1000)
+
+# Limite de erros guardados para exibição; os demais são apenas contados
+MAX_ERROS = 1000
+
+IMPORTACOES = {
+    'materiais': {'form': MaterialForm, 'modelo': Material},
+    'servicos': {'form': ServicoForm, 'modelo': Servico, 'chaves': {'modulo': 'nome'}},
+    'transacoes': {'form': TransacaoForm, 'modelo': Transacao},
+}
+
+VERDADEIROS = {'1', 'true', 'sim', 's', 'yes', 'y', 'x', 'on'}
+FALSOS = {'', '0', 'false', 'nao', 'não', 'n', 'no', 'off'}
+
+
+class ResultadoImportacao:
+    """Resumo de uma importação: linhas lidas, importadas e erros por linha"""
+
+    def __init__(self, nome, simulacao):
+        self.nome = nome
+        self.simulacao = simulacao
+        self.linhas = 0
+        self.importadas = 0
+        self.total_erros = 0
+        self.erros = []  # (número da linha no arquivo, {campo: [mensagens]})
+
+    @property
+    def sucesso(self):
+        return self.total_erros == 0
+
+    def adicionar_erro(self, numero, erros):
+        self.total_erros += 1
+        if len(self.erros) < MAX_ERROS:
+            self.erros.append((numero, erros))
+
+
+def _normalizar(campo, valor):
+    """Aceita os formatos comuns em planilhas brasileiras (sim/não, vírgula decimal)"""
+    valor = (valor or '').strip()
+    if isinstance(campo, forms.BooleanField):
+        if valor.lower() in VERDADEIROS:
+            return True
+        if valor.lower() in FALSOS:
+            return False
+    elif isinstance(campo, forms.DecimalField) and ',' in valor:
+        valor = valor.replace('.', '').replace(',', '.')
+    return valor
+
+
+class ValidadorLinhas:
+    """
+    Valida linhas do CSV com os campos de um formulário do app.
+
+    Os campos são os do formulário (mesmas regras de limpeza e mensagens);
+    colunas ausentes do arquivo ficam com o valor padrão do modelo.
+    """
+
+    def __init__(self, nome, salao, colunas):
+        configuracao = IMPORTACOES[nome]
+        self.modelo = configuracao['modelo']
+        self.salao = salao
+        self.chaves = configuracao.get('chaves', {})
+        formulario = configuracao['form']()
+
+        self.campos = {}
+        self.relacionados = {}
+        for nome_campo, campo in formulario.fields.items():
+            campo_modelo = self.modelo._meta.get_field(nome_campo)
+            if nome_campo not in colunas and campo_modelo.has_default():
+                continue
+            if isinstance(campo, forms.ModelChoiceField):
+                self.relacionados[nome_campo] = self._queryset_relacionado(campo)
+            self.campos[nome_campo] = campo
+
+        obrigatorias = [
+            nome_campo for nome_campo, campo in self.campos.items()
+            if campo.required and nome_campo not in colunas
+        ]
+        if obrigatorias:
+            raise ValidationError(f'Colunas obrigatórias ausentes: {", ".join(obrigatorias)}.')
+
+    def _queryset_relacionado(self, campo):
+        queryset = campo.queryset.model._base_manager.all()
+        # Só aceita registros relacionados do próprio salão
+        if any(field.name == 'salao' for field in queryset.model._meta.fields):
+            queryset = queryset.filter(salao=self.salao)
+        return queryset
+
+    def _buscar_relacionados(self, linhas):
+        """Carrega, com uma consulta por campo, os objetos referenciados pelo lote"""
+        encontrados = {}
+        for nome_campo, queryset in self.relacionados.items():
+            chave = self.chaves.get(nome_campo, 'pk')
+            valores = {(linha.get(nome_campo) or '').strip() for _, linha in linhas} - {''}
+            if chave == 'pk':
+                valores = {valor for valor in valores if valor.isdigit()}
+            objetos = queryset.filter(**{f'{chave}__in': valores}) if valores else []
+            encontrados[nome_campo] = {str(getattr(objeto, chave)): objeto for objeto in objetos}
+        return encontrados
+
+    def validar_lote(self, linhas, resultado):
+        """Retorna as instâncias (não salvas) das linhas válidas e registra os erros"""
+        relacionados = self._buscar_relacionados(linhas)
+        instancias = []
+        for numero, linha in linhas:
+            dados, erros = {}, {}
+            for nome_campo, campo in self.campos.items():
+                valor = _normalizar(campo, linha.get(nome_campo))
+                try:
+                    if nome_campo in relacionados:
+                        if valor in campo.empty_values:
+                            dados[nome_campo] = campo.clean(None)
+                        elif valor in relacionados[nome_campo]:
+                            dados[nome_campo] = relacionados[nome_campo][valor]
+                        else:
+                            raise ValidationError(
+                                campo.error_messages['invalid_choice'], code='invalid_choice'
+                            )
+                    else:
+                        dados[nome_campo] = campo.clean(valor)
+                except ValidationError as erro:
+                    erros[nome_campo] = erro.messages
+            if erros:
+                resultado.adicionar_erro(numero, erros)
+            else:
+                instancias.append(self.modelo(salao=self.salao, **dados))
+        return instancias
+
+
+def _lotes(leitor, tamanho):
+    # A linha 1 do arquivo é o cabeçalho
+    numeradas = enumerate(leitor, start=2)
+    while lote := list(islice(numeradas, tamanho)):
+        yield lote
+
+
+def _codificacao(arquivo, tamanho_amostra=64 * 1024):
+    """
+    UTF-8 se o início do arquivo for UTF-8 válido; senão Windows-1252, em
+    que o Excel em português salva o "CSV (separado por vírgulas)".
+    """
+    amostra = arquivo.read(tamanho_amostra)
+    arquivo.seek(0)
+    try:
+        # Sem final=True, um caractere cortado no fim da amostra não é erro
+        codecs.getincrementaldecoder('utf-8')().decode(amostra)
+    except UnicodeDecodeError:
+        return 'cp1252'
+    return 'utf-8-sig'
+
+
+def importar_csv(arquivo, nome, salao, simular=False, tamanho_lote=TAMANHO_LOTE, usuario=None):
+    """
+    Importa um CSV (arquivo binário, UTF-8 ou Windows-1252, separado por
+    vírgula ou ponto e vírgula) para o salão.
+
+    Retorna um ResultadoImportacao. Nada é gravado se houver erros ou se
+    simular=True. `usuario` fica registrado nas movimentações do estoque
+    inicial dos materiais. Levanta ValidationError se faltarem colunas obrigatórias
+    ou se o arquivo não puder ser lido como CSV.
+    """
+    texto = io.TextIOWrapper(arquivo, encoding=_codificacao(arquivo), newline='')
+    leitor = None
+    try:
+        leitor = _leitor(texto)
+        return _importar(leitor, nome, salao, simular, tamanho_lote, usuario)
+    except UnicodeDecodeError:
+        raise ValidationError(
+            'Não foi possível ler o arquivo: a codificação de texto não é UTF-8 nem Windows-1252. '
+            'Salve-o como "CSV UTF-8" e tente novamente.'
+        ) from None
+    except csv.Error as erro:
+        linha = f' (linha {leitor.line_num})' if leitor else ''
+        raise ValidationError(f'O arquivo não é um CSV válido{linha}: {erro}') from None
+
+
+def _leitor(texto):
+    try:
+        amostra = texto.read(4096)
+        dialeto = csv.Sniffer().sniff(amostra, delimiters=',;') if amostra else csv.excel
+    except csv.Error:
+        dialeto = csv.excel
+    texto.seek(0)
+
+    leitor = csv.DictReader(texto, dialect=dialeto)
+    leitor.fieldnames = [coluna.strip() for coluna in leitor.fieldnames or []]
+    return leitor
+
+
+def _importar(leitor, nome, salao, simular, tamanho_lote, usuario):
+    validador = ValidadorLinhas(nome, salao, set(leitor.fieldnames))
+    modelo = validador.modelo
+    resultado = ResultadoImportacao(nome, simular)
+    deltas = None
+    banco = banco_de(modelo, salao)
+
+    with transaction.atomic(using=banco):
+        for lote in _lotes(leitor, tamanho_lote):
+            resultado.linhas += len(lote)
+            instancias = validador.validar_lote(lote, resultado)
+            # Depois do primeiro erro apenas valida o restante do arquivo
+            if simular or not resultado.sucesso:
+                continue
+            if modelo is Material:
+                iniciais = [(material, material.quantidade) for material in instancias]
+                for material in instancias:
+                    material.quantidade = 0
+            modelo._base_manager.bulk_create(instancias, batch_size=tamanho_lote)
+            if modelo is Transacao:
+                deltas = acumular_deltas(instancias, deltas)
+            elif modelo is Material:
+                registrar_estoque_inicial(iniciais, usuario)
+            resultado.importadas += len(instancias)
+
+        if simular or not resultado.sucesso:
+            resultado.importadas = 0
+            transaction.set_rollback(True, using=banco)
+        else:
+            # O resumo é atualizado uma vez, com as diferenças de todos os lotes
+            aplicar_deltas(deltas)
+            transaction.on_commit(lambda: invalidar_dashboard(salao.id), using=banco)
+            if modelo is Servico:
+                transaction.on_commit(lambda: invalidar_catalogo(salao.id), using=banco)
+    return resultado
@@ -0,0 +1,30 @@
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from core.models import Salao
+from gestao.estoque import gerar_snapshots
+
+
+class Command(BaseCommand):
+    help = 'Grava o snapshot do estoque de cada material ao fim de um dia (padrão: ontem)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--data', type=date.fromisoformat, help='Dia do snapshot (AAAA-MM-DD)')
+        parser.add_argument('--salao', help='Subdomínio do salão (padrão: todos)')
+
+    def handle(self, *args, **options):
+        data = options['data'] or timezone.localdate() - timedelta(days=1)
+        if data >= timezone.localdate():
+            raise CommandError('O snapshot só pode ser gerado para dias já encerrados.')
+
+        salao = None
+        if options['salao']:
+            try:
+                salao = Salao.objects.get(subdominio=options['salao'])
+            except Salao.DoesNotExist:
+                raise CommandError(f"Salão '{options['salao']}' não encontrado.")
+
+        total = gerar_snapshots(data, salao)
+        self.stdout.write(self.style.SUCCESS(f'{total} snapshot(s) de estoque gravado(s) para {data:%d/%m/%Y}.'))
@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from core.models import Salao
+from gestao.financeiro import recalcular_resumo, verificar_resumo
+
+
+class Command(BaseCommand):
+    help = 'Reconstrói o resumo financeiro diário (TransacaoDiaria) e o confere com as transações'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--salao', help='Subdomínio do salão (padrão: todos)')
+        parser.add_argument(
+            '--verificar', action='store_true',
+            help='Apenas confere o resumo com as transações, sem reconstruir',
+        )
+
+    def handle(self, *args, **options):
+        salao = None
+        if options['salao']:
+            try:
+                salao = Salao.objects.get(subdominio=options['salao'])
+            except Salao.DoesNotExist:
+                raise CommandError(f"Salão '{options['salao']}' não encontrado.")
+
+        if not options['verificar']:
+            linhas = recalcular_resumo(salao)
+            self.stdout.write(f'{linhas} linha(s) de resumo gravada(s).')
+
+        divergencias = verificar_resumo(salao)
+        for chave, esperado, encontrado in divergencias:
+            self.stderr.write(f'Divergência em {chave}: esperado {esperado}, encontrado {encontrado}')
+        if divergencias:
+            raise CommandError(f'{len(divergencias)} divergência(s) entre o resumo e as transações.')
+        self.stdout.write(self.style.SUCCESS('Resumo financeiro confere com as transações.'))
@@ -0,0 +1,50 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def popular_resumo(apps, schema_editor):
+    Transacao = apps.get_model('gestao', 'Transacao')
+    TransacaoDiaria = apps.get_model('gestao', 'TransacaoDiaria')
+    banco = schema_editor.connection.alias
+    totais = (
+        Transacao.objects.using(banco)
+        .exclude(salao=None)
+        .values('salao_id', 'data', 'tipo', 'categoria', 'pago')
+        .annotate(total=models.Sum('valor'), quantidade=models.Count('id'))
+        .order_by()
+    )
+    TransacaoDiaria.objects.using(banco).bulk_create(
+        (TransacaoDiaria(**linha) for linha in totais.iterator()),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_delete_configuracaosalao_salao_email_salao_endereco_and_more'),
+        ('gestao', '0002_material_salao_movimentacaoestoque_salao_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TransacaoDiaria',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('data', models.DateField(verbose_name='Data')),
+                ('tipo', models.CharField(choices=[('receita', 'Receita'), ('despesa', 'Despesa')], max_length=20, verbose_name='Tipo')),
+                ('categoria', models.CharField(choices=[('servico', 'Serviço Prestado'), ('fornecedor', 'Fornecedor'), ('salario', 'Salário'), ('aluguel', 'Aluguel'), ('conta', 'Conta (Água, Luz, etc)'), ('outro', 'Outro')], max_length=30, verbose_name='Categoria')),
+                ('pago', models.BooleanField(verbose_name='Pago/Recebido')),
+                ('total', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='Total')),
+                ('quantidade', models.IntegerField(default=0, verbose_name='Quantidade de Transações')),
+                ('salao', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='transacoes_diarias', to='core.salao', verbose_name='Salão')),
+            ],
+            options={
+                'verbose_name': 'Resumo Diário de Transações',
+                'verbose_name_plural': 'Resumos Diários de Transações',
+                'ordering': ['-data'],
+                'constraints': [models.UniqueConstraint(fields=('salao', 'data', 'tipo', 'categoria', 'pago'), name='transacao_diaria_unica')],
+            },
+        ),
+        migrations.RunPython(popular_resumo, migrations.RunPython.noop),
+    ]
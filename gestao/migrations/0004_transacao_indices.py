@@ -0,0 +1,23 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gestao', '0003_transacaodiaria'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='transacao',
+            index=models.Index(fields=['salao', 'data', 'criado_em', 'id'], name='transacao_salao_data'),
+        ),
+        migrations.AddIndex(
+            model_name='transacao',
+            index=models.Index(fields=['salao', 'tipo', 'data', 'criado_em', 'id'], name='transacao_salao_tipo_data'),
+        ),
+        migrations.AddIndex(
+            model_name='transacao',
+            index=models.Index(fields=['salao', 'categoria', 'data', 'criado_em', 'id'], name='transacao_salao_cat_data'),
+        ),
+    ]
@@ -0,0 +1,39 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_delete_configuracaosalao_salao_email_salao_endereco_and_more'),
+        ('gestao', '0004_transacao_indices'),
+        ('servicos', '0003_agendamento_hora_fim'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='movimentacaoestoque',
+            name='agendamento',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='movimentacoes_estoque', to='servicos.agendamento', verbose_name='Agendamento Relacionado'),
+        ),
+        migrations.AddConstraint(
+            model_name='movimentacaoestoque',
+            constraint=models.UniqueConstraint(condition=models.Q(('agendamento__isnull', False)), fields=('agendamento', 'material'), name='movimentacao_consumo_unico'),
+        ),
+        migrations.CreateModel(
+            name='ConsumoMaterial',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantidade', models.DecimalField(decimal_places=2, max_digits=10, verbose_name='Quantidade por Atendimento')),
+                ('material', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='consumos', to='gestao.material', verbose_name='Material')),
+                ('salao', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='consumos_materiais', to='core.salao', verbose_name='Salão')),
+                ('servico', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='consumos', to='servicos.servico', verbose_name='Serviço')),
+            ],
+            options={
+                'verbose_name': 'Consumo de Material',
+                'verbose_name_plural': 'Consumos de Materiais',
+                'ordering': ['servico', 'material'],
+                'constraints': [models.UniqueConstraint(fields=('servico', 'material'), name='consumo_material_unico')],
+            },
+        ),
+    ]
@@ -0,0 +1,37 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_delete_configuracaosalao_salao_email_salao_endereco_and_more'),
+        ('gestao', '0005_consumomaterial_movimentacaoestoque_agendamento'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='movimentacaoestoque',
+            index=models.Index(fields=['material', 'criado_em'], name='movimentacao_material_data'),
+        ),
+        migrations.CreateModel(
+            name='SnapshotEstoque',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('data', models.DateField(verbose_name='Data')),
+                ('referencia', models.DateTimeField(verbose_name='Referência')),
+                ('quantidade', models.DecimalField(decimal_places=2, max_digits=12, verbose_name='Quantidade')),
+                ('custo_unitario', models.DecimalField(decimal_places=2, max_digits=10, verbose_name='Custo Unitário')),
+                ('valor_total', models.DecimalField(decimal_places=2, max_digits=14, verbose_name='Valor em Estoque')),
+                ('criado_em', models.DateTimeField(auto_now_add=True, verbose_name='Criado em')),
+                ('material', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='snapshots', to='gestao.material', verbose_name='Material')),
+                ('salao', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='snapshots_estoque', to='core.salao', verbose_name='Salão')),
+            ],
+            options={
+                'verbose_name': 'Snapshot de Estoque',
+                'verbose_name_plural': 'Snapshots de Estoque',
+                'ordering': ['-data', 'material'],
+                'constraints': [models.UniqueConstraint(fields=('material', 'data'), name='snapshot_estoque_unico')],
+            },
+        ),
+    ]
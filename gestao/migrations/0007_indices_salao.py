@@ -0,0 +1,27 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gestao', '0006_snapshotestoque'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='material',
+            index=models.Index(fields=['salao', 'modulo', 'nome'], name='material_salao_modulo_nome'),
+        ),
+        migrations.AddIndex(
+            model_name='movimentacaoestoque',
+            index=models.Index(fields=['salao', 'criado_em'], name='movimentacao_salao_data'),
+        ),
+        migrations.AddIndex(
+            model_name='transacao',
+            index=models.Index(
+                fields=['salao', 'data', 'criado_em', 'id'],
+                condition=models.Q(pago=False),
+                name='transacao_salao_pendentes',
+            ),
+        ),
+    ]
@@ -0,0 +1,21 @@
+from django.db import migrations
+
+from core.particionamento import impedir_reversao
+
+
+def reverter(apps, schema_editor):
+    impedir_reversao(apps.get_model('gestao', 'Transacao'), schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gestao', '0007_indices_salao'),
+        ('servicos', '0005_particionamento'),
+    ]
+
+    operations = [
+        # Não converte a tabela: a partir daqui ela pode ser particionada pelo
+        # comando criar_particoes --converter (ver core.particionamento)
+        migrations.RunPython(migrations.RunPython.noop, reverter),
+    ]
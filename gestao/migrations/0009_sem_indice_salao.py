@@ -0,0 +1,32 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gestao', '0008_particionamento'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='material',
+            name='salao',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='materiais', to='core.salao', verbose_name='Salão'),
+        ),
+        migrations.AlterField(
+            model_name='movimentacaoestoque',
+            name='salao',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='movimentacoes', to='core.salao', verbose_name='Salão'),
+        ),
+        migrations.AlterField(
+            model_name='transacao',
+            name='salao',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='transacoes', to='core.salao', verbose_name='Salão'),
+        ),
+        migrations.AlterField(
+            model_name='transacaodiaria',
+            name='salao',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='transacoes_diarias', to='core.salao', verbose_name='Salão'),
+        ),
+    ]
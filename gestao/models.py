@@ -13,7 +13,10 @@ class Material(models.Model):
         ('geral', 'Geral'),
     )
     
-    salao = models.ForeignKey(Salao, on_delete=models.CASCADE, related_name='materiais', verbose_name='Salão')
+    # Sem índice só de salao: o material_salao_modulo_nome já começa por ele
+    salao = models.ForeignKey(
+        Salao, on_delete=models.CASCADE, related_name='materiais', verbose_name='Salão', db_index=False
+    )
     nome = models.CharField('Nome do Material', max_length=200)
     modulo = models.CharField('Módulo', max_length=20, choices=MODULO_CHOICES)
     descricao = models.TextField('Descrição', blank=True)
@@ -33,6 +36,9 @@ class Material(models.Model):
         verbose_name = 'Material'
         verbose_name_plural = 'Materiais'
         ordering = ['modulo', 'nome']
+        indexes = [
+            models.Index(fields=['salao', 'modulo', 'nome'], name='material_salao_modulo_nome'),
+        ]
     
     def __str__(self):
         return f"{self.nome} ({self.get_modulo_display()}) - {self.quantidade} {self.unidade}"
@@ -51,7 +57,10 @@ class MovimentacaoEstoque(models.Model):
         ('ajuste', 'Ajuste'),
     )
     
-    salao = models.ForeignKey(Salao, on_delete=models.CASCADE, related_name='movimentacoes', verbose_name='Salão')
+    # Sem índice só de salao: o movimentacao_salao_data já começa por ele
+    salao = models.ForeignKey(
+        Salao, on_delete=models.CASCADE, related_name='movimentacoes', verbose_name='Salão', db_index=False
+    )
     material = models.ForeignKey(Material, on_delete=models.CASCADE, verbose_name='Material', related_name='movimentacoes')
     tipo = models.CharField('Tipo', max_length=20, choices=TIPO_CHOICES)
     quantidade = models.DecimalField('Quantidade', max_digits=10, decimal_places=2)
@@ -64,6 +73,16 @@ class MovimentacaoEstoque(models.Model):
         verbose_name='Usuário Responsável'
     )
     
+    # Consumo automático de um agendamento concluído (no máximo uma baixa por material)
+    agendamento = models.ForeignKey(
+        'servicos.Agendamento',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        verbose_name='Agendamento Relacionado',
+        related_name='movimentacoes_estoque'
+    )
+    
     criado_em = models.DateTimeField('Data', auto_now_add=True)
     
     objects = TenantManager()
@@ -72,9 +91,84 @@ class MovimentacaoEstoque(models.Model):
         verbose_name = 'Movimentação de Estoque'
         verbose_name_plural = 'Movimentações de Estoque'
         ordering = ['-criado_em']
+        indexes = [
+            # Soma das movimentações de um material em um intervalo (ver SnapshotEstoque)
+            models.Index(fields=['material', 'criado_em'], name='movimentacao_material_data'),
+            # Histórico do salão em ordem cronológica (exportação, admin)
+            models.Index(fields=['salao', 'criado_em'], name='movimentacao_salao_data'),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['agendamento', 'material'],
+                condition=models.Q(agendamento__isnull=False),
+                name='movimentacao_consumo_unico',
+            ),
+        ]
     
     def __str__(self):
         return f"{self.get_tipo_display()} - {self.material.nome} - {self.quantidade}"
+    
+    @property
+    def variacao(self):
+        """Efeito no estoque: entradas somam, saídas subtraem e ajustes guardam a diferença com sinal"""
+        return -self.quantidade if self.tipo == 'saida' else self.quantidade
+
+
+class SnapshotEstoque(models.Model):
+    """
+    Estoque de um material ao fim de um dia.
+
+    Gerado por `manage.py gerar_snapshots_estoque`. Consultas do estoque em
+    uma data partem do snapshot mais próximo e somam apenas as movimentações
+    posteriores a ele (ver gestao.estoque.estoque_em).
+    """
+    salao = models.ForeignKey(Salao, on_delete=models.CASCADE, related_name='snapshots_estoque', verbose_name='Salão')
+    material = models.ForeignKey(Material, on_delete=models.CASCADE, verbose_name='Material', related_name='snapshots')
+    data = models.DateField('Data')
+    # Instante de corte: o snapshot inclui as movimentações criadas antes dele
+    referencia = models.DateTimeField('Referência')
+    
+    quantidade = models.DecimalField('Quantidade', max_digits=12, decimal_places=2)
+    custo_unitario = models.DecimalField('Custo Unitário', max_digits=10, decimal_places=2)
+    valor_total = models.DecimalField('Valor em Estoque', max_digits=14, decimal_places=2)
+    
+    criado_em = models.DateTimeField('Criado em', auto_now_add=True)
+    
+    objects = TenantManager()
+    
+    class Meta:
+        verbose_name = 'Snapshot de Estoque'
+        verbose_name_plural = 'Snapshots de Estoque'
+        ordering = ['-data', 'material']
+        constraints = [
+            models.UniqueConstraint(fields=['material', 'data'], name='snapshot_estoque_unico'),
+        ]
+    
+    def __str__(self):
+        return f"{self.material.nome} em {self.data}: {self.quantidade} (R$ {self.valor_total})"
+
+
+class ConsumoMaterial(models.Model):
+    """Materiais consumidos por um serviço (ficha técnica), baixados quando o agendamento é concluído"""
+    salao = models.ForeignKey(Salao, on_delete=models.CASCADE, related_name='consumos_materiais', verbose_name='Salão')
+    servico = models.ForeignKey(
+        'servicos.Servico', on_delete=models.CASCADE, verbose_name='Serviço', related_name='consumos'
+    )
+    material = models.ForeignKey(Material, on_delete=models.CASCADE, verbose_name='Material', related_name='consumos')
+    quantidade = models.DecimalField('Quantidade por Atendimento', max_digits=10, decimal_places=2)
+    
+    objects = TenantManager()
+    
+    class Meta:
+        verbose_name = 'Consumo de Material'
+        verbose_name_plural = 'Consumos de Materiais'
+        ordering = ['servico', 'material']
+        constraints = [
+            models.UniqueConstraint(fields=['servico', 'material'], name='consumo_material_unico'),
+        ]
+    
+    def __str__(self):
+        return f"{self.servico.nome}: {self.quantidade} {self.material.unidade} de {self.material.nome}"
 
 
 class Transacao(models.Model):
@@ -93,7 +187,10 @@ class Transacao(models.Model):
         ('outro', 'Outro'),
     )
     
-    salao = models.ForeignKey(Salao, on_delete=models.CASCADE, related_name='transacoes', verbose_name='Salão')
+    # Sem índice só de salao: o transacao_salao_data já começa por ele
+    salao = models.ForeignKey(
+        Salao, on_delete=models.CASCADE, related_name='transacoes', verbose_name='Salão', db_index=False
+    )
     tipo = models.CharField('Tipo', max_length=20, choices=TIPO_CHOICES)
     categoria = models.CharField('Categoria', max_length=30, choices=CATEGORIA_CHOICES)
     descricao = models.CharField('Descrição', max_length=500)
@@ -132,7 +229,55 @@ class Transacao(models.Model):
         verbose_name = 'Transação'
         verbose_name_plural = 'Transações'
         ordering = ['-data', '-criado_em']
+        indexes = [
+            # Paginação por chave (data, criado_em, id) com e sem filtros
+            models.Index(fields=['salao', 'data', 'criado_em', 'id'], name='transacao_salao_data'),
+            models.Index(fields=['salao', 'tipo', 'data', 'criado_em', 'id'], name='transacao_salao_tipo_data'),
+            models.Index(fields=['salao', 'categoria', 'data', 'criado_em', 'id'], name='transacao_salao_cat_data'),
+            # Contas pendentes: poucas linhas em relação ao livro-caixa inteiro
+            models.Index(
+                fields=['salao', 'data', 'criado_em', 'id'],
+                condition=models.Q(pago=False),
+                name='transacao_salao_pendentes',
+            ),
+        ]
     
     def __str__(self):
         sinal = '+' if self.tipo == 'receita' else '-'
         return f"{sinal} R$ {self.valor} - {self.descricao} ({self.data})"
+
+
+class TransacaoDiaria(models.Model):
+    """
+    Totais diários de transações por salão, tipo, categoria e situação.
+
+    Mantido incrementalmente pelos signals de Transacao (ver gestao.financeiro)
+    e reconstruído com `manage.py recalcular_resumo_financeiro`.
+    """
+    # Sem índice só de salao: o transacao_diaria_unica já começa por ele
+    salao = models.ForeignKey(
+        Salao, on_delete=models.CASCADE, related_name='transacoes_diarias', verbose_name='Salão', db_index=False
+    )
+    data = models.DateField('Data')
+    tipo = models.CharField('Tipo', max_length=20, choices=Transacao.TIPO_CHOICES)
+    categoria = models.CharField('Categoria', max_length=30, choices=Transacao.CATEGORIA_CHOICES)
+    pago = models.BooleanField('Pago/Recebido')
+    
+    total = models.DecimalField('Total', max_digits=14, decimal_places=2, default=0)
+    quantidade = models.IntegerField('Quantidade de Transações', default=0)
+    
+    objects = TenantManager()
+    
+    class Meta:
+        verbose_name = 'Resumo Diário de Transações'
+        verbose_name_plural = 'Resumos Diários de Transações'
+        ordering = ['-data']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['salao', 'data', 'tipo', 'categoria', 'pago'],
+                name='transacao_diaria_unica',
+            ),
+        ]
+    
+    def __str__(self):
+        return f"{self.data} - {self.get_tipo_display()} - {self.get_categoria_display()}: R$ {self.total}"
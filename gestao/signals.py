@@ -0,0 +1,72 @@
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from core.shards import usar_banco_do_sinal
+from servicos.models import Agendamento
+from .dashboard import invalidar_dashboard
+from .estoque import consumir_materiais
+from .financeiro import aplicar_no_resumo, chave_resumo
+from .models import Material, Transacao
+
+
+@receiver(pre_save, sender=Transacao)
+def guardar_transacao_anterior(sender, instance, using, **kwargs):
+    """Guarda chave e valor originais para descontá-los do resumo"""
+    instance._resumo_anterior = None
+    if instance.pk and not instance._state.adding:
+        anterior = sender._base_manager.using(using).filter(pk=instance.pk).values_list(
+            'salao_id', 'data', 'tipo', 'categoria', 'pago', 'valor'
+        ).first()
+        if anterior:
+            instance._resumo_anterior = (anterior[:5], anterior[5])
+
+
+@receiver(post_save, sender=Transacao)
+@usar_banco_do_sinal
+def atualizar_resumo(sender, instance, **kwargs):
+    anterior = getattr(instance, '_resumo_anterior', None)
+    chave = chave_resumo(instance)
+    if anterior:
+        chave_anterior, valor_anterior = anterior
+        if chave_anterior == chave:
+            if valor_anterior != instance.valor:
+                aplicar_no_resumo(chave, instance.valor - valor_anterior, 0)
+            return
+        aplicar_no_resumo(chave_anterior, -valor_anterior, -1)
+    aplicar_no_resumo(chave, instance.valor, 1)
+
+
+@receiver(post_delete, sender=Transacao)
+@usar_banco_do_sinal
+def descontar_do_resumo(sender, instance, **kwargs):
+    # A linha existe desde a criação da transação; se sumiu, o salão está sendo excluído
+    aplicar_no_resumo(chave_resumo(instance), -instance.valor, -1, criar=False)
+
+
+@receiver(post_save, sender=Agendamento)
+@receiver(post_delete, sender=Agendamento)
+@receiver(post_save, sender=Transacao)
+@receiver(post_delete, sender=Transacao)
+@receiver(post_save, sender=Material)
+@receiver(post_delete, sender=Material)
+def invalidar_estatisticas(sender, instance, **kwargs):
+    """Gravações que alteram os indicadores do dashboard do salão"""
+    invalidar_dashboard(instance.salao_id)
+
+
+@receiver(pre_save, sender=Agendamento)
+def guardar_status_anterior(sender, instance, using, **kwargs):
+    """Guarda o status original quando o agendamento está sendo concluído"""
+    instance._status_anterior = None
+    if instance.status == 'concluido' and instance.pk and not instance._state.adding:
+        instance._status_anterior = sender._base_manager.using(using).filter(pk=instance.pk).values_list(
+            'status', flat=True
+        ).first()
+
+
+@receiver(post_save, sender=Agendamento)
+@usar_banco_do_sinal
+def baixar_materiais_consumidos(sender, instance, **kwargs):
+    """Dá baixa na ficha técnica do serviço quando o agendamento passa a concluído"""
+    if instance.status == 'concluido' and getattr(instance, '_status_anterior', None) != 'concluido':
+        consumir_materiais(instance)
@@ -1,3 +1,787 @@
+import csv
+import random
+import zipfile
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+from io import BytesIO, StringIO
+from unittest import mock
+
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from core.models import Salao, Usuario
+from core.testutils import CargaTestMixin, PlanoConsultaMixin
+from core.utils import usar_salao
+from servicos.catalogo import catalogo
+from servicos.models import Agendamento, Modulo, Profissional, Servico
+from .dashboard import chave_cache, estatisticas_dashboard
+from .financeiro import (
+    acumular_deltas, aplicar_deltas, decodificar_cursor, pagina_transacoes, recalcular_resumo, totais_por_tipo,
+    verificar_resumo,
+)
+from .estoque import (
+    consumir_materiais, estoque_em, gerar_snapshots, registrar_movimentacao, saldo_por_movimentacoes, valor_estoque_em,
+)
+from .exportacao import EXPORTACOES, consulta_exportacao, gerar_xlsx, linhas_exportacao
+from .importacao import importar_csv
+from .models import ConsumoMaterial, Material, MovimentacaoEstoque, SnapshotEstoque, Transacao, TransacaoDiaria
+
+
+class GestaoTestMixin:
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.salao = Salao.objects.create(nome='Salão A', subdominio='salao-a')
+        cls.outro_salao = Salao.objects.create(nome='Salão B', subdominio='salao-b')
+        cls.admin = Usuario.objects.create_user(
+            username='admin', password='senha', salao=cls.salao, tipo='admin'
+        )
+        cls.hoje = date.today()
+
+    def transacao(self, valor, tipo='receita', categoria='servico', pago=True, data=None, salao=None,
+                  descricao='Teste'):
+        return Transacao.objects.create(
+            salao=salao or self.salao, tipo=tipo, categoria=categoria, descricao=descricao,
+            valor=Decimal(valor), data=data or self.hoje, pago=pago,
+        )
+
+
+class ResumoFinanceiroTests(GestaoTestMixin, TestCase):
+
+    def resumo(self, **filtros):
+        with usar_salao(self.salao):
+            return totais_por_tipo(**filtros)
+
+    def test_criacao_atualiza_resumo(self):
+        self.transacao('100.00')
+        self.transacao('50.50')
+        self.transacao('30.00', tipo='despesa', categoria='conta')
+        self.transacao('999.00', salao=self.outro_salao)
+        self.assertEqual(self.resumo(pago=True), (Decimal('150.50'), Decimal('30.00')))
+        linha = TransacaoDiaria.objects.get(salao=self.salao, tipo='receita')
+        self.assertEqual(linha.quantidade, 2)
+
+    def test_deltas_em_massa_somam_as_linhas_existentes(self):
+        self.transacao('100.00')
+        transacoes = Transacao.objects.bulk_create([
+            Transacao(salao=self.salao, tipo='receita', categoria='servico', descricao='Lote',
+                      valor=Decimal('10.00'), data=self.hoje, pago=True),
+            Transacao(salao=self.salao, tipo='receita', categoria='servico', descricao='Lote',
+                      valor=Decimal('5.00'), data=self.hoje - timedelta(days=1), pago=True),
+            Transacao(salao=self.outro_salao, tipo='despesa', categoria='conta', descricao='Lote',
+                      valor=Decimal('7.00'), data=self.hoje, pago=True),
+        ])
+        # Lotes de uma linha: cada INSERT ... ON CONFLICT cria ou soma a sua
+        aplicar_deltas(acumular_deltas(transacoes), tamanho_lote=1)
+        hoje = TransacaoDiaria.objects.get(salao=self.salao, data=self.hoje)
+        self.assertEqual((hoje.total, hoje.quantidade), (Decimal('110.00'), 2))
+        self.assertEqual(self.resumo(pago=True), (Decimal('115.00'), 0))
+        self.assertEqual(verificar_resumo(), [])
+
+    def test_alteracao_move_valor_entre_chaves(self):
+        transacao = self.transacao('100.00', pago=False)
+        self.assertEqual(self.resumo(pago=True), (0, 0))
+
+        transacao.pago = True
+        transacao.valor = Decimal('120.00')
+        transacao.data = self.hoje - timedelta(days=40)
+        transacao.save()
+        self.assertEqual(self.resumo(pago=True), (Decimal('120.00'), 0))
+        self.assertEqual(self.resumo(pago=True, data_inicio=self.hoje), (0, 0))
+        self.assertEqual(verificar_resumo(), [])
+
+    def test_alteracao_apenas_do_valor(self):
+        transacao = self.transacao('100.00')
+        transacao.valor = Decimal('80.00')
+        transacao.save()
+        self.assertEqual(self.resumo(), (Decimal('80.00'), 0))
+        self.assertEqual(TransacaoDiaria.objects.get(salao=self.salao).quantidade, 1)
+
+    def test_exclusao_desconta_do_resumo(self):
+        transacao = self.transacao('100.00')
+        self.transacao('40.00')
+        transacao.delete()
+        self.assertEqual(self.resumo(), (Decimal('40.00'), 0))
+        self.assertEqual(verificar_resumo(), [])
+
+    def test_exclusao_do_salao_com_transacoes(self):
+        self.transacao('100.00')
+        self.transacao('30.00', tipo='despesa', categoria='conta')
+        self.transacao('999.00', salao=self.outro_salao)
+        self.salao.delete()
+        # O desconto das transações excluídas não recria o resumo do salão apagado
+        connection.check_constraints()
+        self.assertFalse(TransacaoDiaria._base_manager.filter(salao_id=self.salao.id).exists())
+        self.assertEqual(TransacaoDiaria._base_manager.get(salao=self.outro_salao).total, Decimal('999.00'))
+
+    def test_verificar_e_recalcular(self):
+        self.transacao('100.00')
+        Transacao.objects.update(valor=Decimal('70.00'))  # não dispara signals
+        self.assertEqual(len(verificar_resumo()), 1)
+
+        recalcular_resumo(self.salao)
+        self.assertEqual(verificar_resumo(), [])
+        self.assertEqual(self.resumo(), (Decimal('70.00'), 0))
+
+    def test_comando_recalcular(self):
+        self.transacao('100.00')
+        TransacaoDiaria.objects.all().delete()
+
+        with self.assertRaises(CommandError):
+            call_command('recalcular_resumo_financeiro', '--verificar', stdout=StringIO(), stderr=StringIO())
+
+        saida = StringIO()
+        call_command('recalcular_resumo_financeiro', stdout=saida)
+        self.assertIn('confere', saida.getvalue())
+        self.assertEqual(self.resumo(), (Decimal('100.00'), 0))
+
+    def test_totais_das_telas_vem_do_resumo(self):
+        self.transacao('100.00')
+        self.transacao('25.00', tipo='despesa', categoria='fornecedor')
+        self.client.force_login(self.admin)
+
+        resposta = self.client.get(reverse('gestao_financeiro'))
+        self.assertEqual(resposta.context['total_receitas'], Decimal('100.00'))
+        self.assertEqual(resposta.context['saldo'], Decimal('75.00'))
+
+        resposta = self.client.get(reverse('admin_dashboard'))
+        self.assertEqual(resposta.context['receitas_mes'], Decimal('100.00'))
+        self.assertEqual(resposta.context['despesas_mes'], Decimal('25.00'))
+
+
+class DashboardTests(GestaoTestMixin, TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        modulo = Modulo.objects.create(nome='cabelo')
+        usuario_prof = Usuario.objects.create_user(username='prof', password='senha', salao=cls.salao)
+        cls.profissional = Profissional.objects.create(
+            salao=cls.salao, usuario=usuario_prof, horario_inicio=time(0), horario_fim=time(23, 59),
+            trabalha_sabado=True, trabalha_domingo=True,
+        )
+        cls.profissional.modulos.add(modulo)
+        cls.servico = Servico.objects.create(salao=cls.salao, nome='Corte', modulo=modulo, preco=50)
+        for hora in (time(10), time(12), time(14)):
+            Agendamento.objects.create(
+                salao=cls.salao, cliente=cls.admin, profissional=cls.profissional,
+                servico=cls.servico, data=cls.hoje, hora=hora,
+            )
+        Material.objects.create(salao=cls.salao, nome='Shampoo', modulo='cabelo', quantidade=2, estoque_minimo=5)
+        Material.objects.create(salao=cls.salao, nome='Esmalte', modulo='unhas', quantidade=50, estoque_minimo=5)
+        Material.objects.create(salao=cls.outro_salao, nome='Tinta', modulo='cabelo', quantidade=0)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_estatisticas_em_uma_consulta(self):
+        self.transacao('100.00')
+        self.transacao('30.00', tipo='despesa', categoria='conta')
+        self.transacao('500.00', salao=self.outro_salao)
+        with self.assertNumQueries(1):
+            estatisticas = estatisticas_dashboard(self.salao.id, self.hoje)
+        self.assertEqual(estatisticas['agendamentos_hoje'], 3)
+        self.assertEqual(estatisticas['total_agendamentos_mes'], 3)
+        self.assertEqual(estatisticas['receitas_mes'], Decimal('100.00'))
+        self.assertEqual(estatisticas['despesas_mes'], Decimal('30.00'))
+        self.assertEqual(estatisticas['materiais_baixo'], 1)
+        with self.assertNumQueries(0):
+            estatisticas_dashboard(self.salao.id, self.hoje)
+
+    def test_salao_sem_movimento(self):
+        estatisticas = estatisticas_dashboard(self.outro_salao.id, self.hoje)
+        self.assertEqual(estatisticas['receitas_mes'], 0)
+        self.assertEqual(estatisticas['agendamentos_hoje'], 0)
+        self.assertEqual(estatisticas['materiais_baixo'], 1)
+
+    def test_cache_invalidado_por_gravacoes(self):
+        estatisticas_dashboard(self.salao.id, self.hoje)
+        self.transacao('80.00')
+        self.assertEqual(estatisticas_dashboard(self.salao.id, self.hoje)['receitas_mes'], Decimal('80.00'))
+
+        Material.objects.filter(nome='Esmalte').get().delete()
+        Agendamento.objects.filter(hora=time(10)).get().delete()
+        estatisticas = estatisticas_dashboard(self.salao.id, self.hoje)
+        self.assertEqual(estatisticas['agendamentos_hoje'], 2)
+
+    def test_calculo_na_replica_nao_entra_no_cache(self):
+        with mock.patch('gestao.dashboard.lendo_da_replica', return_value=True):
+            estatisticas_dashboard(self.salao.id, self.hoje)
+            self.assertIsNone(cache.get(chave_cache(self.salao.id)))
+        estatisticas = estatisticas_dashboard(self.salao.id, self.hoje)
+        self.assertEqual(cache.get(chave_cache(self.salao.id)), estatisticas)
+        # O valor calculado no principal é lido do cache também dentro da réplica
+        with mock.patch('gestao.dashboard.lendo_da_replica', return_value=True), self.assertNumQueries(0):
+            estatisticas_dashboard(self.salao.id, self.hoje)
+
+    def test_limite_de_consultas_da_view(self):
+        self.client.force_login(self.admin)
+        url = reverse('admin_dashboard')
+
+        with CaptureQueriesContext(connection) as frio:
+            resposta = self.client.get(url)
+        self.assertEqual(resposta.status_code, 200)
+        self.assertEqual(len(resposta.context['proximos_agendamentos']), 3)
+        # usuário + salão, estatísticas, próximos agendamentos
+        self.assertLessEqual(len(frio), 3, [q['sql'] for q in frio.captured_queries])
+
+        with CaptureQueriesContext(connection) as quente:
+            self.client.get(url)
+        # apenas os próximos agendamentos
+        self.assertLessEqual(len(quente), 1, [q['sql'] for q in quente.captured_queries])
+
+
+class PaginacaoFinanceiroTests(GestaoTestMixin, TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        valores = [
+            ('100.00', 'receita', 'servico', True), ('40.00', 'despesa', 'fornecedor', True),
+            ('25.50', 'receita', 'servico', False), ('300.00', 'despesa', 'aluguel', True),
+            ('80.00', 'receita', 'outro', True), ('15.00', 'despesa', 'conta', False),
+        ]
+        for dia in range(4):
+            for valor, tipo, categoria, pago in valores:
+                Transacao.objects.create(
+                    salao=cls.salao, tipo=tipo, categoria=categoria, descricao='Teste',
+                    valor=Decimal(valor), data=cls.hoje - timedelta(days=dia), pago=pago,
+                )
+        Transacao.objects.create(
+            salao=cls.outro_salao, tipo='receita', categoria='servico', descricao='Outro',
+            valor=Decimal('999.00'), data=cls.hoje, pago=True,
+        )
+
+    def esperado(self, **filtros):
+        """Transações em ordem decrescente com o saldo acumulado calculado em Python"""
+        transacoes = Transacao.objects.filter(salao=self.salao, **filtros).order_by('data', 'criado_em', 'id')
+        saldo, linhas = Decimal('0'), []
+        for transacao in transacoes:
+            saldo += transacao.valor if transacao.tipo == 'receita' else -transacao.valor
+            linhas.append((transacao.pk, saldo))
+        return linhas[::-1]
+
+    def percorrer(self, tamanho, **filtros):
+        linhas, cursor, paginas = [], None, 0
+        with usar_salao(self.salao):
+            while True:
+                pagina, proximo = pagina_transacoes(
+                    cursor=decodificar_cursor(cursor) if cursor else None, tamanho=tamanho, **filtros
+                )
+                linhas += [(transacao.pk, transacao.saldo) for transacao in pagina]
+                paginas += 1
+                if not proximo:
+                    return linhas, paginas
+                cursor = proximo
+
+    def test_paginas_cobrem_tudo_com_saldo_acumulado(self):
+        linhas, paginas = self.percorrer(5)
+        self.assertEqual(linhas, self.esperado())
+        self.assertEqual(paginas, 5)
+
+    def test_filtros_e_saldo_do_periodo(self):
+        inicio = self.hoje - timedelta(days=2)
+        linhas, _ = self.percorrer(4, data_inicio=inicio, tipo='receita', pago=True)
+        self.assertEqual(linhas, self.esperado(data__gte=inicio, tipo='receita', pago=True))
+
+        linhas, _ = self.percorrer(3, data_fim=self.hoje - timedelta(days=1), categoria='servico')
+        self.assertEqual(linhas, self.esperado(data__lte=self.hoje - timedelta(days=1), categoria='servico'))
+
+    def test_pagina_profunda_tem_custo_constante(self):
+        with usar_salao(self.salao):
+            ultima = Transacao.objects.order_by('data', 'criado_em', 'id')[2]
+            with self.assertNumQueries(2):
+                pagina, proximo = pagina_transacoes(
+                    cursor=(ultima.data, ultima.criado_em, ultima.pk), tamanho=5
+                )
+        self.assertEqual([transacao.pk for transacao in pagina], [pk for pk, _ in self.esperado()[-2:]])
+        self.assertIsNone(proximo)
+
+    def test_cursor_invalido(self):
+        for cursor in ('', 'x', 'bm9wZQ', 'WzEsMiwzXQ'):
+            with self.assertRaises(ValueError):
+                decodificar_cursor(cursor)
+
+    def test_view_pagina_e_filtra(self):
+        self.client.force_login(self.admin)
+        url = reverse('gestao_financeiro')
+
+        resposta = self.client.get(url, {'tipo': 'despesa'})
+        self.assertTrue(all(transacao.tipo == 'despesa' for transacao in resposta.context['transacoes']))
+        self.assertEqual(resposta.context['total_receitas'], 0)
+        self.assertEqual(resposta.context['total_despesas'], Decimal('1360.00'))
+
+        resposta = self.client.get(url)
+        self.assertEqual(len(resposta.context['transacoes']), 24)
+        self.assertIsNone(resposta.context['proxima_pagina'])
+
+        resposta = self.client.get(url, {'cursor': 'invalido'})
+        self.assertEqual(resposta.status_code, 200)
+        self.assertIsNone(resposta.context['primeira_pagina'])
+
+
+class ExportacaoTests(GestaoTestMixin, TestCase):
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+        self.transacao('100.00', data=self.hoje - timedelta(days=10))
+        self.transacao('20.00', tipo='despesa', categoria='conta')
+        self.transacao('999.00', salao=self.outro_salao)
+        material = Material.objects.create(salao=self.salao, nome='Shampoo', modulo='cabelo')
+        MovimentacaoEstoque.objects.create(
+            salao=self.salao, material=material, tipo='entrada', quantidade=5, usuario=self.admin
+        )
+
+    def baixar(self, nome, formato, **parametros):
+        resposta = self.client.get(reverse('gestao_exportar', args=[nome, formato]), parametros)
+        self.assertEqual(resposta.status_code, 200)
+        self.assertTrue(resposta.streaming)
+        return b''.join(resposta.streaming_content)
+
+    def test_csv_do_salao_e_periodo(self):
+        conteudo = self.baixar('transacoes', 'csv').decode('utf-8-sig')
+        linhas = list(csv.reader(StringIO(conteudo)))
+        self.assertEqual(linhas[0][:3], ['ID', 'Data', 'Tipo'])
+        self.assertEqual([linha[5] for linha in linhas[1:]], ['100.00', '20.00'])
+
+        conteudo = self.baixar('transacoes', 'csv', data_inicio=self.hoje.isoformat()).decode('utf-8-sig')
+        self.assertEqual(len(list(csv.reader(StringIO(conteudo)))), 2)
+
+        conteudo = self.baixar('movimentacoes', 'csv').decode('utf-8-sig')
+        self.assertIn('Shampoo', conteudo)
+        self.assertIn('admin', conteudo)
+
+    def test_periodo_das_movimentacoes_no_fuso_do_projeto(self):
+        material = Material.objects.get(nome='Shampoo')
+        ontem = self.hoje - timedelta(days=1)
+        for instante, motivo in [
+            (timezone.make_aware(datetime.combine(ontem, time(23, 59))), 'fim de ontem'),
+            (timezone.make_aware(datetime.combine(self.hoje, time.min)), 'início de hoje'),
+        ]:
+            movimentacao = MovimentacaoEstoque.objects.create(
+                salao=self.salao, material=material, tipo='entrada', quantidade=1, motivo=motivo,
+            )
+            MovimentacaoEstoque.objects.filter(pk=movimentacao.pk).update(criado_em=instante)
+
+        motivos = [linha[5] for linha in linhas_exportacao('movimentacoes', self.salao, ontem, ontem)]
+        self.assertEqual(motivos, ['fim de ontem'])
+        motivos = [linha[5] for linha in linhas_exportacao('movimentacoes', self.salao, self.hoje, self.hoje)]
+        self.assertIn('início de hoje', motivos)
+        self.assertNotIn('fim de ontem', motivos)
+
+    def test_xlsx_valido(self):
+        conteudo = self.baixar('transacoes', 'xlsx')
+        with zipfile.ZipFile(BytesIO(conteudo)) as arquivo:
+            self.assertIsNone(arquivo.testzip())
+            planilha = arquivo.read('xl/worksheets/sheet1.xml').decode()
+        self.assertEqual(planilha.count('<row>'), 3)
+        self.assertIn('<c><v>100.00</v></c>', planilha)
+        self.assertNotIn('999.00', planilha)
+
+    def test_texto_que_seria_formula_e_neutralizado(self):
+        self.transacao('10.00', descricao='=HYPERLINK("http://exemplo.com","x")')
+        self.transacao('10.00', descricao='-2+3')
+        conteudo = self.baixar('transacoes', 'csv').decode('utf-8-sig')
+        descricoes = [linha[4] for linha in csv.reader(StringIO(conteudo))][1:]
+        self.assertIn('\'=HYPERLINK("http://exemplo.com","x")', descricoes)
+        self.assertIn("'-2+3", descricoes)
+
+        planilha = b''.join(gerar_xlsx(['Texto', 'Valor'], [('@SUM(A1)', Decimal('-1.50'))]))
+        with zipfile.ZipFile(BytesIO(planilha)) as arquivo:
+            planilha = arquivo.read('xl/worksheets/sheet1.xml').decode()
+        self.assertIn("<t>'@SUM(A1)</t>", planilha)
+        # Números negativos continuam números
+        self.assertIn('<c><v>-1.50</v></c>', planilha)
+
+    def test_xlsx_em_pedacos(self):
+        sorteio = random.Random(1)
+        linhas = ((n, f'Linha <{n}> & {sorteio.getrandbits(128):x}', Decimal('1.50')) for n in range(20000))
+        pedacos = list(gerar_xlsx(['N', 'Texto', 'Valor'], linhas))
+        self.assertGreater(len(pedacos), 3)
+        with zipfile.ZipFile(BytesIO(b''.join(pedacos))) as arquivo:
+            planilha = arquivo.read('xl/worksheets/sheet1.xml').decode()
+        self.assertEqual(planilha.count('<row>'), 20001)
+        self.assertIn('Linha &lt;19999&gt; &amp; ', planilha)
+
+    def test_parametros_invalidos(self):
+        url = reverse('gestao_exportar', args=['transacoes', 'csv'])
+        self.assertEqual(self.client.get(url, {'data_inicio': 'ontem'}).status_code, 400)
+        self.assertEqual(self.client.get(reverse('gestao_exportar', args=['usuarios', 'csv'])).status_code, 404)
+        self.assertEqual(self.client.get(reverse('gestao_exportar', args=['transacoes', 'pdf'])).status_code, 404)
+
+
+class ImportacaoTests(GestaoTestMixin, TestCase):
+
+    def importar(self, nome, conteudo, **kwargs):
+        return importar_csv(BytesIO(conteudo.encode()), nome, self.salao, **kwargs)
+
+    def test_importa_transacoes_e_atualiza_resumo(self):
+        linhas = ['tipo;categoria;descricao;valor;data;pago']
+        linhas += [f'receita;servico;Corte {n};1.234,50;{self.hoje:%d/%m/%Y};sim' for n in range(30)]
+        linhas += [f'despesa;conta;Luz;100;{self.hoje.isoformat()};não']
+        resultado = self.importar('transacoes', '\n'.join(linhas), tamanho_lote=8)
+        self.assertTrue(resultado.sucesso)
+        self.assertEqual((resultado.linhas, resultado.importadas), (31, 31))
+        self.assertEqual(Transacao.objects.filter(salao=self.salao).count(), 31)
+        self.assertFalse(Transacao.objects.get(categoria='conta').pago)
+        self.assertEqual(verificar_resumo(self.salao), [])
+        with usar_salao(self.salao):
+            self.assertEqual(totais_por_tipo(pago=True), (Decimal('37035.00'), 0))
+
+    def test_erros_por_linha_nao_gravam_nada(self):
+        conteudo = (
+            'nome,modulo,quantidade\n'
+            'Shampoo,cabelo,10\n'
+            ',cabelo,5\n'
+            'Esmalte,unhas,muito\n'
+            'Creme,pele,3\n'
+        )
+        resultado = self.importar('materiais', conteudo, tamanho_lote=2)
+        self.assertFalse(resultado.sucesso)
+        self.assertEqual([numero for numero, _ in resultado.erros], [3, 4])
+        self.assertIn('nome', resultado.erros[0][1])
+        self.assertIn('quantidade', resultado.erros[1][1])
+        self.assertEqual(resultado.importadas, 0)
+        self.assertFalse(Material.objects.exists())
+
+    def test_estoque_importado_entra_como_movimentacao(self):
+        conteudo = 'nome,modulo,quantidade\nShampoo,cabelo,10\nEsmalte,unhas,"2,5"\nCreme,pele,0\n'
+        resultado = self.importar('materiais', conteudo, tamanho_lote=2, usuario=self.admin)
+        self.assertEqual(resultado.importadas, 3)
+        for material in Material.objects.filter(salao=self.salao):
+            with self.subTest(material.nome):
+                self.assertEqual(material.quantidade, saldo_por_movimentacoes(material))
+        self.assertEqual(Material.objects.get(nome='Esmalte').quantidade, Decimal('2.5'))
+        movimentacao = MovimentacaoEstoque.objects.get(material__nome='Shampoo')
+        self.assertEqual(
+            (movimentacao.tipo, movimentacao.motivo, movimentacao.usuario), ('entrada', 'Estoque inicial', self.admin),
+        )
+        self.assertFalse(MovimentacaoEstoque.objects.filter(material__nome='Creme').exists())
+
+    def test_simulacao_valida_sem_gravar(self):
+        resultado = self.importar('materiais', 'nome,modulo\nShampoo,cabelo\n', simular=True)
+        self.assertTrue(resultado.sucesso)
+        self.assertEqual(resultado.importadas, 0)
+        self.assertFalse(Material.objects.exists())
+
+    def test_chaves_estrangeiras_em_uma_consulta_por_lote(self):
+        Modulo.objects.create(nome='cabelo')
+        Modulo.objects.create(nome='unhas')
+        conteudo = 'nome,modulo,preco\n' + ''.join(
+            f'Serviço {n},{"cabelo" if n % 2 else "unhas"},{n}0\n' for n in range(1, 41)
+        ) + 'Massagem,spa,50\n'
+        # savepoint, módulos do lote, rollback e release
+        with self.assertNumQueries(4):
+            resultado = self.importar('servicos', conteudo, simular=True, tamanho_lote=100)
+        self.assertEqual(resultado.linhas, 41)
+        self.assertEqual([(numero, list(erros)) for numero, erros in resultado.erros], [(42, ['modulo'])])
+
+        versao_catalogo = catalogo.geracoes(self.salao.id)
+        with self.captureOnCommitCallbacks(execute=True):
+            resultado = self.importar('servicos', conteudo.rsplit('Massagem', 1)[0])
+        self.assertEqual(resultado.importadas, 40)
+        # bulk_create não dispara signals: a importação invalida o catálogo
+        self.assertNotEqual(catalogo.geracoes(self.salao.id), versao_catalogo)
+        self.assertEqual(Servico.objects.filter(salao=self.salao, modulo__nome='cabelo').count(), 20)
+        self.assertEqual(Servico.objects.get(nome='Serviço 1').duracao_minutos, 60)
+
+    def test_nao_referencia_registros_de_outro_salao(self):
+        usuario = Usuario.objects.create_user(username='prof-b', password='senha', salao=self.outro_salao)
+        profissional = Profissional.objects.create(salao=self.outro_salao, usuario=usuario)
+        conteudo = f'tipo,categoria,descricao,valor,data,profissional\nreceita,servico,X,10,{self.hoje},{profissional.pk}\n'
+        resultado = self.importar('transacoes', conteudo)
+        self.assertIn('profissional', resultado.erros[0][1])
+
+    def test_colunas_obrigatorias(self):
+        with self.assertRaises(ValidationError):
+            self.importar('transacoes', 'tipo,valor\nreceita,10\n')
+
+    def test_arquivo_salvo_pelo_excel_em_windows_1252(self):
+        conteudo = 'nome;modulo;quantidade\nMáscara de hidratação;cabelo;2\nEsmalte;unhas;1\n'
+        resultado = importar_csv(BytesIO(conteudo.encode('cp1252')), 'materiais', self.salao)
+        self.assertEqual(resultado.importadas, 2)
+        self.assertTrue(Material.objects.filter(nome='Máscara de hidratação').exists())
+
+    def test_codificacao_invalida_depois_da_amostra(self):
+        # O início é UTF-8 válido; o byte inválido (0x81 não existe nem no cp1252) vem bem depois
+        conteudo = 'nome,modulo\n'.encode() + b'Shampoo,cabelo\n' * 5000 + b'Cr\x81me,pele\n'
+        with self.assertRaisesMessage(ValidationError, 'codificação'):
+            importar_csv(BytesIO(conteudo), 'materiais', self.salao, tamanho_lote=100)
+        self.assertFalse(Material.objects.exists())
+
+    def test_view(self):
+        self.client.force_login(self.admin)
+        arquivo = SimpleUploadedFile('materiais.csv', b'nome,modulo\nCr\x81me,pele\n')
+        resposta = self.client.post(reverse('gestao_importar'), {'tipo': 'materiais', 'arquivo': arquivo})
+        self.assertEqual(resposta.status_code, 200)
+        self.assertIn('arquivo', resposta.context['form'].errors)
+
+        arquivo = SimpleUploadedFile('materiais.csv', b'nome,modulo,quantidade\nShampoo,cabelo,2\n')
+        resposta = self.client.post(reverse('gestao_importar'), {'tipo': 'materiais', 'arquivo': arquivo})
+        self.assertEqual(resposta.status_code, 200)
+        self.assertEqual(resposta.context['resultado'].importadas, 1)
+        self.assertEqual(Material.objects.get().salao, self.salao)
+
+
+class EstoqueTests(GestaoTestMixin, TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        modulo = Modulo.objects.create(nome='cabelo')
+        usuario_prof = Usuario.objects.create_user(username='prof', password='senha', salao=cls.salao)
+        cls.profissional = Profissional.objects.create(
+            salao=cls.salao, usuario=usuario_prof, horario_inicio=time(0), horario_fim=time(23, 59),
+            trabalha_sabado=True, trabalha_domingo=True,
+        )
+        cls.profissional.modulos.add(modulo)
+        cls.servico = Servico.objects.create(salao=cls.salao, nome='Coloração', modulo=modulo, preco=150)
+        cls.tinta = Material.objects.create(salao=cls.salao, nome='Tinta', modulo='cabelo', quantidade=10)
+        cls.luvas = Material.objects.create(salao=cls.salao, nome='Luvas', modulo='geral', quantidade=100)
+        ConsumoMaterial.objects.create(salao=cls.salao, servico=cls.servico, material=cls.tinta, quantidade=Decimal('1.5'))
+        ConsumoMaterial.objects.create(salao=cls.salao, servico=cls.servico, material=cls.luvas, quantidade=2)
+
+    def agendamento(self, **kwargs):
+        return Agendamento.objects.create(
+            salao=self.salao, cliente=self.admin, profissional=self.profissional,
+            servico=self.servico, data=self.hoje, hora=kwargs.pop('hora', time(10)), **kwargs
+        )
+
+    def test_entrada_saida_e_ajuste(self):
+        registrar_movimentacao(self.tinta, 'entrada', 5, usuario=self.admin)
+        self.assertEqual(self.tinta.quantidade, 15)
+        registrar_movimentacao(self.tinta, 'saida', '2.5')
+        self.assertEqual(self.tinta.quantidade, Decimal('12.5'))
+
+        ajuste = registrar_movimentacao(self.tinta, 'ajuste', 11)
+        self.assertEqual(ajuste.quantidade, Decimal('-1.5'))
+        self.assertEqual(self.tinta.quantidade, 11)
+        self.assertEqual(10 + saldo_por_movimentacoes(self.tinta), self.tinta.quantidade)
+
+    def test_saida_sem_estoque(self):
+        with self.assertRaises(ValidationError):
+            registrar_movimentacao(self.tinta, 'saida', 11)
+        self.tinta.refresh_from_db()
+        self.assertEqual(self.tinta.quantidade, 10)
+        self.assertFalse(MovimentacaoEstoque.objects.exists())
+
+    def test_atualizacao_atomica(self):
+        # Uma instância desatualizada não sobrescreve o estoque
+        copia = Material.objects.get(pk=self.tinta.pk)
+        registrar_movimentacao(self.tinta, 'entrada', 5)
+        registrar_movimentacao(copia, 'entrada', 3)
+        self.assertEqual(copia.quantidade, 18)
+
+    def test_conclusao_baixa_ficha_tecnica_uma_vez(self):
+        agendamento = self.agendamento()
+        agendamento.status = 'concluido'
+        with CaptureQueriesContext(connection) as consultas:
+            agendamento.save()
+        # Uma inserção para as movimentações e um UPDATE para todos os materiais
+        escritas = [q['sql'] for q in consultas.captured_queries if 'gestao_' in q['sql'].split(' WHERE ')[0]]
+        self.assertEqual([sql.split()[0] for sql in escritas if not sql.startswith('SELECT')], ['INSERT', 'UPDATE'])
+        self.tinta.refresh_from_db()
+        self.luvas.refresh_from_db()
+        self.assertEqual((self.tinta.quantidade, self.luvas.quantidade), (Decimal('8.5'), 98))
+        self.assertEqual(agendamento.movimentacoes_estoque.count(), 2)
+
+        agendamento.observacoes = 'Retoque'
+        agendamento.save()
+        agendamento.status = 'confirmado'
+        agendamento.save()
+        agendamento.status = 'concluido'
+        agendamento.save()
+        self.assertEqual(consumir_materiais(agendamento), [])
+        self.tinta.refresh_from_db()
+        self.assertEqual(self.tinta.quantidade, Decimal('8.5'))
+
+    def test_agendamento_criado_concluido(self):
+        self.agendamento(status='concluido')
+        self.luvas.refresh_from_db()
+        self.assertEqual(self.luvas.quantidade, 98)
+
+    def test_view_movimenta_e_cadastra_com_estoque_inicial(self):
+        self.client.force_login(self.admin)
+        url = reverse('gestao_estoque')
+        resposta = self.client.post(url, {
+            'movimentar': '1', 'material': self.tinta.pk, 'tipo': 'saida', 'quantidade': '20', 'motivo': '',
+        })
+        self.assertEqual(resposta.status_code, 200)
+        self.assertIn('quantidade', resposta.context['movimentacao_form'].errors)
+
+        self.client.post(url, {'movimentar': '1', 'material': self.tinta.pk, 'tipo': 'saida', 'quantidade': '4'})
+        self.tinta.refresh_from_db()
+        self.assertEqual(self.tinta.quantidade, 6)
+
+        self.client.post(url, {
+            'nome': 'Esmalte', 'modulo': 'unhas', 'quantidade': '7', 'unidade': 'frasco',
+            'custo_unitario': '5', 'estoque_minimo': '2',
+        })
+        esmalte = Material.objects.get(nome='Esmalte')
+        self.assertEqual(esmalte.quantidade, 7)
+        self.assertEqual(saldo_por_movimentacoes(esmalte), 7)
+
+    def test_material_de_outro_salao_nao_e_aceito(self):
+        outro = Material.objects.create(salao=self.outro_salao, nome='Alheio', modulo='geral', quantidade=5)
+        self.client.force_login(self.admin)
+        resposta = self.client.post(reverse('gestao_estoque'), {
+            'movimentar': '1', 'material': outro.pk, 'tipo': 'saida', 'quantidade': '1',
+        })
+        self.assertIn('material', resposta.context['movimentacao_form'].errors)
+
+
+class SnapshotEstoqueTests(GestaoTestMixin, TestCase):
+
+    def setUp(self):
+        self.hoje = timezone.localdate()
+        self.tinta = Material.objects.create(
+            salao=self.salao, nome='Tinta', modulo='cabelo', quantidade=0, custo_unitario=Decimal('2.50')
+        )
+        Material.objects.filter(pk=self.tinta.pk).update(criado_em=self.momento(10))
+        for dias, tipo, quantidade in ((9, 'entrada', 10), (5, 'saida', 3), (2, 'entrada', 4), (0, 'saida', 1)):
+            movimentacao = registrar_movimentacao(self.tinta, tipo, quantidade)
+            MovimentacaoEstoque.objects.filter(pk=movimentacao.pk).update(criado_em=self.momento(dias))
+        # Material cadastrado hoje não aparece em inventários passados
+        Material.objects.create(salao=self.salao, nome='Novo', modulo='geral', quantidade=5)
+
+    def momento(self, dias_atras):
+        return timezone.make_aware(datetime.combine(self.hoje - timedelta(days=dias_atras), time(12)))
+
+    def quantidade_em(self, dias_atras):
+        with usar_salao(self.salao):
+            return {m.nome: m.quantidade_em for m in estoque_em(self.hoje - timedelta(days=dias_atras))}
+
+    def test_sem_snapshot_usa_estoque_atual(self):
+        esperado = {10: 0, 9: 10, 6: 10, 5: 7, 3: 7, 2: 11, 1: 11}
+        for dias, quantidade in esperado.items():
+            self.assertEqual(self.quantidade_em(dias), {'Tinta': quantidade}, dias)
+        self.assertEqual(self.quantidade_em(0), {'Tinta': 10, 'Novo': 5})
+
+    def test_snapshot_mais_movimentacoes_desde_ele(self):
+        self.assertEqual(gerar_snapshots(self.hoje - timedelta(days=5), self.salao), 1)
+        snapshot = SnapshotEstoque.objects.get()
+        self.assertEqual((snapshot.quantidade, snapshot.valor_total), (7, Decimal('17.50')))
+
+        # A consulta parte do snapshot: alterá-lo muda as datas posteriores, não as anteriores
+        SnapshotEstoque.objects.update(quantidade=100)
+        with usar_salao(self.salao), self.assertNumQueries(1):
+            materiais = list(estoque_em(self.hoje - timedelta(days=1)))
+        self.assertEqual(materiais[0].quantidade_em, 104)
+        self.assertEqual(self.quantidade_em(5), {'Tinta': 100})
+        self.assertEqual(self.quantidade_em(6), {'Tinta': 10})
+
+    def test_valorizacao(self):
+        gerar_snapshots(self.hoje - timedelta(days=3))
+        Material.objects.filter(pk=self.tinta.pk).update(custo_unitario=Decimal('4.00'))
+        with usar_salao(self.salao):
+            # Custo do snapshot para datas cobertas por ele, custo atual antes dele
+            self.assertEqual(valor_estoque_em(self.hoje - timedelta(days=1)), Decimal('27.50'))
+            self.assertEqual(valor_estoque_em(self.hoje - timedelta(days=6)), Decimal('40.00'))
+
+    def test_comando(self):
+        saida = StringIO()
+        call_command('gerar_snapshots_estoque', stdout=saida)
+        call_command('gerar_snapshots_estoque', stdout=saida)
+        self.assertEqual(SnapshotEstoque.objects.get().quantidade, 11)
+        with self.assertRaises(CommandError):
+            call_command('gerar_snapshots_estoque', '--data', self.hoje.isoformat(), stdout=saida)
+
+    def test_view_inventario(self):
+        self.client.force_login(self.admin)
+        resposta = self.client.get(reverse('gestao_estoque'), {'em': (self.hoje - timedelta(days=5)).isoformat()})
+        self.assertEqual([m.quantidade_em for m in resposta.context['inventario']], [7])
+        self.assertEqual(resposta.context['valor_inventario'], Decimal('17.50'))
+
+
+class PlanoConsultasTests(GestaoTestMixin, PlanoConsultaMixin, TestCase):
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def test_proximos_agendamentos_sem_cancelados(self):
+        with usar_salao(self.salao):
+            proximos = Agendamento.objects.filter(data__gte=self.hoje).exclude(status='cancelado').order_by(
+                'data', 'hora'
+            )[:10]
+            self.assertUsaIndice(proximos, 'agendamento_salao_ativos')
+
+    def test_transacoes_pendentes(self):
+        with usar_salao(self.salao):
+            pendentes = Transacao.objects.filter(pago=False).order_by('-data', '-criado_em', '-id')
+            self.assertUsaIndice(pendentes, 'transacao_salao_pendentes')
+
+    def test_listagens_do_salao(self):
+        with usar_salao(self.salao):
+            self.assertUsaIndice(Material.objects.order_by('modulo', 'nome'), 'material_salao_modulo_nome')
+            self.assertUsaIndice(Servico.objects.order_by('modulo', 'nome'), 'servico_salao_modulo_nome')
+        self.assertUsaIndice(
+            MovimentacaoEstoque._base_manager.filter(salao=self.salao).order_by('criado_em', 'id'),
+            'movimentacao_salao_data',
+        )
+
+    def test_views_da_gestao(self):
+        self.transacao('100.00')
+        urls = [
+            reverse('admin_dashboard'),
+            reverse('gestao_financeiro'),
+            reverse('gestao_financeiro') + '?tipo=despesa&pago=false',
+            reverse('gestao_financeiro') + f'?categoria=servico&data_inicio={self.hoje}',
+            reverse('gestao_estoque') + f'?em={self.hoje - timedelta(days=1)}',
+            reverse('gestao_servicos'),
+            reverse('gestao_profissionais'),
+        ]
+        for url in urls:
+            with self.subTest(url), self.assertConsultasUsamIndices():
+                self.assertEqual(self.client.get(url).status_code, 200)
+
+    def test_exportacoes(self):
+        for nome in EXPORTACOES:
+            with self.subTest(nome), self.assertConsultasUsamIndices():
+                list(linhas_exportacao(nome, self.salao, self.hoje - timedelta(days=30), self.hoje))
+
+    def test_exportacao_de_movimentacoes_filtra_o_periodo_pelo_indice(self):
+        consulta = consulta_exportacao('movimentacoes', self.salao, self.hoje - timedelta(days=30), self.hoje)
+        self.assertUsaIndice(consulta, 'movimentacao_salao_data')
+        # O período entra na busca do índice, e não só o salão
+        plano = self.plano(*consulta.query.sql_with_params())
+        self.assertRegex(plano, r'criado_em ?>', plano)
+
+
+class DesempenhoTests(CargaTestMixin, TestCase):
+    """Orçamento de consultas das views de gestao/urls.py"""
+
+    def test_views(self):
+        ontem = date.today() - timedelta(days=1)
+        orcamentos = [
+            # (url, consultas, dados)
+            (reverse('admin_dashboard'), 3, None),
+            (reverse('gestao_profissionais'), 4, None),
+            (reverse('gestao_servicos'), 3, None),
+            (reverse('gestao_estoque'), 3, None),
+            (reverse('gestao_estoque'), 4, {'em': ontem}),
+            (reverse('gestao_financeiro'), 6, None),
+            (reverse('gestao_financeiro'), 6, {'tipo': 'despesa', 'pago': 'false'}),
+            (reverse('gestao_importar'), 1, None),
+            (reverse('gestao_exportar', args=['transacoes', 'csv']), 2, None),
+            (reverse('gestao_exportar', args=['agendamentos', 'csv']), 2, None),
+            (reverse('gestao_exportar', args=['movimentacoes', 'xlsx']), 2, None),
+        ]
+        for url, consultas, dados in orcamentos:
+            with self.subTest(url=url, dados=dados):
+                self.orcamento_view(url, consultas, dados=dados, usuario=self.admin)
 
-# Create your tests here.
+    def test_paginacao_do_financeiro_sob_carga(self):
+        url = reverse('gestao_financeiro')
+        resposta = self.orcamento_view(url, 6, usuario=self.admin)
+        vistas = len(resposta.context['transacoes'])
+        while resposta.context['proxima_pagina']:
+            resposta = self.orcamento_view(url + resposta.context['proxima_pagina'], 6, usuario=self.admin)
+            vistas += len(resposta.context['transacoes'])
+        self.assertEqual(vistas, self.carga['transacoes'])
@@ -7,4 +7,6 @@ urlpatterns = [
     path('servicos/', views.gestao_servicos, name='gestao_servicos'),
     path('estoque/', views.gestao_estoque, name='gestao_estoque'),
     path('financeiro/', views.gestao_financeiro, name='gestao_financeiro'),
+    path('importar/', views.importar, name='gestao_importar'),
+    path('exportar/<slug:nome>.<slug:formato>', views.exportar, name='gestao_exportar'),
 ]
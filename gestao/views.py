@@ -1,12 +1,22 @@
-from django.shortcuts import render, redirect, get_object_or_404
+from django.shortcuts import render, redirect
+from django.http import Http404, HttpResponseBadRequest, StreamingHttpResponse
 from django.contrib.auth.decorators import login_required, user_passes_test
 from django.contrib import messages
-from django.db.models import Sum, Count, Q, F
-from django.db import models
-from datetime import date, timedelta
+from django.core.exceptions import ValidationError
+from datetime import date
+from urllib.parse import urlencode
+from core.replicas import iterar_na_replica, replica_para_leitura
 from servicos.models import Agendamento, Profissional, Servico
-from .models import Material, Transacao, MovimentacaoEstoque
-from .forms import MaterialForm, TransacaoForm, ProfissionalForm, ServicoForm
+from .models import Material
+from .forms import (
+    MaterialForm, TransacaoForm, ProfissionalForm, ServicoForm, MovimentacaoEstoqueForm,
+    FiltroTransacaoForm, PeriodoForm, ImportacaoForm, InventarioForm,
+)
+from .dashboard import estatisticas_dashboard
+from .estoque import estoque_em, registrar_movimentacao
+from .exportacao import EXPORTACOES, FORMATOS, cabecalho, linhas_exportacao
+from .financeiro import decodificar_cursor, pagina_transacoes, totais_por_tipo
+from .importacao import importar_csv
 
 def is_admin(user):
     """Verifica se usuário é admin"""
@@ -14,53 +24,31 @@ def is_admin(user):
 
 @login_required
 @user_passes_test(is_admin)
+@replica_para_leitura
 def admin_dashboard(request):
     """Dashboard administrativo"""
     hoje = date.today()
-    mes_atual = hoje.replace(day=1)
-    
-    # Estatísticas
-    total_agendamentos_mes = Agendamento.objects.filter(
-        data__gte=mes_atual
-    ).count()
-    
-    agendamentos_hoje = Agendamento.objects.filter(data=hoje).count()
-    
-    # Financeiro do mês
-    receitas_mes = Transacao.objects.filter(
-        tipo='receita',
-        data__gte=mes_atual,
-        pago=True
-    ).aggregate(total=Sum('valor'))['total'] or 0
-    
-    despesas_mes = Transacao.objects.filter(
-        tipo='despesa',
-        data__gte=mes_atual,
-        pago=True
-    ).aggregate(total=Sum('valor'))['total'] or 0
-    
-    saldo_mes = receitas_mes - despesas_mes
     
+    # Estatísticas (uma consulta, em cache por salão)
+    estatisticas = estatisticas_dashboard(getattr(request.salao, 'id', None), hoje)
+    saldo_mes = estatisticas['receitas_mes'] - estatisticas['despesas_mes']
     saldo_class = 'success' if saldo_mes >= 0 else 'danger'
     
-    # Materiais com estoque baixo
-    materiais_baixo = Material.objects.filter(
-        quantidade__lte=models.F('estoque_minimo')
-    ).count()
-   
     # Próximos agendamentos
     proximos_agendamentos = Agendamento.objects.filter(
         data__gte=hoje
-    ).exclude(status='cancelado').select_related('servico', 'cliente', 'profissional').order_by('data', 'hora')[:10]
+    ).exclude(status='cancelado').select_related(
+        'servico', 'cliente', 'profissional__usuario'
+    ).order_by('data', 'hora')[:10]
     
     context = {
-        'total_agendamentos_mes': total_agendamentos_mes,
-        'agendamentos_hoje': agendamentos_hoje,
-        'receitas_mes': receitas_mes,
-        'despesas_mes': despesas_mes,
+        'total_agendamentos_mes': estatisticas['total_agendamentos_mes'],
+        'agendamentos_hoje': estatisticas['agendamentos_hoje'],
+        'receitas_mes': estatisticas['receitas_mes'],
+        'despesas_mes': estatisticas['despesas_mes'],
         'saldo_mes': saldo_mes,
         'saldo_class': saldo_class,
-        'materiais_baixo': materiais_baixo,
+        'materiais_baixo': estatisticas['materiais_baixo'],
         'proximos_agendamentos': proximos_agendamentos,
         'today': hoje,
     }
@@ -71,7 +59,7 @@ def admin_dashboard(request):
 @user_passes_test(is_admin)
 def gestao_profissionais(request):
     """Gestão de profissionais"""
-    profissionais = Profissional.objects.all().order_by('usuario__first_name')
+    profissionais = Profissional.objects.select_related('usuario').order_by('usuario__first_name')
     
     if request.method == 'POST':
         form = ProfissionalForm(request.POST)
@@ -120,7 +108,7 @@ def gestao_profissionais(request):
 @user_passes_test(is_admin)
 def gestao_servicos(request):
     """Gestão de serviços"""
-    servicos = Servico.objects.all().order_by('modulo', 'nome')
+    servicos = Servico.objects.select_related('modulo').order_by('modulo', 'nome')
     
     if request.method == 'POST':
         form = ServicoForm(request.POST)
@@ -142,37 +130,93 @@ def gestao_servicos(request):
 
 @login_required
 @user_passes_test(is_admin)
+@replica_para_leitura
 def gestao_estoque(request):
     """Gestão de estoque"""
     materiais = Material.objects.all().order_by('modulo', 'nome')
+    form = MaterialForm()
+    movimentacao_form = MovimentacaoEstoqueForm()
     
-    if request.method == 'POST':
+    if request.method == 'POST' and 'movimentar' in request.POST:
+        movimentacao_form = MovimentacaoEstoqueForm(request.POST)
+        if movimentacao_form.is_valid():
+            dados = movimentacao_form.cleaned_data
+            try:
+                registrar_movimentacao(
+                    dados['material'], dados['tipo'], dados['quantidade'],
+                    usuario=request.user, motivo=dados['motivo'],
+                )
+            except ValidationError as erro:
+                movimentacao_form.add_error(None, erro)
+            else:
+                messages.success(request, 'Movimentação registrada com sucesso!')
+                return redirect('gestao_estoque')
+    elif request.method == 'POST':
         form = MaterialForm(request.POST)
         if form.is_valid():
             material = form.save(commit=False)
             material.salao = request.salao
+            # O estoque inicial entra como movimentação, para o histórico reconciliar
+            quantidade_inicial = material.quantidade
+            material.quantidade = 0
             material.save()
+            if quantidade_inicial:
+                registrar_movimentacao(
+                    material, 'entrada', quantidade_inicial, usuario=request.user, motivo='Estoque inicial'
+                )
             messages.success(request, 'Material cadastrado com sucesso!')
             return redirect('gestao_estoque')
-    else:
-        form = MaterialForm()
+    
+    # Inventário em uma data passada (snapshot mais próximo + movimentações desde ele)
+    inventario_form = InventarioForm(request.GET or None)
+    inventario = None
+    if inventario_form.is_valid():
+        inventario = list(estoque_em(inventario_form.cleaned_data['em']).order_by('modulo', 'nome'))
     
     context = {
         'materiais': materiais,
         'form': form,
+        'movimentacao_form': movimentacao_form,
+        'inventario_form': inventario_form,
+        'inventario': inventario,
+        'valor_inventario': sum(material.valor_em for material in inventario or []),
     }
     return render(request, 'gestao/estoque.html', context)
 
 
 @login_required
 @user_passes_test(is_admin)
+@replica_para_leitura
 def gestao_financeiro(request):
     """Gestão financeira"""
-    transacoes = Transacao.objects.all().order_by('-data')[:50]
+    filtro_form = FiltroTransacaoForm(request.GET or None)
+    filtros = filtro_form.filtros()
+    
+    # Paginação por chave: o cursor aponta para a última transação da página anterior
+    try:
+        cursor = decodificar_cursor(request.GET['cursor']) if request.GET.get('cursor') else None
+    except ValueError:
+        cursor = None
+    transacoes, proximo_cursor = pagina_transacoes(cursor=cursor, **filtros)
+    
+    proxima_pagina = None
+    if proximo_cursor:
+        parametros = request.GET.copy()
+        parametros['cursor'] = proximo_cursor
+        proxima_pagina = f'?{parametros.urlencode()}'
+    primeira_pagina = None
+    if cursor:
+        parametros = request.GET.copy()
+        parametros.pop('cursor')
+        primeira_pagina = f'?{parametros.urlencode()}'
+    
+    # Links de exportação do mesmo período
+    periodo_exportacao = urlencode({
+        campo: request.GET[campo] for campo in ('data_inicio', 'data_fim') if request.GET.get(campo)
+    })
     
-    # Totais
-    total_receitas = Transacao.objects.filter(tipo='receita', pago=True).aggregate(total=Sum('valor'))['total'] or 0
-    total_despesas = Transacao.objects.filter(tipo='despesa', pago=True).aggregate(total=Sum('valor'))['total'] or 0
+    # Totais do período filtrado (lidos do resumo diário); por padrão, só o que foi pago
+    total_receitas, total_despesas = totais_por_tipo(**{'pago': True, **filtros})
     saldo = total_receitas - total_despesas
     saldo_class = 'success' if saldo >= 0 else 'danger'
     
@@ -190,9 +234,71 @@ def gestao_financeiro(request):
     context = {
         'transacoes': transacoes,
         'form': form,
+        'filtro_form': filtro_form,
+        'proxima_pagina': proxima_pagina,
+        'primeira_pagina': primeira_pagina,
+        'periodo_exportacao': periodo_exportacao,
         'total_receitas': total_receitas,
         'total_despesas': total_despesas,
         'saldo': saldo,
         'saldo_class': saldo_class,
     }
     return render(request, 'gestao/financeiro.html', context)
+
+
+@login_required
+@user_passes_test(is_admin)
+@replica_para_leitura
+def exportar(request, nome, formato):
+    """Exporta transações, agendamentos ou movimentações em CSV/XLSX (streaming)"""
+    if nome not in EXPORTACOES or formato not in FORMATOS or request.salao is None:
+        raise Http404
+    
+    periodo = PeriodoForm(request.GET)
+    if not periodo.is_valid():
+        return HttpResponseBadRequest(periodo.errors.as_text())
+    
+    gerar, content_type = FORMATOS[formato]
+    # As linhas são lidas durante o streaming, depois que a view retorna
+    linhas = iterar_na_replica(linhas_exportacao(nome, request.salao, **periodo.filtros()))
+    response = StreamingHttpResponse(gerar(cabecalho(nome), linhas), content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="{nome}-{date.today():%Y%m%d}.{formato}"'
+    return response
+
+
+@login_required
+@user_passes_test(is_admin)
+def importar(request):
+    """Importação em massa de materiais, serviços ou transações a partir de CSV"""
+    resultado = None
+    
+    if request.method == 'POST':
+        form = ImportacaoForm(request.POST, request.FILES)
+        if form.is_valid():
+            if request.salao is None:
+                raise Http404
+            try:
+                resultado = importar_csv(
+                    form.cleaned_data['arquivo'].file,
+                    form.cleaned_data['tipo'],
+                    request.salao,
+                    simular=form.cleaned_data['simular'],
+                    usuario=request.user,
+                )
+            except ValidationError as erro:
+                form.add_error('arquivo', erro)
+            else:
+                if not resultado.sucesso:
+                    messages.error(request, f'{resultado.total_erros} linha(s) com erro. Nada foi importado.')
+                elif resultado.simulacao:
+                    messages.info(request, f'{resultado.linhas} linha(s) válidas. Nada foi gravado (simulação).')
+                else:
+                    messages.success(request, f'{resultado.importadas} registro(s) importados com sucesso!')
+    else:
+        form = ImportacaoForm()
+    
+    context = {
+        'form': form,
+        'resultado': resultado,
+    }
+    return render(request, 'gestao/importar.html', context)
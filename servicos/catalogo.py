@@ -0,0 +1,118 @@
+"""
+Catálogos do salão lidos em quase toda página de agendamento.
+
+Os módulos, os serviços ativos, os profissionais ativos (com os módulos que
+atendem) e o HTML da página servicos_lista ficam no CacheSalao `catalogo`,
+no namespace de cada salão. Gravações de Servico, Profissional (inclusive
+dos seus módulos) e Salao, que liga e desliga módulos, passam o salão para
+uma nova geração; gravações de Modulo, todos os salões (ver
+servicos.signals). Assim o catálogo de um salão vai ao banco uma vez por
+alteração, e não uma vez por requisição.
+
+Os serviços e profissionais ficam compartilhados entre as requisições do
+processo; as funções abaixo devolvem cópias rasas deles, que a requisição
+pode alterar (ou associar a outros objetos) sem afetar o cache. Os módulos,
+apenas lidos, não são copiados.
+"""
+import copy
+
+from django.conf import settings
+from django.template.loader import render_to_string
+
+from core.utils import CacheSalao
+from .models import Modulo, Profissional, Servico
+
+CATALOGO_CACHE_TIMEOUT = getattr(settings, 'CATALOGO_CACHE_TIMEOUT', 60 * 60)
+
+catalogo = CacheSalao(
+    'catalogo',
+    timeout=CATALOGO_CACHE_TIMEOUT,
+    ttl_local=getattr(settings, 'CATALOGO_CACHE_LOCAL_TTL', 60 * 5),
+)
+
+
+def invalidar_catalogo(salao_id):
+    """Faz o próximo acesso ao catálogo do salão ir ao banco"""
+    catalogo.invalidar(salao_id)
+
+
+def invalidar_modulos():
+    """Descarta os módulos e o catálogo de todos os salões"""
+    catalogo.invalidar(None)
+
+
+def modulos():
+    """Módulos em ordem de cadastro"""
+    return catalogo.obter(None, 'modulos', lambda: list(Modulo.objects.order_by('pk')))
+
+
+def _servicos_ativos(salao_id):
+    def carregar():
+        servicos = Servico._base_manager.filter(salao_id=salao_id, ativo=True).select_related('modulo')
+        return {servico.pk: servico for servico in servicos.order_by('nome')}
+    return catalogo.obter(salao_id, 'servicos', carregar)
+
+
+def servicos_ativos(salao_id):
+    """{id: servico} dos serviços ativos do salão (com o módulo), em ordem de nome"""
+    return {pk: copy.copy(servico) for pk, servico in _servicos_ativos(salao_id).items()}
+
+
+def servico_ativo(salao_id, servico_id):
+    """Serviço ativo do salão (com o módulo), ou None"""
+    servico = _servicos_ativos(salao_id).get(servico_id)
+    return copy.copy(servico) if servico is not None else None
+
+
+def _profissionais_ativos(salao_id):
+    # Uma consulta, pela tabela de ligação Profissional-Modulo
+    def carregar():
+        vinculos = (
+            Profissional.modulos.through.objects
+            .filter(profissional__salao_id=salao_id, profissional__ativo=True)
+            .select_related('profissional__usuario')
+            .order_by('profissional__usuario__first_name', 'profissional_id')
+        )
+        profissionais = {}
+        for vinculo in vinculos:
+            profissional = profissionais.setdefault(vinculo.profissional_id, vinculo.profissional)
+            profissional.modulo_ids = getattr(profissional, 'modulo_ids', frozenset()) | {vinculo.modulo_id}
+        return list(profissionais.values())
+    return catalogo.obter(salao_id, 'profissionais', carregar)
+
+
+def profissionais_ativos(salao_id):
+    """
+    Profissionais ativos do salão que atendem algum módulo, com o usuário e
+    os ids dos módulos em `modulo_ids`, em ordem de nome.
+    """
+    return [copy.copy(profissional) for profissional in _profissionais_ativos(salao_id)]
+
+
+def profissionais_do_modulo(salao_id, modulo_id):
+    """Profissionais ativos do salão que atendem o módulo"""
+    return [
+        copy.copy(profissional) for profissional in _profissionais_ativos(salao_id)
+        if modulo_id in profissional.modulo_ids
+    ]
+
+
+def servicos_por_modulo(salao):
+    """{modulo: [servicos ativos]} dos módulos ligados no salão"""
+    ligados = [
+        modulo for modulo in modulos()
+        if getattr(salao, f'modulo_{modulo.nome}', True)
+    ]
+    agrupados = {modulo.pk: [] for modulo in ligados}
+    for servico in _servicos_ativos(salao.id).values():
+        if servico.modulo_id in agrupados:
+            agrupados[servico.modulo_id].append(servico)
+    return {modulo: agrupados[modulo.pk] for modulo in ligados if agrupados[modulo.pk]}
+
+
+async def catalogo_html(request, salao):
+    """HTML do catálogo do salão, do cache ou renderizado e guardado"""
+    def renderizar():
+        contexto = {'servicos_por_modulo': servicos_por_modulo(salao)}
+        return render_to_string('servicos/catalogo.html', contexto, request=request)
+    return await catalogo.aobter(salao.id, 'html', renderizar)
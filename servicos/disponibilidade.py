@@ -0,0 +1,147 @@
+from datetime import time, timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+from django.utils import timezone
+
+from core.shards import banco_de
+from .catalogo import profissionais_do_modulo
+from .models import Agendamento
+
+# Granularidade dos horários oferecidos ao cliente
+INTERVALO_MINUTOS = getattr(settings, 'AGENDAMENTO_INTERVALO_MINUTOS', 30)
+
+# Tempo de vida da ocupação de um profissional em um dia
+CACHE_TIMEOUT = getattr(settings, 'DISPONIBILIDADE_CACHE_TIMEOUT', 60 * 10)
+
+
+def _minutos(hora):
+    """Converte um time em minutos desde a meia-noite"""
+    return hora.hour * 60 + hora.minute
+
+
+def _hora(minutos):
+    """Converte minutos desde a meia-noite em time"""
+    return time(minutos // 60, minutos % 60)
+
+
+def chave_cache(salao_id, profissional_id, dia, banco=DEFAULT_DB_ALIAS):
+    """
+    Chave de cache da ocupação de um profissional em um dia. Os ids dos
+    profissionais mudam quando o salão troca de shard, por isso a chave
+    inclui o banco.
+    """
+    return f'disponibilidade:{salao_id}:{banco}:{profissional_id}:{dia.isoformat()}'
+
+
+def invalidar_disponibilidade(salao_id, profissional_id, dia, banco=DEFAULT_DB_ALIAS):
+    """Descarta a ocupação em cache de um profissional em um dia"""
+    cache.delete(chave_cache(salao_id, profissional_id, dia, banco))
+
+
+def ocupacao(profissionais, data_inicio, data_fim):
+    """
+    Retorna {(profissional_id, dia): [(inicio, fim), ...]} com os intervalos
+    ocupados (em minutos) de cada profissional no período.
+
+    Os dias já em cache não vão ao banco; os demais são carregados com uma
+    única consulta que cobre todo o período faltante.
+    """
+    dias = [data_inicio + timedelta(days=n) for n in range((data_fim - data_inicio).days + 1)]
+    banco = banco_de(Agendamento)
+    chaves = {
+        chave_cache(prof.salao_id, prof.id, dia, banco): (prof.id, dia)
+        for prof in profissionais
+        for dia in dias
+    }
+
+    resultado = {}
+    for chave, intervalos in cache.get_many(list(chaves)).items():
+        resultado[chaves[chave]] = intervalos
+
+    faltantes = [chaves[chave] for chave in chaves if chaves[chave] not in resultado]
+    if not faltantes:
+        return resultado
+
+    carregados = {item: [] for item in faltantes}
+    agendamentos = Agendamento.objects.filter(
+        profissional_id__in={prof_id for prof_id, _ in faltantes},
+        data__range=(min(dia for _, dia in faltantes), max(dia for _, dia in faltantes)),
+    ).exclude(status='cancelado').values_list('profissional_id', 'data', 'hora', 'hora_fim')
+    for prof_id, dia, hora, hora_fim in agendamentos:
+        if (prof_id, dia) in carregados:
+            carregados[(prof_id, dia)].append((_minutos(hora), _minutos(hora_fim)))
+
+    salao_por_profissional = {prof.id: prof.salao_id for prof in profissionais}
+    cache.set_many(
+        {
+            chave_cache(salao_por_profissional[prof_id], prof_id, dia, banco): sorted(intervalos)
+            for (prof_id, dia), intervalos in carregados.items()
+        },
+        CACHE_TIMEOUT,
+    )
+    resultado.update(carregados)
+    return resultado
+
+
+def horarios_livres(profissional, dia, duracao, ocupados, agora=None):
+    """Lista os horários de início livres de um profissional em um dia"""
+    if dia.weekday() not in profissional.dias_trabalho():
+        return []
+
+    agora = agora or timezone.localtime()
+    if dia < agora.date():
+        return []
+
+    inicio = _minutos(profissional.horario_inicio)
+    fim = _minutos(profissional.horario_fim)
+    if dia == agora.date():
+        # Não oferece horários que já passaram
+        minimo = _minutos(agora.time()) + 1
+        while inicio < minimo:
+            inicio += INTERVALO_MINUTOS
+
+    horarios = []
+    for minuto in range(inicio, fim - duracao + 1, INTERVALO_MINUTOS):
+        termino = minuto + duracao
+        if any(ocup_inicio < termino and ocup_fim > minuto for ocup_inicio, ocup_fim in ocupados):
+            continue
+        horarios.append(_hora(minuto))
+    return horarios
+
+
+def horarios_disponiveis(servico, data_inicio, data_fim=None, profissional=None):
+    """
+    Calcula os horários livres para um serviço em um período.
+
+    Retorna uma lista de (dia, [(profissional, [horarios])]) ordenada por dia,
+    considerando o expediente de cada profissional que atende o módulo do
+    serviço e a duração dos agendamentos já existentes.
+    """
+    data_fim = data_fim or data_inicio
+
+    profissionais = profissionais_do_modulo(servico.salao_id, servico.modulo_id)
+    if profissional is not None:
+        profissional_id = getattr(profissional, 'pk', profissional)
+        profissionais = [prof for prof in profissionais if prof.pk == profissional_id]
+
+    if not profissionais or data_fim < data_inicio:
+        return []
+
+    ocupados = ocupacao(profissionais, data_inicio, data_fim)
+    agora = timezone.localtime()
+
+    resultado = []
+    dia = data_inicio
+    while dia <= data_fim:
+        livres = []
+        for prof in profissionais:
+            horarios = horarios_livres(
+                prof, dia, servico.duracao_minutos, ocupados.get((prof.id, dia), []), agora
+            )
+            if horarios:
+                livres.append((prof, horarios))
+        resultado.append((dia, livres))
+        dia += timedelta(days=1)
+    return resultado
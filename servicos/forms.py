@@ -1,9 +1,37 @@
 from django import forms
 from crispy_forms.helper import FormHelper
 from crispy_forms.layout import Layout, Submit
-from .models import Agendamento, Profissional
+from .catalogo import profissionais_do_modulo
+from .models import Agendamento
 from datetime import date
 
+
+class ProfissionalChoiceField(forms.ChoiceField):
+    """
+    Escolha entre profissionais já carregados (catálogo em cache do salão):
+    renderizar e validar não consultam o banco. O valor limpo é o
+    Profissional, como no ModelChoiceField.
+    """
+
+    def __init__(self, profissionais, **kwargs):
+        self.profissionais = {str(profissional.pk): profissional for profissional in profissionais}
+        choices = [('', '---------')] + [(pk, str(profissional)) for pk, profissional in self.profissionais.items()]
+        super().__init__(choices=choices, **kwargs)
+
+    def to_python(self, value):
+        if value in self.empty_values:
+            return None
+        try:
+            return self.profissionais[str(getattr(value, 'pk', value))]
+        except KeyError:
+            raise forms.ValidationError(
+                self.error_messages['invalid_choice'], code='invalid_choice', params={'value': value}
+            )
+
+    def validate(self, value):
+        forms.Field.validate(self, value)
+
+
 class AgendamentoForm(forms.ModelForm):
     """Formulário de agendamento"""
     
@@ -25,12 +53,15 @@ class AgendamentoForm(forms.ModelForm):
     def __init__(self, *args, **kwargs):
         servico = kwargs.pop('servico', None)
         super().__init__(*args, **kwargs)
+        self.servico = servico
         
         if servico:
-            # Filtra profissionais que atendem o módulo do serviço
-            self.fields['profissional'].queryset = Profissional.objects.filter(
-                modulos=servico.modulo,
-                ativo=True
+            # Profissionais que atendem o módulo do serviço, do catálogo do salão
+            campo = self.fields['profissional']
+            self.fields['profissional'] = ProfissionalChoiceField(
+                profissionais_do_modulo(servico.salao_id, servico.modulo_id),
+                label=campo.label,
+                required=campo.required,
             )
         
         self.helper = FormHelper()
@@ -46,13 +77,12 @@ class AgendamentoForm(forms.ModelForm):
         if data and data < date.today():
             raise forms.ValidationError('Não é possível agendar para datas passadas.')
         
-        # Verifica se já existe agendamento no mesmo horário
-        if data and hora and profissional:
-            if Agendamento.objects.filter(
-                profissional=profissional,
-                data=data,
-                hora=hora
-            ).exclude(status='cancelado').exists():
+        # Verifica se o intervalo do serviço se sobrepõe a outro agendamento
+        if data and hora and profissional and self.servico:
+            hora_fim = Agendamento.calcular_hora_fim(hora, self.servico.duracao_minutos)
+            if Agendamento.conflitantes(
+                profissional, data, hora, hora_fim, excluir_pk=self.instance.pk
+            ).exists():
                 raise forms.ValidationError('Este horário já está ocupado. Escolha outro horário.')
         
         return cleaned_data
@@ -0,0 +1,70 @@
+from datetime import datetime, time, timedelta
+
+from django.db import migrations, models
+
+
+EXCLUSAO_SQL = """
+CREATE EXTENSION IF NOT EXISTS btree_gist;
+ALTER TABLE servicos_agendamento
+    ADD CONSTRAINT agendamento_sem_sobreposicao
+    EXCLUDE USING gist (
+        profissional_id WITH =,
+        tsrange(data + hora, data + hora_fim) WITH &&
+    ) WHERE (status <> 'cancelado');
+"""
+
+
+def preencher_hora_fim(apps, schema_editor):
+    Agendamento = apps.get_model('servicos', 'Agendamento')
+    agendamentos = Agendamento.objects.using(schema_editor.connection.alias).select_related('servico')
+    atualizados = []
+    for agendamento in agendamentos.iterator(chunk_size=2000):
+        fim = datetime.combine(datetime.min, agendamento.hora) + timedelta(minutes=agendamento.servico.duracao_minutos)
+        agendamento.hora_fim = fim.time() if fim.date() == datetime.min.date() else time(23, 59, 59)
+        atualizados.append(agendamento)
+        if len(atualizados) >= 2000:
+            Agendamento.objects.using(schema_editor.connection.alias).bulk_update(atualizados, ['hora_fim'])
+            atualizados = []
+    Agendamento.objects.using(schema_editor.connection.alias).bulk_update(atualizados, ['hora_fim'])
+
+
+def criar_restricao_exclusao(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(EXCLUSAO_SQL)
+
+
+def remover_restricao_exclusao(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(
+            'ALTER TABLE servicos_agendamento DROP CONSTRAINT IF EXISTS agendamento_sem_sobreposicao;'
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('servicos', '0002_agendamento_salao_profissional_salao_servico_salao'),
+    ]
+
+    operations = [
+        migrations.AlterUniqueTogether(
+            name='agendamento',
+            unique_together=set(),
+        ),
+        migrations.AddField(
+            model_name='agendamento',
+            name='hora_fim',
+            field=models.TimeField(editable=False, null=True, verbose_name='Hora de Término'),
+        ),
+        migrations.RunPython(preencher_hora_fim, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='agendamento',
+            name='hora_fim',
+            field=models.TimeField(editable=False, verbose_name='Hora de Término'),
+        ),
+        migrations.AddIndex(
+            model_name='agendamento',
+            index=models.Index(fields=['profissional', 'data', 'hora'], name='agendamento_prof_data_hora'),
+        ),
+        migrations.RunPython(criar_restricao_exclusao, remover_restricao_exclusao),
+    ]
@@ -0,0 +1,31 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('servicos', '0003_agendamento_hora_fim'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='servico',
+            index=models.Index(fields=['salao', 'modulo', 'nome'], name='servico_salao_modulo_nome'),
+        ),
+        migrations.AddIndex(
+            model_name='agendamento',
+            index=models.Index(fields=['salao', 'data', 'hora'], name='agendamento_salao_data_hora'),
+        ),
+        migrations.AddIndex(
+            model_name='agendamento',
+            index=models.Index(
+                fields=['salao', 'data', 'hora'],
+                condition=~models.Q(status='cancelado'),
+                name='agendamento_salao_ativos',
+            ),
+        ),
+        migrations.AddIndex(
+            model_name='agendamento',
+            index=models.Index(fields=['cliente', 'data', 'hora'], name='agendamento_cliente_data_hora'),
+        ),
+    ]
@@ -0,0 +1,20 @@
+from django.db import migrations
+
+from core.particionamento import impedir_reversao
+
+
+def reverter(apps, schema_editor):
+    impedir_reversao(apps.get_model('servicos', 'Agendamento'), schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('servicos', '0004_indices_salao'),
+    ]
+
+    operations = [
+        # Não converte a tabela: a partir daqui ela pode ser particionada pelo
+        # comando criar_particoes --converter (ver core.particionamento)
+        migrations.RunPython(migrations.RunPython.noop, reverter),
+    ]
@@ -0,0 +1,27 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('servicos', '0005_particionamento'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='agendamento',
+            name='salao',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='agendamentos', to='core.salao', verbose_name='Salão'),
+        ),
+        migrations.AlterField(
+            model_name='profissional',
+            name='salao',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='profissionais', to='core.salao', verbose_name='Salão'),
+        ),
+        migrations.AlterField(
+            model_name='servico',
+            name='salao',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='servicos', to='core.salao', verbose_name='Salão'),
+        ),
+    ]
@@ -1,7 +1,7 @@
-from django.db import models
+from django.db import models, router, transaction, IntegrityError
 from django.conf import settings
 from django.core.exceptions import ValidationError
-from datetime import datetime, timedelta
+from datetime import datetime, time, timedelta
 
 from core.models import Salao
 from core.utils import TenantManager
@@ -28,7 +28,10 @@ class Modulo(models.Model):
 
 class Servico(models.Model):
     """Serviços oferecidos pelo salão"""
-    salao = models.ForeignKey(Salao, on_delete=models.CASCADE, related_name='servicos', verbose_name='Salão')
+    # Sem índice só de salao: o servico_salao_modulo_nome já começa por ele
+    salao = models.ForeignKey(
+        Salao, on_delete=models.CASCADE, related_name='servicos', verbose_name='Salão', db_index=False
+    )
     nome = models.CharField('Nome do Serviço', max_length=200)
     modulo = models.ForeignKey(Modulo, on_delete=models.CASCADE, verbose_name='Módulo', related_name='servicos')
     descricao = models.TextField('Descrição', blank=True)
@@ -42,6 +45,10 @@ class Servico(models.Model):
         verbose_name = 'Serviço'
         verbose_name_plural = 'Serviços'
         ordering = ['modulo', 'nome']
+        indexes = [
+            # Catálogo do salão (serviços ativos por módulo) e listagem da gestão
+            models.Index(fields=['salao', 'modulo', 'nome'], name='servico_salao_modulo_nome'),
+        ]
     
     def __str__(self):
         return f"{self.nome} ({self.modulo}) - R$ {self.preco}"
@@ -107,7 +114,10 @@ class Agendamento(models.Model):
         ('cancelado', 'Cancelado'),
     )
     
-    salao = models.ForeignKey(Salao, on_delete=models.CASCADE, related_name='agendamentos', verbose_name='Salão')
+    # Sem índice só de salao: o agendamento_salao_data_hora já começa por ele
+    salao = models.ForeignKey(
+        Salao, on_delete=models.CASCADE, related_name='agendamentos', verbose_name='Salão', db_index=False
+    )
     cliente = models.ForeignKey(
         settings.AUTH_USER_MODEL,
         on_delete=models.CASCADE,
@@ -129,6 +139,7 @@ class Agendamento(models.Model):
     
     data = models.DateField('Data')
     hora = models.TimeField('Hora')
+    hora_fim = models.TimeField('Hora de Término', editable=False)
     status = models.CharField('Status', max_length=20, choices=STATUS_CHOICES, default='pendente')
     
     observacoes = models.TextField('Observações', blank=True)
@@ -142,11 +153,46 @@ class Agendamento(models.Model):
         verbose_name = 'Agendamento'
         verbose_name_plural = 'Agendamentos'
         ordering = ['-data', '-hora']
-        unique_together = ['profissional', 'data', 'hora']
+        indexes = [
+            # Consulta de sobreposição: profissional + dia + faixa de horário
+            models.Index(fields=['profissional', 'data', 'hora'], name='agendamento_prof_data_hora'),
+            # Agenda do salão por dia (estatísticas do dashboard, exportação)
+            models.Index(fields=['salao', 'data', 'hora'], name='agendamento_salao_data_hora'),
+            # Próximos agendamentos: os cancelados se acumulam e nunca são listados
+            models.Index(
+                fields=['salao', 'data', 'hora'],
+                condition=~models.Q(status='cancelado'),
+                name='agendamento_salao_ativos',
+            ),
+            # Agendamentos do cliente, mais recentes primeiro
+            models.Index(fields=['cliente', 'data', 'hora'], name='agendamento_cliente_data_hora'),
+        ]
     
     def __str__(self):
         return f"{self.cliente.get_full_name()} - {self.servico.nome} - {self.data} {self.hora}"
     
+    @staticmethod
+    def calcular_hora_fim(hora, duracao_minutos):
+        """Horário de término de um atendimento (limitado ao fim do dia)"""
+        inicio = datetime.combine(datetime.min, hora)
+        fim = inicio + timedelta(minutes=duracao_minutos)
+        if fim.date() != inicio.date():
+            return time.max.replace(microsecond=0)
+        return fim.time()
+    
+    @classmethod
+    def conflitantes(cls, profissional, data, hora, hora_fim, excluir_pk=None):
+        """Agendamentos não cancelados do profissional que se sobrepõem ao intervalo"""
+        conflitos = cls._base_manager.filter(
+            profissional=profissional,
+            data=data,
+            hora__lt=hora_fim,
+            hora_fim__gt=hora,
+        ).exclude(status='cancelado')
+        if excluir_pk:
+            conflitos = conflitos.exclude(pk=excluir_pk)
+        return conflitos
+    
     def clean(self):
         """Validações customizadas"""
         # Verifica se o profissional trabalha nesse dia
@@ -158,7 +204,43 @@ class Agendamento(models.Model):
             # Verifica horário de trabalho
             if self.hora < self.profissional.horario_inicio or self.hora >= self.profissional.horario_fim:
                 raise ValidationError(f'Horário fora do expediente do profissional ({self.profissional.horario_inicio} - {self.profissional.horario_fim}).')
+            
+            # Verifica sobreposição com outros agendamentos do profissional
+            if self.status != 'cancelado' and self.hora_fim and Agendamento.conflitantes(
+                self.profissional, self.data, self.hora, self.hora_fim, excluir_pk=self.pk
+            ).exists():
+                raise ValidationError('Este horário já está ocupado. Escolha outro horário.')
+    
+    def _travar_agenda(self, using):
+        """
+        Bloqueia a agenda do profissional até o fim da transação, serializando
+        agendamentos concorrentes. Usa SELECT ... FOR UPDATE quando o banco
+        suporta; caso contrário (SQLite) um UPDATE sem efeito obtém o lock de
+        escrita antes da verificação de conflitos.
+        """
+        profissionais = Profissional._base_manager.using(using).filter(pk=self.profissional_id)
+        if transaction.get_connection(using).features.has_select_for_update:
+            list(profissionais.select_for_update().values_list('pk'))
+        else:
+            profissionais.update(ativo=models.F('ativo'))
     
     def save(self, *args, **kwargs):
-        self.full_clean()
-        super().save(*args, **kwargs)
+        if self.hora is not None and self.servico_id:
+            self.hora_fim = self.calcular_hora_fim(self.hora, self.servico.duracao_minutos)
+        using = kwargs.get('using') or router.db_for_write(Agendamento, instance=self)
+        try:
+            with transaction.atomic(using=using):
+                if self.profissional_id:
+                    self._travar_agenda(using)
+                # A existência das chaves estrangeiras preenchidas é garantida pelo banco;
+                # validá-las aqui custaria uma consulta por relação a cada gravação
+                self.full_clean(exclude=[
+                    campo for campo in ('salao', 'cliente', 'profissional', 'servico')
+                    if getattr(self, f'{campo}_id') is not None
+                ])
+                super().save(*args, **kwargs)
+        except IntegrityError as erro:
+            # Restrição de exclusão do PostgreSQL (agendamento_sem_sobreposicao)
+            if 'agendamento_sem_sobreposicao' in str(erro):
+                raise ValidationError('Este horário já está ocupado. Escolha outro horário.') from erro
+            raise
@@ -0,0 +1,67 @@
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from core.models import Salao, Usuario
+from .catalogo import invalidar_catalogo, invalidar_modulos
+from .disponibilidade import invalidar_disponibilidade
+from .models import Agendamento, Modulo, Profissional, Servico
+
+
+@receiver(pre_save, sender=Agendamento)
+def guardar_horario_anterior(sender, instance, using, **kwargs):
+    """Guarda profissional e data originais para invalidar o dia antigo"""
+    instance._horario_anterior = None
+    if instance.pk and not instance._state.adding:
+        instance._horario_anterior = sender._base_manager.using(using).filter(pk=instance.pk).values_list(
+            'salao_id', 'profissional_id', 'data'
+        ).first()
+
+
+@receiver(post_save, sender=Agendamento)
+def invalidar_disponibilidade_agendamento(sender, instance, using, **kwargs):
+    """Salvar ou cancelar um agendamento muda a ocupação do profissional"""
+    invalidar_disponibilidade(instance.salao_id, instance.profissional_id, instance.data, using)
+    anterior = getattr(instance, '_horario_anterior', None)
+    if anterior and anterior != (instance.salao_id, instance.profissional_id, instance.data):
+        invalidar_disponibilidade(*anterior, using)
+
+
+@receiver(post_delete, sender=Agendamento)
+def invalidar_disponibilidade_exclusao(sender, instance, using, **kwargs):
+    invalidar_disponibilidade(instance.salao_id, instance.profissional_id, instance.data, using)
+
+
+@receiver(post_save, sender=Servico)
+@receiver(post_delete, sender=Servico)
+@receiver(post_save, sender=Profissional)
+@receiver(post_delete, sender=Profissional)
+@receiver(post_save, sender=Salao)
+def invalidar_catalogo_salao(sender, instance, **kwargs):
+    """Serviços, profissionais e módulos ligados no salão mudam o catálogo"""
+    invalidar_catalogo(instance.pk if sender is Salao else instance.salao_id)
+
+
+@receiver(m2m_changed, sender=Profissional.modulos.through)
+def invalidar_catalogo_modulos_profissional(sender, instance, action, reverse, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if reverse:
+        # Alteração feita a partir do Modulo: pode envolver vários salões
+        invalidar_modulos()
+    else:
+        invalidar_catalogo(instance.salao_id)
+
+
+@receiver(post_save, sender=Usuario)
+def invalidar_catalogo_usuario(sender, instance, update_fields=None, **kwargs):
+    """O nome do usuário aparece nos profissionais do catálogo"""
+    if instance.tipo != 'profissional' or (update_fields and set(update_fields) <= {'last_login'}):
+        return
+    for salao_id in Profissional._base_manager.filter(usuario=instance).values_list('salao_id', flat=True):
+        invalidar_catalogo(salao_id)
+
+
+@receiver(post_save, sender=Modulo)
+@receiver(post_delete, sender=Modulo)
+def invalidar_catalogo_modulos(sender, instance, **kwargs):
+    invalidar_modulos()
@@ -1,3 +1,383 @@
-from django.test import TestCase
+from datetime import date, time, timedelta
 
-# Create your tests here.
+from asgiref.sync import async_to_sync, sync_to_async
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.db import connection
+from django.http import Http404
+from django.test import RequestFactory, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from core.models import Salao, Usuario
+from core.testutils import CargaTestMixin, PlanoConsultaMixin
+from core.utils import usar_salao
+from . import catalogo, views
+from .disponibilidade import horarios_disponiveis
+from .forms import AgendamentoForm
+from .models import Agendamento, Modulo, Profissional, Servico
+
+
+def proxima_segunda():
+    hoje = date.today()
+    return hoje + timedelta(days=7 - hoje.weekday())
+
+
+class AgendaTestMixin:
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.salao = Salao.objects.create(nome='Salão Teste', subdominio='teste')
+        cls.modulo = Modulo.objects.create(nome='cabelo')
+        cls.cliente = Usuario.objects.create_user(username='cliente', password='senha', salao=cls.salao)
+        usuario_prof = Usuario.objects.create_user(
+            username='prof', password='senha', first_name='Ana', salao=cls.salao, tipo='profissional'
+        )
+        cls.profissional = Profissional.objects.create(
+            salao=cls.salao, usuario=usuario_prof, horario_inicio=time(9), horario_fim=time(13)
+        )
+        cls.profissional.modulos.add(cls.modulo)
+        cls.corte = Servico.objects.create(
+            salao=cls.salao, nome='Corte', modulo=cls.modulo, preco=50, duracao_minutos=60
+        )
+        cls.escova = Servico.objects.create(
+            salao=cls.salao, nome='Escova Progressiva', modulo=cls.modulo, preco=200, duracao_minutos=90
+        )
+        cls.segunda = proxima_segunda()
+
+    def setUp(self):
+        cache.clear()
+
+    def agendar(self, servico, hora, dia=None):
+        return Agendamento.objects.create(
+            salao=self.salao, cliente=self.cliente, profissional=self.profissional,
+            servico=servico, data=dia or self.segunda, hora=hora,
+        )
+
+
+class DisponibilidadeTests(AgendaTestMixin, TestCase):
+
+    def horarios(self, servico, dia=None):
+        dia = dia or self.segunda
+        disponibilidade = horarios_disponiveis(servico, dia)
+        return disponibilidade[0][1][0][1] if disponibilidade[0][1] else []
+
+    def test_expediente_e_duracao_do_servico(self):
+        self.assertEqual(
+            self.horarios(self.corte),
+            [time(9), time(9, 30), time(10), time(10, 30), time(11), time(11, 30), time(12)],
+        )
+
+    def test_agendamento_longo_bloqueia_horarios_sobrepostos(self):
+        self.agendar(self.escova, time(10))
+        self.assertEqual(self.horarios(self.corte), [time(9), time(11, 30), time(12)])
+
+    def test_dia_sem_expediente(self):
+        domingo = self.segunda + timedelta(days=6)
+        self.assertEqual(horarios_disponiveis(self.corte, domingo), [(domingo, [])])
+
+    def test_semana_usa_poucas_consultas_e_cache(self):
+        fim = self.segunda + timedelta(days=6)
+        with self.assertNumQueries(2):
+            horarios_disponiveis(self.corte, self.segunda, fim)
+        # Profissionais e ocupação da semana vêm do cache
+        with self.assertNumQueries(0):
+            horarios_disponiveis(self.corte, self.segunda, fim)
+
+    def test_cache_invalidado_ao_agendar_e_cancelar(self):
+        self.assertIn(time(10), self.horarios(self.corte))
+
+        agendamento = self.agendar(self.corte, time(10))
+        self.assertNotIn(time(10), self.horarios(self.corte))
+
+        agendamento.status = 'cancelado'
+        agendamento.save()
+        self.assertIn(time(10), self.horarios(self.corte))
+
+    def test_cache_invalidado_ao_mudar_de_dia(self):
+        agendamento = self.agendar(self.corte, time(10))
+        self.assertNotIn(time(10), self.horarios(self.corte))
+
+        agendamento.data = self.segunda + timedelta(days=1)
+        agendamento.save()
+        self.assertIn(time(10), self.horarios(self.corte))
+
+    def test_endpoint_json(self):
+        self.agendar(self.corte, time(9))
+        self.client.force_login(self.cliente)
+        resposta = self.client.get(
+            reverse('horarios_disponiveis', args=[self.corte.id]),
+            {'data': self.segunda.isoformat(), 'dias': 2},
+        )
+        self.assertEqual(resposta.status_code, 200)
+        dados = resposta.json()
+        self.assertEqual(len(dados['dias']), 2)
+        primeiro = dados['dias'][0]['profissionais'][0]
+        self.assertEqual(primeiro['id'], self.profissional.id)
+        self.assertEqual(primeiro['horarios'][0], '10:00')
+
+    def test_endpoint_rejeita_periodo_invalido(self):
+        self.client.force_login(self.cliente)
+        url = reverse('horarios_disponiveis', args=[self.corte.id])
+        self.assertEqual(self.client.get(url, {'dias': 90}).status_code, 400)
+        self.assertEqual(self.client.get(url, {'data': 'ontem'}).status_code, 400)
+
+
+class SobreposicaoTests(AgendaTestMixin, TestCase):
+
+    def test_hora_fim_calculada_pela_duracao(self):
+        agendamento = self.agendar(self.escova, time(10))
+        self.assertEqual(agendamento.hora_fim, time(11, 30))
+
+    def test_servico_longo_bloqueia_inicio_no_meio(self):
+        self.agendar(self.escova, time(10))
+        with self.assertRaisesMessage(ValidationError, 'ocupado'):
+            self.agendar(self.corte, time(10, 30))
+
+    def test_servico_que_invade_agendamento_seguinte(self):
+        self.agendar(self.corte, time(11))
+        with self.assertRaisesMessage(ValidationError, 'ocupado'):
+            self.agendar(self.escova, time(10))
+
+    def test_horarios_adjacentes_sao_permitidos(self):
+        self.agendar(self.corte, time(10))
+        self.agendar(self.corte, time(11))
+        self.agendar(self.corte, time(9))
+        self.assertEqual(Agendamento.objects.count(), 3)
+
+    def test_cancelado_libera_o_horario(self):
+        agendamento = self.agendar(self.escova, time(10))
+        agendamento.status = 'cancelado'
+        agendamento.save()
+        self.agendar(self.corte, time(10))
+        self.assertEqual(Agendamento.objects.exclude(status='cancelado').count(), 1)
+
+    def test_consulta_de_conflitos_usa_uma_query(self):
+        self.agendar(self.escova, time(10))
+        with self.assertNumQueries(1):
+            self.assertTrue(
+                Agendamento.conflitantes(self.profissional, self.segunda, time(11), time(12)).exists()
+            )
+
+    def test_form_considera_duracao(self):
+        self.agendar(self.escova, time(10))
+        form = AgendamentoForm(
+            data={'profissional': self.profissional.id, 'data': self.segunda, 'hora': '11:00'},
+            servico=self.corte,
+        )
+        self.assertFalse(form.is_valid())
+        self.assertIn('ocupado', str(form.non_field_errors()))
+
+
+
+class CatalogoTests(AgendaTestMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        catalogo.invalidar_modulos()
+        self.client.force_login(self.cliente)
+
+    def consultas_de_servicos(self):
+        with CaptureQueriesContext(connection) as contexto:
+            resposta = self.client.get(reverse('servicos_lista'))
+        self.assertEqual(resposta.status_code, 200)
+        return resposta, [
+            consulta['sql'] for consulta in contexto.captured_queries
+            if 'servicos_servico' in consulta['sql'] or 'servicos_modulo' in consulta['sql']
+        ]
+
+    def test_uma_consulta_agrupada(self):
+        pele = Modulo.objects.create(nome='pele', icone='bi-droplet')
+        Servico.objects.create(salao=self.salao, nome='Limpeza', modulo=pele, preco=80)
+        Servico.objects.create(salao=self.salao, nome='Inativo', modulo=pele, preco=80, ativo=False)
+        with self.assertNumQueries(2):
+            agrupados = catalogo.servicos_por_modulo(self.salao)
+        self.assertEqual(
+            {str(modulo): [servico.nome for servico in servicos] for modulo, servicos in agrupados.items()},
+            {'Cabelo': ['Corte', 'Escova Progressiva'], 'Pele': ['Limpeza']},
+        )
+        with self.assertNumQueries(0):
+            catalogo.servicos_por_modulo(self.salao)
+
+    def test_html_em_cache_ate_gravar_servico(self):
+        resposta, consultas = self.consultas_de_servicos()
+        self.assertContains(resposta, 'Escova Progressiva')
+        self.assertEqual(len(consultas), 2)
+
+        resposta, consultas = self.consultas_de_servicos()
+        self.assertContains(resposta, 'Escova Progressiva')
+        self.assertEqual(consultas, [])
+
+        Servico.objects.create(salao=self.salao, nome='Hidratação', modulo=self.modulo, preco=90)
+        resposta, consultas = self.consultas_de_servicos()
+        self.assertContains(resposta, 'Hidratação')
+        self.assertEqual(len(consultas), 1)
+
+        self.escova.delete()
+        resposta, _ = self.consultas_de_servicos()
+        self.assertNotContains(resposta, 'Escova Progressiva')
+
+    def test_cache_por_salao(self):
+        outro = Salao.objects.create(nome='Outro', subdominio='outro')
+        Servico.objects.create(salao=outro, nome='Serviço do Outro', modulo=self.modulo, preco=10)
+        self.consultas_de_servicos()
+        cliente_outro = Usuario.objects.create_user(username='cliente-outro', password='senha', salao=outro)
+        self.client.force_login(cliente_outro)
+        resposta, _ = self.consultas_de_servicos()
+        self.assertContains(resposta, 'Serviço do Outro')
+        self.assertNotContains(resposta, 'Escova Progressiva')
+
+    def test_modulo_desligado_e_modulo_alterado(self):
+        self.consultas_de_servicos()
+        self.salao.modulo_cabelo = False
+        self.salao.save()
+        resposta, _ = self.consultas_de_servicos()
+        self.assertNotContains(resposta, 'Corte')
+
+        self.salao.modulo_cabelo = True
+        self.salao.save()
+        self.modulo.icone = 'bi-brush'
+        self.modulo.save()
+        resposta, _ = self.consultas_de_servicos()
+        self.assertContains(resposta, 'bi-brush')
+
+
+    def escolhas(self, servico=None):
+        form = AgendamentoForm(servico=servico or self.corte)
+        return [nome for pk, nome in form.fields['profissional'].choices if pk]
+
+    def test_agendamento_le_catalogo_em_cache(self):
+        url = reverse('agendar_servico', args=[self.corte.id])
+        self.assertContains(self.client.get(url), 'Ana')
+        with CaptureQueriesContext(connection) as contexto:
+            resposta = self.client.get(url)
+        self.assertContains(resposta, 'Ana')
+        self.assertFalse([
+            consulta['sql'] for consulta in contexto.captured_queries
+            if 'servicos_servico' in consulta['sql'] or 'servicos_profissional' in consulta['sql']
+        ])
+        self.assertEqual(self.client.get(reverse('agendar_servico', args=[9999])).status_code, 404)
+
+    def test_form_valida_sem_consultar_profissionais(self):
+        self.escolhas()
+        dados = {'profissional': self.profissional.id, 'data': self.segunda, 'hora': '10:00'}
+        # Só a verificação de conflito e a validação da chave estrangeira do modelo vão ao banco
+        with self.assertNumQueries(2):
+            form = AgendamentoForm(data=dados, servico=self.corte)
+            self.assertTrue(form.is_valid())
+        self.assertEqual(form.cleaned_data['profissional'], self.profissional)
+
+        form = AgendamentoForm(data=dict(dados, profissional=9999), servico=self.corte)
+        self.assertFalse(form.is_valid())
+        self.assertIn('profissional', form.errors)
+
+    def test_profissionais_invalidados_por_signals(self):
+        self.assertEqual(self.escolhas(), ['Ana'])
+
+        usuario = self.profissional.usuario
+        usuario.first_name = 'Beatriz'
+        usuario.save()
+        self.assertEqual(self.escolhas(), ['Beatriz'])
+
+        self.profissional.modulos.remove(self.modulo)
+        self.assertEqual(self.escolhas(), [])
+        self.modulo.profissionais.add(self.profissional)
+        self.assertEqual(self.escolhas(), ['Beatriz'])
+
+        self.profissional.ativo = False
+        self.profissional.save()
+        self.assertEqual(self.escolhas(), [])
+
+    def test_requisicao_sem_salao(self):
+        chamadas = [
+            ('agendar_servico', views.agendar_servico, (self.corte.id,)),
+            ('horarios_disponiveis', views.horarios_disponiveis_json, (self.corte.id,)),
+            ('servicos_lista', async_to_sync(views.servicos_lista), ()),
+        ]
+        for nome, view, argumentos in chamadas:
+            with self.subTest(nome):
+                request = RequestFactory().get('/')
+                request.user = self.cliente
+                request.auser = sync_to_async(lambda: self.cliente)
+                request.salao = None
+                with self.assertRaises(Http404):
+                    view(request, *argumentos)
+
+    def test_catalogo_devolve_copias(self):
+        servico = catalogo.servico_ativo(self.salao.id, self.corte.id)
+        servico.nome = 'Alterado'
+        profissional, = catalogo.profissionais_do_modulo(self.salao.id, self.modulo.id)
+        profissional.modulo_ids = frozenset()
+        profissional.usuario = self.cliente
+        self.assertEqual(catalogo.servico_ativo(self.salao.id, self.corte.id).nome, 'Corte')
+        self.assertEqual(catalogo.servicos_ativos(self.salao.id)[self.corte.id].nome, 'Corte')
+        profissional, = catalogo.profissionais_ativos(self.salao.id)
+        self.assertEqual(profissional.modulo_ids, {self.modulo.id})
+        self.assertEqual(profissional.usuario.first_name, 'Ana')
+
+    def test_login_nao_invalida_catalogo(self):
+        geracoes = catalogo.catalogo.geracoes(self.salao.id)
+        self.client.login(username='prof', password='senha')
+        self.assertEqual(catalogo.catalogo.geracoes(self.salao.id), geracoes)
+
+
+class PlanoConsultasTests(AgendaTestMixin, PlanoConsultaMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(self.cliente)
+
+    def test_catalogo_do_salao(self):
+        with usar_salao(self.salao):
+            self.assertUsaIndice(
+                Servico.objects.filter(ativo=True, modulo=self.modulo), 'servico_salao_modulo_nome'
+            )
+
+    def test_conflitos_do_profissional(self):
+        conflitos = Agendamento.conflitantes(self.profissional, self.segunda, time(10), time(11))
+        self.assertUsaIndice(conflitos, 'agendamento_prof_data_hora')
+
+    def test_views_de_agendamento(self):
+        self.agendar(self.corte, time(10))
+        urls = [
+            reverse('servicos_lista'),
+            reverse('agendar_servico', args=[self.corte.id]),
+            reverse('horarios_disponiveis', args=[self.corte.id]) + f'?data={self.segunda}&dias=7',
+        ]
+        for url in urls:
+            with self.subTest(url), self.assertConsultasUsamIndices():
+                self.client.get(url)
+
+
+class DesempenhoTests(CargaTestMixin, TestCase):
+    """Orçamento de consultas das views de servicos/urls.py"""
+
+    def test_views(self):
+        agendamento = Agendamento.objects.filter(cliente=self.cliente, status='pendente').first()
+        amanha = date.today() + timedelta(days=1)
+        orcamentos = [
+            # (url, consultas, método, dados)
+            (reverse('servicos_lista'), 3, 'get', None),
+            (reverse('agendar_servico', args=[self.servico.id]), 4, 'get', None),
+            (reverse('horarios_disponiveis', args=[self.servico.id]), 4, 'get', {'data': amanha, 'dias': 7}),
+            (reverse('cancelar_agendamento', args=[agendamento.id]), 7, 'post', None),
+        ]
+        for url, consultas, metodo, dados in orcamentos:
+            with self.subTest(url):
+                self.orcamento_view(url, consultas, metodo=metodo, dados=dados)
+
+    def test_agendamento_sob_carga(self):
+        # Primeiro horário livre do profissional no próximo dia: a gravação valida a sobreposição
+        profissional = self.carga['profissionais'][0]
+        amanha = date.today() + timedelta(days=1)
+        self.client.force_login(self.cliente)
+        disponiveis = self.client.get(
+            reverse('horarios_disponiveis', args=[self.servico.id]),
+            {'data': amanha, 'profissional': profissional.id},
+        ).json()
+        hora = disponiveis['dias'][0]['profissionais'][0]['horarios'][0]
+        dados = {'profissional': profissional.id, 'data': amanha, 'hora': hora}
+        self.orcamento_view(reverse('agendar_servico', args=[self.servico.id]), 10, metodo='post', dados=dados)
+        self.assertTrue(
+            Agendamento.objects.filter(profissional=profissional, data=amanha, hora=hora, cliente=self.cliente).exists()
+        )
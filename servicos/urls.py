@@ -4,5 +4,6 @@ from . import views
 urlpatterns = [
     path('', views.servicos_lista, name='servicos_lista'),
     path('agendar/<int:servico_id>/', views.agendar_servico, name='agendar_servico'),
+    path('agendar/<int:servico_id>/horarios/', views.horarios_disponiveis_json, name='horarios_disponiveis'),
     path('cancelar/<int:agendamento_id>/', views.cancelar_agendamento, name='cancelar_agendamento'),
 ]
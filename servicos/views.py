@@ -1,38 +1,32 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
+from django.core.exceptions import ValidationError
 from django.db.models import Q
-from datetime import datetime, timedelta, time
-from .models import Modulo, Servico, Profissional, Agendamento
+from django.http import Http404, JsonResponse
+from django.utils import timezone
+from django.utils.safestring import mark_safe
+from datetime import date, datetime, timedelta, time
+from .models import Agendamento
+from .catalogo import catalogo_html, profissionais_do_modulo, servico_ativo
 from .forms import AgendamentoForm
+from .disponibilidade import horarios_disponiveis
+
+# Maior período (em dias) aceito pela consulta de horários livres
+MAX_DIAS_DISPONIBILIDADE = 31
 
 
 @login_required
-def servicos_lista(request):
+async def servicos_lista(request):
     """Lista de serviços disponíveis para o salão do usuário"""
     salao = request.salao
+    if salao is None:
+        raise Http404
     
-    # Filtra serviços ativos baseado nos módulos ativos do salão
-    # O TenantManager já filtra os serviços para o salão correto
-    servicos = Servico.objects.filter(ativo=True)
-    
-    if not salao.modulo_cabelo:
-        servicos = servicos.exclude(modulo__nome='cabelo')
-    if not salao.modulo_pele:
-        servicos = servicos.exclude(modulo__nome='pele')
-    if not salao.modulo_unhas:
-        servicos = servicos.exclude(modulo__nome='unhas')
-    
-    # Agrupa por módulo
-    modulos = Modulo.objects.all()
-    servicos_por_modulo = {}
-    for modulo in modulos:
-        servicos_modulo = servicos.filter(modulo=modulo)
-        if servicos_modulo.exists():
-            servicos_por_modulo[modulo] = servicos_modulo
-    
+    # O HTML fica no catálogo em cache do salão até a próxima gravação de
+    # serviço, profissional ou do salão
     context = {
-        'servicos_por_modulo': servicos_por_modulo,
+        'catalogo': mark_safe(await catalogo_html(request, salao)),
         'salao': salao,
     }
     return render(request, 'servicos/servicos_lista.html', context)
@@ -41,13 +35,13 @@ def servicos_lista(request):
 @login_required
 def agendar_servico(request, servico_id):
     """Página de agendamento de serviço"""
-    servico = get_object_or_404(Servico, id=servico_id, ativo=True)
-    
-    # Profissionais que atendem esse módulo
-    profissionais = Profissional.objects.filter(
-        modulos=servico.modulo,
-        ativo=True
-    )
+    # Serviço e profissionais que atendem o módulo vêm do catálogo em cache do salão
+    if request.salao is None:
+        raise Http404
+    servico = servico_ativo(request.salao.id, servico_id)
+    if servico is None:
+        raise Http404
+    profissionais = profissionais_do_modulo(request.salao.id, servico.modulo_id)
     
     if request.method == 'POST':
         form = AgendamentoForm(request.POST, servico=servico)
@@ -56,9 +50,14 @@ def agendar_servico(request, servico_id):
             agendamento.cliente = request.user
             agendamento.salao = request.salao
             agendamento.servico = servico
-            agendamento.save()
-            messages.success(request, 'Agendamento realizado com sucesso!')
-            return redirect('meus_agendamentos')
+            try:
+                agendamento.save()
+            except ValidationError as erro:
+                # Outro cliente reservou o horário entre a validação e a gravação
+                form.add_error(None, erro)
+            else:
+                messages.success(request, 'Agendamento realizado com sucesso!')
+                return redirect('meus_agendamentos')
     else:
         form = AgendamentoForm(servico=servico)
     
@@ -70,10 +69,58 @@ def agendar_servico(request, servico_id):
     return render(request, 'servicos/agendar_servico.html', context)
 
 
+@login_required
+def horarios_disponiveis_json(request, servico_id):
+    """Horários livres de um serviço, consultados pela página de agendamento"""
+    if request.salao is None:
+        raise Http404
+    servico = servico_ativo(request.salao.id, servico_id)
+    if servico is None:
+        raise Http404
+
+    try:
+        data_inicio = date.fromisoformat(request.GET['data']) if request.GET.get('data') else timezone.localdate()
+        dias = int(request.GET.get('dias', 1))
+        profissional = int(request.GET['profissional']) if request.GET.get('profissional') else None
+    except ValueError:
+        return JsonResponse({'erro': 'Parâmetros inválidos.'}, status=400)
+
+    if not 1 <= dias <= MAX_DIAS_DISPONIBILIDADE:
+        return JsonResponse({'erro': f'O período deve ter entre 1 e {MAX_DIAS_DISPONIBILIDADE} dias.'}, status=400)
+
+    disponibilidade = horarios_disponiveis(
+        servico,
+        data_inicio,
+        data_inicio + timedelta(days=dias - 1),
+        profissional=profissional,
+    )
+
+    return JsonResponse({
+        'servico': servico.id,
+        'duracao_minutos': servico.duracao_minutos,
+        'dias': [
+            {
+                'data': dia.isoformat(),
+                'profissionais': [
+                    {
+                        'id': prof.id,
+                        'nome': str(prof),
+                        'horarios': [hora.strftime('%H:%M') for hora in horarios],
+                    }
+                    for prof, horarios in livres
+                ],
+            }
+            for dia, livres in disponibilidade
+        ],
+    })
+
+
 @login_required
 def cancelar_agendamento(request, agendamento_id):
     """Cancelar agendamento"""
-    agendamento = get_object_or_404(Agendamento, id=agendamento_id, cliente=request.user)
+    agendamento = get_object_or_404(
+        Agendamento.objects.select_related('servico', 'profissional'), id=agendamento_id, cliente=request.user
+    )
     
     if agendamento.status in ['pendente', 'confirmado']:
         agendamento.status = 'cancelado'